@@ -0,0 +1,230 @@
+"""
+Time-series store of actuals keyed by (entity, account, period).
+
+Analytics endpoints (forecasting, anomaly detection, insights, score trends) need
+per-account history. Rather than have clients send full histories in request bodies,
+every import is folded into a monthly series per account when it is saved:
+
+    actuals_series/{entity_id}_{data_type} = {
+        "periods": ["2024-01", "2024-02", ...],       # sorted months
+        "series": {"4000": [1200.0, None, ...], ...},  # one value per period, aligned
+        "names": {"4000": "Sales", ...},
+    }
+
+All of an entity's accounts of one data type share the period axis, so a range scan
+is a bisect on `periods` and a multi-account read is one blob read:
+
+    frame = read_actuals("entity1", "trial_balance", accounts=["4000", "5000"],
+                         start=date(2023, 7, 1), end=date(2024, 6, 30), freq="Q")
+
+Monthly values roll up to quarters and years by sum (P&L flows) or by the last value
+in the period (balances), unless `how` says otherwise. Trial balance series hold
+`balance` by account code; P&L and balance sheet series hold `amount` by item name.
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import date
+from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+
+from app.apis.financial_columns import account_column, read_import_frame
+from app.apis.financial_import import register_import_change_listener, sanitize_storage_key
+from app.apis.storage_utils import storage
+from app.auth import AuthorizedUser
+
+router = APIRouter(prefix="/actuals", tags=["Actuals"])
+
+ACTUALS_SERIES_PREFIX = "actuals_series/"
+
+# Value read from imports of each data type
+IMPORT_VALUE_COLUMNS = {"trial_balance": "balance", "profit_loss": "amount", "balance_sheet": "amount"}
+# How monthly values combine into quarters and years when the caller does not say
+DEFAULT_ROLLUPS = {"profit_loss": "sum"}
+
+RollupFrequency = Literal["M", "Q", "Y"]
+RollupMethod = Literal["sum", "last", "mean"]
+
+
+def _series_key(entity_id: str, data_type: str) -> str:
+    return ACTUALS_SERIES_PREFIX + sanitize_storage_key(f"{entity_id}_{data_type}")
+
+
+def _period_key(value: Any) -> str:
+    return pd.Timestamp(value).strftime("%Y-%m")
+
+
+def _empty_series(entity_id: str, data_type: str) -> Dict[str, Any]:
+    return {"entity_id": entity_id, "data_type": data_type, "periods": [], "series": {}, "names": {}}
+
+
+# --- Writes ---
+
+def record_actuals(entity_id: str, data_type: str, period: Any, values: Dict[str, Optional[float]],
+                   names: Optional[Dict[str, Optional[str]]] = None, replace: bool = False):
+    """
+    Sets the values of accounts for the month of `period` (None clears a value). With
+    `replace`, accounts not in `values` are cleared for that month, as when a full
+    import supersedes the previous one. Series left with no values are dropped.
+    """
+    month = _period_key(period)
+    values = {str(account): (None if value is None or pd.isna(value) else float(value))
+              for account, value in values.items()}
+
+    def apply(doc: Dict[str, Any]):
+        periods, series = doc["periods"], doc["series"]
+        position = bisect_left(periods, month)
+        if position == len(periods) or periods[position] != month:
+            periods.insert(position, month)
+            for column in series.values():
+                column.insert(position, None)
+        if replace:
+            for account, column in series.items():
+                if account not in values:
+                    column[position] = None
+        for account, value in values.items():
+            column = series.get(account)
+            if column is None:
+                if value is None:
+                    continue
+                column = series[account] = [None] * len(periods)
+            column[position] = value
+        for account in [account for account, column in series.items() if all(v is None for v in column)]:
+            del series[account]
+            doc["names"].pop(account, None)
+        if not any(column[position] is not None for column in series.values()):
+            del periods[position]
+            for column in series.values():
+                del column[position]
+        doc["names"].update({account: name for account, name in (names or {}).items() if account in series})
+
+    storage.json.update(_series_key(entity_id, data_type), apply, default=lambda: _empty_series(entity_id, data_type))
+
+
+def import_change_values(change: Dict[str, Any]) -> Optional[Tuple[Dict[str, Optional[float]], Dict[str, str], bool]]:
+    """
+    For an import change notification (see register_import_change_listener): the
+    per-account values it sets (None for removed accounts), the account names, and
+    whether they replace all of the period's values. None for data types without values.
+    """
+    data_type = change["data_type"]
+    value_column = IMPORT_VALUE_COLUMNS.get(data_type)
+    if value_column is None:
+        return None
+    key_column = account_column(data_type)
+    changed = change.get("changed_keys")
+    if changed is not None and key_column == "item_name":
+        # P&L and balance sheet row keys are "category|item_name"
+        changed = list(dict.fromkeys(key.split("|", 1)[-1] for key in changed))
+    frame = read_import_frame(change["storage_key"], columns=[key_column, value_column, "account_name"],
+                              accounts=changed)
+    if key_column not in frame.columns or value_column not in frame.columns:
+        return None
+
+    accounts = frame[key_column].astype(str)
+    # An account listed more than once in an import (e.g. under two categories) is summed
+    totals = frame[value_column].astype(float).groupby(accounts, sort=False).sum(min_count=1)
+    values: Dict[str, Optional[float]] = totals.to_dict()
+    # Changed keys missing from the import were removed from it
+    values.update({str(account): None for account in changed or [] if str(account) not in values})
+    names = {}
+    if "account_name" in frame.columns:
+        names = {account: str(name) for account, name in zip(accounts, frame["account_name"]) if pd.notna(name)}
+    return values, names, changed is None
+
+
+def _on_import_change(change: Dict[str, Any]):
+    extracted = import_change_values(change)
+    if extracted is None:
+        return
+    values, names, replace = extracted
+    record_actuals(change["business_entity_id"], change["data_type"], change["period"], values, names, replace=replace)
+
+
+register_import_change_listener(_on_import_change)
+
+
+# --- Reads ---
+
+def list_actual_accounts(entity_id: str, data_type: str) -> Dict[str, Optional[str]]:
+    """Accounts with a series for the entity and data type, with their names where known."""
+    try:
+        doc = storage.json.get(_series_key(entity_id, data_type))
+    except FileNotFoundError:
+        return {}
+    return {account: doc["names"].get(account) for account in doc["series"]}
+
+
+def read_actuals(entity_id: str, data_type: str, accounts: Optional[Iterable[str]] = None,
+                 start: Optional[Any] = None, end: Optional[Any] = None,
+                 freq: RollupFrequency = "M", how: Optional[RollupMethod] = None) -> pd.DataFrame:
+    """
+    Actuals between start and end (inclusive, by month) as a frame indexed by period
+    end date with one float column per account (NaN where there is no value). Accounts
+    without a series come back as all-NaN columns; accounts=None reads every series.
+    """
+    try:
+        doc = storage.json.get(_series_key(entity_id, data_type))
+    except FileNotFoundError:
+        doc = _empty_series(entity_id, data_type)
+    periods, series = doc["periods"], doc["series"]
+    accounts = list(dict.fromkeys(str(account) for account in accounts)) if accounts is not None else list(series)
+
+    lo = bisect_left(periods, _period_key(start)) if start is not None else 0
+    hi = bisect_right(periods, _period_key(end)) if end is not None else len(periods)
+    matrix = np.full((hi - lo, len(accounts)), np.nan)
+    for column, account in enumerate(accounts):
+        values = series.get(account)
+        if values is not None:
+            matrix[:, column] = np.array(values[lo:hi], dtype=float)
+    frame = pd.DataFrame(matrix, columns=accounts,
+                         index=pd.PeriodIndex(periods[lo:hi], freq="M"))
+
+    if freq != "M":
+        how = how or DEFAULT_ROLLUPS.get(data_type, "last")
+        grouped = frame.groupby(frame.index.asfreq(freq))
+        frame = grouped.sum(min_count=1) if how == "sum" else grouped.mean() if how == "mean" else grouped.last()
+    frame.index = frame.index.to_timestamp(how="end").normalize()
+    return frame
+
+
+def read_account_history(entity_id: str, data_type: str, account: str, **kwargs: Any) -> List[Dict[str, Any]]:
+    """One account's non-empty points as [{"date": date, "value": float}], oldest first."""
+    column = read_actuals(entity_id, data_type, [account], **kwargs)[str(account)].dropna()
+    return [{"date": timestamp.date(), "value": float(value)} for timestamp, value in column.items()]
+
+
+# --- Endpoints ---
+
+class ActualsSeriesRequest(BaseModel):
+    entity_id: str
+    data_type: str = Field(default="trial_balance", description="trial_balance, profit_loss or balance_sheet")
+    accounts: Optional[List[str]] = Field(None, description="Account codes (or item names); all accounts if omitted")
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    freq: RollupFrequency = "M"
+    how: Optional[RollupMethod] = Field(None, description="Roll-up method; sum for P&L, last value otherwise")
+
+
+class ActualsSeriesResponse(BaseModel):
+    periods: List[date]
+    series: Dict[str, List[Optional[float]]]
+    names: Dict[str, Optional[str]]
+
+
+@router.post("/series", response_model=ActualsSeriesResponse)
+def get_actuals_series(request: ActualsSeriesRequest, user: AuthorizedUser) -> ActualsSeriesResponse:
+    """Actuals of several accounts over a date range, by month, quarter or year."""
+    if request.start_date and request.end_date and request.start_date > request.end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    frame = read_actuals(request.entity_id, request.data_type, request.accounts,
+                         request.start_date, request.end_date, request.freq, request.how)
+    names = list_actual_accounts(request.entity_id, request.data_type)
+    return ActualsSeriesResponse(
+        periods=[timestamp.date() for timestamp in frame.index],
+        series={account: [None if pd.isna(v) else float(v) for v in frame[account]] for account in frame.columns},
+        names={account: names.get(account) for account in frame.columns},
+    )
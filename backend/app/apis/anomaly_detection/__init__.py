@@ -9,6 +9,8 @@ from typing import List, Dict, Any, Optional
 from datetime import date
 import numpy as np
 
+from app.apis.actuals_timeseries import read_account_history
+
 # Create an API router
 router = APIRouter(
     prefix="/tax-compliance/anomaly-detection",
@@ -21,12 +23,18 @@ class TimeSeriesPoint(BaseModel):
     y: float = Field(..., description="The numeric value of the data point")
 
 class TimeSeriesData(BaseModel):
-    data: List[TimeSeriesPoint] = Field(..., description="List of time series data points")
+    data: Optional[List[TimeSeriesPoint]] = Field(None, description="List of time series data points; read from stored actuals if omitted")
+    # Stored actuals to analyse instead of sending the series (see app.apis.actuals_timeseries)
+    entity_id: Optional[str] = Field(None, description="Entity whose stored actuals to analyse")
+    account: Optional[str] = Field(None, description="Account code (trial balance) or item name")
+    data_type: str = Field("trial_balance", description="Imported data type the stored actuals come from")
+    start_date: Optional[date] = Field(None, description="First period of stored actuals to analyse")
+    end_date: Optional[date] = Field(None, description="Last period of stored actuals to analyse")
     # Optional parameters for Prophet can be added here later, e.g., seasonality settings
 
     @validator('data')
     def check_min_data_points(cls, v):
-        if len(v) < 3:
+        if v is not None and len(v) < 3:
             raise ValueError('At least 3 data points are required for anomaly detection')
         return v
 
@@ -55,6 +63,18 @@ async def detect_tax_anomalies(payload: TimeSeriesData) -> AnomalyDetectionRespo
     Returns:
         AnomalyDetectionResponse: A list of detected anomalies.
     """
+    if payload.data is None:
+        if not (payload.entity_id and payload.account):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Provide either data or entity_id and account.")
+        history = read_account_history(payload.entity_id, payload.data_type, payload.account,
+                                       start=payload.start_date, end=payload.end_date)
+        if len(history) < 3:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At least 3 data points are required for anomaly detection; {len(history)} stored for account {payload.account}.",
+            )
+        payload.data = [TimeSeriesPoint(ds=point["date"], y=point["value"]) for point in history]
+
     print(f"Received request to detect anomalies for {len(payload.data)} data points.")
     
     detected_anomalies: List[Anomaly] = []
@@ -1,13 +1,8 @@
 from fastapi import APIRouter, HTTPException, Path, Body, Depends, Request # Add Request
 from pydantic import BaseModel, Field
-from typing import List, Optional
-try:
-    import databutton as db
-except ImportError:
-    # Use mock databutton for local development
-    import sys
-    sys.path.append('..')
-    import databutton_mock as db
+from typing import Any, Callable, Dict, List, Optional
+from fastapi.concurrency import run_in_threadpool
+from app.apis.storage_utils import async_storage
 from datetime import datetime
 import uuid
 import re # Import re for sanitization
@@ -66,6 +61,28 @@ def get_budget_index_key(organization_id: str) -> str:
     return key
 
 
+# --- Change Notifications ---
+
+_budget_change_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def register_budget_change_listener(listener: Callable[[Dict[str, Any]], None]):
+    """
+    Registers a callback run after a budget version is created, replaced or deleted,
+    with {"organization_id", "version_id", "items"}. items holds the version's budget
+    items as dicts, or is None if the version was deleted.
+    """
+    _budget_change_listeners.append(listener)
+
+
+def _notify_budget_change(change: Dict[str, Any]):
+    for listener in _budget_change_listeners:
+        try:
+            listener(change)
+        except Exception as e:
+            print(f"Budget change listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+
 # --- API Endpoints ---
 
 @router.post("/{organization_id}/versions", response_model=BudgetVersionMetadata, status_code=201)
@@ -96,7 +113,7 @@ async def create_budget_version(
     # 4. Save BudgetVersion data to db.storage.json
     storage_key = get_budget_storage_key(organization_id, version_id)
     try:
-        db.storage.json.put(storage_key, data_to_save)
+        await async_storage.json.put(storage_key, data_to_save)
         print(
             f"Saved budget version {version_id} for org {organization_id} to {storage_key}"
         )
@@ -105,27 +122,28 @@ async def create_budget_version(
         raise HTTPException(
             status_code=500, detail=f"Failed to save budget version data: {e}"
         ) from e
+    await run_in_threadpool(_notify_budget_change, {
+        "organization_id": organization_id,
+        "version_id": version_id,
+        "items": data_to_save["items"],
+    })
 
     # 5. Update/create index file
     index_key = get_budget_index_key(organization_id)
     try:
-        # Get existing index or create new list
-        index_data = []
-        try:
-            index_data = db.storage.json.get(index_key, default=[])
-        except FileNotFoundError:
-            index_data = [] # Explicitly start with empty list if not found
-
         # Prepare new metadata entry for the index (as a dictionary)
         new_metadata_entry = {
             "version_id": version_id,
             "name": request_body.name,
             "created_at": created_at_iso, # Use ISO string for the index as well
         }
-        index_data.append(new_metadata_entry)
 
-        # Save updated index
-        db.storage.json.put(index_key, index_data)
+        def append_entry(index_data: list) -> list:
+            index_data.append(new_metadata_entry)
+            return index_data
+
+        # Versioned update: retried against the latest index if another request wrote it meanwhile
+        await async_storage.json.update(index_key, append_entry, default=list)
         print(f"Updated budget index for org {organization_id} at {index_key}")
 
     except Exception as e:
@@ -146,7 +164,7 @@ async def list_budget_versions(
     """Lists metadata for all available budget versions for an organization."""
     index_key = get_budget_index_key(organization_id)
     try:
-        index_data = db.storage.json.get(index_key, default=[])
+        index_data = await async_storage.json.get(index_key, default=[])
         # Validate data format - Pydantic will implicitly do this on return
         return index_data
     except FileNotFoundError:
@@ -164,7 +182,7 @@ async def get_budget_version(
     """Retrieves a specific budget version, including all its items."""
     storage_key = get_budget_storage_key(organization_id, version_id)
     try:
-        budget_data = db.storage.json.get(storage_key)
+        budget_data = await async_storage.json.get(storage_key)
         # Validate data format - Pydantic will implicitly do this on return
         return budget_data
     except FileNotFoundError:
@@ -187,7 +205,7 @@ async def update_budget_version(
 
     # 1. Check if version exists (read index)
     try:
-        index_data = db.storage.json.get(index_key, default=[])
+        index_data = await async_storage.json.get(index_key, default=[])
         existing_metadata_dict = next((item for item in index_data if item['version_id'] == version_id), None)
         if not existing_metadata_dict:
             raise HTTPException(status_code=404, detail=f"Budget version '{version_id}' not found for update.") from None
@@ -215,22 +233,28 @@ async def update_budget_version(
 
     # 3. Overwrite file at storage_key
     try:
-        db.storage.json.put(storage_key, updated_budget_version_data.model_dump())
+        await async_storage.json.put(storage_key, updated_budget_version_data.model_dump())
         print(f"Updated budget version {version_id} for org {organization_id} at {storage_key}")
     except Exception as e:
         print(f"Error saving updated budget version {version_id} to {storage_key}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to save updated budget version data: {e}") from e
+    await run_in_threadpool(_notify_budget_change, {
+        "organization_id": organization_id,
+        "version_id": version_id,
+        "items": [item.model_dump() for item in updated_budget_version_data.items],
+    })
 
     # 4. Update index file metadata if name changed
     if new_version_name != current_name:
         try:
-            updated_index_data = []
-            for item in index_data:
-                if item['version_id'] == version_id:
-                    item['name'] = new_version_name
-                    # Update other metadata if necessary (e.g., updated_at)
-                updated_index_data.append(item)
-            db.storage.json.put(index_key, updated_index_data)
+            def rename_entry(index_data: list) -> list:
+                for item in index_data:
+                    if item.get('version_id') == version_id:
+                        item['name'] = new_version_name
+                        # Update other metadata if necessary (e.g., updated_at)
+                return index_data
+
+            await async_storage.json.update(index_key, rename_entry, default=list)
             print(f"Updated budget index name for {version_id} at {index_key}")
         except Exception as e:
             print(f"Error updating budget index name for {version_id} at {index_key}: {e}")
@@ -270,7 +294,7 @@ async def delete_budget_version(
     # 1. Read index file
     try:
         print(f"Reading index data from {index_key}...")
-        index_data = db.storage.json.get(index_key, default=[])
+        index_data = await async_storage.json.get(index_key, default=[])
         print(f"Read {len(index_data)} items from index: {index_data}")
     except FileNotFoundError:
         print(f"Index file {index_key} not found. Nothing to delete.")
@@ -281,26 +305,28 @@ async def delete_budget_version(
         raise HTTPException(status_code=500, detail=f"Failed to read budget index: {e}") from e
 
     # 2. Filter out the version to be deleted
-    original_length = len(index_data)
-    updated_index_data = [item for item in index_data if item.get('version_id') != version_id]
-    new_length = len(updated_index_data)
-    print(f"Filtered index data. Original length: {original_length}, New length: {new_length}")
-    if new_length < original_length:
-        print(f"Version {version_id} found in index. Filtered list: {updated_index_data}")
-    else:
+    if not any(item.get('version_id') == version_id for item in index_data):
         print(f"Version {version_id} was NOT found in the index. No changes needed.")
         # Return 204 as the desired state (item not listed) is already true
         return
 
-    # 3. Save the updated index
+    # 3. Save the updated index, re-filtering the latest copy if it changed since the read above
+    def remove_entry(current_index: list) -> list:
+        return [item for item in current_index if item.get('version_id') != version_id]
+
     try:
-        print(f"Attempting to save updated index ({new_length} items) back to {index_key}...")
-        db.storage.json.put(index_key, updated_index_data)
-        print(f"Successfully saved updated index to {index_key}.")
+        print(f"Attempting to remove {version_id} from index {index_key}...")
+        updated_index_data = await async_storage.json.update(index_key, remove_entry, default=list)
+        print(f"Successfully saved updated index ({len(updated_index_data)} items) to {index_key}.")
     except Exception as e:
         print(f"!!! ERROR saving updated index {index_key} during delete: {e}")
         # If saving fails, the deletion didn't persist. Raise 500.
         raise HTTPException(status_code=500, detail=f"Failed to save updated budget index: {e}") from e
+    await run_in_threadpool(_notify_budget_change, {
+        "organization_id": organization_id,
+        "version_id": version_id,
+        "items": None,
+    })
 
     print(f"--- Finished delete attempt successfully for version: {version_id} ---")
     # No content to return for 204
@@ -3,7 +3,7 @@ from pydantic import BaseModel, Field
 from enum import Enum
 from typing import List, Dict, Optional, Union, Literal, Any
 from datetime import date, datetime
-import databutton as db
+from app.apis.storage_utils import storage
 import json
 import uuid
 
@@ -57,13 +57,13 @@ def sanitize_storage_key(key: str) -> str:
 def save_entity(entity: BusinessEntityBase) -> None:
     """Save a business entity to storage"""
     entity_key = sanitize_storage_key(f"entity_{entity.id}")
-    db.storage.json.put(entity_key, entity.model_dump())
+    storage.json.put(entity_key, entity.model_dump())
 
 def get_entity(entity_id: str) -> Optional[BusinessEntityBase]:
     """Get a business entity from storage"""
     entity_key = sanitize_storage_key(f"entity_{entity_id}")
     try:
-        entity_data = db.storage.json.get(entity_key)
+        entity_data = storage.json.get(entity_key)
         return BusinessEntityBase(**entity_data)
     except Exception as e:
         print(f"Error retrieving entity: {e}")
@@ -73,16 +73,15 @@ def list_entities() -> List[BusinessEntityBase]:
     """List all business entities from storage"""
     entities = []
     # Get all json files starting with "entity_"
-    storage_files = db.storage.json.list()
+    storage_files = storage.json.list(prefix="entity_")
 
     for file in storage_files:
-        if file.name.startswith("entity_"):
-            try:
-                entity_data = db.storage.json.get(file.name)
-                entities.append(BusinessEntityBase(**entity_data))
-            except Exception as e:
-                # Skip invalid entities
-                print(f"Error parsing entity data: {e}")
+        try:
+            entity_data = storage.json.get(file.name)
+            entities.append(BusinessEntityBase(**entity_data))
+        except Exception as e:
+            # Skip invalid entities
+            print(f"Error parsing entity data: {e}")
 
     return entities
 
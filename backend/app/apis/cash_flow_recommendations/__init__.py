@@ -3,7 +3,7 @@ from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Union, Literal
 import numpy as np
 from datetime import datetime, timedelta
-import databutton as db
+from app.apis.storage_utils import async_storage
 import json
 
 router = APIRouter()
@@ -535,7 +535,7 @@ async def optimize_cash_flow(data: CashFlowData) -> CashFlowOptimizationResponse
         # Store the recommendations for future reference
         try:
             key = f"cash_flow_recommendations_{data.company_id}_{datetime.now().strftime('%Y%m%d')}"
-            db.storage.json.put(key, response.dict())
+            await async_storage.json.put(key, response.dict())
         except Exception as e:
             print(f"Failed to store recommendations: {e}")
         
@@ -549,17 +549,18 @@ async def get_historical_recommendations(company_id: str):
     """Get historical cash flow recommendations for a company"""
     try:
         # List all files that match the pattern
-        all_files = db.storage.json.list()
-        recommendation_files = [f for f in all_files if f.name.startswith(f"cash_flow_recommendations_{company_id}_")]
+        recommendation_files = await async_storage.json.list(prefix=f"cash_flow_recommendations_{company_id}_")
         
         # Sort by date (newest first)
         recommendation_files.sort(key=lambda x: x.name, reverse=True)
         
         # Get the latest 5 recommendations
+        latest_files = recommendation_files[:5]
+        documents = await async_storage.json.get_many(file.name for file in latest_files)
         results = []
-        for file in recommendation_files[:5]:
+        for file in latest_files:
             try:
-                data = db.storage.json.get(file.name)
+                data = documents[file.name]
                 date_str = file.name.split('_')[-1]
                 date = datetime.strptime(date_str, '%Y%m%d').strftime('%Y-%m-%d')
                 
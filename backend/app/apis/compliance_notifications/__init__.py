@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any, Union
 from datetime import datetime, timedelta
-import databutton as db
+from app.apis.storage_utils import storage
 import uuid
 import json
 
@@ -44,15 +44,28 @@ def sanitize_storage_key(key: str) -> str:
     import re
     return re.sub(r'[^a-zA-Z0-9._-]', '', key)
 
-def store_notifications(notifications: List[Dict]) -> None:
-    """Store notifications in storage"""
-    db.storage.json.put(sanitize_storage_key(NOTIFICATIONS_KEY), notifications)
+# One storage key per notification, indexed by recipient. The former single
+# "notifications" list is split into records on first use.
+notifications_collection = storage.collection(
+    "notifications",
+    id_field="id",
+    legacy_key=NOTIFICATIONS_KEY,
+    indexes={"userId": lambda notif: notif.get("userId")},
+    compression_dictionary=True,
+)
 
-def get_notifications() -> List[Dict]:
-    """Get notifications from storage"""
+def store_notification(notification: Dict) -> None:
+    """Store a single notification in storage"""
+    notifications_collection.put(notification)
+
+def get_notifications(user_id: Optional[str] = None) -> List[Dict]:
+    """Get notifications from storage, optionally only those for one user"""
     try:
-        return db.storage.json.get(NOTIFICATIONS_KEY, default=[])
-    except:
+        if user_id is not None:
+            return notifications_collection.find("userId", user_id)
+        return notifications_collection.all()
+    except Exception as e:
+        print(f"Error loading notifications: {e}")
         return []
 
 # Get all notifications, with filtering options
@@ -67,7 +80,7 @@ def list_notifications(
     limit: int = Query(50, ge=1, le=100),
     offset: int = Query(0, ge=0)
 ) -> Dict:
-    all_notifications = get_notifications()
+    all_notifications = get_notifications(user_id)
     
     # Filter notifications
     filtered = []
@@ -117,8 +130,6 @@ def list_notifications(
 # Internal function to create and store a notification
 def _create_and_store_notification(notification: NotificationCreate) -> Dict:
     """Creates a notification object, adds it to storage, and returns it."""
-    all_notifications = get_notifications()
-    
     # Create new notification object
     new_notification = notification.dict()
     new_notification["id"] = str(uuid.uuid4())
@@ -127,8 +138,7 @@ def _create_and_store_notification(notification: NotificationCreate) -> Dict:
     # (Pydantic v1 models handle this by default when converting dict -> model)
     
     # Add to storage
-    all_notifications.append(new_notification)
-    store_notifications(all_notifications)
+    store_notification(new_notification)
     
     return new_notification # Return the full notification dict
 
@@ -150,17 +160,18 @@ def create_notification(notification: NotificationCreate) -> NotificationRespons
 # Mark notification as read
 @router.post("/{notification_id}/read")
 def mark_notification_read(notification_id: str) -> NotificationResponse:
-    all_notifications = get_notifications()
-    
     updated = False
-    for notif in all_notifications:
-        if notif.get("id") == notification_id and not notif.get("readAt"):
+
+    def mark_read(notif: Dict) -> Dict:
+        nonlocal updated
+        updated = not notif.get("readAt")
+        if updated:
             notif["readAt"] = datetime.now().isoformat()
-            updated = True
-            break
+        return notif
+
+    notifications_collection.update(notification_id, mark_read)
     
     if updated:
-        store_notifications(all_notifications)
         return NotificationResponse(success=True, message="Notification marked as read")
     else:
         return NotificationResponse(success=False, message="Notification not found or already read")
@@ -168,20 +179,21 @@ def mark_notification_read(notification_id: str) -> NotificationResponse:
 # Mark notification as dismissed
 @router.post("/{notification_id}/dismiss")
 def dismiss_notification(notification_id: str) -> NotificationResponse:
-    all_notifications = get_notifications()
-    
     updated = False
-    for notif in all_notifications:
-        if notif.get("id") == notification_id and not notif.get("dismissedAt"):
+
+    def dismiss(notif: Dict) -> Dict:
+        nonlocal updated
+        updated = not notif.get("dismissedAt")
+        if updated:
             notif["dismissedAt"] = datetime.now().isoformat()
             # Also mark as read if not already
             if not notif.get("readAt"):
                 notif["readAt"] = datetime.now().isoformat()
-            updated = True
-            break
+        return notif
+
+    notifications_collection.update(notification_id, dismiss)
     
     if updated:
-        store_notifications(all_notifications)
         return NotificationResponse(success=True, message="Notification dismissed")
     else:
         return NotificationResponse(success=False, message="Notification not found or already dismissed")
@@ -195,16 +207,10 @@ def bulk_update_notifications(
     entity_id: Optional[str] = None,
     type: Optional[str] = None
 ) -> NotificationResponse:
-    all_notifications = get_notifications()
-    
     update_count = 0
     now_iso = datetime.now().isoformat()
     
-    for notif in all_notifications:
-        # Skip if not for this user
-        if notif.get("userId") != user_id:
-            continue
-            
+    for notif in get_notifications(user_id):
         # Apply filters if specified
         if notification_ids and notif.get("id") not in notification_ids:
             continue
@@ -218,16 +224,17 @@ def bulk_update_notifications(
         # Apply action
         if action == "mark_read" and not notif.get("readAt"):
             notif["readAt"] = now_iso
+            store_notification(notif)
             update_count += 1
         elif action == "dismiss" and not notif.get("dismissedAt"):
             notif["dismissedAt"] = now_iso
             # Also mark as read if not already
             if not notif.get("readAt"):
                 notif["readAt"] = now_iso
+            store_notification(notif)
             update_count += 1
     
     if update_count > 0:
-        store_notifications(all_notifications)
         return NotificationResponse(
             success=True, 
             message=f"{update_count} notifications updated",
@@ -279,8 +286,8 @@ def generate_deadline_alerts(user_id: str, entity_id: Optional[str] = None) -> N
             },
         ]
     
-    # Current notifications
-    all_notifications = get_notifications()
+    # Current notifications for this user
+    all_notifications = get_notifications(user_id)
     
     # Track new notifications
     new_notifications = []
@@ -370,11 +377,7 @@ def generate_deadline_alerts(user_id: str, entity_id: Optional[str] = None) -> N
     for notif in new_notifications:
         notif["id"] = str(uuid.uuid4())
         notif["createdAt"] = datetime.now().isoformat()
-        all_notifications.append(notif)
-        
-    # Save updated notifications
-    if new_notifications:
-        store_notifications(all_notifications)
+        store_notification(notif)
         
     return NotificationResponse(
         success=True,
@@ -455,8 +458,8 @@ def generate_compliance_alerts(
     # Run compliance checks
     compliance_results = run_compliance_checks(request_data)
     
-    # Current notifications
-    all_notifications = get_notifications()
+    # Current notifications for this user
+    all_notifications = get_notifications(user_id)
     
     # New notifications
     new_notifications = []
@@ -508,10 +511,7 @@ def generate_compliance_alerts(
             
             new_notifications.append(new_notif)
             all_notifications.append(new_notif)
-    
-    # Save updated notifications
-    if new_notifications:
-        store_notifications(all_notifications)
+            store_notification(new_notif)
     
     return NotificationResponse(
         success=True,
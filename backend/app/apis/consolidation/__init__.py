@@ -3,15 +3,16 @@ API for financial consolidation calculations.
 """
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, Field, validator
-from typing import List, Dict, Optional, Any, Tuple # Added missing imports, Added Tuple
+from typing import List, Dict, Optional, Any, Tuple, Callable # Added missing imports, Added Tuple
 from collections import defaultdict # Added for P&L mapping
-import databutton as db # Added
+from app.apis.storage_utils import storage
 import re # Added
 import math # Added for rounding
 import pandas as pd # Added for FX
 from enum import Enum # Added
 import uuid # Added
-from datetime import datetime # Ensure datetime is imported directly for default_factory
+from datetime import datetime, date # Ensure datetime is imported directly for default_factory
+import calendar
 
 # --- Configurable Constants (for Intercompany Eliminations) ---
 # TODO: Make these configurable per organization/consolidation group later
@@ -31,16 +32,47 @@ IC_PAYABLE_RANGE_END = "2499"     # Example
 
 # Import necessary components from other APIs/schemas
 from app.apis.business_entity import list_entities # Function to get all entities
-from app.apis.fx_rates import load_fx_rates_df # Added for FX
+from app.apis.fx_rates import FXRateGraph, get_fx_rate_graph # Added for FX
 from app.apis.tax_compliance_schema import BusinessEntityBase, OwnershipDetail # Models
+from app.apis.financial_columns import find_import, read_import_frame # Columnar copy of imported data
 
 
 # --- Helper Functions ---
 
+# Only these fields of the imported rows are used by the aggregation below
+CONSOLIDATION_COLUMNS = ["account_code", "item_name", "balance", "amount", "is_intercompany"]
+
+
+def _load_consolidation_records(storage_key: str) -> List[Dict]:
+    """The fields consolidation uses from an import, as records (missing values as None)."""
+    frame = read_import_frame(storage_key, columns=CONSOLIDATION_COLUMNS)
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
 def sanitize_storage_key(key: str) -> str:
     """Sanitize storage key to only allow alphanumeric and ._- symbols"""
     return re.sub(r'[^a-zA-Z0-9._-]', '', key)
 
+
+_consolidation_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def register_consolidation_listener(listener: Callable[[Dict[str, Any]], None]):
+    """
+    Registers a callback run after a consolidation computed from stored data (not test
+    overrides), with {"organization_id", "consolidation_group_id", "period", "data_type",
+    "reporting_currency", "consolidated_trial_balance"}.
+    """
+    _consolidation_listeners.append(listener)
+
+
+def _notify_consolidation(change: Dict[str, Any]):
+    for listener in _consolidation_listeners:
+        try:
+            listener(change)
+        except Exception as e:
+            print(f"Consolidation listener {getattr(listener, '__name__', listener)} failed: {e}")
+
 def get_account_type(account_code: str) -> str:
     """Determine account type based on code range (simplistic)."""
     # TODO: Replace with proper Chart of Accounts lookup
@@ -52,30 +84,33 @@ def get_account_type(account_code: str) -> str:
     else:
         return 'Unknown' # Or handle other ranges/types
 
-def get_fx_rate(fx_df: pd.DataFrame, from_curr: str, to_curr: str, rate_type: str) -> Optional[float]:
-    """Get a specific FX rate from the loaded DataFrame."""
-    if fx_df.empty:
+def get_period_date_range(period: str) -> Tuple[Optional[date], Optional[date]]:
+    """
+    Converts a consolidation period ("2024", "2024-12", "2024-Q4") into a
+    (start, end) date range. Returns (None, None) for unrecognised formats.
+    """
+    match = re.fullmatch(r"(\d{4})(?:-(?:Q([1-4])|(\d{1,2})))?", period.strip().upper())
+    if not match:
+        return None, None
+    year = int(match.group(1))
+    if match.group(2):
+        last_month = int(match.group(2)) * 3
+        first_month = last_month - 2
+    elif match.group(3):
+        first_month = last_month = int(match.group(3))
+        if not 1 <= first_month <= 12:
+            return None, None
+    else:
+        first_month, last_month = 1, 12
+    return date(year, first_month, 1), date(year, last_month, calendar.monthrange(year, last_month)[1])
+
+def get_fx_rate(fx_graphs: Dict[str, FXRateGraph], from_curr: str, to_curr: str, rate_type: str) -> Optional[float]:
+    """Get a specific FX rate from the period's rate graphs (direct, inverse or cross rate)."""
+    graph = fx_graphs.get(rate_type.lower())
+    if graph is None:
         return None
     try:
-        # Filter for the specific rate
-        rate_row = fx_df[
-            (fx_df['from_currency'] == from_curr) & 
-            (fx_df['to_currency'] == to_curr) & 
-            (fx_df['rate_type'].str.lower() == rate_type.lower())
-        ]
-        if not rate_row.empty:
-            return rate_row['rate'].iloc[0]
-        else:
-            # Try inverse rate if direct rate not found
-            inverse_rate_row = fx_df[
-                (fx_df['from_currency'] == to_curr) & 
-                (fx_df['to_currency'] == from_curr) & 
-                (fx_df['rate_type'].str.lower() == rate_type.lower())
-            ]
-            if not inverse_rate_row.empty:
-                inverse_rate = inverse_rate_row['rate'].iloc[0]
-                if inverse_rate != 0:
-                    return 1.0 / inverse_rate
+        return graph.rate(from_curr, to_curr)
     except Exception as e:
         print(f"Error looking up FX rate ({from_curr}->{to_curr}, {rate_type}): {e}")
     return None
@@ -301,6 +336,13 @@ router = APIRouter(prefix="/consolidation", tags=["Consolidation"])
 
 # Endpoint to manage Chart of Accounts Mappings
 COA_MAPPING_STORAGE_PREFIX = "coa_mapping_"
+COA_MAPPING_BY_ORG_INDEX = "coa_mapping_by_org"
+
+storage.json.register_index(
+    COA_MAPPING_BY_ORG_INDEX,
+    COA_MAPPING_STORAGE_PREFIX,
+    lambda mapping: mapping.get("organization_id"),
+)
 
 class CoAMappingCreatePayload(BaseModel):
     name: str
@@ -329,7 +371,7 @@ def create_coa_mapping(payload: CoAMappingCreatePayload):
     )
     storage_key = f"{COA_MAPPING_STORAGE_PREFIX}{coa_mapping.mapping_id}"
     try:
-        db.storage.json.put(sanitize_storage_key(storage_key), coa_mapping.dict())
+        storage.json.put(sanitize_storage_key(storage_key), coa_mapping.dict())
         print(f"Saved CoA Mapping {coa_mapping.mapping_id} for org {coa_mapping.organization_id}")
     except Exception as e:
         print(f"Error saving CoA mapping {coa_mapping.mapping_id}: {e}")
@@ -340,7 +382,7 @@ def create_coa_mapping(payload: CoAMappingCreatePayload):
 def get_coa_mapping(mapping_id: str):
     storage_key = f"{COA_MAPPING_STORAGE_PREFIX}{mapping_id}"
     try:
-        mapping_data = db.storage.json.get(sanitize_storage_key(storage_key))
+        mapping_data = storage.json.get(sanitize_storage_key(storage_key))
         return CoAMapping(**mapping_data)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"CoA Mapping with ID '{mapping_id}' not found.")
@@ -354,7 +396,7 @@ def update_coa_mapping(mapping_id: str, payload: CoAMappingUpdatePayload):
     try:
         # Get existing mapping
         try:
-            existing_mapping_data = db.storage.json.get(sanitize_storage_key(storage_key))
+            existing_mapping_data = storage.json.get(sanitize_storage_key(storage_key))
             existing_mapping = CoAMapping(**existing_mapping_data)
         except FileNotFoundError:
             raise HTTPException(status_code=404, detail=f"CoA Mapping with ID '{mapping_id}' not found for update.")
@@ -369,7 +411,7 @@ def update_coa_mapping(mapping_id: str, payload: CoAMappingUpdatePayload):
         
         existing_mapping.updated_at = datetime.utcnow()
         
-        db.storage.json.put(sanitize_storage_key(storage_key), existing_mapping.dict())
+        storage.json.put(sanitize_storage_key(storage_key), existing_mapping.dict())
         print(f"Updated CoA Mapping {existing_mapping.mapping_id}")
         return existing_mapping
 
@@ -385,8 +427,8 @@ def delete_coa_mapping(mapping_id: str):
     try:
         # Check if file exists before attempting delete to provide a 404 if not found
         # db.storage.json.get will raise FileNotFoundError if it doesn't exist.
-        db.storage.json.get(sanitize_storage_key(storage_key)) # This line checks existence
-        db.storage.json.delete(sanitize_storage_key(storage_key))
+        storage.json.get(sanitize_storage_key(storage_key)) # This line checks existence
+        storage.json.delete(sanitize_storage_key(storage_key))
         print(f"Deleted CoA Mapping {mapping_id}")
         # No content to return, FastAPI handles 204
     except FileNotFoundError:
@@ -399,25 +441,24 @@ def delete_coa_mapping(mapping_id: str):
 def list_coa_mappings_for_organization(organization_id: str):
     org_mappings: List[CoAMapping] = []
     try:
-        all_mapping_keys = db.storage.json.list()
+        org_mapping_keys = storage.json.list_by_index(COA_MAPPING_BY_ORG_INDEX, organization_id)
     except Exception as e:
         print(f"Error listing CoA mapping keys from storage: {e}")
         raise HTTPException(status_code=500, detail="Could not list CoA mappings from storage.")
 
-    for item in all_mapping_keys:
+    for item in org_mapping_keys:
         key = item.name 
-        if key.startswith(COA_MAPPING_STORAGE_PREFIX):
-            try:
-                mapping_data = db.storage.json.get(sanitize_storage_key(key))
-                coa_mapping = CoAMapping(**mapping_data)
-                if coa_mapping.organization_id == organization_id:
-                    org_mappings.append(coa_mapping)
-            except FileNotFoundError:
-                print(f"Listed CoA mapping key {key} not found during retrieval.")
-                continue
-            except Exception as e:
-                print(f"Error processing CoA mapping key {key} for organization {organization_id}: {e}")
-                continue
+        try:
+            mapping_data = storage.json.get(sanitize_storage_key(key))
+            coa_mapping = CoAMapping(**mapping_data)
+            if coa_mapping.organization_id == organization_id:
+                org_mappings.append(coa_mapping)
+        except FileNotFoundError:
+            print(f"Listed CoA mapping key {key} not found during retrieval.")
+            continue
+        except Exception as e:
+            print(f"Error processing CoA mapping key {key} for organization {organization_id}: {e}")
+            continue
                 
     return CoAMappingListResponse(mappings=org_mappings)
 
@@ -490,19 +531,6 @@ def perform_consolidation(request: ConsolidationRequest):
     """
     print(f"Starting consolidation for group {request.consolidation_group_id} period {request.period}")
 
-    # 0. Load FX Rates for the period
-    print(f"Loading FX rates for organization {request.organization_id} around period {request.period}...")
-    try:
-        # load_fx_rates_df should handle fetching appropriate rates (e.g., Average, Closing for the period)
-        fx_rates_df = load_fx_rates_df() # Corrected: Call with no arguments as per error
-        print(f"Loaded {len(fx_rates_df)} FX rates.")
-        if fx_rates_df.empty:
-             print("Warning: No FX rates loaded. Currency translation will not be possible.")
-    except Exception as e:
-        print(f"Error loading FX rates: {e}. Proceeding without currency translation.")
-        fx_rates_df = pd.DataFrame() # Ensure df exists but is empty
-
-
     # 1. Fetch or use override entity structure
     if request.entity_structure_override:
         print("Using provided entity_structure_override for testing.")
@@ -521,6 +549,21 @@ def perform_consolidation(request: ConsolidationRequest):
          raise HTTPException(status_code=400, detail=f"Could not determine reporting currency for parent entity {request.consolidation_group_id}")
     print(f"Reporting Currency: {reporting_currency}")
 
+    # Load FX Rates for the period
+    print(f"Loading FX rates for organization {request.organization_id} around period {request.period}...")
+    fx_graphs: Dict[str, FXRateGraph] = {}
+    try:
+        # Rate graphs are memoized per (period end, rate type) and derive cross rates
+        _, period_end = get_period_date_range(request.period)
+        for rate_type in ('Closing', 'Average'):
+            fx_graphs[rate_type.lower()] = get_fx_rate_graph(period_end, rate_type)
+        print(f"Loaded FX rates for currencies: {sorted(fx_graphs['closing'].currencies)}")
+        if not fx_graphs['closing'].currencies:
+             print("Warning: No FX rates loaded. Currency translation will not be possible.")
+    except Exception as e:
+        print(f"Error loading FX rates: {e}. Proceeding without currency translation.")
+        fx_graphs = {} # Lookups return None and balances stay untranslated
+
     # 2. Fetch or use override financial data for each relevant entity
     entity_financial_data: Dict[str, List[Dict]] = {} # {entity_id: [financial records]}
     # Get entity IDs from the parsed structure object
@@ -537,21 +580,34 @@ def perform_consolidation(request: ConsolidationRequest):
             # Allow proceeding, but consolidation might be incomplete
     else:
         print(f"Fetching financial data for period {request.period} and type {request.data_type} from storage...")
-        all_files = db.storage.json.list()
         found_data_count = 0
 
         for entity_id in entity_ids:
             found_match = False
+            storage_key = find_import(request.organization_id, entity_id, request.data_type, request.period)
+            if storage_key:
+                try:
+                    data_list = _load_consolidation_records(storage_key)
+                    if data_list:
+                        print(f"  Found latest import for entity {entity_id}: {storage_key}")
+                        entity_financial_data[entity_id] = data_list
+                        found_data_count += 1
+                        found_match = True
+                except FileNotFoundError:
+                    print(f"  Warning: Import {storage_key} listed as latest but not found on fetch.")
+
+            # Imports saved before the latest-import pointer existed are found by scanning
             prefix = sanitize_storage_key(f"{request.organization_id}_{entity_id}_{request.data_type}")
             # print(f"Searching for prefix: {prefix}") # Reduced verbosity
 
-            for file_info in all_files:
-                if file_info.name.startswith(prefix):
+            for file_info in ([] if found_match else storage.json.list(prefix=prefix)):
+                # Data and manifest parts are read through their import record
+                if file_info.name.startswith(prefix) and not re.search(r"_(part|manifest)\d{5}$", file_info.name):
                     try:
-                        file_content = db.storage.json.get(file_info.name)
+                        file_content = storage.json.get(file_info.name)
                         if file_content and file_content.get("date") == request.period:
                             print(f"  Found matching file for entity {entity_id}: {file_info.name}")
-                            data_list = file_content.get("data", [])
+                            data_list = _load_consolidation_records(file_info.name)
                             if data_list:
                                entity_financial_data[entity_id] = data_list
                                found_data_count += 1
@@ -631,7 +687,7 @@ def perform_consolidation(request: ConsolidationRequest):
                      account_type = get_account_type(account)
                      rate_type = 'Closing' if account_type == 'BS' else 'Average'
                      
-                     rate = get_fx_rate(fx_rates_df, entity_currency, reporting_currency, rate_type)
+                     rate = get_fx_rate(fx_graphs, entity_currency, reporting_currency, rate_type)
                      
                      if rate is not None:
                          balance_reporting = balance_local * rate
@@ -712,7 +768,7 @@ def perform_consolidation(request: ConsolidationRequest):
                          balance_reporting = balance_local
                          if needs_translation and entity_currency:
                              rate_type = 'Closing' if account_type == 'BS' else 'Average'
-                             rate = get_fx_rate(fx_rates_df, entity_currency, reporting_currency, rate_type)
+                             rate = get_fx_rate(fx_graphs, entity_currency, reporting_currency, rate_type)
                              if rate is not None:
                                  balance_reporting = balance_local * rate
                              else:
@@ -839,6 +895,16 @@ def perform_consolidation(request: ConsolidationRequest):
     # Round final balances for cleaner output
     final_consolidated_tb = {acc: round(bal, 2) for acc, bal in consolidated_tb.items()}
     
+    if not request.entity_structure_override and not request.entity_financial_data_override:
+        _notify_consolidation({
+            "organization_id": request.organization_id,
+            "consolidation_group_id": request.consolidation_group_id,
+            "period": request.period,
+            "data_type": request.data_type,
+            "reporting_currency": reporting_currency,
+            "consolidated_trial_balance": final_consolidated_tb,
+        })
+
     return ConsolidatedFinancials(
         period=request.period,
         reporting_currency=reporting_currency, # Added missing reporting_currency
@@ -1049,7 +1115,7 @@ async def get_consolidated_financial_statements(request: ConsolidationRequest):
     if request.coa_mapping_id:
         try:
             map_storage_key = f"{COA_MAPPING_STORAGE_PREFIX}{request.coa_mapping_id}"
-            map_data = db.storage.json.get(sanitize_storage_key(map_storage_key))
+            map_data = storage.json.get(sanitize_storage_key(map_storage_key))
             loaded_coa_map = CoAMapping(**map_data)
             print(f"Successfully loaded CoA Mapping ID: {request.coa_mapping_id} for statement generation.")
         except FileNotFoundError:
@@ -1259,7 +1325,7 @@ def _run_internal_test() -> ConsolidatedFinancials:
     }
     fx_df = pd.DataFrame(fx_data)
     try:
-        db.storage.dataframes.put(fx_key, fx_df)
+        storage.dataframes.put(fx_key, fx_df)
         print("Dummy FX rates saved successfully.")
     except Exception as e:
          print(f"Error saving dummy FX rates: {e}. Test may fail on translation.")
@@ -1,4 +1,4 @@
-import databutton as db
+from app.apis.storage_utils import async_storage
 from fastapi import APIRouter, HTTPException, Depends, status
 from pydantic import BaseModel, Field, field_validator
 from typing import List, Dict, Any, Optional, Annotated
@@ -98,7 +98,7 @@ async def _get_dashboard_doc(user_id: str, dashboard_id: str) -> Optional[Dict[s
     """Fetches a dashboard configuration document from storage."""
     storage_key = create_dashboard_storage_key(user_id, dashboard_id)
     try:
-        doc = db.storage.json.get(storage_key)
+        doc = await async_storage.json.get(storage_key)
         return doc
     except FileNotFoundError:
         return None
@@ -110,7 +110,7 @@ async def _save_dashboard_doc(user_id: str, dashboard_id: str, config_dict: Dict
     """Saves a dashboard configuration document to storage."""
     storage_key = create_dashboard_storage_key(user_id, dashboard_id)
     try:
-        db.storage.json.put(storage_key, config_dict)
+        await async_storage.json.put(storage_key, config_dict)
     except Exception as e:
         print(f"Error saving dashboard {dashboard_id} for user {user_id}: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save dashboard data")
@@ -119,7 +119,7 @@ async def _delete_dashboard_doc(user_id: str, dashboard_id: str):
     """Deletes a dashboard configuration document from storage."""
     storage_key = create_dashboard_storage_key(user_id, dashboard_id)
     try:
-        db.storage.json.delete(storage_key)
+        await async_storage.json.delete(storage_key)
     except FileNotFoundError:
         # If already deleted, consider it a success for idempotency
         pass
@@ -131,7 +131,7 @@ async def _list_user_dashboard_ids(user_id: str) -> List[str]:
     """Lists dashboard IDs owned by a specific user based on storage keys."""
     try:
         prefix_to_match = sanitize_storage_key(f"{STORAGE_KEY_PREFIX}{user_id}-")
-        all_files = db.storage.json.list()
+        all_files = await async_storage.json.list(prefix=prefix_to_match)
         dashboard_ids = []
         for file in all_files:
             if file.name.startswith(prefix_to_match) and file.name.endswith('.json'):
@@ -1,10 +1,14 @@
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Tuple
 import pandas as pd
+import itertools
 import re
 import json
-import databutton as db
+from app.apis.storage_utils import storage
+from app.apis.models import (
+    BenchmarkChunkWriter, benchmark_view_segments, load_benchmark_view, make_benchmark_manifest
+)
+from app.apis.streaming_ingest import iter_csv_chunks, iter_excel_sheets
 from datetime import datetime
-import io
 from fastapi import UploadFile, APIRouter
 
 # Create an empty router to indicate this is not an API
@@ -15,10 +19,139 @@ def sanitize_storage_key(key: str) -> str:
     """Sanitize storage key to only allow alphanumeric and ._- symbols"""
     return re.sub(r'[^a-zA-Z0-9._-]', '', key)
 
+# Vectorized Transformation Helpers
+# Files are transformed column-wise: invalid rows are dropped with boolean masks and
+# the remaining frame is converted to dicts in one Arrow pass. Rows that are dropped
+# are counted per reason and reported in the import metadata.
+
+def _to_float(series: pd.Series, percent_strings: bool = False) -> pd.Series:
+    """
+    Column-wise float conversion; values that cannot be converted become NaN.
+    With percent_strings, strings like "12.5%" are read as 0.125.
+    """
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype(float)
+    text = series.where(series.notna()).astype(object)
+    is_text = text.map(lambda v: isinstance(v, str))
+    stripped = text.where(~is_text, text[is_text].str.strip())
+    if not percent_strings:
+        return pd.to_numeric(stripped, errors='coerce').astype(float)
+    is_percent = is_text & stripped.where(is_text, "").astype(str).str.endswith('%')
+    values = pd.to_numeric(stripped.where(~is_text, stripped[is_text].str.rstrip('%')), errors='coerce')
+    return values.where(~is_percent, values / 100).astype(float)
+
+def _is_label(series: pd.Series, labels: List[str]) -> pd.Series:
+    """Mask of cells whose lowercased text is one of labels (repeated header rows)."""
+    return series.astype(str).str.strip().str.lower().isin(labels) & series.notna()
+
+def _as_text(series: pd.Series) -> pd.Series:
+    return series.astype(object).where(series.notna(), "").astype(str)
+
+def _count_dropped(row_errors: Dict[str, int], reason: str, mask: pd.Series):
+    dropped = int(mask.sum())
+    if dropped:
+        row_errors[reason] = row_errors.get(reason, 0) + dropped
+
+def _first_present(data: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """Per row, the first non-null value among the given columns (NaN if none)."""
+    result = pd.Series(float('nan'), index=data.index, dtype=object)
+    for col in reversed([c for c in columns if c in data.columns]):
+        result = data[col].astype(object).where(data[col].notna(), result)
+    return result
+
+def _to_records(frame: pd.DataFrame, year: str, source_id: str, version: str,
+                optional_columns: Tuple[str, ...] = ('turnover_range',)) -> List[Dict[str, Any]]:
+    """
+    Builds data points from a frame with industry_code, industry_name, metric_name
+    and value columns. Optional columns are only set on rows where they have a value.
+    """
+    import pyarrow as pa
+
+    if frame.empty:
+        return []
+    out = pd.DataFrame({
+        "industry_code": _as_text(frame['industry_code']),
+        "industry_name": _as_text(frame['industry_name']),
+        "metric_name": _as_text(frame['metric_name']),
+        "value": frame['value'].astype(float),
+    })
+    out["year"] = year
+    out["source_id"] = source_id
+    present_optional = [col for col in optional_columns if col in frame.columns and frame[col].notna().any()]
+    for col in present_optional:
+        out[col] = frame[col].astype(object).where(frame[col].notna(), None)
+        out.loc[out[col].notna(), col] = out.loc[out[col].notna(), col].astype(str)
+    out["version"] = version
+
+    # Arrow converts the whole frame to Python dicts far faster than DataFrame.to_dict
+    records = pa.Table.from_pandas(out, preserve_index=False).to_pylist()
+    if present_optional:
+        for record in records:
+            for key in present_optional:
+                if record[key] is None:
+                    del record[key]
+    if 'metadata' in frame.columns:
+        for record, extra in zip(records, frame['metadata'].tolist()):
+            if extra:
+                record["metadata"] = extra
+    return records
+
+def _long_format_points(data: pd.DataFrame, year: str, source_id: str, version: str,
+                        row_errors: Dict[str, int], required: List[str],
+                        default_code: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Rows already holding one metric each (industry_code/industry_name/metric_name/value)."""
+    frame = data.copy()
+    frame['value'] = _to_float(frame['value'])
+    if default_code is not None:
+        if 'industry_code' in frame.columns:
+            frame['industry_code'] = frame['industry_code'].astype(object).where(frame['industry_code'].notna(), default_code)
+        else:
+            frame['industry_code'] = default_code
+    if 'industry_name' not in frame.columns:
+        frame['industry_name'] = ""
+
+    valid = pd.Series(True, index=frame.index)
+    for col in required:
+        missing = valid & frame[col].isna()
+        if col == 'value':
+            # Distinguish empty cells from values that could not be parsed
+            empty = missing & data['value'].isna()
+            _count_dropped(row_errors, "missing_value", empty)
+            _count_dropped(row_errors, "non_numeric_value", missing & ~empty)
+        else:
+            _count_dropped(row_errors, f"missing_{col}", missing)
+        valid &= ~missing
+    return _to_records(frame[valid], year, source_id, version)
+
+def _wide_format_points(data: pd.DataFrame, industry_col: str, metric_cols: List[str], codes: pd.Series,
+                        year: str, source_id: str, version: str, row_errors: Dict[str, int],
+                        turnover: Optional[pd.Series] = None, percent_strings: bool = False) -> List[Dict[str, Any]]:
+    """Rows per industry with one column per metric, unpivoted to one data point per cell."""
+    if not metric_cols:
+        return []
+    values = pd.DataFrame({col: _to_float(data[col], percent_strings) for col in metric_cols}, index=data.index)
+    present = data[metric_cols].notna() & data[metric_cols].astype(str).apply(lambda c: c.str.strip() != "")
+    _count_dropped(row_errors, "non_numeric_value", (present & values.isna()).stack())
+
+    # Unpivot row by row (row-major, same order as the sheet)
+    long = values.stack().rename('value').reset_index(level=1).rename(columns={'level_1': 'metric_name'})
+    long = long[long['value'].notna()]
+    long['metric_name'] = long['metric_name'].astype(str)
+    long['industry_code'] = codes.reindex(long.index)
+    long['industry_name'] = data[industry_col].reindex(long.index)
+    if turnover is not None:
+        long['turnover_range'] = turnover.reindex(long.index)
+    return _to_records(long, year, source_id, version)
+
 # Import File Handlers
-def process_csv_file(file: UploadFile, source_id: str, year: str, version: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+# Files are read from the upload's spooled temporary file in row chunks and each chunk
+# is validated and transformed on its own, so memory does not grow with the file.
+# The iter_* handlers return (batches, metadata): batches yields one list of data
+# points per chunk, and metadata gains row counts and row errors once it is exhausted.
+
+def iter_csv_points(file: UploadFile, source_id: str, year: str, version: str) -> Tuple[Iterator[List[Dict[str, Any]]], Dict[str, Any]]:
     """
-    Process a CSV file into benchmark data points with enhanced validation and transformation
+    Stream a CSV file into batches of benchmark data points
     
     Args:
         file: The uploaded CSV file
@@ -27,11 +160,12 @@ def process_csv_file(file: UploadFile, source_id: str, year: str, version: str)
         version: The version of the import
         
     Returns:
-        Tuple containing processed data points and metadata
+        Tuple containing an iterator of data point batches and metadata
     """
-    # Read the CSV into a pandas DataFrame
-    contents = file.file.read()
-    data = pd.read_csv(io.BytesIO(contents))
+    # The header (and first chunk) is read up front so column problems are known immediately
+    chunks = iter_csv_chunks(file.file)
+    first = next(chunks, None)
+    columns = first.columns.tolist() if first is not None else []
     
     # Generate import metadata
     metadata = {
@@ -40,19 +174,19 @@ def process_csv_file(file: UploadFile, source_id: str, year: str, version: str)
         "source_id": source_id,
         "year": year,
         "version": version,
-        "original_columns": data.columns.tolist(),
-        "row_count": len(data),
-        "column_count": len(data.columns),
+        "original_columns": columns,
+        "row_count": 0,
+        "column_count": len(columns),
         "file_type": "csv"
     }
     
     # Transform data - this would need customization based on the specific CSV format
     # Here's a generic example that assumes the CSV has columns that match our data model
-    data_points = []
     required_columns = ['industry_code', 'industry_name', 'metric_name', 'value']
+    renamed_cols: Dict[str, str] = {}
     
     # Check if all required columns exist
-    missing_columns = [col for col in required_columns if col not in data.columns]
+    missing_columns = [col for col in required_columns if col not in columns]
     if missing_columns:
         # If columns are missing, try to map standard formats
         # Example mapping for ATO Small Business Benchmarks
@@ -65,63 +199,172 @@ def process_csv_file(file: UploadFile, source_id: str, year: str, version: str)
             
             for mapping in possible_mappings:
                 # Try each mapping
-                renamed_cols = {k: v for k, v in mapping.items() if k in data.columns}
-                if len(renamed_cols) >= 3:  # At least 3 columns mapped successfully
-                    data = data.rename(columns=renamed_cols)
+                candidate = {k: v for k, v in mapping.items() if k in columns}
+                if len(candidate) >= 3:  # At least 3 columns mapped successfully
+                    renamed_cols = candidate
                     break
             
             # Check again after mapping
-            missing_columns = [col for col in required_columns if col not in data.columns]
+            columns = [renamed_cols.get(col, col) for col in columns]
+            missing_columns = [col for col in required_columns if col not in columns]
             if missing_columns:
                 metadata['error'] = f"Missing required columns after mapping: {', '.join(missing_columns)}"
-                return [], metadata
+                return iter(()), metadata
         else:
             # For unknown formats, return empty data with error in metadata
             metadata['error'] = f"Missing required columns: {', '.join(missing_columns)}"
-            return [], metadata
+            return iter(()), metadata
+    
+    # Any additional columns in the CSV are kept as string metadata on each data point
+    extra_columns = [col for col in columns if col not in required_columns and col != 'turnover_range']
+    
+    def batches() -> Iterator[List[Dict[str, Any]]]:
+        row_errors: Dict[str, int] = {}
+        processed = 0
+        for data in itertools.chain([first], chunks):
+            metadata['row_count'] += len(data)
+            if renamed_cols:
+                data = data.rename(columns=renamed_cols)
+            if extra_columns:
+                extras = [_as_text(data[col]).astype(object).where(data[col].notna(), None).tolist() for col in extra_columns]
+                data = data.assign(metadata=[
+                    {col: value for col, value in zip(extra_columns, row) if value is not None} or None
+                    for row in zip(*extras)
+                ])
+            
+            data_points = _long_format_points(
+                data, year, source_id, version, row_errors, required=['industry_code', 'metric_name', 'value']
+            )
+            processed += len(data_points)
+            yield data_points
+        
+        metadata['processed_points'] = processed
+        metadata['skipped_rows'] = sum(row_errors.values())
+        metadata['row_errors'] = row_errors
     
-    # Ensure value is a float
-    if 'value' in data.columns:
-        data['value'] = pd.to_numeric(data['value'], errors='coerce')
+    return batches(), metadata
+
+def process_csv_file(file: UploadFile, source_id: str, year: str, version: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Process a CSV file into a list of benchmark data points (see iter_csv_points)"""
+    batches, metadata = iter_csv_points(file, source_id, year, version)
+    data_points = [dp for batch in batches for dp in batch]
+    return data_points, metadata
+
+def _excel_sheet_points(data: pd.DataFrame, source_id: str, year: str, version: str,
+                        row_errors: Dict[str, int]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Transform one chunk of a worksheet into data points.
     
-    # Convert DataFrame to list of dictionaries
-    for _, row in data.iterrows():
-        # Skip rows with missing critical data
-        if pd.isna(row.get('industry_code')) or pd.isna(row.get('metric_name')) or pd.isna(row.get('value')):
-            continue
-            
-        data_point = {
-            "industry_code": str(row.get('industry_code', "")),
-            "industry_name": str(row.get('industry_name', "")),
-            "metric_name": str(row.get('metric_name', "")),
-            "value": float(row.get('value', 0)),
-            "year": year,
-            "source_id": source_id,
-        }
+    Returns:
+        Tuple containing the data points and an error if the sheet format is not recognised
+    """
+    # Perform source-specific transformations
+    if source_id == 'ato_small_business':
+        # Detect ATO format by looking at column names
+        if not any(col in data.columns for col in ['ANZSIC code', 'Industry', 'Industry code', 'Industry name']):
+            return [], "Sheet does not appear to contain ATO benchmark data"
+        industry_col = next((col for col in ['Industry', 'Industry name'] if col in data.columns), None)
+        code_col = next((col for col in ['ANZSIC code', 'Industry code'] if col in data.columns), None)
+        if not (industry_col and code_col):
+            return [], "Could not identify industry code or name columns"
         
-        # Add optional fields if they exist
-        if 'turnover_range' in data.columns and not pd.isna(row.get('turnover_range')):
-            data_point["turnover_range"] = str(row['turnover_range'])
-            
-        # Add version for historical tracking
-        data_point["version"] = version
+        # Skip header or empty rows
+        skip = data[code_col].isna() | data[industry_col].isna()
+        _count_dropped(row_errors, "missing_industry", skip)
+        header = ~skip & (_is_label(data[code_col], ['anzsic', 'code', 'industry code']) |
+                          _is_label(data[industry_col], ['industry', 'description', 'industry name']))
+        _count_dropped(row_errors, "header_row", header)
+        rows = data[~(skip | header)]
         
-        # Add any additional metadata fields that might be in the CSV
-        for col in data.columns:
-            if col not in required_columns and col != 'turnover_range' and not pd.isna(row.get(col)):
-                # Store as metadata
-                if "metadata" not in data_point:
-                    data_point["metadata"] = {}
-                data_point["metadata"][col] = str(row[col])
+        # Metrics come from the remaining column headers; percentages like "12%" become 0.12
+        excluded = [industry_col, code_col, 'Turnover range', 'Annual turnover']
+        metric_cols = [col for col in rows.columns if col not in excluded]
+        return _wide_format_points(
+            rows, industry_col, metric_cols, rows[code_col], year, source_id, version, row_errors,
+            turnover=_first_present(rows, ['Turnover range', 'Annual turnover']), percent_strings=True
+        ), None
+    
+    if source_id == 'abs_industry_stats':
+        # Custom processing for ABS data format
+        # This would need to be tailored to the actual ABS format
+        # Simplified example with common column detection
+        industry_col = next((col for col in ['Industry', 'Industry name', 'Industry Division', 'Division'] if col in data.columns), None)
+        metric_cols = [col for col in data.columns if col not in ['Industry', 'Industry name', 'Industry Division', 'Division', 'Year', 'Code', 'ANZSIC']]
+        if not (industry_col and metric_cols):
+            return [], "Sheet does not appear to contain ABS industry statistics"
         
-        data_points.append(data_point)
+        # Skip header or empty rows
+        skip = data[industry_col].isna()
+        _count_dropped(row_errors, "missing_industry", skip)
+        header = ~skip & _is_label(data[industry_col], ['industry', 'description', 'name'])
+        _count_dropped(row_errors, "header_row", header)
+        rows = data[~(skip | header)]
+        
+        # Industry code from the first code column with a value
+        codes = _first_present(rows, ['Code', 'ANZSIC', 'Industry code'])
+        codes = codes.where(codes.notna(), "unknown")
+        return _wide_format_points(
+            rows, industry_col, metric_cols, codes, year, source_id, version, row_errors
+        ), None
+    
+    # Generic processing for other sources
+    # Assuming a standard format with recognizable columns
+    # First, try to detect column structure
+    industry_col = next((col for col in ['Industry', 'Industry name', 'Business type'] if col in data.columns), None)
+    code_col = next((col for col in ['ANZSIC code', 'Industry code', 'Code'] if col in data.columns), None)
+    metric_col = next((col for col in ['Metric', 'Measure', 'Ratio', 'Indicator'] if col in data.columns), None)
+    value_col = next((col for col in ['Value', 'Result', 'Amount', 'Percentage'] if col in data.columns), None)
+    
+    if industry_col and value_col:
+        # If we have industry and value columns, we can extract data
+        if metric_col:
+            # Format where metrics are in a column
+            frame = pd.DataFrame({
+                "industry_name": data[industry_col],
+                "metric_name": data[metric_col],
+                "value": data[value_col],
+            })
+            if code_col:
+                frame["industry_code"] = data[code_col]
+            if 'Turnover range' in data.columns:
+                frame["turnover_range"] = data['Turnover range']
+            return _long_format_points(
+                frame, year, source_id, version, row_errors,
+                required=['industry_name', 'metric_name', 'value'], default_code="unknown"
+            ), None
+        
+        # Format where columns are metrics
+        metric_cols = [col for col in data.columns if col not in [industry_col, code_col]]
+        
+        skip = data[industry_col].isna()
+        _count_dropped(row_errors, "missing_industry", skip)
+        header = ~skip & _is_label(data[industry_col], ['industry', 'description', 'name'])
+        _count_dropped(row_errors, "header_row", header)
+        rows = data[~(skip | header)]
+        
+        if code_col:
+            codes = rows[code_col].astype(object).where(rows[code_col].notna(), "unknown")
+        else:
+            codes = pd.Series("unknown", index=rows.index)
+        return _wide_format_points(
+            rows, industry_col, metric_cols, codes, year, source_id, version, row_errors
+        ), None
     
-    metadata['processed_points'] = len(data_points)
-    return data_points, metadata
+    # Try standard format with required columns
+    required_columns = ['industry_code', 'industry_name', 'metric_name', 'value']
+    missing_columns = [col for col in required_columns if col not in data.columns]
+    if missing_columns:
+        return [], f"Missing required columns: {', '.join(missing_columns)}"
+    
+    # Process the data with standard column names
+    columns = required_columns + (['turnover_range'] if 'turnover_range' in data.columns else [])
+    return _long_format_points(
+        data[columns], year, source_id, version, row_errors, required=required_columns
+    ), None
 
-def process_excel_file(file: UploadFile, source_id: str, year: str, version: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+def iter_excel_points(file: UploadFile, source_id: str, year: str, version: str) -> Tuple[Iterator[List[Dict[str, Any]]], Dict[str, Any]]:
     """
-    Process an Excel file into benchmark data points with enhanced support for multiple formats
+    Stream an Excel file into batches of benchmark data points, sheet by sheet
     
     Args:
         file: The uploaded Excel file
@@ -130,11 +373,9 @@ def process_excel_file(file: UploadFile, source_id: str, year: str, version: str
         version: The version of the import
         
     Returns:
-        Tuple containing processed data points and metadata
+        Tuple containing an iterator of data point batches and metadata. A file that
+        cannot be read sets metadata['error'] and ends the iteration.
     """
-    # Read the Excel file into a pandas DataFrame
-    contents = file.file.read()
-    
     # Generate import metadata before processing
     metadata = {
         "filename": file.filename,
@@ -146,236 +387,44 @@ def process_excel_file(file: UploadFile, source_id: str, year: str, version: str
         "file_type": "excel"
     }
     
-    try:
-        # Try to read all sheets
-        excel_file = pd.ExcelFile(io.BytesIO(contents))
-        sheet_names = excel_file.sheet_names
-        metadata["sheets"] = sheet_names
-        
-        all_data_points = []
-        
-        # Process each sheet
-        for sheet in sheet_names:
-            data = pd.read_excel(excel_file, sheet_name=sheet)
-            metadata[f"sheet_{sheet}_rows"] = len(data)
-            metadata[f"sheet_{sheet}_columns"] = len(data.columns)
-            metadata[f"sheet_{sheet}_column_names"] = data.columns.tolist()
-            
-            # Perform source-specific transformations
-            if source_id == 'ato_small_business':
-                # Detect ATO format by looking at column names
-                if any(col in data.columns for col in ['ANZSIC code', 'Industry', 'Industry code', 'Industry name']):
-                    industry_col = next((col for col in ['Industry', 'Industry name'] if col in data.columns), None)
-                    code_col = next((col for col in ['ANZSIC code', 'Industry code'] if col in data.columns), None)
-                    
-                    if industry_col and code_col:
-                        # Iterate through rows to extract metrics from column headers
-                        for _, row in data.iterrows():
-                            industry_code = row.get(code_col)
-                            industry_name = row.get(industry_col)
-                            
-                            # Skip header or empty rows
-                            if pd.isna(industry_code) or pd.isna(industry_name) or \
-                               str(industry_code).lower() in ['anzsic', 'code', 'industry code'] or \
-                               str(industry_name).lower() in ['industry', 'description', 'industry name']:
-                                continue
-                                
-                            # Extract turnover range if available
-                            turnover_range = None
-                            if 'Turnover range' in data.columns and not pd.isna(row.get('Turnover range')):
-                                turnover_range = str(row.get('Turnover range'))
-                            elif 'Annual turnover' in data.columns and not pd.isna(row.get('Annual turnover')):
-                                turnover_range = str(row.get('Annual turnover'))
-                            
-                            # Process metrics from remaining columns
-                            for col in data.columns:
-                                if col not in [industry_col, code_col, 'Turnover range', 'Annual turnover']:
-                                    try:
-                                        value = row.get(col)
-                                        if not pd.isna(value) and str(value).strip():
-                                            # Convert percentage strings to floats
-                                            if isinstance(value, str):
-                                                value = value.strip().rstrip('%')
-                                                try:
-                                                    value = float(value) / 100 if '%' in str(row.get(col)) else float(value)
-                                                except ValueError:
-                                                    # Skip non-numeric values
-                                                    continue
-                                            
-                                            data_point = {
-                                                "industry_code": str(industry_code),
-                                                "industry_name": str(industry_name),
-                                                "metric_name": str(col),
-                                                "value": float(value),
-                                                "year": year,
-                                                "source_id": source_id,
-                                                "version": version
-                                            }
-                                            
-                                            if turnover_range:
-                                                data_point["turnover_range"] = turnover_range
-                                                
-                                            all_data_points.append(data_point)
-                                    except (ValueError, TypeError):
-                                        # Skip non-numeric values
-                                        pass
-                    else:
-                        metadata[f"sheet_{sheet}_error"] = "Could not identify industry code or name columns"
-                else:
-                    metadata[f"sheet_{sheet}_error"] = "Sheet does not appear to contain ATO benchmark data"
-            elif source_id == 'abs_industry_stats':
-                # Custom processing for ABS data format
-                # This would need to be tailored to the actual ABS format
-                # Simplified example with common column detection
-                industry_col = next((col for col in ['Industry', 'Industry name', 'Industry Division', 'Division'] if col in data.columns), None)
-                metric_cols = [col for col in data.columns if col not in ['Industry', 'Industry name', 'Industry Division', 'Division', 'Year', 'Code', 'ANZSIC']]
-                
-                if industry_col and metric_cols:
-                    for _, row in data.iterrows():
-                        industry_name = row.get(industry_col)
-                        
-                        # Skip header or empty rows
-                        if pd.isna(industry_name) or str(industry_name).lower() in ['industry', 'description', 'name']:
-                            continue
-                        
-                        # Get industry code if available
-                        industry_code = "unknown"
-                        for code_col in ['Code', 'ANZSIC', 'Industry code']:
-                            if code_col in data.columns and not pd.isna(row.get(code_col)):
-                                industry_code = str(row.get(code_col))
-                                break
-                        
-                        # Process each metric column
-                        for metric_col in metric_cols:
-                            try:
-                                value = row.get(metric_col)
-                                if not pd.isna(value):
-                                    data_point = {
-                                        "industry_code": industry_code,
-                                        "industry_name": str(industry_name),
-                                        "metric_name": str(metric_col),
-                                        "value": float(value),
-                                        "year": year,
-                                        "source_id": source_id,
-                                        "version": version
-                                    }
-                                    all_data_points.append(data_point)
-                            except (ValueError, TypeError):
-                                # Skip non-numeric values
-                                pass
-                else:
-                    metadata[f"sheet_{sheet}_error"] = "Sheet does not appear to contain ABS industry statistics"
-            else:
-                # Generic processing for other sources
-                # Assuming a standard format with recognizable columns
-                # First, try to detect column structure
-                industry_col = next((col for col in ['Industry', 'Industry name', 'Business type'] if col in data.columns), None)
-                code_col = next((col for col in ['ANZSIC code', 'Industry code', 'Code'] if col in data.columns), None)
-                metric_col = next((col for col in ['Metric', 'Measure', 'Ratio', 'Indicator'] if col in data.columns), None)
-                value_col = next((col for col in ['Value', 'Result', 'Amount', 'Percentage'] if col in data.columns), None)
-                
-                if industry_col and value_col:
-                    # If we have industry and value columns, we can extract data
-                    if metric_col:
-                        # Format where metrics are in a column
-                        for _, row in data.iterrows():
-                            try:
-                                industry_name = row.get(industry_col)
-                                metric_name = row.get(metric_col)
-                                value = row.get(value_col)
-                                
-                                if pd.isna(industry_name) or pd.isna(metric_name) or pd.isna(value):
-                                    continue
-                                
-                                industry_code = row.get(code_col) if code_col and not pd.isna(row.get(code_col)) else "unknown"
-                                
-                                data_point = {
-                                    "industry_code": str(industry_code),
-                                    "industry_name": str(industry_name),
-                                    "metric_name": str(metric_name),
-                                    "value": float(value),
-                                    "year": year,
-                                    "source_id": source_id,
-                                    "version": version
-                                }
-                                
-                                # Add turnover range if available
-                                if 'Turnover range' in data.columns and not pd.isna(row.get('Turnover range')):
-                                    data_point["turnover_range"] = str(row.get('Turnover range'))
-                                
-                                all_data_points.append(data_point)
-                            except (ValueError, TypeError):
-                                # Skip invalid rows
-                                pass
-                    else:
-                        # Format where columns are metrics
-                        metric_cols = [col for col in data.columns if col not in [industry_col, code_col]]
-                        
-                        for _, row in data.iterrows():
-                            industry_name = row.get(industry_col)
-                            if pd.isna(industry_name) or str(industry_name).lower() in ['industry', 'description', 'name']:
-                                continue
-                            
-                            industry_code = row.get(code_col) if code_col and not pd.isna(row.get(code_col)) else "unknown"
-                            
-                            for metric in metric_cols:
-                                try:
-                                    value = row.get(metric)
-                                    if not pd.isna(value):
-                                        data_point = {
-                                            "industry_code": str(industry_code),
-                                            "industry_name": str(industry_name),
-                                            "metric_name": str(metric),
-                                            "value": float(value),
-                                            "year": year,
-                                            "source_id": source_id,
-                                            "version": version
-                                        }
-                                        all_data_points.append(data_point)
-                                except (ValueError, TypeError):
-                                    # Skip non-numeric values
-                                    pass
-                else:
-                    # Try standard format with required columns
-                    required_columns = ['industry_code', 'industry_name', 'metric_name', 'value']
-                    missing_columns = [col for col in required_columns if col not in data.columns]
-                    
-                    if missing_columns:
-                        metadata[f"sheet_{sheet}_error"] = f"Missing required columns: {', '.join(missing_columns)}"
-                        continue
+    def batches() -> Iterator[List[Dict[str, Any]]]:
+        row_errors: Dict[str, int] = {}
+        processed = 0
+        try:
+            # Process each sheet
+            for sheet, chunks in iter_excel_sheets(file.file):
+                metadata["sheets"].append(sheet)
+                metadata[f"sheet_{sheet}_rows"] = 0
+                for data in chunks:
+                    if f"sheet_{sheet}_columns" not in metadata:
+                        metadata[f"sheet_{sheet}_columns"] = len(data.columns)
+                        metadata[f"sheet_{sheet}_column_names"] = data.columns.tolist()
+                    metadata[f"sheet_{sheet}_rows"] += len(data)
                     
-                    # Process the data with standard column names
-                    for _, row in data.iterrows():
-                        try:
-                            if pd.isna(row.get('industry_code')) or pd.isna(row.get('industry_name')) or \
-                               pd.isna(row.get('metric_name')) or pd.isna(row.get('value')):
-                                continue
-                                
-                            data_point = {
-                                "industry_code": str(row.get('industry_code')),
-                                "industry_name": str(row.get('industry_name')),
-                                "metric_name": str(row.get('metric_name')),
-                                "value": float(row.get('value')),
-                                "year": year,
-                                "source_id": source_id,
-                                "version": version
-                            }
-                            
-                            # Add optional fields if they exist
-                            if 'turnover_range' in row and not pd.isna(row.get('turnover_range')):
-                                data_point["turnover_range"] = str(row['turnover_range'])
-                                
-                            all_data_points.append(data_point)
-                        except (ValueError, TypeError):
-                            # Skip invalid rows
-                            pass
+                    data_points, error = _excel_sheet_points(data, source_id, year, version, row_errors)
+                    if error:
+                        # The format is decided by the columns, so the rest of the sheet is skipped
+                        metadata[f"sheet_{sheet}_error"] = error
+                        break
+                    processed += len(data_points)
+                    yield data_points
+        except Exception as e:
+            metadata['error'] = str(e)
+            return
         
-        metadata['processed_points'] = len(all_data_points)
-        return all_data_points, metadata
-        
-    except Exception as e:
-        metadata['error'] = str(e)
+        metadata['processed_points'] = processed
+        metadata['skipped_rows'] = sum(row_errors.values())
+        metadata['row_errors'] = row_errors
+    
+    return batches(), metadata
+
+def process_excel_file(file: UploadFile, source_id: str, year: str, version: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Process an Excel file into a list of benchmark data points (see iter_excel_points)"""
+    batches, metadata = iter_excel_points(file, source_id, year, version)
+    data_points = [dp for batch in batches for dp in batch]
+    if metadata.get('error'):
         return [], metadata
+    return data_points, metadata
 
 # Save and Retrieve Functions
 def save_benchmark_import(data_points: List[Dict[str, Any]], metadata: Dict[str, Any]) -> str:
@@ -389,84 +438,103 @@ def save_benchmark_import(data_points: List[Dict[str, Any]], metadata: Dict[str,
     Returns:
         import_id: The ID of the saved import
     """
-    # Generate a unique import ID
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    source_id = metadata.get("source_id", "unknown")
-    import_id = f"{source_id}_{timestamp}"
+    import_id, segment = _save_benchmark_batches([data_points], metadata)
     
     # Add import_id and timestamp to each data point for tracking
     for dp in data_points:
-        dp["import_id"] = import_id
-        dp["timestamp"] = datetime.now().isoformat()
-    
-    # Save metadata
-    metadata_key = sanitize_storage_key(f"benchmark_import_{import_id}_metadata")
-    db.storage.json.put(metadata_key, metadata)
-    
-    # Save data points
-    data_key = sanitize_storage_key(f"benchmark_import_{import_id}_data")
-    db.storage.json.put(data_key, data_points)
+        dp.update(segment["fields"])
+    return import_id
+
+def save_benchmark_import_stream(batches: Iterable[List[Dict[str, Any]]], metadata: Dict[str, Any]) -> Tuple[Optional[str], int]:
+    """
+    Save benchmark data produced batch by batch (see iter_csv_points / iter_excel_points)
+    without holding more than one batch and one storage chunk in memory.
     
-    # Update the main benchmark data store
+    Returns:
+        Tuple of (import_id, number of data points). import_id is None if metadata
+        reports an error once the batches are exhausted; nothing is then recorded.
+    """
+    import_id, segment = _save_benchmark_batches(batches, metadata, abort_on_error=True)
+    return import_id, segment["rows"] if import_id else 0
+
+def _save_benchmark_batches(batches: Iterable[List[Dict[str, Any]]], metadata: Dict[str, Any],
+                            abort_on_error: bool = False) -> Tuple[Optional[str], Dict[str, Any]]:
+    """Stores the batches as chunks, then updates the views; returns (import_id, segment)."""
     version = metadata.get("version", "1.0")
     source_id = metadata.get("source_id")
+    source_key = sanitize_storage_key(f"benchmark_data_{source_id}")
+    all_key = sanitize_storage_key("benchmark_data_all")
+    imports_key = sanitize_storage_key("benchmark_imports")
+    
+    # Store the rows once, as content-addressed chunks; every view below only references
+    # them. Rows are stored without the per-import tracking fields so that unchanged
+    # rows hash to chunks that already exist.
+    writer = BenchmarkChunkWriter(source_id, version)
+    for batch in batches:
+        writer.add([{k: v for k, v in dp.items() if k not in ("import_id", "timestamp")} for dp in batch])
+    segment = writer.finish()
+    # Chunks written before a failure are left unreferenced rather than half-imported
+    if abort_on_error and metadata.get("error"):
+        return None, segment
+    
+    source_segments = benchmark_view_segments(storage.json.get(source_key, default=list)) if source_id else []
+    
+    # Re-importing the data already current for this source and version is a no-op
+    for current in source_segments:
+        existing_import_id = current.get("fields", {}).get("import_id")
+        if existing_import_id and current.get("version") == version and current.get("content_hash") == segment["content_hash"]:
+            print(f"Benchmark data for {source_id} v{version} is unchanged; keeping import {existing_import_id}")
+            segment["fields"] = current["fields"]
+            return existing_import_id, segment
+    
+    # Generate a unique import ID
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    import_id = f"{metadata.get('source_id', 'unknown')}_{timestamp}"
+    segment["fields"] = {"import_id": import_id, "timestamp": datetime.now().isoformat()}
     
+    # Import metadata and data manifest
+    metadata_key = sanitize_storage_key(f"benchmark_import_{import_id}_metadata")
+    data_key = sanitize_storage_key(f"benchmark_import_{import_id}_data")
+    writes = {metadata_key: metadata, data_key: make_benchmark_manifest([segment])}
     if source_id:
-        # Get existing data for this source
-        source_key = sanitize_storage_key(f"benchmark_data_{source_id}")
-        existing_data = db.storage.json.get(source_key, default=[])
-        
-        # Remove data points with the same version if it exists
-        if version:
-            # Keep historical data points with different versions
-            existing_data = [dp for dp in existing_data if dp.get("version") != version]
-        
-        # Add the new data points
-        existing_data.extend(data_points)
-        
-        # Save the updated data
-        db.storage.json.put(source_key, existing_data)
-        
-        # Also save version-specific data for this source
+        # Also reference the data from the version-specific view for this source
         version_key = sanitize_storage_key(f"benchmark_data_{source_id}_v{version}")
-        db.storage.json.put(version_key, data_points)
-        
-        # Update the consolidated store
-        all_key = sanitize_storage_key("benchmark_data_all")
-        all_data = db.storage.json.get(all_key, default=[])
-        
-        # Remove existing data points for this source and version
-        all_data = [dp for dp in all_data if not (dp.get("source_id") == source_id and dp.get("version") == version)]
-        
-        # Add the new data points
-        all_data.extend(data_points)
-        
-        # Save the updated consolidated data
-        db.storage.json.put(all_key, all_data)
+        writes[version_key] = make_benchmark_manifest([segment])
+    storage.json.put_many(writes)
     
-    # Keep track of imports
-    imports_key = sanitize_storage_key("benchmark_imports")
-    imports = db.storage.json.get(imports_key, default=[])
+    # Views shared with other imports are changed with compare-and-swap, so imports of
+    # other sources (or versions) running at the same time keep their segments
+    def replace_segments(view: Any, replaced: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+        kept = [s for s in benchmark_view_segments(view) if not replaced(s)]
+        return make_benchmark_manifest(kept + [segment])
+    
+    if source_id:
+        # Keep historical segments with different versions and add the new one
+        storage.json.update(source_key, lambda view: replace_segments(
+            view, lambda s: s.get("version") == version), default=list)
+        # Update the consolidated store, replacing this source and version
+        storage.json.update(all_key, lambda view: replace_segments(
+            view, lambda s: s.get("source_id") == source_id and s.get("version") == version), default=list)
     
+    # Keep track of imports
     import_summary = {
         "import_id": import_id,
         "source_id": metadata.get("source_id", "unknown"),
         "timestamp": metadata.get("timestamp"),
         "filename": metadata.get("filename", "unknown"),
-        "data_points": len(data_points),
+        "data_points": segment["rows"],
         "year": metadata.get("year", "unknown"),
         "version": version,
-        "status": "success" if data_points else "error",
+        "status": "success" if segment["rows"] else "error",
         "error": metadata.get("error")
     }
     
-    imports.append(import_summary)
-    db.storage.json.put(imports_key, imports)
+    storage.json.update(imports_key, lambda imports: imports + [import_summary], default=list)
     
     # Update the source's last_updated timestamp
     update_source_timestamp(source_id)
     
-    return import_id
+    return import_id, segment
 
 def update_source_timestamp(source_id: str):
     """
@@ -497,7 +565,7 @@ def get_benchmark_imports(source_id: Optional[str] = None, limit: int = 100) ->
         List of import summaries
     """
     imports_key = sanitize_storage_key("benchmark_imports")
-    imports = db.storage.json.get(imports_key, default=[])
+    imports = storage.json.get(imports_key, default=[])
     
     # Filter by source_id if provided
     if source_id:
@@ -521,11 +589,11 @@ def get_import_details(import_id: str) -> Dict[str, Any]:
     """
     # Get metadata
     metadata_key = sanitize_storage_key(f"benchmark_import_{import_id}_metadata")
-    metadata = db.storage.json.get(metadata_key, default={})
+    metadata = storage.json.get(metadata_key, default={})
     
     # Get import summary
     imports_key = sanitize_storage_key("benchmark_imports")
-    imports = db.storage.json.get(imports_key, default=[])
+    imports = storage.json.get(imports_key, default=[])
     summary = next((imp for imp in imports if imp.get("import_id") == import_id), {})
     
     # Combine metadata and summary
@@ -533,7 +601,7 @@ def get_import_details(import_id: str) -> Dict[str, Any]:
     
     # Add sample data
     data_key = sanitize_storage_key(f"benchmark_import_{import_id}_data")
-    data = db.storage.json.get(data_key, default=[])
+    data = load_benchmark_view(data_key, limit=10)
     
     return {
         "import_details": summary,
@@ -0,0 +1,196 @@
+"""
+Columnar copy of imported financial data.
+
+financial_import saves each import as JSON rows (inline, in parts, or as changes to
+an earlier import). Readers that only need a few columns or accounts should not have
+to resolve and parse all of it, so every import is also stored here as one Parquet
+frame under `financial_columns/{storage_key}`:
+
+- typed columns: amounts as float64, flags as bool, `period` as a date, and text
+  (account_code, account_name, category, item_name, entity_id, ...) as dictionary-
+  encoded categoricals
+- rows sorted by the account column (account_code for trial balances, item_name for
+  P&L and balance sheets), so Parquet row-group statistics act as a clustered index
+- an account index under `financial_columns_index/{storage_key}` listing the accounts
+  (code -> name) and columns, so a read for accounts an import does not have skips the
+  frame entirely
+
+    frame = read_import_frame(storage_key, columns=["account_code", "balance"], accounts=["4000", "5000"])
+
+The copy is written when an import is saved (via register_import_change_listener)
+and, for imports saved before this store existed, on first read. It is deleted with
+the import (via register_import_delete_listener).
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+from fastapi import APIRouter
+
+from app.apis.financial_import import (
+    FinancialDataType, get_latest_import, load_import_data, register_import_change_listener,
+    register_import_delete_listener,
+)
+from app.apis.storage_utils import storage
+
+# Create an empty router to indicate this is not an API
+router = APIRouter()
+
+FINANCIAL_COLUMNS_PREFIX = "financial_columns/"
+FINANCIAL_COLUMNS_INDEX_PREFIX = "financial_columns_index/"
+FINANCIAL_COLUMNS_BY_ENTITY_INDEX = "financial_columns_by_entity"
+
+AMOUNT_COLUMNS = ("debit", "credit", "balance", "amount")
+FLAG_COLUMNS = ("is_intercompany",)
+
+storage.json.register_index(
+    FINANCIAL_COLUMNS_BY_ENTITY_INDEX,
+    FINANCIAL_COLUMNS_INDEX_PREFIX,
+    lambda value: value.get("business_entity_id") if isinstance(value, dict) else None,
+)
+
+
+def _frame_key(storage_key: str) -> str:
+    return FINANCIAL_COLUMNS_PREFIX + storage_key
+
+
+def _index_key(storage_key: str) -> str:
+    return FINANCIAL_COLUMNS_INDEX_PREFIX + storage_key
+
+
+def account_column(data_type: str) -> str:
+    """Column identifying an account in imports of data_type."""
+    return "account_code" if str(getattr(data_type, "value", data_type)) == FinancialDataType.TRIAL_BALANCE.value else "item_name"
+
+
+def _column_frame(rows: List[Dict[str, Any]], business_entity_id: str, period: str) -> pd.DataFrame:
+    df = pd.DataFrame(rows)
+    for column in df.columns:
+        if column in AMOUNT_COLUMNS:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+        elif column in FLAG_COLUMNS:
+            df[column] = df[column].fillna(False).astype(bool)
+        elif pd.api.types.is_bool_dtype(df[column]) or pd.api.types.is_float_dtype(df[column]):
+            continue
+        else:
+            # Text and codes (including integer-looking ones) become dictionary-encoded strings
+            df[column] = df[column].astype("string").astype("category")
+    df["entity_id"] = pd.Series([business_entity_id] * len(df), dtype="category")
+    df["period"] = pd.Series([pd.to_datetime(period, errors="coerce")] * len(df), dtype="datetime64[ns]")
+    return df
+
+
+def write_import_columns(record: Dict[str, Any], rows: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Stores the columnar copy and account index of a saved import record (rows are
+    resolved from the record if not given). Returns the account index.
+    """
+    storage_key = record["storage_key"]
+    if rows is None:
+        rows = load_import_data(record)
+    key_column = account_column(record.get("data_type"))
+    df = _column_frame(rows, record.get("business_entity_id"), record.get("date"))
+
+    accounts: Dict[str, Optional[str]] = {}
+    if key_column in df.columns:
+        name_column = "account_name" if "account_name" in df.columns else None
+        names = df[name_column] if name_column else pd.Series([None] * len(df))
+        for code, name in zip(df[key_column], names):
+            if pd.notna(code) and code not in accounts:
+                accounts[code] = name if pd.notna(name) else None
+    storage.dataframes.put(_frame_key(storage_key), df, sort_by=[key_column] if key_column in df.columns else None)
+
+    index = {
+        "storage_key": storage_key,
+        "import_id": record.get("import_id"),
+        "organization_id": record.get("organization_id"),
+        "business_entity_id": record.get("business_entity_id"),
+        "data_type": str(getattr(record.get("data_type"), "value", record.get("data_type"))),
+        "period": record.get("date"),
+        "timestamp": record.get("timestamp"),
+        "account_column": key_column,
+        "columns": df.columns.tolist(),
+        "row_count": len(df),
+        "accounts": accounts,
+    }
+    storage.json.put(_index_key(storage_key), index)
+    return index
+
+
+def get_import_index(storage_key: str) -> Dict[str, Any]:
+    """
+    Account index of an import, building the columnar copy first if the import
+    predates it. Raises FileNotFoundError if there is no such import.
+    """
+    try:
+        return storage.json.get(_index_key(storage_key))
+    except FileNotFoundError:
+        record = storage.json.get(storage_key)
+        return write_import_columns(dict(record, storage_key=storage_key))
+
+
+def read_import_frame(storage_key: str, columns: Optional[List[str]] = None,
+                      accounts: Optional[Iterable[Any]] = None) -> pd.DataFrame:
+    """
+    The import's rows as a DataFrame, limited to `columns` (those the import has) and to
+    the rows of `accounts`, matched against the account column as strings. Only the
+    requested columns, and row groups that can hold the requested accounts, are read.
+    Raises FileNotFoundError if there is no such import.
+    """
+    index = get_import_index(storage_key)
+    if columns is not None:
+        columns = [column for column in dict.fromkeys(columns) if column in index["columns"]]
+
+    filters = None
+    if accounts is not None:
+        wanted = [account for account in dict.fromkeys(str(a) for a in accounts if a is not None)
+                  if account in index["accounts"]]
+        if not wanted:
+            return pd.DataFrame(columns=columns if columns is not None else index["columns"])
+        filters = [(index["account_column"], "in", wanted)]
+    return storage.dataframes.get(_frame_key(storage_key), columns=columns, filters=filters)
+
+
+def find_import(organization_id: str, business_entity_id: str, data_type: str, period: str) -> Optional[str]:
+    """Storage key of the latest import of a period, if any."""
+    latest = get_latest_import(organization_id, business_entity_id, data_type, period)
+    return latest["storage_key"] if latest else None
+
+
+def find_entity_imports(business_entity_id: str, data_type: Optional[str] = None,
+                        period: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Account indexes of an entity's imports (optionally of one data type and period),
+    for callers that know the entity but not its organization.
+    """
+    keys = [entry.name for entry in storage.json.list_by_index(FINANCIAL_COLUMNS_BY_ENTITY_INDEX, business_entity_id)]
+    indexes = storage.json.get_many(keys)
+    data_type = str(getattr(data_type, "value", data_type)) if data_type is not None else None
+    return [
+        index for index in (indexes[key] for key in keys if key in indexes)
+        if (data_type is None or index.get("data_type") == data_type)
+        and (period is None or index.get("period") == period)
+    ]
+
+
+def delete_import_columns(storage_key: str):
+    # The index goes first: find_entity_imports then never lists an import without its frame
+    for delete, key in ((storage.json.delete, _index_key(storage_key)),
+                        (storage.dataframes.delete, _frame_key(storage_key))):
+        try:
+            delete(key)
+        except FileNotFoundError:
+            pass
+
+
+def _on_import_change(change: Dict[str, Any]):
+    record = storage.json.get(change["storage_key"])
+    write_import_columns(dict(record, storage_key=change["storage_key"]))
+
+
+def _on_import_delete(change: Dict[str, Any]):
+    delete_import_columns(change["storage_key"])
+
+
+register_import_change_listener(_on_import_change)
+register_import_delete_listener(_on_import_delete)
@@ -1,21 +1,42 @@
 from fastapi import APIRouter, UploadFile, File, Query, HTTPException, Form, Request # Added Request
 from enum import Enum
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Iterator, Optional, Any, Tuple, Callable, Union
+from collections import Counter
 import pandas as pd
 import io
 import json
-import databutton as db
+import hashlib
+import os
+from app.apis.storage_utils import storage
+from app.apis.streaming_ingest import (
+    detect_csv_encoding, hash_upload, iter_csv_chunks, open_stored_upload, profile_csv, store_upload
+)
+from app.apis.import_jobs import (
+    STATUS_FAILED, ImportJobContext, ImportJobLeaseLost, get_import_job, register_import_job_handler,
+    submit_import_job
+)
+from fastapi.concurrency import run_in_threadpool
 import uuid
 import re
 from datetime import datetime
 from pathlib import Path
 import pytz # Added for timezone handling
 from app.auth import AuthorizedUser
-from app.apis.utils import log_audit_event # Correct import
+from app.apis.utils import log_audit_event, log_audit_event_async # Correct import
 
 router = APIRouter(prefix="/financial-import")
 
+UPLOAD_METADATA_PREFIX = "temp_uploads/"
+UPLOAD_METADATA_BY_ORG_INDEX = "financial_import_metadata_by_org"
+
+# Upload metadata is looked up by organization without scanning every stored key
+storage.json.register_index(
+    UPLOAD_METADATA_BY_ORG_INDEX,
+    UPLOAD_METADATA_PREFIX,
+    lambda metadata: metadata.get("organization_id"),
+)
+
 
 def sanitize_storage_key(key: str) -> str:
     """Sanitize storage key to only allow alphanumeric and ._- symbols"""
@@ -81,7 +102,7 @@ async def upload_financial_data_legacy(
         upload_id = f"upload_{uuid.uuid4().hex}"
 
         # Save the dataframe temporarily
-        db.storage.dataframes.put(sanitize_storage_key(upload_id), df)
+        storage.dataframes.put(sanitize_storage_key(upload_id), df)
 
         # Get preview data
         preview_rows = df.head(5).to_dict(orient="records")
@@ -108,30 +129,33 @@ def process_financial_data(
 ):
     """Process the uploaded financial data using the provided column mappings"""
     try:
-        # Retrieve the uploaded dataframe
-        df = db.storage.dataframes.get(sanitize_storage_key(request.upload_id))
+        # Retrieve only the mapped columns of the uploaded dataframe
+        source_columns = list(dict.fromkeys(m.source_column for m in payload.mappings))
+        df = storage.dataframes.get(sanitize_storage_key(payload.upload_id), columns=source_columns)
         if df is None or df.empty:
             raise HTTPException(status_code=404, detail="Uploaded data not found")
 
         # Apply column mappings
-        mapped_data = transform_data(df, request)
+        mapped_data = transform_data(df, payload)
 
         # Generate an import ID
         import_id = f"import_{uuid.uuid4().hex}"
 
-        # Save the processed data
-        save_imported_data(
+        # Save the processed data (only the rows that changed since the period's previous import)
+        saved = save_imported_data(
             import_id=import_id,
-            organization_id=request.organization_id,
-            business_entity_id=request.business_entity_id, # Pass entity ID
-            data_type=request.data_type,
-            import_date=request.date, # Pass date
+            organization_id=payload.organization_id,
+            business_entity_id=payload.business_entity_id, # Pass entity ID
+            data_type=payload.data_type,
+            import_date=payload.date, # Pass date
             data=mapped_data
         )
+        import_id = saved["import_id"]
 
         response = ImportResponse(
             success=True,
-            message="Data imported successfully",
+            message=(f"No changes since import {saved['duplicate_of']}; existing import returned"
+                     if saved["duplicate_of"] else "Data imported successfully"),
             import_id=import_id,
             item_count=len(mapped_data)
         )
@@ -143,7 +167,9 @@ def process_financial_data(
             "organization_id": payload.organization_id,
             "business_entity_id": payload.business_entity_id,
             "data_type": payload.data_type,
-            "item_count": len(mapped_data)
+            "item_count": len(mapped_data),
+            "stored_rows": saved["stored_rows"],
+            "duplicate_of": saved["duplicate_of"],
         }
         log_audit_event(
             user_identifier=user.sub,
@@ -301,28 +327,677 @@ def transform_balance_sheet(df: pd.DataFrame) -> List[Dict]:
         return df.to_dict(orient="records")
 
 
+def _import_storage_key(organization_id: str, business_entity_id: str, data_type: str, import_id: str) -> str:
+    return sanitize_storage_key(f"{organization_id}_{business_entity_id}_{data_type}_{import_id}")
+
+
+def _import_part_key(storage_key: str, index: int) -> str:
+    return f"{storage_key}_part{index:05d}"
+
+
+def _import_manifest_key(storage_key: str, index: int) -> str:
+    return f"{storage_key}_manifest{index:05d}"
+
+
+# --- Deduplication and Change Detection ---
+# Every import is compared with the previous import of the same (organization, entity,
+# data type, period). Its manifest lists the key (account code, or category + item
+# name) and content hash of each row, in order, and which rows differ from the previous
+# import. When most rows are unchanged the import stores only the changed rows and
+# reads the rest from the previous import (`base_key`); an import with nothing changed
+# is not stored again. Re-uploads of an identical file are recognised by the file's
+# sha256 before it is stored or parsed.
+
+# Imports stored as changes on top of changes at most this deep (reads resolve the chain)
+IMPORT_DELTA_MAX_CHAIN = int(os.environ.get("IMPORT_DELTA_MAX_CHAIN", "5"))
+# An import with a larger fraction of changed rows is stored in full
+IMPORT_DELTA_MAX_CHANGED_FRACTION = float(os.environ.get("IMPORT_DELTA_MAX_CHANGED_FRACTION", "0.5"))
+
+UPLOAD_CONTENT_PREFIX = "upload_content/"
+IMPORT_FINGERPRINT_PREFIX = "import_fingerprints/"
+IMPORT_SERIES_PREFIX = "import_series/"
+# import_id -> storage key of the import record, for lookups by id alone
+IMPORT_ID_PREFIX = "import_ids/"
+# Repeated row keys within one import are numbered: "<key>\x1f1", "<key>\x1f2", ...
+_DUPLICATE_KEY_SEPARATOR = "\x1f"
+
+_import_change_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def register_import_change_listener(listener: Callable[[Dict[str, Any]], None]):
+    """
+    Registers a callback run after an import is saved, with {"organization_id",
+    "business_entity_id", "data_type", "period", "import_id", "storage_key",
+    "previous_import_id", "changed_keys"}. changed_keys lists the row keys (account codes for trial balances)
+    that were added, changed or removed, or is None if everything should be treated
+    as changed. Imports identical to the previous one are not reported.
+    """
+    _import_change_listeners.append(listener)
+
+
+def _notify_import_change(change: Dict[str, Any]):
+    for listener in _import_change_listeners:
+        try:
+            listener(change)
+        except Exception as e:
+            print(f"Import change listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+
+_import_delete_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def register_import_delete_listener(listener: Callable[[Dict[str, Any]], None]):
+    """
+    Registers a callback run after an import is deleted, with {"organization_id",
+    "business_entity_id", "data_type", "period", "import_id", "storage_key"}, so copies
+    and caches of it can be dropped.
+    """
+    _import_delete_listeners.append(listener)
+
+
+def _notify_import_delete(change: Dict[str, Any]):
+    for listener in _import_delete_listeners:
+        try:
+            listener(change)
+        except Exception as e:
+            print(f"Import delete listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+
+def _row_key(data_type: str, row: Dict[str, Any]) -> str:
+    if data_type == FinancialDataType.TRIAL_BALANCE:
+        return str(row.get("account_code"))
+    return f"{row.get('category')}|{row.get('item_name')}"
+
+
+def _row_hash(row: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(row, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _series_key(organization_id: str, business_entity_id: str, data_type: str, period: str) -> str:
+    return IMPORT_SERIES_PREFIX + sanitize_storage_key(f"{organization_id}_{business_entity_id}_{data_type}_{period}")
+
+
+def _import_id_key(import_id: str) -> str:
+    return IMPORT_ID_PREFIX + sanitize_storage_key(import_id)
+
+
+def get_latest_import(organization_id: str, business_entity_id: str, data_type: str, period: str) -> Optional[Dict[str, Any]]:
+    """{"import_id", "storage_key", "item_count"} of the latest import of a period, if any."""
+    try:
+        return storage.json.get(_series_key(organization_id, business_entity_id, data_type, period), fresh=True)
+    except FileNotFoundError:
+        return None
+
+
+def _load_manifests(manifest_keys: List[str]) -> List[Dict[str, Any]]:
+    manifests = storage.json.get_many(manifest_keys, default=dict)
+    return [manifests[key] for key in manifest_keys]
+
+
+def _import_base(latest: Optional[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, str]]]:
+    """The previous import's record and row hashes by key, if it has a manifest to compare with."""
+    if not latest:
+        return None, None
+    try:
+        record = storage.json.get(latest["storage_key"])
+    except FileNotFoundError:
+        return None, None
+    if not record.get("manifest_parts"):
+        return record, None
+    hashes: Dict[str, str] = {}
+    for manifest in _load_manifests(record["manifest_parts"]):
+        hashes.update(zip(manifest["keys"], manifest["hashes"]))
+    return record, hashes
+
+
+class ImportRowWriter:
+    """
+    Builds the manifest of an import batch by batch, comparing each row with the
+    previous import's hashes. add() returns the rows to store for the batch (all of
+    them, or only the changed ones when `store_changes_only`) and its manifest.
+    `occurrences` counts the rows seen per key so far; a resumed job passes back the
+    counts it checkpointed, so repeated keys are numbered as in an uninterrupted run.
+    """
+
+    def __init__(self, data_type: str, base_hashes: Optional[Dict[str, str]], store_changes_only: bool = False,
+                 occurrences: Optional[Dict[str, int]] = None):
+        self.data_type = data_type
+        self.base_hashes = base_hashes
+        self.store_changes_only = store_changes_only and base_hashes is not None
+        self.occurrences: Counter = Counter(occurrences or {})
+
+    def add(self, rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        keys, hashes, changed = [], [], []
+        for position, row in enumerate(rows):
+            key = _row_key(self.data_type, row)
+            occurrence = self.occurrences[key]
+            self.occurrences[key] += 1
+            if occurrence:
+                key = f"{key}{_DUPLICATE_KEY_SEPARATOR}{occurrence}"
+            row_hash = _row_hash(row)
+            keys.append(key)
+            hashes.append(row_hash)
+            if self.base_hashes is None or self.base_hashes.get(key) != row_hash:
+                changed.append(position)
+        manifest = {"keys": keys, "hashes": hashes, "changed": changed if self.base_hashes is not None else None}
+        stored = [rows[position] for position in changed] if self.store_changes_only else rows
+        return stored, manifest
+
+
+def _changed_keys(manifests: List[Dict[str, Any]], base_hashes: Optional[Dict[str, str]]) -> Optional[List[str]]:
+    """Keys added, changed or removed since the previous import (None if there was nothing to compare)."""
+    if base_hashes is None or any(manifest.get("changed") is None for manifest in manifests):
+        return None
+    changed = set()
+    seen = set()
+    for manifest in manifests:
+        seen.update(manifest["keys"])
+        changed.update(manifest["keys"][position] for position in manifest["changed"])
+    changed.update(key for key in base_hashes if key not in seen)
+    return sorted({key.split(_DUPLICATE_KEY_SEPARATOR)[0] for key in changed})
+
+
+def load_import_data(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The rows of a saved import, whether stored inline, in parts, or as changes to a base import."""
+    if "data_parts" in record:
+        parts = storage.json.get_many(record["data_parts"], default=list)
+        rows = [row for part_key in record["data_parts"] for row in parts[part_key]]
+    else:
+        rows = record.get("data") or []
+    if not record.get("base_key"):
+        return rows
+
+    try:
+        base = storage.json.get(record["base_key"])
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Import {record.get('import_id')} is stored as changes to {record['base_key']}, "
+                                f"which no longer exists (imports must be removed with delete_import)")
+    base_keys = [key for manifest in _load_manifests(base["manifest_parts"]) for key in manifest["keys"]]
+    base_rows = dict(zip(base_keys, load_import_data(base)))
+    # Unchanged rows have the same key and hash as in the base, so they are taken from it
+    own_rows = iter(rows)
+    result = []
+    for manifest in _load_manifests(record["manifest_parts"]):
+        changed = set(manifest["changed"])
+        for position, key in enumerate(manifest["keys"]):
+            result.append(next(own_rows) if position in changed else base_rows[key])
+    return result
+
+
+def _store_parts_in_full(storage_key: str, manifests: List[Dict[str, Any]], base_record: Dict[str, Any],
+                         base_hashes: Dict[str, str]) -> None:
+    """
+    Rewrites the parts of a job import that were stored as changes to `base_record`
+    so each holds all of its rows. A part that already does (a retried rewrite, or
+    one in which every row changed) is left as it is.
+    """
+    part_keys = [_import_part_key(storage_key, i) for i in range(len(manifests))]
+    parts = storage.json.get_many(part_keys, default=list)
+    base_rows = dict(zip(base_hashes, load_import_data(base_record)))
+    full_parts = {}
+    for part_key, manifest in zip(part_keys, manifests):
+        if len(parts[part_key]) == len(manifest["keys"]):
+            continue
+        own_rows = iter(parts[part_key])
+        changed = set(manifest["changed"])
+        full_parts[part_key] = [next(own_rows) if position in changed else base_rows[key]
+                                for position, key in enumerate(manifest["keys"])]
+    if full_parts:
+        storage.json.put_many(full_parts)
+
+
+def _add_dependent(base_key: str, storage_key: str) -> Dict[str, Any]:
+    """
+    Records on the base import that `storage_key` is stored as changes to it, so
+    delete_import can keep the delta readable. Raises FileNotFoundError if the base
+    is gone. Returns the base record.
+    """
+    def add(base: Dict[str, Any]):
+        dependents = base.setdefault("dependents", [])
+        if storage_key not in dependents:
+            dependents.append(storage_key)
+    return storage.json.update(base_key, add)
+
+
+def _materialize_import(storage_key: str):
+    """Rewrites a delta import with all of its rows, so it no longer reads from its base."""
+    record = storage.json.get(storage_key, fresh=True)
+    if not record.get("base_key"):
+        return
+    rows = load_import_data(record)
+    old_parts = record.get("data_parts") or []
+    if "data_parts" in record:
+        # One part per manifest, written under new keys so readers of the current parts are unaffected
+        manifests = _load_manifests(record["manifest_parts"])
+        new_parts: Dict[str, List[Dict[str, Any]]] = {}
+        start = 0
+        for manifest in manifests:
+            new_parts[_import_part_key(storage_key, len(old_parts) + len(new_parts))] = rows[start:start + len(manifest["keys"])]
+            start += len(manifest["keys"])
+        storage.json.put_many(new_parts)
+        record["data_parts"] = list(new_parts)
+    else:
+        record["data"] = rows
+    record.pop("base_key")
+    record.pop("chain", None)
+    storage.json.put(storage_key, record)
+    for part_key in old_parts:
+        storage.json.delete(part_key)
+
+
+def delete_import(storage_key: str):
+    """
+    Deletes a saved import with its parts and manifests, then notifies the delete
+    listeners. Imports stored as changes to it are first rewritten in full (their
+    manifests stay, so deltas on top of them keep working), and it is taken off its
+    own base's dependents.
+    """
+    try:
+        record = storage.json.get(storage_key, fresh=True)
+    except FileNotFoundError:
+        return
+    for dependent_key in record.get("dependents") or []:
+        try:
+            _materialize_import(dependent_key)
+        except FileNotFoundError:
+            pass  # Already deleted
+
+    storage.json.delete(storage_key)
+    storage.json.delete(_import_id_key(record["import_id"]))
+    for key in (record.get("data_parts") or []) + (record.get("manifest_parts") or []):
+        storage.json.delete(key)
+    if record.get("base_key"):
+        try:
+            storage.json.update(record["base_key"], lambda base: base.update(
+                dependents=[key for key in base.get("dependents") or [] if key != storage_key]))
+        except FileNotFoundError:
+            pass
+    series_key = _series_key(record["organization_id"], record["business_entity_id"], record["data_type"], record["date"])
+    latest = storage.json.get(series_key, default=dict, fresh=True)
+    if latest.get("storage_key") == storage_key:
+        storage.json.delete(series_key)
+    _notify_import_delete({
+        "organization_id": record["organization_id"],
+        "business_entity_id": record["business_entity_id"],
+        "data_type": record["data_type"],
+        "period": record["date"],
+        "import_id": record["import_id"],
+        "storage_key": storage_key,
+    })
+
+
 def save_imported_data(
     import_id: str, 
     organization_id: str, 
     business_entity_id: str, # Added
     data_type: FinancialDataType, 
     import_date: str, # Added
-    data: List[Dict]
-):
-    """Save imported and processed financial data"""
+    data: Optional[List[Dict]] = None,
+    data_parts: Optional[Union[int, List[str]]] = None,
+    item_count: Optional[int] = None,
+    manifest_parts: Optional[int] = None,
+    base_key: Optional[str] = None,
+    changed_keys: Optional[List[str]] = None,
+    duplicate_of: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Save imported and processed financial data. Background imports write their rows
+    (and manifests) in parts (see _import_part_key) and pass the number of parts, or
+    the part keys in order, instead of data; with base_key the parts only hold the rows that changed since that import.
+    They also pass the changes they found (changed_keys, duplicate_of).
+
+    Rows passed as `data` are compared with the previous import of the period: if none
+    changed, nothing is saved and `duplicate_of` names that import; if few changed,
+    only those are stored. Returns {"import_id", "item_count", "stored_rows",
+    "duplicate_of", "changed_keys"}.
+    """
     # Create storage key based on org ID, entity ID, data type and import ID
-    storage_key = sanitize_storage_key(f"{organization_id}_{business_entity_id}_{data_type}_{import_id}") # Updated key format
+    storage_key = _import_storage_key(organization_id, business_entity_id, data_type, import_id) # Updated key format
+    latest = get_latest_import(organization_id, business_entity_id, data_type, import_date)
     
-    # Save as JSON in storage
-    db.storage.json.put(storage_key, {
+    record = {
         "import_id": import_id,
         "organization_id": organization_id,
         "business_entity_id": business_entity_id, # Added field
         "data_type": data_type,
         "date": import_date, # Added import date
         "timestamp": pd.Timestamp.now().isoformat(),
-        "data": data
+    }
+    if data_parts is None:
+        data = data or []
+        base_record, base_hashes = _import_base(latest if latest and latest["import_id"] != import_id else None)
+        stored, manifest = ImportRowWriter(data_type, base_hashes, store_changes_only=True).add(data)
+        changed_keys = _changed_keys([manifest], base_hashes)
+        if changed_keys == []:
+            print(f"Import {import_id} is identical to {latest['import_id']}; not stored again")
+            return {"import_id": latest["import_id"], "item_count": len(data), "stored_rows": 0,
+                    "duplicate_of": latest["import_id"], "changed_keys": []}
+        as_delta = (
+            base_hashes is not None
+            and base_record.get("chain", 0) < IMPORT_DELTA_MAX_CHAIN
+            and len(stored) <= IMPORT_DELTA_MAX_CHANGED_FRACTION * max(len(data), 1)
+        )
+        record["data"] = stored if as_delta else data
+        record["manifest_parts"] = [_import_manifest_key(storage_key, 0)]
+        record["item_count"] = len(data)
+        if as_delta:
+            record["base_key"] = latest["storage_key"]
+            record["chain"] = _add_dependent(latest["storage_key"], storage_key).get("chain", 0) + 1
+        storage.json.put(record["manifest_parts"][0], manifest)
+    else:
+        if isinstance(data_parts, int):
+            data_parts = [_import_part_key(storage_key, i) for i in range(data_parts)]
+        record["data_parts"] = list(data_parts)
+        record["item_count"] = item_count
+        if manifest_parts is not None:
+            record["manifest_parts"] = [_import_manifest_key(storage_key, i) for i in range(manifest_parts)]
+        if base_key:
+            record["base_key"] = base_key
+            record["chain"] = _add_dependent(base_key, storage_key).get("chain", 0) + 1
+        if duplicate_of:
+            record["duplicate_of"] = duplicate_of
+    
+    # Save as JSON in storage
+    storage.json.put(storage_key, record)
+    storage.json.put(_import_id_key(import_id), {"import_id": import_id, "storage_key": storage_key})
+    stored_rows = len(record.get("data") or []) if data_parts is None else None
+    if duplicate_of:
+        return {"import_id": import_id, "item_count": record["item_count"], "stored_rows": stored_rows,
+                "duplicate_of": duplicate_of, "changed_keys": []}
+
+    storage.json.put(_series_key(organization_id, business_entity_id, data_type, import_date), {
+        "import_id": import_id,
+        "storage_key": storage_key,
+        "item_count": record["item_count"],
     })
+    _notify_import_change({
+        "organization_id": organization_id,
+        "business_entity_id": business_entity_id,
+        "data_type": str(getattr(data_type, "value", data_type)),
+        "period": import_date,
+        "import_id": import_id,
+        "storage_key": storage_key,
+        "previous_import_id": latest["import_id"] if latest and latest["import_id"] != import_id else None,
+        "changed_keys": changed_keys,
+    })
+    return {"import_id": import_id, "item_count": record["item_count"], "stored_rows": stored_rows,
+            "duplicate_of": None, "changed_keys": changed_keys}
+
+
+def _import_fingerprint(payload: "ImportMappingRequest", content_sha256: str) -> str:
+    """Identifies an import by the uploaded file's content and everything that shapes its rows."""
+    spec = payload.model_dump(exclude={"upload_id"})
+    spec["content_sha256"] = content_sha256
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _upload_content_key(scope: str, data_type: str, content_sha256: str) -> str:
+    return UPLOAD_CONTENT_PREFIX + sanitize_storage_key(f"{scope}_{data_type}_{content_sha256}")
+
+
+def _find_duplicate_upload(scope: str, data_type: str, content_sha256: str) -> Optional[Dict[str, Any]]:
+    """Metadata of an earlier upload of the same file by the same organization (or user), if still stored."""
+    try:
+        upload_id = storage.json.get(_upload_content_key(scope, data_type, content_sha256))["upload_id"]
+        return storage.json.get(f"{UPLOAD_METADATA_PREFIX}{upload_id}/metadata.json")
+    except FileNotFoundError:
+        return None
+
+
+def _remember_upload_content(scope: str, data_type: str, content_sha256: str, upload_id: str):
+    storage.json.put(_upload_content_key(scope, data_type, content_sha256), {"upload_id": upload_id})
+
+
+# --- Background Import Jobs ---
+# POST /jobs runs the same mapping and transformation as /process as a background job
+# (see app.apis.import_jobs). The upload is re-read from storage in chunks; each chunk
+# is transformed and written as its own part, then checkpointed, so a restarted job
+# continues after the last part it wrote.
+
+FINANCIAL_IMPORT_JOB_TYPE = "financial_import"
+# Mapped fields that are coerced to numbers (non-numeric values are imported as 0)
+AMOUNT_FIELDS = ("debit", "credit", "amount")
+# Row errors listed per chunk; the rest are only counted
+MAX_ROW_ERRORS_PER_CHUNK = 20
+
+
+class ImportJobSubmitted(BaseModel):
+    job_id: str
+    import_id: str
+    status: str
+    duplicate: bool = False # The same file was already imported with the same mapping; its job is returned
+
+
+def _upload_source(upload_id: str) -> Optional[Dict[str, Any]]:
+    """Stored raw file, encoding and row count of an upload made through /upload or /upload-for-organization."""
+    try:
+        metadata = storage.json.get(f"{UPLOAD_METADATA_PREFIX}{upload_id}/metadata.json", default=None)
+    except FileNotFoundError:
+        return None
+    if not metadata or not metadata.get("temp_file_key"):
+        return None
+    # Uploads stored before files were split into parts are a single blob at temp_file_key
+    descriptor = metadata.get("temp_file") or {"key": metadata["temp_file_key"]}
+    encoding = metadata.get("encoding") or detect_csv_encoding(open_stored_upload(descriptor))
+    return {"descriptor": descriptor, "encoding": encoding, "row_count": metadata.get("row_count")}
+
+
+def _iter_upload_chunks(upload_id: str, columns: List[str], chunk_rows: int,
+                        skip_rows: int) -> Tuple[Iterator[pd.DataFrame], Optional[int]]:
+    """
+    Chunks of the given columns of an upload, starting after skip_rows data rows,
+    and the upload's total row count if known.
+    """
+    source = _upload_source(upload_id)
+    if source is not None:
+        wanted = set(columns)
+        chunks = iter_csv_chunks(
+            open_stored_upload(source["descriptor"]), chunk_rows, source["encoding"],
+            usecols=lambda column: column in wanted,
+            # A callable keeps memory flat however many rows are skipped
+            skiprows=(lambda line: 0 < line <= skip_rows) if skip_rows else None,
+        )
+        return chunks, source["row_count"]
+
+    # Uploads from /upload-legacy are stored as a dataframe
+    df = storage.dataframes.get(sanitize_storage_key(upload_id), columns=columns)
+    if df is None or df.empty:
+        raise FileNotFoundError(f"Uploaded data {upload_id} not found")
+    return (df.iloc[start:start + chunk_rows] for start in range(skip_rows, len(df), chunk_rows)), len(df)
+
+
+def _amount_errors(chunk: pd.DataFrame, payload: ImportMappingRequest, first_row: int) -> Tuple[List[str], int]:
+    """Values in mapped amount columns that are not numeric (they are imported as 0)."""
+    messages: List[str] = []
+    total = 0
+    for mapping in payload.mappings:
+        if mapping.target_field not in AMOUNT_FIELDS or mapping.source_column not in chunk.columns:
+            continue
+        values = chunk[mapping.source_column]
+        bad = values.notna() & pd.to_numeric(values, errors='coerce').isna()
+        total += int(bad.sum())
+        for position in bad.to_numpy().nonzero()[0][:MAX_ROW_ERRORS_PER_CHUNK - len(messages)]:
+            # Row numbers as seen in the file (the header is row 1)
+            messages.append(f"Row {first_row + int(position) + 2}: non-numeric {mapping.target_field} "
+                            f"'{values.iloc[position]}' imported as 0")
+    return messages, total
+
+
+def run_financial_import_job(job: ImportJobContext) -> Dict[str, Any]:
+    """Import job handler: maps, transforms and stores an upload chunk by chunk."""
+    payload = ImportMappingRequest(**job.params["request"])
+    import_id = job.params["import_id"]
+    user_id = job.params.get("user_id") or "system"
+    storage_key = _import_storage_key(payload.organization_id, payload.business_entity_id, payload.data_type, import_id)
+    log_details = {
+        "import_id": import_id,
+        "job_id": job.job_id,
+        "upload_id": payload.upload_id,
+        "organization_id": payload.organization_id,
+        "business_entity_id": payload.business_entity_id,
+        "data_type": payload.data_type,
+    }
+
+    try:
+        rows_done = job.checkpoint.get("rows", 0)
+        parts = job.checkpoint.get("parts", 0)
+        item_count = job.checkpoint.get("items", 0)
+
+        occurrences = job.checkpoint.get("occurrences")
+
+        # The import compared with is chosen once; a resumed job keeps comparing with it
+        if "base_key" in job.checkpoint:
+            base_key = job.checkpoint["base_key"]
+            base_record, base_hashes = _import_base({"storage_key": base_key} if base_key else None)
+            if base_key and base_hashes is None:
+                # Deleted since: the parts written so far may only hold the rows that differ from it
+                print(f"Import {import_id}: base import {base_key} no longer exists; starting over in full")
+                rows_done = parts = item_count = 0
+                occurrences, base_key = None, None
+        else:
+            latest = get_latest_import(payload.organization_id, payload.business_entity_id, payload.data_type, payload.date)
+            base_record, base_hashes = _import_base(latest)
+            base_key = latest["storage_key"] if base_hashes is not None else None
+        as_delta = base_hashes is not None and base_record.get("chain", 0) < IMPORT_DELTA_MAX_CHAIN
+        writer = ImportRowWriter(payload.data_type, base_hashes, store_changes_only=as_delta, occurrences=occurrences)
+
+        source_columns = list(dict.fromkeys(m.source_column for m in payload.mappings))
+        chunks, rows_total = _iter_upload_chunks(payload.upload_id, source_columns, job.chunk_rows, rows_done)
+        job.set_total(rows_total)
+
+        for chunk in chunks:
+            errors, error_count = _amount_errors(chunk, payload, rows_done)
+            mapped_data = transform_data(chunk.copy(), payload)
+            stored, manifest = writer.add(mapped_data)
+            # Written before the checkpoint: a retried chunk overwrites the same part
+            storage.json.put_many({
+                _import_part_key(storage_key, parts): stored,
+                _import_manifest_key(storage_key, parts): manifest,
+            })
+            parts += 1
+            rows_done += len(chunk)
+            item_count += len(mapped_data)
+            job.commit({"rows": rows_done, "parts": parts, "items": item_count, "base_key": base_key,
+                        "occurrences": dict(writer.occurrences)},
+                       rows=len(chunk), errors=errors, error_count=error_count)
+
+        manifest_keys = [_import_manifest_key(storage_key, i) for i in range(parts)]
+        manifests = _load_manifests(manifest_keys)
+        changed_keys = _changed_keys(manifests, base_hashes)
+        changed_rows = sum(len(manifest["changed"] or []) for manifest in manifests)
+        if as_delta and changed_rows > IMPORT_DELTA_MAX_CHANGED_FRACTION * max(item_count, 1):
+            # Most rows changed: as in save_imported_data, a full record reads faster than the base chain
+            print(f"Import {import_id}: {changed_rows} of {item_count} rows changed; storing it in full")
+            _store_parts_in_full(storage_key, manifests, base_record, base_hashes)
+            as_delta = False
+        saved = save_imported_data(
+            import_id=import_id,
+            organization_id=payload.organization_id,
+            business_entity_id=payload.business_entity_id,
+            data_type=payload.data_type,
+            import_date=payload.date,
+            data_parts=parts,
+            item_count=item_count,
+            manifest_parts=parts,
+            base_key=base_key if as_delta else None,
+            changed_keys=changed_keys,
+            duplicate_of=base_record["import_id"] if changed_keys == [] else None,
+        )
+    except ImportJobLeaseLost:
+        raise
+    except Exception as e:
+        log_details["error"] = f"Unhandled exception: {str(e)}"
+        log_audit_event(
+            user_identifier=user_id,
+            action_type="FINANCIAL_DATA_PROCESS",
+            status="FAILURE",
+            target_object_type="IMPORT",
+            target_object_id=import_id,
+            details=log_details
+        )
+        raise
+
+    log_details["item_count"] = item_count
+    log_details["duplicate_of"] = saved["duplicate_of"]
+    log_details["changed_keys"] = None if changed_keys is None else len(changed_keys)
+    log_audit_event(
+        user_identifier=user_id,
+        action_type="FINANCIAL_DATA_PROCESS",
+        status="SUCCESS",
+        target_object_type="IMPORT",
+        target_object_id=import_id,
+        details=log_details
+    )
+    return {"import_id": import_id, "item_count": item_count, "storage_key": storage_key, "parts": parts,
+            "duplicate_of": saved["duplicate_of"], "changed_keys": None if changed_keys is None else len(changed_keys)}
+
+
+register_import_job_handler(FINANCIAL_IMPORT_JOB_TYPE, run_financial_import_job)
+
+
+@router.post("/jobs", response_model=ImportJobSubmitted, status_code=202)
+def submit_financial_import_job(
+    payload: ImportMappingRequest,
+    user: AuthorizedUser,
+    request: Request
+):
+    """
+    Queue processing of an uploaded file as a background job. Returns immediately;
+    progress is reported by GET /import-jobs/{job_id}. Submitting a file that was
+    already imported with the same mapping returns the earlier job instead.
+    """
+    metadata_key = f"{UPLOAD_METADATA_PREFIX}{payload.upload_id}/metadata.json"
+    try:
+        metadata = storage.json.get(metadata_key)
+    except FileNotFoundError:
+        metadata = None
+    content_sha256 = ((metadata or {}).get("temp_file") or {}).get("sha256")
+    fingerprint_key = IMPORT_FINGERPRINT_PREFIX + _import_fingerprint(payload, content_sha256) if content_sha256 else None
+
+    log_details = {
+        "upload_id": payload.upload_id,
+        "organization_id": payload.organization_id,
+        "business_entity_id": payload.business_entity_id,
+        "data_type": payload.data_type,
+    }
+    if fingerprint_key:
+        previous = storage.json.get(fingerprint_key, default=dict)
+        previous_job = get_import_job(previous["job_id"]) if previous else None
+        if previous_job and previous_job["status"] != STATUS_FAILED:
+            print(f"Upload {payload.upload_id} was already imported as {previous['import_id']}")
+            log_audit_event(
+                user_identifier=user.sub,
+                action_type="FINANCIAL_DATA_PROCESS_QUEUED",
+                status="SUCCESS",
+                request=request,
+                target_object_type="IMPORT",
+                target_object_id=previous["import_id"],
+                details={**log_details, "job_id": previous["job_id"], "duplicate": True}
+            )
+            return ImportJobSubmitted(job_id=previous["job_id"], import_id=previous["import_id"],
+                                      status=previous_job["status"], duplicate=True)
+
+    import_id = f"import_{uuid.uuid4().hex}"
+    job = submit_import_job(
+        FINANCIAL_IMPORT_JOB_TYPE,
+        {"import_id": import_id, "request": payload.model_dump(), "user_id": user.sub},
+        organization_id=payload.organization_id,
+        user_id=user.sub,
+    )
+    if fingerprint_key:
+        storage.json.put(fingerprint_key, {"import_id": import_id, "job_id": job["job_id"]})
+    if metadata is not None:
+        storage.json.update(metadata_key, lambda stored: stored.update(last_import_id=import_id), default=dict)
+    log_audit_event(
+        user_identifier=user.sub,
+        action_type="FINANCIAL_DATA_PROCESS_QUEUED",
+        status="SUCCESS",
+        request=request,
+        target_object_type="IMPORT",
+        target_object_id=import_id,
+        details={**log_details, "job_id": job["job_id"]}
+    )
+    return ImportJobSubmitted(job_id=job["job_id"], import_id=import_id, status=job["status"])
 
 
 # Define the structure expected by the frontend
@@ -344,20 +1019,22 @@ def list_imports(organization_id: str):
     
     imports_list = []
     try:
-        # List all metadata files potentially related to imports
-        # We assume metadata files are stored like 'temp_uploads/{upload_id}/metadata.json'
-        all_metadata_files = db.storage.json.list()
-        # Filter for files that seem to be metadata files in the temp structure
+        # Metadata files are stored like 'temp_uploads/{upload_id}/metadata.json'
+        # and indexed by their organization_id
+        org_metadata_files = storage.json.list_by_index(UPLOAD_METADATA_BY_ORG_INDEX, organization_id)
         potential_metadata_keys = [
-            f.name for f in all_metadata_files 
-            if f.name.startswith("temp_uploads/") and f.name.endswith("/metadata.json")
+            f.name for f in org_metadata_files
+            if f.name.endswith("/metadata.json")
         ]
         
         print(f"Found {len(potential_metadata_keys)} potential metadata files.")
+        metadata_docs = storage.json.get_many(potential_metadata_keys)
 
         for metadata_key in potential_metadata_keys:
             try:
-                metadata = db.storage.json.get(metadata_key)
+                if metadata_key not in metadata_docs:
+                    raise FileNotFoundError(metadata_key)
+                metadata = metadata_docs[metadata_key]
                 # Check if the metadata belongs to the requested organization
                 if metadata.get("organization_id") == organization_id:
                     # Map metadata to the FinancialImport structure
@@ -402,9 +1079,51 @@ class UploadResponseData(BaseModel):
     columns: list[str]
     preview_rows: list[dict[str, Any]]
     row_count: int
+    is_duplicate: bool = False # Same file as an earlier upload; upload_id is that upload's
+    existing_import_id: Optional[str] = None # Latest import processed from that upload
     # organization_id: str | None = None # Keep track if needed later
 
 
+async def _duplicate_upload_response(
+    metadata: Dict[str, Any],
+    file: UploadFile,
+    user: AuthorizedUser,
+    request: Request,
+    action_type: str
+) -> UploadResponseData:
+    """Response for a re-upload of a stored file: the earlier upload is returned instead of a new one."""
+    preview_rows = metadata.get("preview_rows")
+    if preview_rows is None and metadata.get("columns"):
+        # Uploads stored before previews were kept in the metadata
+        _, preview_rows, _, _ = await run_in_threadpool(profile_csv, file.file)
+    print(f"Upload of {file.filename} is identical to upload {metadata['upload_id']}; reusing it")
+    await log_audit_event_async(
+        user_identifier=user.sub,
+        action_type=action_type,
+        status="SUCCESS",
+        request=request,
+        target_object_type="UPLOAD",
+        target_object_id=metadata["upload_id"],
+        details={
+            "organization_id": metadata.get("organization_id"),
+            "filename": file.filename,
+            "data_type": metadata.get("data_type"),
+            "duplicate": True,
+            "existing_import_id": metadata.get("last_import_id"),
+        }
+    )
+    return UploadResponseData(
+        upload_id=metadata["upload_id"],
+        file_name=file.filename,
+        data_type=metadata.get("data_type"),
+        columns=metadata.get("columns") or [],
+        preview_rows=preview_rows or [],
+        row_count=metadata.get("row_count") or 0,
+        is_duplicate=True,
+        existing_import_id=metadata.get("last_import_id"),
+    )
+
+
 @router.post("/upload-for-organization", response_model=UploadResponseData)
 async def upload_organization_financial_data(
     user: AuthorizedUser, # Added for audit logging, placed first
@@ -439,10 +1158,17 @@ async def upload_organization_financial_data(
     columns = []
     preview_rows = []
     row_count = 0
+    encoding = None
 
     try:
-        # Read file content into memory (consider streaming for large files)
-        content = await file.read()
+        # A file this organization already uploaded is not stored or parsed again
+        content_sha256 = await run_in_threadpool(hash_upload, file.file)
+        existing_upload = await run_in_threadpool(_find_duplicate_upload, organization_id, data_type, content_sha256)
+        if existing_upload:
+            return await _duplicate_upload_response(existing_upload, file, user, request, "ORG_FINANCIAL_DATA_UPLOAD")
+
+        # The upload is already spooled to disk; it is copied to storage and parsed in chunks
+        # from there, so it is never read into memory whole.
 
         # --- Process the file based on data_type ---
         if data_type == "budget":
@@ -456,34 +1182,19 @@ async def upload_organization_financial_data(
             # Consider saving budget files to a different storage path if needed:
             # temp_file_key = f"temp_budget_uploads/{upload_id}/{safe_filename}"
             # metadata_key = f"temp_budget_uploads/{upload_id}/metadata.json"
-            # db.storage.binary.put(temp_file_key, content) 
+            # storage.binary.put(temp_file_key, content) 
             # --> Sticking to the same temp path for now for simplicity.
-            db.storage.binary.put(temp_file_key, content)
-            print(f"Temporary BUDGET file saved to: {temp_file_key}")
+            temp_file = await run_in_threadpool(store_upload, temp_file_key, file.file)
+            print(f"Temporary BUDGET file saved to: {temp_file_key} ({len(temp_file['parts'])} part(s))")
 
         elif data_type == "trial_balance":
             print(f"Processing TRIAL_BALANCE file: {file.filename}")
-            db.storage.binary.put(temp_file_key, content) # Save the raw file first
-            print(f"Temporary TRIAL_BALANCE file saved to: {temp_file_key}")
+            temp_file = await run_in_threadpool(store_upload, temp_file_key, file.file) # Save the raw file first
+            print(f"Temporary TRIAL_BALANCE file saved to: {temp_file_key} ({len(temp_file['parts'])} part(s))")
             try:
-                # Use BytesIO to treat the byte content as a file for pandas
-                file_like_object = io.BytesIO(content)
-                # Attempt to read CSV, be robust to encoding issues
-                try:
-                    df = pd.read_csv(file_like_object)
-                except UnicodeDecodeError:
-                    # Try common alternative encoding
-                    file_like_object.seek(0) # Reset stream position
-                    df = pd.read_csv(file_like_object, encoding='latin1')
-                
-                # Limit preview rows for performance
-                preview_limit = 5 
-                preview_df = df.head(preview_limit)
-
-                columns = df.columns.tolist()
-                # Convert preview rows to dict format, handle potential NaN/NaT values
-                preview_rows = preview_df.fillna('').to_dict('records') 
-                row_count = len(df)
+                # Columns, a 5 row preview (NaN as '') and the row count in one chunked pass;
+                # falls back to latin1 if the file is not valid UTF-8
+                columns, preview_rows, row_count, encoding = await run_in_threadpool(profile_csv, file.file)
                 print(f"CSV processed: {row_count} rows, {len(columns)} columns. Preview generated.")
 
             except pd.errors.EmptyDataError:
@@ -509,13 +1220,17 @@ async def upload_organization_financial_data(
             "original_filename": file.filename,
             "safe_filename": safe_filename,
             "temp_file_key": temp_file_key,
+            "temp_file": temp_file, # Stored parts, size and sha256 of the raw file
             "data_type": data_type,
             "organization_id": organization_id, # Store the org ID
             "columns": columns,
             "row_count": row_count,
+            "encoding": encoding, # Detected CSV encoding, so the file can be re-read without sniffing
+            "preview_rows": preview_rows, # Returned again if the same file is re-uploaded
             "upload_timestamp": datetime.utcnow().isoformat() + "Z",
         }
-        db.storage.json.put(metadata_key, metadata)
+        storage.json.put(metadata_key, metadata)
+        _remember_upload_content(organization_id, data_type, temp_file["sha256"], upload_id)
         print(f"Upload metadata saved to: {metadata_key}")
 
 
@@ -539,7 +1254,7 @@ async def upload_organization_financial_data(
             "columns": columns,
             "metadata_key": metadata_key
         }
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="ORG_FINANCIAL_DATA_UPLOAD",
             status="SUCCESS",
@@ -559,7 +1274,7 @@ async def upload_organization_financial_data(
             "data_type": data_type,
             "error": f"HTTPException: {http_err.status_code} - {http_err.detail}"
         }
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="ORG_FINANCIAL_DATA_UPLOAD",
             status="FAILURE",
@@ -575,8 +1290,8 @@ async def upload_organization_financial_data(
         error_message = f"Internal server error during file upload processing: {e}"
         print(f"Unhandled error during upload for org {organization_id}: {e}")
         # Clean up any partially saved data if possible (optional)
-        # db.storage.binary.delete(temp_file_key)
-        # db.storage.json.delete(metadata_key)
+        # storage.binary.delete(temp_file_key)
+        # storage.json.delete(metadata_key)
         
         # Audit failed upload (generic Exception)
         log_details = {
@@ -585,7 +1300,7 @@ async def upload_organization_financial_data(
             "data_type": data_type,
             "error": f"Unhandled exception: {str(e)}"
         }
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="ORG_FINANCIAL_DATA_UPLOAD",
             status="FAILURE",
@@ -632,25 +1347,22 @@ async def upload_financial_data(
         "upload_id": upload_id
     }
 
+    # Wizard uploads have no organization yet, so re-uploads are matched per user
+    duplicate_scope = f"user_{user.sub}"
+
     try:
-        content = await file.read()
-        db.storage.binary.put(temp_file_key, content)
-        print(f"Temporary file saved to: {temp_file_key}")
+        content_sha256 = await run_in_threadpool(hash_upload, file.file)
+        existing_upload = await run_in_threadpool(_find_duplicate_upload, duplicate_scope, data_type, content_sha256)
+        if existing_upload:
+            return await _duplicate_upload_response(existing_upload, file, user, request, "FINANCIAL_DATA_UPLOAD")
+
+        # Copied from the spooled upload in parts, never read into memory whole
+        temp_file = await run_in_threadpool(store_upload, temp_file_key, file.file)
+        print(f"Temporary file saved to: {temp_file_key} ({len(temp_file['parts'])} part(s))")
 
-        # Process CSV
+        # Process CSV in chunks
         try:
-            file_like_object = io.BytesIO(content)
-            try:
-                df = pd.read_csv(file_like_object)
-            except UnicodeDecodeError:
-                 file_like_object.seek(0)
-                 df = pd.read_csv(file_like_object, encoding='latin1')
-            
-            preview_limit = 5 
-            preview_df = df.head(preview_limit)
-            columns = df.columns.tolist()
-            preview_rows = preview_df.fillna('').to_dict('records') 
-            row_count = len(df)
+            columns, preview_rows, row_count, encoding = await run_in_threadpool(profile_csv, file.file)
             print(f"CSV processed: {row_count} rows, {len(columns)} columns. Preview generated.")
             csv_processing_error = None
         except pd.errors.EmptyDataError:
@@ -658,13 +1370,14 @@ async def upload_financial_data(
             columns = []
             preview_rows = []
             row_count = 0
+            encoding = None
             csv_processing_error = "Empty CSV file"
         except Exception as csv_err:
             csv_processing_error = f"CSV processing error: {str(csv_err)}"
             print(f"Error processing CSV file: {csv_err}")
             # Log failure immediately if CSV processing fails
             log_details["error"] = csv_processing_error
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=user.sub, 
                 action_type="FINANCIAL_DATA_UPLOAD",
                 status="FAILURE",
@@ -681,14 +1394,18 @@ async def upload_financial_data(
             "original_filename": file.filename,
             "safe_filename": safe_filename,
             "temp_file_key": temp_file_key,
+            "temp_file": temp_file,
             "data_type": data_type,
             "organization_id": None, # Explicitly null for wizard uploads initially
             "columns": columns,
             "row_count": row_count,
+            "encoding": encoding,
+            "preview_rows": preview_rows,
             "upload_timestamp": datetime.utcnow().replace(tzinfo=pytz.utc).isoformat(),
             "csv_processing_error": csv_processing_error # Store potential non-fatal processing issues
         }
-        db.storage.json.put(metadata_key, metadata)
+        storage.json.put(metadata_key, metadata)
+        _remember_upload_content(duplicate_scope, data_type, temp_file["sha256"], upload_id)
         print(f"Upload metadata saved to: {metadata_key}")
 
         response_data = UploadResponseData(
@@ -706,7 +1423,7 @@ async def upload_financial_data(
             "columns_detected": len(columns),
             "metadata_key": metadata_key
         })
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="FINANCIAL_DATA_UPLOAD",
             status="SUCCESS",
@@ -721,7 +1438,7 @@ async def upload_financial_data(
         # Log specific validation errors (e.g., bad file type checked before try block)
         # This might catch errors from the initial checks if they are moved inside the try later
         log_details["error"] = f"HTTP Error: {http_exc.status_code} - {http_exc.detail}"
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="FINANCIAL_DATA_UPLOAD",
             status="FAILURE",
@@ -737,7 +1454,7 @@ async def upload_financial_data(
         error_message = f"Internal server error during file upload processing: {e}"
         print(f"Unhandled error during wizard upload: {e}")
         log_details["error"] = f"Unhandled exception: {str(e)}"
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub, 
             action_type="FINANCIAL_DATA_UPLOAD",
             status="FAILURE",
@@ -753,33 +1470,22 @@ async def upload_financial_data(
 
 def list_imports(organization_id: str):
     """List all imports for an organization"""
-    # List all files in storage
-    all_files = db.storage.json.list()
-    
-    # Filter for files that match the organization
-    org_imports = []
-    for file in all_files:
-        if file.name.startswith(sanitize_storage_key(organization_id)):
-            org_imports.append(file.name)
-    
-    return org_imports
+    # List files stored under the organization's key prefix
+    all_files = storage.json.list(prefix=sanitize_storage_key(organization_id))
+    return [file.name for file in all_files]
 
 
 @router.get("/imports/{import_id}")
 def get_import(import_id: str):
     """Get imported data by import ID"""
-    # List all files in storage
-    all_files = db.storage.json.list()
-    
-    # Find the file containing this import ID
-    import_file = None
-    for file in all_files:
-        if import_id in file.name:
-            import_file = file.name
-            break
-    
-    if not import_file:
+    try:
+        storage_key = storage.json.get(_import_id_key(import_id))["storage_key"]
+        record = storage.json.get(storage_key)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Import not found")
-    
-    # Return the imported data
-    return db.storage.json.get(import_file)
+
+    # Return the imported data, joining parts and rows kept from the previous import
+    record["data"] = load_import_data(record)
+    for internal_field in ("data_parts", "manifest_parts", "base_key", "chain", "dependents"):
+        record.pop(internal_field, None)
+    return record
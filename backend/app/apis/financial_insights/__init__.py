@@ -4,6 +4,8 @@ from typing import List, Dict, Any, Optional, Union, Literal
 import numpy as np
 from datetime import datetime, date
 
+from app.apis.actuals_timeseries import read_actuals
+
 router = APIRouter()
 
 # Models for request and response
@@ -20,6 +22,7 @@ class FinancialMetric(BaseModel):
     target_value: Optional[float] = None
     unit: Optional[str] = None  # e.g., "$", "%", etc.
     data_points: Optional[List[FinancialDataPoint]] = None
+    account: Optional[str] = None  # Read data_points from the stored actuals of this account (needs entity_id)
     metadata: Optional[Dict[str, Any]] = None
 
 class InsightRequest(BaseModel):
@@ -29,6 +32,11 @@ class InsightRequest(BaseModel):
     company_size: Optional[str] = None  # e.g., "small", "medium", "large"
     time_period: Optional[str] = None  # e.g., "Q2 2023", "FY 2023"
     context: Optional[Dict[str, Any]] = None
+    # Stored actuals for metrics sent with an account instead of data_points
+    entity_id: Optional[str] = None
+    data_type: str = "trial_balance"
+    history_start: Optional[date] = None
+    history_end: Optional[date] = None
 
 class Insight(BaseModel):
     title: str
@@ -505,6 +513,17 @@ async def generate_insights(request: InsightRequest) -> InsightResponse:
     if not request.metrics:
         raise HTTPException(status_code=400, detail="No metrics provided for analysis")
     
+    # Histories of metrics that name an account are read from the stored actuals in one batch
+    stored = [m for m in request.metrics if m.data_points is None and m.account]
+    if stored and request.entity_id:
+        history = read_actuals(request.entity_id, request.data_type, [m.account for m in stored],
+                               start=request.history_start, end=request.history_end)
+        for metric in stored:
+            metric.data_points = [
+                FinancialDataPoint(date=timestamp.date(), value=float(value))
+                for timestamp, value in history[metric.account].dropna().items()
+            ]
+    
     # Analyze each metric
     analyses = [analyze_metric(metric) for metric in request.metrics]
     
@@ -3,11 +3,24 @@ from typing import Dict, List, Optional, Any, Union, Tuple
 from fastapi import APIRouter, HTTPException
 from datetime import datetime, date
 import math
+import re
 import numpy as np
+import pandas as pd
 from app.apis.financial_health_indicators import get_financial_health_indicators
+from app.apis.actuals_timeseries import read_actuals, record_actuals
+from app.apis.storage_utils import storage
 
 router = APIRouter()
 
+# Calculated scores are kept as monthly series in the actuals store, keyed by company
+SCORE_SERIES_DATA_TYPE = "financial_score"
+OVERALL_SCORE_SERIES = "overall"
+SCORE_PROFILE_PREFIX = "financial_score_profile/"
+
+
+def _score_profile_key(company_id: str) -> str:
+    return SCORE_PROFILE_PREFIX + re.sub(r'[^a-zA-Z0-9._-]', '_', company_id)
+
 # Define models for the scoring API
 class FinancialMetric(BaseModel):
     name: str
@@ -462,6 +475,14 @@ def calculate_financial_score(company_data: CompanyData) -> ScoreResponse:
     
     # Get overall interpretation
     overall_interpretation, _ = get_interpretation_and_suggestions(overall_score_value, "overall")
+
+    # Record the scores for trend analysis
+    calculation_date = datetime.now()
+    score_values = {OVERALL_SCORE_SERIES: overall_score_value}
+    score_values.update({category: score.score for category, score in category_scores.items()})
+    record_actuals(company_data.company_id, SCORE_SERIES_DATA_TYPE, calculation_date, score_values)
+    storage.json.put(_score_profile_key(company_data.company_id),
+                     {"industry": company_data.industry, "size": company_data.size})
     
     # Create response
     overall = OverallScore(
@@ -475,7 +496,7 @@ def calculate_financial_score(company_data: CompanyData) -> ScoreResponse:
         company_id=company_data.company_id,
         industry=company_data.industry,
         size=company_data.size,
-        calculation_date=datetime.now(),
+        calculation_date=calculation_date,
         overall_score=overall,
         industry_average=industry_average,
         industry_median=industry_median,
@@ -487,58 +508,21 @@ def calculate_financial_score(company_data: CompanyData) -> ScoreResponse:
 @router.post("/trend-analysis")
 def analyze_score_trends(request: TrendAnalysisRequest) -> TrendAnalysisResponse:
     """Analyze trends in financial health scores over time"""
-    # In a real implementation, this would query a database of historical scores
-    # For this demo, we'll create synthetic data
-    
-    # Number of days in the range
-    days = (request.end_date - request.start_date).days + 1
-    
-    # Ensure there's at least one day in the range
-    if days < 1:
+    if request.end_date < request.start_date:
         raise HTTPException(status_code=400, detail="End date must be after start date")
-    
-    # Generate synthetic trend data
+
+    # Scores are recorded monthly by calculate_financial_score (the last calculation of a month wins)
+    history = read_actuals(request.company_id, SCORE_SERIES_DATA_TYPE,
+                           start=request.start_date, end=request.end_date)
+    categories = [column for column in history.columns if column != OVERALL_SCORE_SERIES]
     trend_points = []
-    
-    # Base values - in a real implementation, these would come from the database
-    base_overall = 65.0
-    base_profitability = 70.0
-    base_liquidity = 60.0
-    base_leverage = 75.0
-    base_efficiency = 68.0
-    
-    # Generate points with some realistic random variation and trend
-    import random
-    random.seed(hash(request.company_id))  # Make it deterministic per company
-    
-    # Add a subtle trend direction
-    trend_direction = 0.05  # Small upward trend
-    
-    for i in range(days):
-        current_date = request.start_date.replace(day=request.start_date.day + i)
-        
-        # Add some random variation and a small trend
-        noise = random.uniform(-3.0, 3.0)
-        trend = i * trend_direction
-        
-        # Calculate scores with variation
-        overall = min(100, max(0, base_overall + noise + trend))
-        profitability = min(100, max(0, base_profitability + noise * 1.2 + trend))
-        liquidity = min(100, max(0, base_liquidity + noise * 0.8 + trend * 0.5))
-        leverage = min(100, max(0, base_leverage + noise * 0.9 + trend * 1.2))
-        efficiency = min(100, max(0, base_efficiency + noise * 1.1 + trend * 0.8))
-        
-        # Add point to trend
-        trend_points.append(TrendPoint(
-            date=current_date,
-            score=overall,
-            category_scores={
-                "Profitability": profitability,
-                "Liquidity": liquidity,
-                "Leverage": leverage,
-                "Efficiency": efficiency
-            }
-        ))
+    if OVERALL_SCORE_SERIES in history.columns:
+        for period_end, row in history[history[OVERALL_SCORE_SERIES].notna()].iterrows():
+            trend_points.append(TrendPoint(
+                date=period_end.date(),
+                score=float(row[OVERALL_SCORE_SERIES]),
+                category_scores={category: float(row[category]) for category in categories if pd.notna(row[category])}
+            ))
     
     # Calculate trend analysis metrics
     
@@ -571,11 +555,14 @@ def analyze_score_trends(request: TrendAnalysisRequest) -> TrendAnalysisResponse
         "direction": trend_direction,
         "interpretation": f"Financial health is {trend_direction.lower()} at a rate of {abs(slope):.2f} points per month with {volatility:.2f} points of volatility."
     }
+    if not trend_points:
+        trend_analysis["interpretation"] = "No financial health scores have been calculated for this company in the selected period."
     
+    profile = storage.json.get(_score_profile_key(request.company_id), default=dict)
     return TrendAnalysisResponse(
         company_id=request.company_id,
-        industry="Retail Trade",  # Would be fetched from company data in real implementation
-        size="small",  # Would be fetched from company data in real implementation
+        industry=profile.get("industry", "Unknown"),
+        size=profile.get("size", "Unknown"),
         trend_points=trend_points,
         trend_analysis=trend_analysis
     )
@@ -6,6 +6,8 @@ from typing import List, Literal, Dict, Optional
 import logging
 from datetime import date, timedelta
 
+from app.apis.actuals_timeseries import read_actuals
+
 try:
     from prophet import Prophet
     PROPHET_AVAILABLE = True
@@ -55,10 +57,14 @@ class HistoricalAccountPoint(BaseModel):
 
 class AccountData(BaseModel):
     account_name: str = Field(..., description="The name or identifier of the financial account")
-    historical_data: List[HistoricalAccountPoint] = Field(..., description="List of historical data points for the account")
+    historical_data: Optional[List[HistoricalAccountPoint]] = Field(None, description="List of historical data points for the account; read from stored actuals if omitted (requires entity_id)")
 
 class AccountForecastRequest(BaseModel):
     accounts_data: List[AccountData] = Field(..., description="List of accounts and their historical data")
+    entity_id: Optional[str] = Field(None, description="Entity whose stored actuals supply the history of accounts sent without historical_data")
+    data_type: str = Field(default="trial_balance", description="Imported data type the stored actuals come from; account_name is the account code (trial balance) or item name")
+    history_start: Optional[date] = Field(None, description="First period of stored history to use")
+    history_end: Optional[date] = Field(None, description="Last period of stored history to use")
     periods: int = Field(default=6, description="Number of future periods to forecast")
     freq: str = Field(default='M', description="Frequency of the forecast periods ('D', 'W', 'M', 'Q', 'Y')")
     method: Literal["ARIMA", "Prophet"] = Field(default="ARIMA", description="Forecasting method to use")
@@ -226,6 +232,20 @@ async def forecast_account(request: AccountForecastRequest) -> AccountForecastRe
     
     print(f"Received account forecast request for {len(request.accounts_data)} accounts, method: {request.method}, forecasting {request.periods} periods with freq '{request.freq}'.")
 
+    # Accounts sent without history are read from the stored actuals in one batch
+    missing_history = [a for a in request.accounts_data if a.historical_data is None]
+    if missing_history and request.entity_id:
+        history = read_actuals(
+            request.entity_id, request.data_type, [a.account_name for a in missing_history],
+            start=request.history_start, end=request.history_end,
+            freq=request.freq if request.freq in ("M", "Q", "Y") else "M",
+        )
+        for account_data in missing_history:
+            points = history[account_data.account_name].dropna()
+            account_data.historical_data = [
+                HistoricalAccountPoint(point_date=timestamp.date(), value=float(value)) for timestamp, value in points.items()
+            ]
+
     all_results: List[SingleAccountForecast] = []
 
     for account_data in request.accounts_data:
@@ -235,6 +255,9 @@ async def forecast_account(request: AccountForecastRequest) -> AccountForecastRe
         forecast_result = SingleAccountForecast(account_name=account_name)
 
         try:
+            if account_data.historical_data is None:
+                raise ValueError("No historical data provided and no entity_id to read stored actuals from.")
+
             # --- Method Selection --- 
             if request.method == "Prophet":
                 # --- Prophet Logic --- 
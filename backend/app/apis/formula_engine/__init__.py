@@ -0,0 +1,337 @@
+"""
+Formula engine for calculated report rows and custom metrics.
+
+A formula is an arithmetic expression over references:
+
+- names: `[Gross Profit]`, or a bare identifier such as `revenue`, for another row
+  or metric (matched case-insensitively)
+- accounts: `{4000}` for one account (0 if absent), `{4000:4999}` for the sum of
+  a code range
+
+with + - * / and ^ (or **), comparisons, numbers and the functions SUM, AVG, MIN,
+MAX, ABS, ROUND and IF(condition, then, else):
+
+    ([Revenue] - [Cost of Sales]) / [Revenue] * 100
+    SUM({6000:6999}) + {7100}
+
+Formulas are parsed once (compile_formula memoizes them by source) into numpy
+closures. A FormulaSet orders named formulas by their dependencies, rejects cycles,
+and evaluates every formula over whole vectors (e.g. all columns and periods of a
+report) at once. Division by zero gives NaN rather than an error.
+
+    formulas = FormulaSet({"Gross Profit": "[Revenue] - [Cost of Sales]",
+                           "GP %": "[Gross Profit] / [Revenue] * 100"})
+    results = formulas.evaluate({"Revenue": np.array([100.0, 120.0]), "Cost of Sales": np.array([60.0, 66.0])})
+"""
+
+import ast
+import re
+import warnings
+from functools import lru_cache
+from graphlib import CycleError, TopologicalSorter
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+import numpy as np
+from fastapi import APIRouter
+
+# Create an empty router to indicate this is not an API
+router = APIRouter()
+
+FORMULA_MAX_LENGTH = 2000
+# Levels of nested operators, calls and parentheses; compiled formulas recurse once per level
+FORMULA_MAX_DEPTH = 200
+
+_ACCOUNT_REFERENCE = re.compile(r"\{\s*([^{}:]+?)\s*(?::\s*([^{}:]+?)\s*)?\}")
+_NAME_REFERENCE = re.compile(r"\[([^\[\]]+)\]")
+
+
+class FormulaError(ValueError):
+    """A formula that cannot be parsed, or formulas that reference each other in a cycle."""
+
+    def __init__(self, message: str, cycle: Optional[List[str]] = None):
+        super().__init__(message)
+        # Names of the formulas in the cycle, for circular references
+        self.cycle = cycle or []
+
+
+def normalize_name(name: str) -> str:
+    """Key used to match name references: case-insensitive, with whitespace collapsed."""
+    return " ".join(str(name).split()).casefold()
+
+
+# --- Evaluation helpers ---
+
+def _divide(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    left, right = np.broadcast_arrays(np.asarray(left, dtype=float), np.asarray(right, dtype=float))
+    result = np.full(left.shape, np.nan)
+    np.divide(left, right, out=result, where=right != 0)
+    return result
+
+
+def _power(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", over="ignore", divide="ignore"):
+        return np.power(np.asarray(left, dtype=float), right)
+
+
+def _stack(args: Tuple[np.ndarray, ...], size: int) -> np.ndarray:
+    return np.vstack([np.broadcast_to(np.asarray(arg, dtype=float), (size,)) for arg in args])
+
+
+def _nan_reduce(reduce: Callable[..., np.ndarray]) -> Callable[..., np.ndarray]:
+    # All-NaN inputs give NaN without the RuntimeWarning numpy raises for them
+    def apply(stacked: np.ndarray) -> np.ndarray:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return reduce(stacked, axis=0)
+    return apply
+
+
+_FUNCTIONS: Dict[str, Tuple[Callable[..., np.ndarray], int, Optional[int]]] = {
+    # name -> (function over a (len(args), size) array or the args, min args, max args)
+    "SUM": (lambda stacked: np.where(np.isnan(stacked).all(axis=0), np.nan, np.nansum(stacked, axis=0)), 1, None),
+    "AVG": (_nan_reduce(np.nanmean), 1, None),
+    "MIN": (_nan_reduce(np.nanmin), 1, None),
+    "MAX": (_nan_reduce(np.nanmax), 1, None),
+}
+_SCALAR_FUNCTIONS: Dict[str, Tuple[Callable[..., np.ndarray], int, int]] = {
+    "ABS": (lambda value: np.abs(value), 1, 1),
+    "ROUND": (lambda value, digits=0: np.round(value, int(np.nan_to_num(np.asarray(digits).flat[0]))), 1, 2),
+    "IF": (lambda condition, then, otherwise: np.where(np.asarray(condition, dtype=bool), then, otherwise), 3, 3),
+}
+
+_BINARY_OPERATORS: Dict[type, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: _divide,
+    ast.Pow: _power,
+}
+_COMPARISONS: Dict[type, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    ast.Gt: np.greater, ast.GtE: np.greater_equal, ast.Lt: np.less,
+    ast.LtE: np.less_equal, ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+
+
+class _Context:
+    """Values available while evaluating: names, accounts and the vector size."""
+
+    def __init__(self, names: Mapping[str, Any], accounts: Mapping[str, Any], size: int):
+        self.names = names
+        self.accounts = accounts
+        self.size = size
+        self._ranges: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def name(self, key: str) -> np.ndarray:
+        value = self.names.get(key)
+        return np.full(self.size, np.nan) if value is None else np.asarray(value, dtype=float)
+
+    def account(self, code: str) -> np.ndarray:
+        value = self.accounts.get(code)
+        return np.zeros(self.size) if value is None else np.asarray(value, dtype=float)
+
+    def account_range(self, low: str, high: str) -> np.ndarray:
+        if (low, high) not in self._ranges:
+            total = np.zeros(self.size)
+            # Positions where no account in the range has a value stay NaN
+            present = np.zeros(self.size, dtype=bool)
+            for code, value in self.accounts.items():
+                if account_in_range(code, low, high):
+                    value = np.asarray(value, dtype=float)
+                    total = total + np.nan_to_num(value)
+                    present |= ~np.isnan(value)
+            self._ranges[(low, high)] = np.where(present, total, np.nan)
+        return self._ranges[(low, high)]
+
+
+def account_in_range(code: str, low: str, high: str) -> bool:
+    """Whether an account code falls in low..high, numerically if all three are numbers."""
+    try:
+        return float(low) <= float(code) <= float(high)
+    except (TypeError, ValueError):
+        return str(low) <= str(code) <= str(high)
+
+
+# --- Compilation ---
+
+def _nesting_depth(tree: ast.AST) -> int:
+    """Depth of the syntax tree, found without recursion."""
+    deepest = 0
+    pending = [(tree, 1)]
+    while pending:
+        node, depth = pending.pop()
+        deepest = max(deepest, depth)
+        pending.extend((child, depth + 1) for child in ast.iter_child_nodes(node))
+    return deepest
+
+
+class Formula:
+    """A parsed formula: its references and a compiled evaluator."""
+
+    def __init__(self, source: str):
+        if not isinstance(source, str) or not source.strip():
+            raise FormulaError("Formula is empty")
+        if len(source) > FORMULA_MAX_LENGTH:
+            raise FormulaError(f"Formula is longer than {FORMULA_MAX_LENGTH} characters")
+        self.source = source
+        self.names: Set[str] = set()
+        self.accounts: Set[str] = set()
+        self.ranges: Set[Tuple[str, str]] = set()
+        self._placeholders: Dict[str, Tuple[str, ...]] = {}
+
+        def account_placeholder(match: re.Match) -> str:
+            if match.group(2) is None:
+                self.accounts.add(match.group(1))
+                reference = ("account", match.group(1))
+            else:
+                self.ranges.add((match.group(1), match.group(2)))
+                reference = ("range", match.group(1), match.group(2))
+            return self._placeholder(reference)
+
+        def name_placeholder(match: re.Match) -> str:
+            return self._placeholder(("name", normalize_name(match.group(1))))
+
+        expression = _ACCOUNT_REFERENCE.sub(account_placeholder, source)
+        expression = _NAME_REFERENCE.sub(name_placeholder, expression)
+        # Spreadsheet-style powers; Python's ^ would bind more loosely than + and *
+        expression = expression.replace("^", "**")
+        try:
+            tree = ast.parse(expression.strip(), mode="eval")
+        except SyntaxError as e:
+            raise FormulaError(f"Invalid formula '{source}': {e.msg}") from None
+        except (RecursionError, MemoryError):
+            raise FormulaError(f"Formula is nested more than {FORMULA_MAX_DEPTH} levels deep") from None
+        if _nesting_depth(tree.body) > FORMULA_MAX_DEPTH:
+            raise FormulaError(f"Formula is nested more than {FORMULA_MAX_DEPTH} levels deep")
+        self._evaluate = self._compile(tree.body)
+
+    def _placeholder(self, reference: Tuple[str, ...]) -> str:
+        placeholder = f"__ref{len(self._placeholders)}"
+        self._placeholders[placeholder] = reference
+        return placeholder
+
+    def _compile(self, node: ast.AST) -> Callable[[_Context], np.ndarray]:
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            value = float(node.value)
+            return lambda context: np.full(context.size, value)
+
+        if isinstance(node, ast.Name):
+            reference = self._placeholders.get(node.id, ("name", normalize_name(node.id)))
+            if reference[0] == "name":
+                self.names.add(reference[1])
+                return lambda context, key=reference[1]: context.name(key)
+            if reference[0] == "account":
+                return lambda context, code=reference[1]: context.account(code)
+            return lambda context, low=reference[1], high=reference[2]: context.account_range(low, high)
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self._compile(node.operand)
+            if isinstance(node.op, ast.USub):
+                return lambda context: -operand(context)
+            return operand
+
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+            operator = _BINARY_OPERATORS[type(node.op)]
+            left, right = self._compile(node.left), self._compile(node.right)
+            return lambda context: operator(left(context), right(context))
+
+        if isinstance(node, ast.Compare) and all(type(op) in _COMPARISONS for op in node.ops):
+            operands = [self._compile(node.left)] + [self._compile(comparator) for comparator in node.comparators]
+            operators = [_COMPARISONS[type(op)] for op in node.ops]
+
+            def compare(context: _Context) -> np.ndarray:
+                values = [operand(context) for operand in operands]
+                result = np.ones(context.size, dtype=bool)
+                for operator, left, right in zip(operators, values, values[1:]):
+                    result &= operator(left, right)
+                return result.astype(float)
+            return compare
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            function_name = node.func.id.upper()
+            args = [self._compile(arg) for arg in node.args]
+            if function_name in _FUNCTIONS:
+                function, minimum, maximum = _FUNCTIONS[function_name]
+            elif function_name in _SCALAR_FUNCTIONS:
+                function, minimum, maximum = _SCALAR_FUNCTIONS[function_name]
+            else:
+                raise FormulaError(f"Unknown function {node.func.id} in formula '{self.source}'")
+            if len(args) < minimum or (maximum is not None and len(args) > maximum):
+                raise FormulaError(f"Wrong number of arguments for {function_name} in formula '{self.source}'")
+            if function_name in _FUNCTIONS:
+                return lambda context: function(_stack(tuple(arg(context) for arg in args), context.size))
+            return lambda context: function(*(arg(context) for arg in args))
+
+        raise FormulaError(f"Unsupported expression '{ast.unparse(node)}' in formula '{self.source}'")
+
+    def evaluate(self, names: Optional[Mapping[str, Any]] = None, accounts: Optional[Mapping[str, Any]] = None,
+                 size: int = 1) -> np.ndarray:
+        """
+        Value of the formula as a float vector of length size. names are keyed by
+        normalize_name; missing names are NaN and missing accounts are 0.
+        """
+        with np.errstate(invalid="ignore", over="ignore"):
+            result = self._evaluate(_Context(names or {}, accounts or {}, size))
+        return np.broadcast_to(np.asarray(result, dtype=float), (size,)).copy()
+
+
+@lru_cache(maxsize=1024)
+def compile_formula(source: str) -> Formula:
+    """The parsed formula for source, shared between callers. Raises FormulaError."""
+    return Formula(source)
+
+
+class FormulaSet:
+    """
+    Named formulas that may reference each other, in dependency order. Names that
+    are referenced but not defined are inputs, supplied when evaluating. `aliases`
+    gives other names a formula can be referenced by ({alias: formula name}), e.g. a
+    report row's label next to its id.
+    """
+
+    def __init__(self, formulas: Mapping[str, str], aliases: Optional[Mapping[str, str]] = None):
+        self.formulas: Dict[str, Formula] = {}
+        self.labels: Dict[str, str] = {}
+        for name, source in formulas.items():
+            key = normalize_name(name)
+            if key in self.formulas:
+                raise FormulaError(f"More than one formula is named '{name}'")
+            self.formulas[key] = compile_formula(source)
+            self.labels[key] = name
+        # alias -> key of the formula it stands for
+        self.aliases: Dict[str, str] = {}
+        for alias, name in (aliases or {}).items():
+            alias_key, key = normalize_name(alias), normalize_name(name)
+            if alias_key == key:
+                continue
+            if key not in self.formulas:
+                raise FormulaError(f"Alias '{alias}' is for an unknown formula '{name}'")
+            if alias_key in self.formulas or self.aliases.get(alias_key, key) != key:
+                raise FormulaError(f"More than one formula is named '{alias}'")
+            self.aliases[alias_key] = key
+
+        graph = {key: {self.aliases.get(name, name) for name in formula.names} & self.formulas.keys()
+                 for key, formula in self.formulas.items()}
+        try:
+            self.order: List[str] = list(TopologicalSorter(graph).static_order())
+        except CycleError as e:
+            cycle = [self.labels.get(key, key) for key in e.args[1]]
+            raise FormulaError(f"Circular reference between formulas: {' -> '.join(cycle)}", cycle=cycle) from None
+
+        self.inputs: Set[str] = (set().union(*(f.names for f in self.formulas.values()))
+                                 - self.formulas.keys() - self.aliases.keys())
+        self.accounts: Set[str] = set().union(*(f.accounts for f in self.formulas.values()))
+        self.ranges: Set[Tuple[str, str]] = set().union(*(f.ranges for f in self.formulas.values()))
+
+    def evaluate(self, names: Optional[Mapping[str, Any]] = None, accounts: Optional[Mapping[str, Any]] = None,
+                 size: int = 1) -> Dict[str, np.ndarray]:
+        """Every formula's vector, keyed by its name as given. Input names may be in any case."""
+        values: Dict[str, Any] = {normalize_name(name): value for name, value in (names or {}).items()}
+        aliases_of: Dict[str, List[str]] = {}
+        for alias, key in self.aliases.items():
+            aliases_of.setdefault(key, []).append(alias)
+        for key in self.order:
+            if key in self.formulas:
+                values[key] = self.formulas[key].evaluate(values, accounts, size)
+                for alias in aliases_of.get(key, ()):
+                    values[alias] = values[key]
+        return {self.labels[key]: values[key] for key in self.formulas}
@@ -2,17 +2,46 @@
 API for managing Foreign Exchange (FX) Rates.
 """
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import date
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Set, Tuple
+from datetime import date, timedelta
 import pandas as pd
-import databutton as db
-import io
+from app.apis.storage_utils import storage
+from app.apis.streaming_ingest import detect_csv_encoding, iter_csv_chunks
+import os
+import tempfile
+import threading
+from collections import OrderedDict, deque
 
 router = APIRouter(prefix="/fx-rates", tags=["FX Rates"])
 
+# Legacy single-frame key. Kept so existing history can be migrated into partitions.
 FX_RATES_STORAGE_KEY = "fx_rates_historical.parquet"
 
+# Rates are partitioned by calendar year, one parquet frame per year.
+# The manifest records rows, date bounds and currency pairs per partition so
+# reads can skip partitions that cannot match the requested filters.
+FX_RATES_PARTITION_KEY_TEMPLATE = "fx_rates_{year}.parquet"
+FX_RATES_MANIFEST_KEY = "fx_rates_manifest"
+# {year: counter} bumped after every merge into the year's partition. Rate graphs are
+# keyed on the counters of the years they read, so an upload in any process replaces them.
+FX_RATES_REVISIONS_KEY = "fx_rates_revisions"
+
+# Cross rates are triangulated through this currency first when no direct quote exists
+FX_BASE_CURRENCY = "AUD"
+# Number of (as_of, rate_type) rate graphs kept in memory
+FX_GRAPH_CACHE_SIZE = 256
+# How far back a graph looks for the latest quote of each pair
+FX_GRAPH_LOOKBACK_DAYS = 366
+# Uploaded CSVs are validated and merged this many rows at a time
+FX_UPLOAD_CHUNK_ROWS = 100000
+# Lease on a year partition while an upload merges into it; a merge rewrites the whole year
+FX_PARTITION_LOCK_SECONDS = 300
+
+FX_RATES_COLUMNS = ['rate_date', 'from_currency', 'to_currency', 'rate']
+FX_RATES_KEY_COLUMNS = ['rate_date', 'from_currency', 'to_currency']
+
 # --- Pydantic Models ---
 
 class FXRateEntry(BaseModel):
@@ -42,86 +71,425 @@ class FXRateFilterParams(BaseModel):
 
 # --- Helper Functions ---
 
-def load_fx_rates_df() -> pd.DataFrame:
-    """Loads the FX rates DataFrame from storage, ensuring date column is correct type."""
+def _empty_fx_rates_df() -> pd.DataFrame:
+    """Returns an empty FX rates DataFrame with the expected schema."""
+    df = pd.DataFrame(columns=FX_RATES_COLUMNS)
+    df['rate_date'] = pd.to_datetime(df['rate_date']).dt.date # Ensure correct dtype even when empty
+    return df
+
+
+def _partition_key(year: int) -> str:
+    return FX_RATES_PARTITION_KEY_TEMPLATE.format(year=year)
+
+
+def _dedup_columns(df: pd.DataFrame) -> List[str]:
+    """Columns identifying a unique rate. rate_type is optional in uploads."""
+    if 'rate_type' in df.columns:
+        return FX_RATES_KEY_COLUMNS + ['rate_type']
+    return FX_RATES_KEY_COLUMNS
+
+
+def _normalize_fx_df(df: pd.DataFrame) -> pd.DataFrame:
+    """Coerces column types so partitions written at different times concatenate cleanly."""
+    if 'rate_date' in df.columns:
+        df['rate_date'] = pd.to_datetime(df['rate_date']).dt.date
+    for col in ('from_currency', 'to_currency'):
+        if col in df.columns:
+            df[col] = df[col].astype(str).str.strip().str.upper()
+    if 'rate' in df.columns:
+        df['rate'] = pd.to_numeric(df['rate'], errors='coerce')
+    return df
+
+
+def load_fx_manifest() -> Dict[str, Dict[str, Any]]:
+    """
+    Loads the partition manifest: {year: {rows, min_date, max_date, pairs}}.
+    Migrates the legacy single-frame history into partitions on first use.
+    """
+    try:
+        return storage.json.get(FX_RATES_MANIFEST_KEY)
+    except FileNotFoundError:
+        return _migrate_legacy_fx_rates()
+
+
+def _migrate_legacy_fx_rates() -> Dict[str, Dict[str, Any]]:
+    """Splits the legacy fx_rates_historical frame into yearly partitions."""
+    manifest: Dict[str, Dict[str, Any]] = {}
     try:
-        df = db.storage.dataframes.get(FX_RATES_STORAGE_KEY, default=pd.DataFrame())
-        if not df.empty and 'rate_date' in df.columns:
-            # Ensure rate_date is datetime after loading
-            df['rate_date'] = pd.to_datetime(df['rate_date']).dt.date
-        elif df.empty:
-             # Define columns for an empty DataFrame to avoid future errors
-             df = pd.DataFrame(columns=['rate_date', 'from_currency', 'to_currency', 'rate'])
-             df['rate_date'] = pd.to_datetime(df['rate_date']).dt.date # Ensure correct dtype even when empty
-        return df
+        legacy_df = storage.dataframes.get(FX_RATES_STORAGE_KEY, default=pd.DataFrame())
+    except Exception as e:
+        print(f"Error loading legacy FX rates for migration: {e}")
+        legacy_df = pd.DataFrame()
+
+    if not legacy_df.empty and 'rate_date' in legacy_df.columns:
+        legacy_df = _normalize_fx_df(legacy_df)
+        print(f"Migrating {len(legacy_df)} legacy FX rates into yearly partitions...")
+        for year, year_df in legacy_df.groupby(pd.to_datetime(legacy_df['rate_date']).dt.year):
+            manifest[str(year)] = _write_partition(int(year), year_df)
+
+    storage.json.put(FX_RATES_MANIFEST_KEY, manifest)
+    return manifest
+
+
+def _partition_summary(df: pd.DataFrame) -> Dict[str, Any]:
+    pairs = sorted({f"{f}/{t}" for f, t in zip(df['from_currency'], df['to_currency'])})
+    return {
+        "rows": int(len(df)),
+        "min_date": min(df['rate_date']).isoformat() if not df.empty else None,
+        "max_date": max(df['rate_date']).isoformat() if not df.empty else None,
+        "pairs": pairs,
+    }
+
+
+def _load_partition(year: int, filters: Optional[List[Tuple[str, str, Any]]] = None) -> pd.DataFrame:
+    """Loads one year partition; filters are pushed down to the Parquet row groups."""
+    df = storage.dataframes.get(_partition_key(year), filters=filters, default=pd.DataFrame())
+    if df.empty:
+        return _empty_fx_rates_df()
+    return _normalize_fx_df(df)
+
+
+def _write_partition(year: int, df: pd.DataFrame) -> Dict[str, Any]:
+    """Sorts and writes a single year partition, returning its manifest entry."""
+    df = df.sort_values(by=FX_RATES_KEY_COLUMNS).reset_index(drop=True)
+    save_fx_rates_df(df, key=_partition_key(year))
+    return _partition_summary(df)
+
+
+def _partition_may_match(
+    summary: Dict[str, Any],
+    currencies: Optional[Set[str]],
+    from_currency: Optional[str],
+    to_currency: Optional[str],
+) -> bool:
+    """Uses the manifest pair list to skip partitions without a requested currency."""
+    if not summary.get("rows"):
+        return False
+    pairs = [pair.split("/") for pair in summary.get("pairs", [])]
+    if from_currency and not any(f == from_currency for f, _ in pairs):
+        return False
+    if to_currency and not any(t == to_currency for _, t in pairs):
+        return False
+    if currencies and not any(f in currencies or t in currencies for f, t in pairs):
+        return False
+    return True
+
+
+def load_fx_rates_df(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    currencies: Optional[Iterable[str]] = None,
+    from_currency: Optional[str] = None,
+    to_currency: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    Loads FX rates from the yearly partitions, opening only the partitions that
+    overlap the requested date range and contain the requested currencies.
+
+    `currencies` keeps rates where either side of the pair is in the set;
+    `from_currency` / `to_currency` match the respective side exactly.
+    """
+    try:
+        manifest = load_fx_manifest()
+        currency_set = {c.upper() for c in currencies} if currencies else None
+        from_currency = from_currency.upper() if from_currency else None
+        to_currency = to_currency.upper() if to_currency else None
+
+        # Partitions are sorted by date, so range filters skip whole row groups
+        filters = []
+        if start_date:
+            filters.append(('rate_date', '>=', start_date))
+        if end_date:
+            filters.append(('rate_date', '<=', end_date))
+        if from_currency:
+            filters.append(('from_currency', '==', from_currency))
+        if to_currency:
+            filters.append(('to_currency', '==', to_currency))
+
+        frames = []
+        for year_str, summary in sorted(manifest.items()):
+            year = int(year_str)
+            if start_date and year < start_date.year:
+                continue
+            if end_date and year > end_date.year:
+                continue
+            if not _partition_may_match(summary, currency_set, from_currency, to_currency):
+                continue
+            frames.append(_load_partition(year, filters or None))
+
+        if not frames:
+            return _empty_fx_rates_df()
+
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if start_date:
+            df = df[df['rate_date'] >= start_date]
+        if end_date:
+            df = df[df['rate_date'] <= end_date]
+        if currency_set:
+            df = df[df['from_currency'].isin(currency_set) | df['to_currency'].isin(currency_set)]
+        if from_currency:
+            df = df[df['from_currency'] == from_currency]
+        if to_currency:
+            df = df[df['to_currency'] == to_currency]
+        return df.reset_index(drop=True)
     except Exception as e:
         print(f"Error loading FX rates: {e}")
         # Return empty DataFrame with correct schema on error
-        df = pd.DataFrame(columns=['rate_date', 'from_currency', 'to_currency', 'rate'])
-        df['rate_date'] = pd.to_datetime(df['rate_date']).dt.date
-        return df
+        return _empty_fx_rates_df()
 
 
-def save_fx_rates_df(df: pd.DataFrame):
-    """Saves the FX rates DataFrame to storage."""
+def save_fx_rates_df(df: pd.DataFrame, key: str = FX_RATES_STORAGE_KEY):
+    """Saves an FX rates DataFrame to storage."""
     try:
         # Ensure date is just date, not datetime, before saving if needed (Parquet handles date well)
         if 'rate_date' in df.columns:
              df['rate_date'] = pd.to_datetime(df['rate_date']).dt.date
-        db.storage.dataframes.put(FX_RATES_STORAGE_KEY, df)
+        storage.dataframes.put(key, df)
     except Exception as e:
         print(f"Error saving FX rates: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to save FX rates: {e}")
 
+
+def _merge_partition(year: int, upload_part: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """
+    Merges uploaded rows into one year partition and records it in the manifest,
+    returning the manifest. The partition's lock is held from the read to the
+    manifest write, so concurrent uploads of the same year both keep their rows.
+    """
+    with storage.json.lock(f"fx_partition_{year}", lease_seconds=FX_PARTITION_LOCK_SECONDS,
+                           timeout=FX_PARTITION_LOCK_SECONDS):
+        existing_part = _load_partition(year)
+        combined = pd.concat([existing_part, upload_part], ignore_index=True)
+        # Upload rows come last, so keep='last' prefers the uploaded rate
+        combined = combined.drop_duplicates(subset=_dedup_columns(combined), keep='last')
+        summary = _write_partition(year, combined)
+        # Only this partition is replaced, so concurrent uploads of other years both survive
+        manifest = storage.json.update(FX_RATES_MANIFEST_KEY, lambda current: current.update({str(year): summary}),
+                                       default=dict)
+        storage.json.update(FX_RATES_REVISIONS_KEY,
+                            lambda current: current.update({str(year): current.get(str(year), 0) + 1}), default=dict)
+        return manifest
+
+
+def merge_fx_rates(new_df: pd.DataFrame) -> Tuple[int, int]:
+    """
+    Merges new rates into the partitions they touch, keeping the uploaded value
+    for duplicate date/currency pairs. Returns (rows_before, rows_after) totals.
+    """
+    manifest = load_fx_manifest()
+    rows_before = sum(summary.get("rows", 0) for summary in manifest.values())
+
+    new_df = _normalize_fx_df(new_df)
+    years = pd.to_datetime(new_df['rate_date']).dt.year
+    for year, upload_part in new_df.groupby(years):
+        manifest = _merge_partition(int(year), upload_part)
+    rows_after = sum(summary.get("rows", 0) for summary in manifest.values())
+    return rows_before, rows_after
+
+# --- Cross-Rate Engine ---
+
+class FXRateGraph:
+    """
+    Currency graph for a single (as_of, rate_type) snapshot.
+
+    Each quoted pair contributes an edge in both directions (the inverse edge
+    uses 1/rate). Rates for pairs without a direct quote are derived along the
+    shortest path, preferring a path through FX_BASE_CURRENCY. Derived rates are
+    memoized, so repeated lookups are O(1).
+    """
+
+    def __init__(self, edges: Dict[str, Dict[str, float]], base_currency: str = FX_BASE_CURRENCY):
+        self.edges = edges
+        self.base_currency = base_currency
+        self._derived: Dict[Tuple[str, str], Optional[float]] = {}
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, rate_type: Optional[str] = None, base_currency: str = FX_BASE_CURRENCY) -> "FXRateGraph":
+        """
+        Builds the graph from the latest quote per pair. Rows without a rate_type
+        (plain spot uploads) apply to every rate type.
+        """
+        edges: Dict[str, Dict[str, float]] = {}
+        if df.empty:
+            return cls(edges, base_currency)
+
+        if rate_type and 'rate_type' in df.columns:
+            row_types = df['rate_type'].astype(str).str.lower()
+            df = df[df['rate_type'].isna() | (row_types == rate_type.lower())]
+
+        df = df[df['rate'].notna() & (df['rate'] != 0)]
+        if 'rate_date' in df.columns:
+            df = df.sort_values(by='rate_date')
+        latest = df.drop_duplicates(subset=['from_currency', 'to_currency'], keep='last')
+
+        for from_curr, to_curr, rate in zip(latest['from_currency'], latest['to_currency'], latest['rate']):
+            edges.setdefault(from_curr, {})[to_curr] = float(rate)
+            # A direct quote always wins over an inverted one
+            edges.setdefault(to_curr, {}).setdefault(from_curr, 1.0 / float(rate))
+        return cls(edges, base_currency)
+
+    @property
+    def currencies(self) -> Set[str]:
+        return set(self.edges)
+
+    def rate(self, from_curr: str, to_curr: str) -> Optional[float]:
+        """Returns the direct, inverse or triangulated rate, or None if unreachable."""
+        from_curr, to_curr = from_curr.upper(), to_curr.upper()
+        if from_curr == to_curr:
+            return 1.0
+        key = (from_curr, to_curr)
+        if key not in self._derived:
+            self._derived[key] = self._derive(from_curr, to_curr)
+        return self._derived[key]
+
+    def _derive(self, from_curr: str, to_curr: str) -> Optional[float]:
+        neighbours = self.edges.get(from_curr)
+        if not neighbours:
+            return None
+        if to_curr in neighbours:
+            return neighbours[to_curr]
+
+        # Preferred two-hop path through the base currency
+        base = self.base_currency
+        if base in neighbours and to_curr in self.edges.get(base, {}):
+            return neighbours[base] * self.edges[base][to_curr]
+
+        # Otherwise the shortest path (fewest conversions) found by BFS
+        previous: Dict[str, str] = {from_curr: from_curr}
+        queue = deque([from_curr])
+        while queue:
+            current = queue.popleft()
+            if current == to_curr:
+                break
+            for nxt in sorted(self.edges.get(current, {})):
+                if nxt not in previous:
+                    previous[nxt] = current
+                    queue.append(nxt)
+        if to_curr not in previous:
+            return None
+
+        rate = 1.0
+        node = to_curr
+        while node != from_curr:
+            prev = previous[node]
+            rate *= self.edges[prev][node]
+            node = prev
+        return rate
+
+
+# (as_of, rate_type) -> (revisions of the years read, graph)
+_fx_graph_cache: "OrderedDict[Tuple[Optional[date], str], Tuple[Tuple, FXRateGraph]]" = OrderedDict()
+_fx_graph_lock = threading.Lock()
+
+
+def _graph_revisions(as_of: Optional[date]) -> Tuple:
+    """Revisions of the partitions a graph reads, from the backend (bypassing the storage cache)."""
+    revisions = storage.json.get(FX_RATES_REVISIONS_KEY, default=dict, fresh=True)
+    if as_of is None:
+        return tuple(sorted(revisions.items()))
+    first_year = (as_of - timedelta(days=FX_GRAPH_LOOKBACK_DAYS)).year
+    return tuple(revisions.get(str(year), 0) for year in range(first_year, as_of.year + 1))
+
+
+def get_fx_rate_graph(as_of: Optional[date] = None, rate_type: Optional[str] = None) -> FXRateGraph:
+    """
+    Returns the memoized rate graph for (as_of, rate_type), building it from the
+    partitions covering the lookback window on first use and whenever one of them
+    has been merged into since. as_of=None uses the latest quotes across the whole history.
+    """
+    cache_key = (as_of, (rate_type or "").lower())
+    # Read before the rates: a merge landing during the build leaves the graph under
+    # the older revisions, so it is rebuilt on the next call rather than served stale
+    revisions = _graph_revisions(as_of)
+    with _fx_graph_lock:
+        entry = _fx_graph_cache.get(cache_key)
+        if entry is not None and entry[0] == revisions:
+            _fx_graph_cache.move_to_end(cache_key)
+            return entry[1]
+
+    start_date = as_of - timedelta(days=FX_GRAPH_LOOKBACK_DAYS) if as_of else None
+    df = load_fx_rates_df(start_date=start_date, end_date=as_of)
+    graph = FXRateGraph.from_dataframe(df, rate_type)
+
+    with _fx_graph_lock:
+        _fx_graph_cache[cache_key] = (revisions, graph)
+        _fx_graph_cache.move_to_end(cache_key)
+        while len(_fx_graph_cache) > FX_GRAPH_CACHE_SIZE:
+            _fx_graph_cache.popitem(last=False)
+    return graph
+
+
+def get_cross_rate(from_curr: str, to_curr: str, as_of: Optional[date] = None, rate_type: Optional[str] = None) -> Optional[float]:
+    """Convenience wrapper: rate to convert one unit of from_curr into to_curr."""
+    return get_fx_rate_graph(as_of, rate_type).rate(from_curr, to_curr)
+
 # --- API Endpoints ---
 
+def _prepare_fx_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Validates one chunk of an FX rate CSV and converts it to the stored column layout."""
+    # Basic validation - check required columns exist
+    required_columns = ['date', 'from_currency', 'to_currency', 'rate']
+    if not all(col in chunk.columns for col in required_columns):
+        raise ValueError(f"CSV must contain columns: {', '.join(required_columns)}")
+
+    # Rename 'date' column to 'rate_date' for consistency
+    chunk = chunk.rename(columns={'date': 'rate_date'})
+
+    # Convert date column and ensure it's date type
+    chunk['rate_date'] = pd.to_datetime(chunk['rate_date']).dt.date
+    return chunk
+
+
+def ingest_fx_rates_file(fileobj: BinaryIO, chunk_rows: int = FX_UPLOAD_CHUNK_ROWS) -> Tuple[int, int]:
+    """
+    Merges an FX rate CSV into the yearly partitions. The file is read chunk_rows rows
+    at a time; each chunk is validated and its rows are spooled to local files by year.
+    Only then is each affected partition merged, once, so a bad row anywhere in the
+    file rejects the whole upload without writing anything.
+    Returns (rows_before, rows_after) totals.
+    """
+    encoding = detect_csv_encoding(fileobj)
+    with tempfile.TemporaryDirectory(prefix="fx_upload_") as spool_dir:
+        spooled: Dict[int, List[str]] = {}
+        earliest = latest = None
+        for chunk in iter_csv_chunks(fileobj, chunk_rows, encoding):
+            chunk = _normalize_fx_df(_prepare_fx_chunk(chunk))
+            if chunk.empty:
+                continue
+            earliest = min(earliest or date.max, min(chunk['rate_date']))
+            latest = max(latest or date.min, max(chunk['rate_date']))
+            for year, year_part in chunk.groupby(pd.to_datetime(chunk['rate_date']).dt.year):
+                paths = spooled.setdefault(int(year), [])
+                path = os.path.join(spool_dir, f"{int(year)}_{len(paths)}.pkl")
+                year_part.to_pickle(path)
+                paths.append(path)
+        if not spooled:
+            raise pd.errors.EmptyDataError("No rows in uploaded file")
+
+        manifest = load_fx_manifest()
+        rows_before = sum(summary.get("rows", 0) for summary in manifest.values())
+        for year, paths in sorted(spooled.items()):
+            upload_part = pd.concat([pd.read_pickle(path) for path in paths], ignore_index=True)
+            manifest = _merge_partition(year, upload_part)
+
+    rows_after = sum(summary.get("rows", 0) for summary in manifest.values())
+    return rows_before, rows_after
+
+
 @router.post("/upload", response_model=FXRateUploadResponse)
 async def upload_fx_rates(file: UploadFile = File(...)):
     """
     Uploads FX rates from a CSV file.
     Expects columns: date, from_currency, to_currency, rate.
-    Appends to existing rates, removes duplicates (keeping latest), and sorts.
+    Merges into the yearly partitions touched by the upload, replacing
+    duplicate date/currency rows with the uploaded values. The file is
+    read from its spooled upload in chunks, so large files use bounded memory.
     """
-    # Placeholder implementation
     print(f"Received file: {file.filename}")
-    # TODO: Implement CSV parsing, DataFrame merging, deduplication, sorting, and saving.
-    
-    # Read existing data
-    existing_df = load_fx_rates_df()
-    
-    # Read uploaded data
-    content = await file.read()
-    try:
-        # Assuming CSV format, adjust parameters as needed (e.g., separator)
-        new_df = pd.read_csv(io.BytesIO(content))
-        # Basic validation - check required columns exist
-        required_columns = ['date', 'from_currency', 'to_currency', 'rate']
-        if not all(col in new_df.columns for col in required_columns):
-             raise ValueError(f"CSV must contain columns: {', '.join(required_columns)}")
-        
-        # Rename 'date' column to 'rate_date' for consistency
-        new_df = new_df.rename(columns={'date': 'rate_date'})
-        
-        # Convert date column and ensure it's date type
-        new_df['rate_date'] = pd.to_datetime(new_df['rate_date']).dt.date
-
-        rows_before = len(existing_df)
-        rows_in_upload = len(new_df)
-
-        # Combine, deduplicate, and sort
-        combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-        # Keep the last entry for each date/currency pair
-        combined_df = combined_df.sort_values(by='rate_date').drop_duplicates(
-            subset=['rate_date', 'from_currency', 'to_currency'], 
-            keep='last'
-        )
-        # Sort final result for consistency
-        combined_df = combined_df.sort_values(by=['rate_date', 'from_currency', 'to_currency']).reset_index(drop=True)
 
-        # Save back to storage
-        save_fx_rates_df(combined_df)
-        
-        rows_after = len(combined_df)
+    try:
+        # Parse and merge in a worker thread, chunk by chunk
+        rows_before, rows_after = await run_in_threadpool(ingest_fx_rates_file, file.file)
         rows_added = rows_after - rows_before # Approximates net additions
 
         return FXRateUploadResponse(
@@ -144,23 +512,16 @@ def get_fx_rates(filters: FXRateFilterParams = Depends()):
     """
     Retrieves FX rates, optionally filtering by date range and currencies.
     """
-    # Placeholder implementation
-    # TODO: Implement loading from storage and filtering based on 'filters' dependency.
-    
-    df = load_fx_rates_df()
+    # Filters are pushed down so only matching yearly partitions are opened
+    df = load_fx_rates_df(
+        start_date=filters.start_date,
+        end_date=filters.end_date,
+        from_currency=filters.from_currency,
+        to_currency=filters.to_currency,
+    )
     
     if df.empty:
         return FXRateListResponse(rates=[])
-
-    # Apply filters
-    if filters.start_date:
-        df = df[df['rate_date'] >= filters.start_date]
-    if filters.end_date:
-        df = df[df['rate_date'] <= filters.end_date]
-    if filters.from_currency:
-        df = df[df['from_currency'].str.upper() == filters.from_currency.upper()]
-    if filters.to_currency:
-        df = df[df['to_currency'].str.upper() == filters.to_currency.upper()]
         
     # Convert DataFrame rows to list of Pydantic models
     rates_list = df.to_dict(orient='records')
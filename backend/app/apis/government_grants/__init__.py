@@ -1,7 +1,7 @@
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Query
 from pydantic import BaseModel
-import databutton as db
+from app.apis.storage_utils import storage
 import re
 
 router = APIRouter()
@@ -50,6 +50,21 @@ def sanitize_storage_key(key: str) -> str:
     """Sanitize storage key to only allow alphanumeric and ._- symbols"""
     return re.sub(r'[^a-zA-Z0-9._-]', '', key)
 
+# Grant programs are stored one key per program; the former single
+# 'australian_government_grants' list is split into records on first use
+GRANTS_LEGACY_STORAGE_KEY = sanitize_storage_key('australian_government_grants')
+grant_programs = storage.collection("government_grants", id_field="id", legacy_key=GRANTS_LEGACY_STORAGE_KEY)
+
+def load_grant_programs() -> List[GrantProgram]:
+    """Returns all stored grant programs, seeding the database if it is empty."""
+    records = grant_programs.all()
+    if not records:
+        return initialize_grant_database()
+    return [GrantProgram(**program) for program in records]
+
+def save_grant_program(program: GrantProgram):
+    grant_programs.put(program.dict())
+
 # Function to store the initial database
 def initialize_grant_database():
     # Federal Government Programs
@@ -638,10 +653,8 @@ def initialize_grant_database():
     )
     
     # Store the data in Databutton storage
-    db.storage.json.put(
-        sanitize_storage_key('australian_government_grants'),
-        [program.dict() for program in all_programs]
-    )
+    for program in all_programs:
+        save_grant_program(program)
     
     return all_programs
 
@@ -658,13 +671,7 @@ def list_grants(
     q: Optional[str] = None
 ):
     """List government grants and incentives with optional filtering"""
-    try:
-        # Get the stored data
-        stored_data = db.storage.json.get(sanitize_storage_key('australian_government_grants'))
-        programs = [GrantProgram(**program) for program in stored_data]
-    except:
-        # If data doesn't exist, initialize it
-        programs = initialize_grant_database()
+    programs = load_grant_programs()
     
     # Apply filters
     if level:
@@ -706,38 +713,20 @@ def list_grants(
 @router.get("/grants/{grant_id}")
 def get_grant(grant_id: str):
     """Get detailed information about a specific grant"""
-    try:
-        # Get the stored data
-        stored_data = db.storage.json.get(sanitize_storage_key('australian_government_grants'))
-        all_programs = [GrantProgram(**program) for program in stored_data]
-        
-        # Find the requested grant
-        for program in all_programs:
-            if program.id == grant_id:
-                return program.dict()
-        
-        return {"error": "Grant not found"}
-    except:
+    program = grant_programs.get(grant_id)
+    if program is None and not grant_programs.keys():
         # If data doesn't exist, initialize it and try again
-        all_programs = initialize_grant_database()
-        
-        # Find the requested grant
-        for program in all_programs:
-            if program.id == grant_id:
-                return program.dict()
-        
-        return {"error": "Grant not found"}
+        initialize_grant_database()
+        program = grant_programs.get(grant_id)
+    if program is not None:
+        return GrantProgram(**program).dict()
+    
+    return {"error": "Grant not found"}
 
 @router.get("/grants/categories")
 def get_grant_categories():
     """Get a list of all grant categories"""
-    try:
-        # Get the stored data
-        stored_data = db.storage.json.get(sanitize_storage_key('australian_government_grants'))
-        all_programs = [GrantProgram(**program) for program in stored_data]
-    except:
-        # If data doesn't exist, initialize it
-        all_programs = initialize_grant_database()
+    all_programs = load_grant_programs()
     
     # Extract and deduplicate categories
     all_categories = set()
@@ -750,13 +739,7 @@ def get_grant_categories():
 @router.get("/grants/business-types")
 def get_business_types():
     """Get a list of all business types eligible for grants"""
-    try:
-        # Get the stored data
-        stored_data = db.storage.json.get(sanitize_storage_key('australian_government_grants'))
-        all_programs = [GrantProgram(**program) for program in stored_data]
-    except:
-        # If data doesn't exist, initialize it
-        all_programs = initialize_grant_database()
+    all_programs = load_grant_programs()
     
     # Extract and deduplicate business types
     all_business_types = set()
@@ -769,13 +752,7 @@ def get_business_types():
 @router.get("/grants/states")
 def get_states():
     """Get a list of all states with grants"""
-    try:
-        # Get the stored data
-        stored_data = db.storage.json.get(sanitize_storage_key('australian_government_grants'))
-        all_programs = [GrantProgram(**program) for program in stored_data]
-    except:
-        # If data doesn't exist, initialize it
-        all_programs = initialize_grant_database()
+    all_programs = load_grant_programs()
     
     # Extract and deduplicate states
     all_states = set()
@@ -788,13 +765,7 @@ def get_states():
 @router.get("/grants/funding-types")
 def get_funding_types():
     """Get a list of all funding types"""
-    try:
-        # Get the stored data
-        stored_data = db.storage.json.get(sanitize_storage_key('australian_government_grants'))
-        all_programs = [GrantProgram(**program) for program in stored_data]
-    except:
-        # If data doesn't exist, initialize it
-        all_programs = initialize_grant_database()
+    all_programs = load_grant_programs()
     
     # Extract and deduplicate funding types
     all_funding_types = set()
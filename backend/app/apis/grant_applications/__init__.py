@@ -2,7 +2,7 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
-import databutton as db
+from app.apis.storage_utils import storage
 import json
 import re
 import uuid
@@ -98,13 +98,14 @@ def get_applications_for_user(user_id: str) -> List[GrantApplication]:
     try:
         # Get the applications index
         applications_key = f"applications_index_{sanitize_storage_key(user_id)}"
-        applications_index = db.storage.json.get(applications_key, default=[])
+        applications_index = storage.json.get(applications_key, default=[])
         
-        # Load each application
+        # Load all applications in one batch
+        app_keys = [f"application_{sanitize_storage_key(app_id)}" for app_id in applications_index]
+        app_docs = storage.json.get_many(app_keys)
         applications = []
-        for app_id in applications_index:
-            app_key = f"application_{sanitize_storage_key(app_id)}"
-            app_data = db.storage.json.get(app_key, default=None)
+        for app_key in app_keys:
+            app_data = app_docs.get(app_key)
             if app_data:
                 # Convert string dates to datetime objects
                 app_data['created_at'] = datetime.fromisoformat(app_data['created_at'])
@@ -165,15 +166,20 @@ def save_application(application: GrantApplication) -> None:
         
         # Save the application
         app_key = f"application_{sanitize_storage_key(application.id)}"
-        db.storage.json.put(app_key, app_data)
+        storage.json.put(app_key, app_data)
         
         # Update the user's applications index
         applications_key = f"applications_index_{sanitize_storage_key(application.user_id)}"
-        applications_index = db.storage.json.get(applications_key, default=[])
+        applications_index = storage.json.get(applications_key, default=[])
         
         if application.id not in applications_index:
-            applications_index.append(application.id)
-            db.storage.json.put(applications_key, applications_index)
+            def add_to_index(index: list) -> list:
+                if application.id not in index:
+                    index.append(application.id)
+                return index
+
+            # Versioned update so concurrent saves for the same user do not drop each other's IDs
+            storage.json.update(applications_key, add_to_index, default=list)
     except Exception as e:
         print(f"Error saving application: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to save application: {str(e)}")
@@ -183,19 +189,22 @@ def delete_application(application_id: str, user_id: str) -> bool:
     try:
         # Remove from user's applications index
         applications_key = f"applications_index_{sanitize_storage_key(user_id)}"
-        applications_index = db.storage.json.get(applications_key, default=[])
+        applications_index = storage.json.get(applications_key, default=[])
         
         if application_id in applications_index:
-            applications_index.remove(application_id)
-            db.storage.json.put(applications_key, applications_index)
+            storage.json.update(
+                applications_key,
+                lambda index: [app_id for app_id in index if app_id != application_id],
+                default=list,
+            )
         
         # Delete the application
         app_key = f"application_{sanitize_storage_key(application_id)}"
         try:
             # This will raise an exception if the file doesn't exist
-            db.storage.json.get(app_key)
+            storage.json.get(app_key)
             # If we got here, the file exists, so delete it
-            db.storage.json.delete(app_key)
+            storage.json.delete(app_key)
             return True
         except Exception:
             # File doesn't exist
@@ -1,10 +1,9 @@
 from typing import List, Optional, Dict, Any, Union, Tuple
 from fastapi import APIRouter, Query, HTTPException
 from pydantic import BaseModel, Field
-import databutton as db
 import re
 from datetime import datetime
-from app.apis.government_grants import GrantProgram, EligibilityCriteria, FundingDetails
+from app.apis.government_grants import GrantProgram, EligibilityCriteria, FundingDetails, load_grant_programs
 
 router = APIRouter()
 
@@ -355,8 +354,7 @@ def match_grants(request: GrantMatchRequest):
     
     try:
         # Get all grant programs
-        stored_data = db.storage.json.get(sanitize_storage_key('australian_government_grants'))
-        grants = [GrantProgram(**program) for program in stored_data]
+        grants = load_grant_programs()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading grants data: {str(e)}")
     
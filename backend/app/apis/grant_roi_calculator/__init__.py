@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any
 from datetime import datetime, timedelta
-import databutton as db
+from app.apis.storage_utils import storage
 import re
 import uuid
 from app.auth import AuthorizedUser
@@ -78,15 +78,15 @@ def get_grant_by_id(grant_id: str):
     """Get grant details by ID"""
     try:
         # First, try to get the grant from the grants index
-        grants_index = db.storage.json.get("grants_index", default=[])
+        grants_index = storage.json.get("grants_index", default=[])
         if grant_id in grants_index:
             grant_key = f"grant_{sanitize_storage_key(grant_id)}"
-            return db.storage.json.get(grant_key)
+            return storage.json.get(grant_key)
         
         # If not found in the index, scan all grants
         for g_id in grants_index:
             grant_key = f"grant_{sanitize_storage_key(g_id)}"
-            grant = db.storage.json.get(grant_key)
+            grant = storage.json.get(grant_key)
             if grant and grant.get("id") == grant_id:
                 return grant
         
@@ -104,7 +104,7 @@ def estimate_application_requirements(grant_id: str, business_id: Optional[str]
     # Get the base requirements structure from storage or create default set
     try:
         requirements_key = f"grant_requirements_{sanitize_storage_key(grant_id)}"
-        stored_requirements = db.storage.json.get(requirements_key, default=None)
+        stored_requirements = storage.json.get(requirements_key, default=None)
         
         if stored_requirements:
             return [ApplicationRequirement(**req) for req in stored_requirements]
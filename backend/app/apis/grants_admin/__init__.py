@@ -1,13 +1,16 @@
 from typing import List, Optional, Dict, Any, Union
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel, Field
-import databutton as db
+from app.apis.storage_utils import storage
 import re
 import uuid
 from datetime import datetime
 import requests
 from bs4 import BeautifulSoup
-from app.apis.government_grants import GrantProgram, EligibilityCriteria, FundingDetails, ApplicationPeriod, sanitize_storage_key
+from app.apis.government_grants import (
+    GrantProgram, EligibilityCriteria, FundingDetails, ApplicationPeriod, sanitize_storage_key,
+    grant_programs, load_grant_programs, save_grant_program,
+)
 
 router = APIRouter()
 
@@ -40,21 +43,16 @@ class ScrapeSource(BaseModel):
 # Helper function to get all grants
 def get_all_grants() -> List[GrantProgram]:
     try:
-        stored_data = db.storage.json.get(sanitize_storage_key('australian_government_grants'))
-        return [GrantProgram(**program) for program in stored_data]
+        return load_grant_programs()
     except Exception as e:
         print(f"Error getting grants: {e}")
-        # Initialize from the government_grants API if needed
-        from app.apis.government_grants import initialize_grant_database
-        return initialize_grant_database()
+        return []
 
-# Helper function to save all grants
-def save_all_grants(grants: List[GrantProgram]):
+# Helper function to save grants. Each grant is its own record, so only the given grants are written.
+def save_grants(grants: List[GrantProgram]):
     try:
-        db.storage.json.put(
-            sanitize_storage_key('australian_government_grants'),
-            [program.dict() for program in grants]
-        )
+        for program in grants:
+            save_grant_program(program)
         return True
     except Exception as e:
         print(f"Error saving grants: {e}")
@@ -67,7 +65,7 @@ def save_grant_update_history(grant_id: str, update_type: str, user: str, detail
         
         # Get existing history or create new
         try:
-            history = db.storage.json.get(history_key, default=[])
+            history = storage.json.get(history_key, default=[])
         except:
             history = []
             
@@ -80,7 +78,7 @@ def save_grant_update_history(grant_id: str, update_type: str, user: str, detail
         })
         
         # Save history
-        db.storage.json.put(history_key, history)
+        storage.json.put(history_key, history)
         return True
     except Exception as e:
         print(f"Error saving grant history: {e}")
@@ -89,7 +87,7 @@ def save_grant_update_history(grant_id: str, update_type: str, user: str, detail
 # Helper function to get scraping sources
 def get_scrape_sources() -> List[ScrapeSource]:
     try:
-        sources = db.storage.json.get(sanitize_storage_key('grant_scrape_sources'))
+        sources = storage.json.get(sanitize_storage_key('grant_scrape_sources'))
         return [ScrapeSource(**source) for source in sources]
     except:
         # Initialize default sources
@@ -126,31 +124,41 @@ def get_scrape_sources() -> List[ScrapeSource]:
             )
         ]
         
-        db.storage.json.put(
+        storage.json.put(
             sanitize_storage_key('grant_scrape_sources'),
             [source.dict() for source in default_sources]
         )
         
         return default_sources
 
+# Scrape statuses are stored one key per status. IDs start with a sortable
+# timestamp so key order is chronological.
+MAX_SCRAPE_STATUSES = 50
+
+def _scrape_status_id(timestamp: str) -> str:
+    return f"{re.sub(r'[^0-9]', '', timestamp)}-{uuid.uuid4().hex[:8]}"
+
+def _legacy_scrape_statuses(statuses: list) -> list:
+    return [dict(status, id=_scrape_status_id(status.get("timestamp", ""))) for status in statuses if isinstance(status, dict)]
+
+scrape_statuses = storage.collection(
+    "grant_scrape_statuses",
+    id_field="id",
+    legacy_key=sanitize_storage_key('grant_scrape_statuses'),
+    legacy_records=_legacy_scrape_statuses,
+)
+
 # Helper function to save scraping status
 def save_scrape_status(status: ScrapeStatus):
     try:
-        # Get existing statuses or create new
-        try:
-            statuses = db.storage.json.get(sanitize_storage_key('grant_scrape_statuses'), default=[])
-        except:
-            statuses = []
-            
-        # Add new status
-        statuses.append(status.dict())
-        
-        # Keep only the latest 50 statuses
-        if len(statuses) > 50:
-            statuses = statuses[-50:]
-            
-        # Save statuses
-        db.storage.json.put(sanitize_storage_key('grant_scrape_statuses'), statuses)
+        record = status.dict()
+        record["id"] = _scrape_status_id(status.timestamp)
+        scrape_statuses.put(record)
+        
+        # Keep only the latest statuses
+        status_keys = scrape_statuses.keys()
+        for key in status_keys[:-MAX_SCRAPE_STATUSES]:
+            storage.json.delete(key)
         return True
     except Exception as e:
         print(f"Error saving scrape status: {e}")
@@ -200,28 +208,14 @@ async def scrape_government_websites(sources: List[str], full_scan: bool):
             source.last_scraped = datetime.now().isoformat()
         
         # Save updated sources
-        db.storage.json.put(
+        storage.json.put(
             sanitize_storage_key('grant_scrape_sources'),
             [source.dict() for source in all_sources]
         )
         
-        # Add new grants to the database
-        if new_grants:
-            existing_grants.extend(new_grants)
-        
-        # Update existing grants
-        if updated_grants:
-            # Create a map of ids to updated grants
-            updated_map = {grant.id: grant for grant in updated_grants}
-            
-            # Replace existing grants with updated versions
-            for i, grant in enumerate(existing_grants):
-                if grant.id in updated_map:
-                    existing_grants[i] = updated_map[grant.id]
-        
-        # Save all grants if there were changes
+        # Save new and updated grants; untouched grants are not rewritten
         if new_grants or updated_grants:
-            save_all_grants(existing_grants)
+            save_grants(new_grants + updated_grants)
         
         # Final status update
         status = ScrapeStatus(
@@ -309,21 +303,17 @@ def scrape_grants_gov_au(existing_grants, existing_grant_ids, full_scan):
 def create_grant(request: GrantCreateRequest):
     """Create a new grant in the database"""
     try:
-        # Get all existing grants
-        existing_grants = get_all_grants()
-        
         # Ensure the ID is unique
         new_grant = request.grant
         if not new_grant.id:
             new_grant.id = f"custom-{uuid.uuid4().hex[:8]}"
         
         # Check for duplicate ID
-        if any(grant.id == new_grant.id for grant in existing_grants):
+        if grant_programs.get(new_grant.id) is not None:
             raise HTTPException(status_code=400, detail="Grant with this ID already exists")
         
-        # Add to existing grants and save
-        existing_grants.append(new_grant)
-        success = save_all_grants(existing_grants)
+        # Save the new grant
+        success = save_grants([new_grant])
         
         if success:
             # Record the creation in history
@@ -347,17 +337,9 @@ def create_grant(request: GrantCreateRequest):
 def update_grant(grant_id: str, request: GrantUpdateRequest):
     """Update an existing grant in the database"""
     try:
-        # Get all existing grants
-        existing_grants = get_all_grants()
-        
         # Find the grant to update
-        grant_index = None
-        for i, grant in enumerate(existing_grants):
-            if grant.id == grant_id:
-                grant_index = i
-                break
-        
-        if grant_index is None:
+        stored_grant = grant_programs.get(grant_id)
+        if stored_grant is None:
             raise HTTPException(status_code=404, detail="Grant not found")
         
         # Ensure the ID matches
@@ -366,7 +348,7 @@ def update_grant(grant_id: str, request: GrantUpdateRequest):
             raise HTTPException(status_code=400, detail="Grant ID in body does not match URL parameter")
         
         # Record changes for history
-        old_grant = existing_grants[grant_index]
+        old_grant = GrantProgram(**stored_grant)
         changes = {}
         for field_name, field_value in updated_grant.dict().items():
             old_value = getattr(old_grant, field_name)
@@ -374,8 +356,7 @@ def update_grant(grant_id: str, request: GrantUpdateRequest):
                 changes[field_name] = {"old": old_value, "new": field_value}
         
         # Update the grant and save
-        existing_grants[grant_index] = updated_grant
-        success = save_all_grants(existing_grants)
+        success = save_grants([updated_grant])
         
         if success:
             # Record the update in history
@@ -399,24 +380,19 @@ def update_grant(grant_id: str, request: GrantUpdateRequest):
 def delete_grant(grant_id: str):
     """Delete a grant from the database"""
     try:
-        # Get all existing grants
-        existing_grants = get_all_grants()
-        
         # Find the grant to delete
-        grant_index = None
-        grant_name = None
-        for i, grant in enumerate(existing_grants):
-            if grant.id == grant_id:
-                grant_index = i
-                grant_name = grant.name
-                break
-        
-        if grant_index is None:
+        stored_grant = grant_programs.get(grant_id)
+        if stored_grant is None:
             raise HTTPException(status_code=404, detail="Grant not found")
+        grant_name = stored_grant.get("name")
         
-        # Remove the grant and save
-        deleted_grant = existing_grants.pop(grant_index)
-        success = save_all_grants(existing_grants)
+        # Remove the grant
+        try:
+            grant_programs.delete(grant_id)
+            success = True
+        except Exception as e:
+            print(f"Error deleting grant {grant_id}: {e}")
+            success = False
         
         if success:
             # Record the deletion in history
@@ -463,10 +439,7 @@ def scrape_grants(background_tasks: BackgroundTasks, request: ScrapeRequest):
 def get_scrape_status():
     """Get the status of recent scraping operations"""
     try:
-        try:
-            statuses = db.storage.json.get(sanitize_storage_key('grant_scrape_statuses'), default=[])
-        except:
-            statuses = []
+        statuses = scrape_statuses.all()
         
         return {"statuses": statuses}
     
@@ -507,7 +480,7 @@ def update_scrape_source(source_id: str, source: ScrapeSource):
         sources[source_index] = source
         
         # Save sources
-        db.storage.json.put(
+        storage.json.put(
             sanitize_storage_key('grant_scrape_sources'),
             [s.dict() for s in sources]
         )
@@ -534,7 +507,7 @@ def create_scrape_source(source: ScrapeSource):
         sources.append(source)
         
         # Save sources
-        db.storage.json.put(
+        storage.json.put(
             sanitize_storage_key('grant_scrape_sources'),
             [s.dict() for s in sources]
         )
@@ -567,7 +540,7 @@ def delete_scrape_source(source_id: str):
         sources.pop(source_index)
         
         # Save sources
-        db.storage.json.put(
+        storage.json.put(
             sanitize_storage_key('grant_scrape_sources'),
             [s.dict() for s in sources]
         )
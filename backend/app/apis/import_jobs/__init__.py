@@ -0,0 +1,426 @@
+"""
+Background import jobs.
+
+Long-running imports are submitted as jobs instead of being processed inside the
+HTTP request. Submitting stores a job record and returns its id; a bounded pool
+of worker threads runs the job's handler, which processes its input in chunks and
+commits a checkpoint after each one. While a handler runs, a heartbeat thread keeps
+renewing the job's lease. If a worker dies mid-file, the lease expires and the job
+is picked up again from its last checkpoint (on startup, or when its status is read),
+so committed chunks are not redone. A queued job that no worker has started within
+a grace period is picked up the same way.
+
+Handlers are registered per job type by the module that owns the import:
+
+    register_import_job_handler("financial_import", run_financial_import_job)
+
+A handler receives an ImportJobContext and returns the job result (a dict). It
+reads `context.checkpoint` to find where to resume and calls `context.commit(...)`
+once a chunk's output has been written.
+
+Job records live in storage.json under `import_jobs/{job_id}`.
+"""
+
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+
+from app.apis.storage_utils import storage
+
+router = APIRouter(prefix="/import-jobs", tags=["Import Jobs"])
+
+# --- Configuration ---
+
+# Jobs running at the same time in this process
+IMPORT_JOB_WORKERS = int(os.environ.get("IMPORT_JOB_WORKERS", "4"))
+# Rows handed to a job handler per chunk
+IMPORT_JOB_CHUNK_ROWS = int(os.environ.get("IMPORT_JOB_CHUNK_ROWS", "20000"))
+# A running job whose lease has not been renewed for this long is assumed dead and resumed
+IMPORT_JOB_LEASE_SECONDS = float(os.environ.get("IMPORT_JOB_LEASE_SECONDS", "300"))
+# How often a running job renews its lease
+IMPORT_JOB_HEARTBEAT_SECONDS = float(os.environ.get("IMPORT_JOB_HEARTBEAT_SECONDS", "30"))
+# A queued job not started by the process that submitted it is run elsewhere after this long
+IMPORT_JOB_QUEUED_GRACE_SECONDS = float(os.environ.get("IMPORT_JOB_QUEUED_GRACE_SECONDS", "120"))
+# Row-level errors kept on the job record (the total is always counted)
+IMPORT_JOB_MAX_ERRORS = int(os.environ.get("IMPORT_JOB_MAX_ERRORS", "100"))
+
+IMPORT_JOB_PREFIX = "import_jobs/"
+IMPORT_JOBS_BY_ORG_INDEX = "import_jobs_by_org"
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+storage.json.register_index(
+    IMPORT_JOBS_BY_ORG_INDEX,
+    IMPORT_JOB_PREFIX,
+    lambda job: job.get("organization_id"),
+)
+
+
+class ImportJobLeaseLost(Exception):
+    """The job was claimed by another worker (this one was presumed dead)."""
+
+
+def _now() -> float:
+    return time.time()
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp else None
+
+
+def _job_key(job_id: str) -> str:
+    return f"{IMPORT_JOB_PREFIX}{job_id}"
+
+
+def get_import_job(job_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        return storage.json.get(_job_key(job_id), fresh=True)
+    except FileNotFoundError:
+        return None
+
+
+def _is_stale(job: Dict[str, Any]) -> bool:
+    if job.get("status") == STATUS_QUEUED:
+        # The submitting process normally runs its queued jobs; others only step in
+        # once the job has waited past the grace period (e.g. that process died)
+        if job.get("job_id") in _dispatched:
+            return False
+        return _now() - (job.get("created_at") or 0) > IMPORT_JOB_QUEUED_GRACE_SECONDS
+    if job.get("status") == STATUS_RUNNING:
+        return _now() - (job.get("heartbeat_at") or 0) > IMPORT_JOB_LEASE_SECONDS
+    return False
+
+
+# --- Handler Context ---
+
+class ImportJobContext:
+    """
+    Passed to a job handler: its parameters, the checkpoint to resume from, and progress reporting.
+    Used as a context manager by the worker, which renews the job's lease from a heartbeat
+    thread for as long as the handler runs.
+    """
+
+    def __init__(self, job: Dict[str, Any], lease: str):
+        self.job_id: str = job["job_id"]
+        self.job_type: str = job["job_type"]
+        self.params: Dict[str, Any] = job.get("params") or {}
+        self.checkpoint: Dict[str, Any] = dict(job.get("checkpoint") or {})
+        self.rows_processed: int = job.get("rows_processed", 0)
+        self.chunk_rows = IMPORT_JOB_CHUNK_ROWS
+        self._lease = lease
+        self._lease_lost = False
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "ImportJobContext":
+        self._heartbeat = threading.Thread(target=self._renew_lease, name=f"import-job-heartbeat-{self.job_id}",
+                                           daemon=True)
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop_heartbeat.set()
+        self._heartbeat.join()
+
+    def _renew_lease(self):
+        while not self._stop_heartbeat.wait(IMPORT_JOB_HEARTBEAT_SECONDS):
+            try:
+                self._update(lambda job: None)
+            except ImportJobLeaseLost:
+                print(f"Import job {self.job_id} lost its lease; stopping at the next commit")
+                return
+            except Exception as e:
+                # Try again on the next beat; the lease only lapses after IMPORT_JOB_LEASE_SECONDS
+                print(f"[WARN] Could not renew the lease of import job {self.job_id}: {e}")
+
+    def _update(self, mutate: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        if self._lease_lost:
+            raise ImportJobLeaseLost(self.job_id)
+
+        def apply(job: Dict[str, Any]):
+            if job is None or job.get("lease") != self._lease:
+                raise ImportJobLeaseLost(self.job_id)
+            mutate(job)
+            job["heartbeat_at"] = _now()
+            return job
+        try:
+            return storage.json.update(_job_key(self.job_id), apply)
+        except ImportJobLeaseLost:
+            self._lease_lost = True
+            raise
+
+    def set_total(self, rows_total: Optional[int]):
+        """Records the expected number of input rows, used for progress and ETA."""
+        def mutate(job: Dict[str, Any]):
+            job["rows_total"] = rows_total
+        self._update(mutate)
+
+    def commit(self, checkpoint: Dict[str, Any], rows: int, errors: Optional[List[str]] = None,
+               error_count: Optional[int] = None):
+        """
+        Records a finished chunk: `checkpoint` replaces the stored one (a resumed run
+        starts from it) and `rows` is added to the rows processed. Call this only after
+        the chunk's output has been written. `error_count` is the chunk's total when
+        `errors` only lists some of them. Raises ImportJobLeaseLost if another worker
+        has taken the job over.
+        """
+        errors = errors or []
+        error_count = len(errors) if error_count is None else error_count
+
+        def mutate(job: Dict[str, Any]):
+            job["checkpoint"] = checkpoint
+            job["rows_processed"] = job.get("rows_processed", 0) + rows
+            job["chunks_processed"] = job.get("chunks_processed", 0) + 1
+            job["error_count"] = job.get("error_count", 0) + error_count
+            kept = job.setdefault("errors", [])
+            kept.extend(errors[:max(0, IMPORT_JOB_MAX_ERRORS - len(kept))])
+
+        self._update(mutate)
+        self.checkpoint = dict(checkpoint)
+        self.rows_processed += rows
+
+
+# --- Worker Pool ---
+
+_handlers: Dict[str, Callable[[ImportJobContext], Dict[str, Any]]] = {}
+_import_job_pool = ThreadPoolExecutor(max_workers=IMPORT_JOB_WORKERS, thread_name_prefix="import-job")
+# Jobs submitted to the pool of this process and not finished yet
+_dispatched: set = set()
+_dispatch_lock = threading.Lock()
+
+
+def register_import_job_handler(job_type: str, handler: Callable[[ImportJobContext], Dict[str, Any]]):
+    _handlers[job_type] = handler
+
+
+def _dispatch(job_id: str):
+    with _dispatch_lock:
+        if job_id in _dispatched:
+            return
+        _dispatched.add(job_id)
+    _import_job_pool.submit(_run_import_job, job_id)
+
+
+def submit_import_job(job_type: str, params: Dict[str, Any], *,
+                      organization_id: Optional[str] = None, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """Stores a queued job and hands it to the worker pool. Returns the job record."""
+    if job_type not in _handlers:
+        raise ValueError(f"No handler registered for import job type '{job_type}'")
+    job_id = f"job_{uuid.uuid4().hex}"
+    job = {
+        "job_id": job_id,
+        "job_type": job_type,
+        "status": STATUS_QUEUED,
+        "params": params,
+        "organization_id": organization_id,
+        "user_id": user_id,
+        "created_at": _now(),
+        "checkpoint": {},
+        "rows_processed": 0,
+        "rows_total": None,
+        "chunks_processed": 0,
+        "errors": [],
+        "error_count": 0,
+        "attempts": 0,
+    }
+    storage.json.put(_job_key(job_id), job)
+    _dispatch(job_id)
+    return job
+
+
+def _claim(job_id: str, lease: str) -> Optional[Dict[str, Any]]:
+    """Marks the job running under `lease` unless it is finished or held by a live worker."""
+    claimed = {}
+
+    def mutate(job: Dict[str, Any]):
+        claimed.clear()
+        if job is None:
+            return job
+        if job.get("status") == STATUS_RUNNING and not _is_stale(job):
+            return job
+        if job.get("status") not in ACTIVE_STATUSES:
+            return job
+        now = _now()
+        job.update({
+            "status": STATUS_RUNNING,
+            "lease": lease,
+            "attempts": job.get("attempts", 0) + 1,
+            "started_at": job.get("started_at") or now,
+            "heartbeat_at": now,
+            # Throughput is measured over the current attempt only
+            "attempt_started_at": now,
+            "attempt_rows_start": job.get("rows_processed", 0),
+        })
+        claimed["job"] = job
+        return job
+
+    storage.json.update(_job_key(job_id), mutate)
+    return claimed.get("job")
+
+
+def _finish(job_id: str, lease: str, status: str, result: Optional[Dict[str, Any]] = None,
+            error: Optional[str] = None):
+    def mutate(job: Dict[str, Any]):
+        if job is None or job.get("lease") != lease:
+            return job
+        job.update({"status": status, "finished_at": _now(), "heartbeat_at": _now(), "result": result})
+        if error:
+            job["error"] = error
+        return job
+    storage.json.update(_job_key(job_id), mutate)
+
+
+def _run_import_job(job_id: str):
+    lease = uuid.uuid4().hex
+    try:
+        job = _claim(job_id, lease)
+        if job is None:
+            return
+        handler = _handlers.get(job["job_type"])
+        if handler is None:
+            _finish(job_id, lease, STATUS_FAILED, error=f"No handler registered for job type '{job['job_type']}'")
+            return
+
+        print(f"Import job {job_id} ({job['job_type']}) started, attempt {job['attempts']}, "
+              f"resuming after {job.get('rows_processed', 0)} rows")
+        try:
+            with ImportJobContext(job, lease) as context:
+                result = handler(context)
+        except ImportJobLeaseLost:
+            print(f"Import job {job_id} was taken over by another worker")
+            return
+        except Exception as e:
+            print(f"Import job {job_id} failed: {e}")
+            traceback.print_exc()
+            _finish(job_id, lease, STATUS_FAILED, error=str(e))
+            return
+        _finish(job_id, lease, STATUS_SUCCEEDED, result=result or {})
+        print(f"Import job {job_id} finished")
+    except Exception as e:
+        print(f"Error running import job {job_id}: {e}")
+    finally:
+        with _dispatch_lock:
+            _dispatched.discard(job_id)
+
+
+def resume_import_jobs() -> int:
+    """
+    Dispatches queued jobs left waiting past the grace period and running jobs whose
+    lease expired. Returns how many were dispatched.
+    """
+    try:
+        entries = storage.json.list(prefix=IMPORT_JOB_PREFIX)
+        jobs = storage.json.get_many([entry.name for entry in entries], fresh=True)
+    except Exception as e:
+        print(f"Error loading import jobs to resume: {e}")
+        return 0
+    resumed = 0
+    for job in jobs.values():
+        if isinstance(job, dict) and job.get("job_type") in _handlers and _is_stale(job):
+            _dispatch(job["job_id"])
+            resumed += 1
+    if resumed:
+        print(f"Resuming {resumed} interrupted import job(s)")
+    return resumed
+
+
+# --- API Models ---
+
+class ImportJobStatus(BaseModel):
+    job_id: str
+    job_type: str
+    status: str
+    organization_id: Optional[str] = None
+    rows_processed: int
+    rows_total: Optional[int] = None
+    progress: Optional[float] = None # 0..1 when the total is known
+    chunks_processed: int
+    rows_per_second: Optional[float] = None # Over the current attempt
+    eta_seconds: Optional[float] = None
+    error_count: int
+    errors: List[str]
+    error: Optional[str] = None # Why the job failed
+    attempts: int
+    created_at: Optional[str] = None
+    started_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+
+
+def import_job_status(job: Dict[str, Any]) -> ImportJobStatus:
+    rows_processed = job.get("rows_processed", 0)
+    rows_total = job.get("rows_total")
+    rows_per_second = None
+    eta_seconds = None
+    if job.get("attempt_started_at"):
+        end = job.get("finished_at") or job.get("heartbeat_at") or _now()
+        elapsed = end - job["attempt_started_at"]
+        if elapsed > 0:
+            rows_per_second = round((rows_processed - job.get("attempt_rows_start", 0)) / elapsed, 1)
+    if job.get("status") == STATUS_RUNNING and rows_total and rows_per_second:
+        eta_seconds = round(max(0, rows_total - rows_processed) / rows_per_second, 1)
+
+    return ImportJobStatus(
+        job_id=job["job_id"],
+        job_type=job["job_type"],
+        status=job["status"],
+        organization_id=job.get("organization_id"),
+        rows_processed=rows_processed,
+        rows_total=rows_total,
+        progress=round(min(1.0, rows_processed / rows_total), 4) if rows_total else None,
+        chunks_processed=job.get("chunks_processed", 0),
+        rows_per_second=rows_per_second,
+        eta_seconds=eta_seconds,
+        error_count=job.get("error_count", 0),
+        errors=job.get("errors", []),
+        error=job.get("error"),
+        attempts=job.get("attempts", 0),
+        created_at=_iso(job.get("created_at")),
+        started_at=_iso(job.get("started_at")),
+        updated_at=_iso(job.get("heartbeat_at")),
+        finished_at=_iso(job.get("finished_at")),
+        result=job.get("result"),
+    )
+
+
+# --- API Endpoints ---
+
+@router.get("/{job_id}", response_model=ImportJobStatus)
+def get_import_job_status(job_id: str):
+    """Progress of an import job: rows processed, throughput, errors and (once finished) its result."""
+    job = get_import_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Import job {job_id} not found")
+    # A job whose worker died is picked up again on the next status check
+    if job.get("job_type") in _handlers and _is_stale(job):
+        _dispatch(job_id)
+    return import_job_status(job)
+
+
+@router.get("", response_model=List[ImportJobStatus])
+def list_import_jobs(
+    organization_id: str = Query(..., description="Organization whose jobs to list"),
+    active_only: bool = Query(False, description="Only queued or running jobs"),
+):
+    """Import jobs of an organization, most recent first."""
+    entries = storage.json.list_by_index(IMPORT_JOBS_BY_ORG_INDEX, organization_id)
+    jobs = storage.json.get_many([entry.name for entry in entries], fresh=True)
+    statuses = [
+        import_job_status(job) for job in jobs.values()
+        if isinstance(job, dict) and (not active_only or job.get("status") in ACTIVE_STATUSES)
+    ]
+    statuses.sort(key=lambda status: status.created_at or "", reverse=True)
+    return statuses
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Form, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel # Added BaseModel import
-from typing import List, Dict, Optional, Any
-import databutton as db
+from typing import List, Dict, Optional, Any, Tuple, Union
+from app.apis.storage_utils import storage
+from app.apis.formula_engine import FormulaError, FormulaSet, compile_formula
 from datetime import datetime
 import statistics
+import numpy as np
 
 # Import our submodules
 from app.apis.models import (
@@ -22,7 +25,8 @@ from app.apis.models import (
 
     # Helpers
     get_benchmark_sources, save_benchmark_sources, initialize_benchmark_sources,
-    get_benchmark_data, get_benchmark_versions, add_benchmark_version, sanitize_storage_key
+    get_benchmark_data, get_benchmark_versions, add_benchmark_version, sanitize_storage_key,
+    resolve_benchmark_views
 )
 
 # Import ETL functions
@@ -46,7 +50,7 @@ METRIC_DEFINITIONS_JSON_KEY = "benchmark_metric_definitions.json"
 def _load_json_data(key: str, model_cls: type) -> List[Any]:
     """Loads JSON data from db.storage and validates with a Pydantic model class."""
     try:
-        data = db.storage.json.get(key)
+        data = storage.json.get(key)
         return [model_cls(**item) for item in data]
     except FileNotFoundError:
         return []
@@ -59,7 +63,7 @@ def _save_json_data(key: str, data: List[BaseModel]):
     """Saves a list of Pydantic models as JSON to db.storage."""
     try:
         # Ensure data is a list of dicts before saving
-        db.storage.json.put(key, [item.dict() for item in data])
+        storage.json.put(key, [item.dict() for item in data])
     except Exception as e:
         print(f"Error saving JSON to {key}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to save data to {key}")
@@ -74,6 +78,56 @@ def _save_metric_definitions(definitions: List[BenchmarkMetricDefinition]):
     _save_json_data(METRIC_DEFINITIONS_JSON_KEY, definitions)
 
 
+_metric_formula_cache: Dict[Tuple[Tuple[str, str], ...], Tuple[FormulaSet, Dict[str, str]]] = {}
+
+
+def _metric_formula_set(formulas: Tuple[Tuple[str, str], ...]) -> Tuple[FormulaSet, Dict[str, str]]:
+    """
+    FormulaSet of the metric formulas that compile, and the error of each that does
+    not. Metrics in a reference cycle are left out with the cycle as their error.
+    """
+    cached = _metric_formula_cache.get(formulas)
+    if cached is not None:
+        return cached
+
+    valid: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+    for name, formula in formulas:
+        try:
+            compile_formula(formula)
+            valid[name] = formula
+        except FormulaError as e:
+            errors[name] = str(e)
+    while True:
+        try:
+            formula_set = FormulaSet(valid)
+            break
+        except FormulaError as e:
+            for name in set(e.cycle) or list(valid):
+                errors[name] = str(e)
+                del valid[name]
+
+    _metric_formula_cache.clear()  # Only the current definitions are worth keeping
+    _metric_formula_cache[formulas] = (formula_set, errors)
+    return formula_set, errors
+
+
+def calculate_defined_metrics(values: Dict[str, Union[float, List[float]]]) -> Tuple[Dict[str, List[Optional[float]]], Dict[str, str]]:
+    """
+    Evaluates the formulas of the metric definitions over the given inputs, e.g.
+    {"Current Assets": 500, "Current Liabilities": 250} for "[Current Assets] / [Current Liabilities]".
+    Inputs may be single values or equal-length series (e.g. one value per year); each
+    metric comes back as a list of the same length. Returns (values, errors by metric name).
+    """
+    formulas = tuple(sorted((d.name, d.formula) for d in _load_metric_definitions() if d.formula))
+    formula_set, errors = _metric_formula_set(formulas)
+    size = max((len(v) for v in values.values() if isinstance(v, list)), default=1)
+    if any(isinstance(v, list) and len(v) != size for v in values.values()):
+        raise ValueError("All series values must have the same length")
+    results = formula_set.evaluate(values, size=size)
+    return {name: [None if np.isnan(v) else float(v) for v in vector] for name, vector in results.items()}, errors
+
+
 # Helper function to initialize sample data (kept for backward compatibility)
 def initialize_benchmark_data() -> List[Dict[str, Any]]:
     """
@@ -148,11 +202,11 @@ def initialize_benchmark_data() -> List[Dict[str, Any]]:
     
     # Store the sample data in database
     storage_key = sanitize_storage_key("benchmark_data_all")
-    existing_data = db.storage.json.get(storage_key, default=[])
+    existing_data = storage.json.get(storage_key, default=[])
     
     # Only initialize if no data exists
     if not existing_data:
-        db.storage.json.put(storage_key, sample_data)
+        storage.json.put(storage_key, sample_data)
         print(f"Initialized {len(sample_data)} benchmark data points")
         
         # Also initialize source-specific data stores
@@ -160,7 +214,7 @@ def initialize_benchmark_data() -> List[Dict[str, Any]]:
         for source_id in sources:
             source_data = [dp for dp in sample_data if dp["source_id"] == source_id]
             source_key = sanitize_storage_key(f"benchmark_data_{source_id}")
-            db.storage.json.put(source_key, source_data)
+            storage.json.put(source_key, source_data)
     
     return sample_data
 
@@ -227,6 +281,25 @@ def delete_benchmark_metric_definition(metric_id: str):
     return # Return None with 204 status code
 
 
+class CalculateMetricsRequest(BaseModel):
+    values: Dict[str, Union[float, List[float]]]  # Input name -> value, or series of values
+
+
+class CalculateMetricsResponse(BaseModel):
+    metrics: Dict[str, List[Optional[float]]]
+    errors: Dict[str, str]
+
+
+@router.post("/metrics/calculate", response_model=CalculateMetricsResponse)
+def calculate_benchmark_metrics(request: CalculateMetricsRequest):
+    """Calculates every metric definition that has a formula from the given input values."""
+    try:
+        metrics, errors = calculate_defined_metrics(request.values)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return CalculateMetricsResponse(metrics=metrics, errors=errors)
+
+
 # Additional endpoints for benchmark data management
 
 @router.post("/sources", response_model=BenchmarkSource, status_code=201)
@@ -334,7 +407,7 @@ async def delete_benchmark_source(source_id: str):
         # Delete associated data
         try:
             source_key = sanitize_storage_key(f"benchmark_data_{source_id}")
-            db.storage.json.put(source_key, [])
+            storage.json.put(source_key, [])
             
             # Also delete version-specific data
             if hasattr(source, 'version_history') and source.version_history:
@@ -342,7 +415,7 @@ async def delete_benchmark_source(source_id: str):
                     version = version_entry.get("version")
                     if version:
                         version_key = sanitize_storage_key(f"benchmark_data_{source_id}_v{version}")
-                        db.storage.json.put(version_key, [])
+                        storage.json.put(version_key, [])
         except Exception as e:
             # Non-critical error when deleting data
             print(f"Warning: Could not delete data for source {source_id}: {e}")
@@ -370,11 +443,12 @@ async def compare_benchmark_versions(
     try:
         # Get data for version 1
         v1_key = sanitize_storage_key(f"benchmark_data_{source_id}_v{version1}")
-        v1_data = db.storage.json.get(v1_key, default=[])
         
         # Get data for version 2
         v2_key = sanitize_storage_key(f"benchmark_data_{source_id}_v{version2}")
-        v2_data = db.storage.json.get(v2_key, default=[])
+        
+        views = resolve_benchmark_views(storage.json.get_many([v1_key, v2_key], default=list))
+        v1_data, v2_data = views[v1_key], views[v2_key]
         
         # Filter by industry code if provided
         if industry_code:
@@ -652,7 +726,7 @@ async def upload_benchmark_data(
 ):
     """Upload and process benchmark data file"""
     # Import ETL functions locally to avoid circular imports
-    from app.apis.etl import process_csv_file, process_excel_file, save_benchmark_import
+    from app.apis.etl import iter_csv_points, iter_excel_points, save_benchmark_import_stream
     
     try:
         # Check if source exists
@@ -660,33 +734,31 @@ async def upload_benchmark_data(
         if not any(s.id == source_id for s in sources):
             raise HTTPException(status_code=404, detail=f"Benchmark source {source_id} not found")
         
-        # Process file based on file extension
+        # Process file based on file extension; rows are parsed and stored chunk by chunk
         file_extension = file.filename.split('.')[-1].lower()
-        data_points = []
-        metadata = {}
         
         if file_extension == 'csv':
-            data_points, metadata = process_csv_file(file, source_id, year, version)
+            batches, metadata = iter_csv_points(file, source_id, year, version)
         elif file_extension in ['xlsx', 'xls']:
-            data_points, metadata = process_excel_file(file, source_id, year, version)
+            batches, metadata = iter_excel_points(file, source_id, year, version)
         else:
             raise HTTPException(status_code=400, detail=f"Unsupported file format: {file_extension}. Please upload CSV or Excel files.")
         
+        # Save the data (parsing a large file off the event loop)
+        import_id, processed_points = await run_in_threadpool(save_benchmark_import_stream, batches, metadata)
+        
         # Check for processing errors
-        if not data_points and metadata.get('error'):
+        if import_id is None:
             raise HTTPException(status_code=400, detail=metadata['error'])
         
-        # Save the data
-        import_id = save_benchmark_import(data_points, metadata)
-        
         # Update the source's version history
         add_benchmark_version(source_id, version, description)
         
         return ImportResponse(
             success=True,
             import_id=import_id,
-            message=f"Successfully processed {len(data_points)} data points",
-            processed_points=len(data_points)
+            message=f"Successfully processed {processed_points} data points",
+            processed_points=processed_points
         )
         
     except HTTPException:
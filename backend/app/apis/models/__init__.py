@@ -6,7 +6,9 @@ from pydantic import BaseModel, Field
 from enum import Enum
 import uuid
 import re
-import databutton as db
+import hashlib
+import json
+from app.apis.storage_utils import storage
 from datetime import datetime
 from typing import Optional, Dict, Any, List, Literal
 
@@ -124,7 +126,7 @@ def sanitize_storage_key(key: str) -> str:
 def get_benchmark_sources() -> List[BenchmarkSource]:
     """Loads benchmark sources from storage."""
     try:
-        sources_data = db.storage.json.get(BENCHMARK_SOURCES_KEY)
+        sources_data = storage.json.get(BENCHMARK_SOURCES_KEY)
         return [BenchmarkSource(**source) for source in sources_data]
     except FileNotFoundError:
         return []
@@ -135,7 +137,7 @@ def get_benchmark_sources() -> List[BenchmarkSource]:
 def save_benchmark_sources(sources: List[BenchmarkSource]):
     """Saves benchmark sources to storage."""
     try:
-        db.storage.json.put(BENCHMARK_SOURCES_KEY, [source.model_dump() for source in sources])
+        storage.json.put(BENCHMARK_SOURCES_KEY, [source.model_dump() for source in sources])
     except Exception as e:
         print(f"Error saving benchmark sources: {e}")
         # Potentially raise an exception here depending on desired error handling
@@ -201,18 +203,18 @@ def get_benchmark_data(
              keys_to_fetch.append(base_key)
         keys_to_fetch.append(sanitize_storage_key(f"{BENCHMARK_DATA_PREFIX}all")) # Legacy combined key?
 
-    # Fetch data from identified keys
-    fetched_keys = set() # Avoid duplicate fetching
-    for key in keys_to_fetch:
-        if key not in fetched_keys:
-            try:
-                data = db.storage.json.get(key)
-                all_data.extend([BenchmarkDataPoint(**item) for item in data])
-                fetched_keys.add(key)
-            except FileNotFoundError:
-                pass # Ignore if a specific version/source key doesn't exist
-            except Exception as e:
-                print(f"Error loading benchmark data from key {key}: {e}")
+    # Fetch data from identified keys in one batch (duplicates are fetched once,
+    # keys for missing versions/sources are simply absent)
+    try:
+        fetched = resolve_benchmark_views(storage.json.get_many(keys_to_fetch))
+    except Exception as e:
+        print(f"Error loading benchmark data: {e}")
+        fetched = {}
+    for key, data in fetched.items():
+        try:
+            all_data.extend([BenchmarkDataPoint(**item) for item in data])
+        except Exception as e:
+            print(f"Error loading benchmark data from key {key}: {e}")
 
     # Apply filters
     filtered_data = all_data
@@ -303,6 +305,154 @@ def add_benchmark_version(source_id: str, version: str, description: Optional[st
         print(f"Warning: Could not add version {version} because source {source_id} was not found.")
 
 
+# --- Content-Addressed Benchmark Storage ---
+# Benchmark rows are stored once, in chunks keyed by the SHA-256 of their content.
+# The benchmark_data_* views (per source, per version, "all") and each import's data
+# key hold a small manifest instead of a copy of the rows:
+#   {"__benchmark_manifest__": 1, "segments": [{"chunks": [hash, ...], "rows": n,
+#     "source_id": ..., "version": ..., "content_hash": ..., "fields": {...}}]}
+# "fields" (import_id, timestamp) are added to each row when the view is read, so
+# identical rows from different imports share chunks. Plain lists written by older
+# code are still read as-is.
+
+BENCHMARK_CHUNK_PREFIX = "benchmark_chunk_"
+BENCHMARK_CHUNK_ROWS = 5000
+BENCHMARK_MANIFEST_MARKER = "__benchmark_manifest__"
+
+def _content_hash(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def is_benchmark_manifest(value: Any) -> bool:
+    return isinstance(value, dict) and BENCHMARK_MANIFEST_MARKER in value
+
+def make_benchmark_manifest(segments: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {BENCHMARK_MANIFEST_MARKER: 1, "segments": segments}
+
+class BenchmarkChunkWriter:
+    """
+    Stores rows as content-addressed chunks while they are being produced: rows are
+    added in batches of any size and each full chunk is written as soon as it is
+    buffered, so at most one chunk of rows is held. Chunk boundaries, and therefore
+    hashes, are the same as for store_benchmark_rows on the concatenated rows.
+    """
+
+    def __init__(self, source_id: Optional[str], version: Optional[str],
+                 fields: Optional[Dict[str, Any]] = None):
+        self.source_id = source_id
+        self.version = version
+        self.fields = fields or {}
+        self.hashes: List[str] = []
+        self.rows = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._written: set = set()
+
+    def _write(self, chunks: List[List[Dict[str, Any]]]):
+        new_chunks = {}
+        for chunk in chunks:
+            chunk_hash = _content_hash(chunk)
+            self.hashes.append(chunk_hash)
+            key = f"{BENCHMARK_CHUNK_PREFIX}{chunk_hash}"
+            if key in self._written or key in new_chunks:
+                continue
+            if not any(entry.name == key for entry in storage.json.list(prefix=key)):
+                new_chunks[key] = chunk
+        if new_chunks:
+            storage.json.put_many(new_chunks)
+        self._written.update(new_chunks)
+
+    def add(self, rows: List[Dict[str, Any]]):
+        self.rows += len(rows)
+        self._buffer.extend(rows)
+        full = len(self._buffer) - len(self._buffer) % BENCHMARK_CHUNK_ROWS
+        if full:
+            self._write([self._buffer[i:i + BENCHMARK_CHUNK_ROWS] for i in range(0, full, BENCHMARK_CHUNK_ROWS)])
+            del self._buffer[:full]
+
+    def finish(self) -> Dict[str, Any]:
+        """Writes the last partial chunk and returns the manifest segment referencing all chunks."""
+        if self._buffer:
+            self._write([self._buffer])
+            self._buffer = []
+        return {
+            "chunks": list(self.hashes),
+            "rows": self.rows,
+            "source_id": self.source_id,
+            "version": self.version,
+            "content_hash": _content_hash([self.source_id, self.version, self.hashes]),
+            "fields": self.fields,
+        }
+
+def store_benchmark_rows(rows: List[Dict[str, Any]], source_id: Optional[str], version: Optional[str],
+                         fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Stores rows as content-addressed chunks (skipping chunks that already exist) and
+    returns the manifest segment referencing them.
+    """
+    writer = BenchmarkChunkWriter(source_id, version, fields)
+    writer.add(rows)
+    return writer.finish()
+
+def legacy_benchmark_segments(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Converts a plain list view into segments, one per (source_id, version)."""
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault((row.get("source_id"), row.get("version")), []).append(row)
+    return [store_benchmark_rows(group, source_id, version) for (source_id, version), group in groups.items()]
+
+def benchmark_view_segments(value: Any) -> List[Dict[str, Any]]:
+    """Segments of a stored view, converting legacy plain lists on the way."""
+    if is_benchmark_manifest(value):
+        return list(value.get("segments", []))
+    if isinstance(value, list) and value:
+        return legacy_benchmark_segments(value)
+    return []
+
+def resolve_benchmark_views(values: Dict[str, Any], limit: Optional[int] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Expands stored views (manifests or legacy lists) into rows, fetching every chunk
+    they reference in one batch. With `limit`, only the chunks needed for the first
+    `limit` rows of each view are read.
+    """
+    needed: List[str] = []
+    for value in values.values():
+        if not is_benchmark_manifest(value):
+            continue
+        remaining = limit
+        for segment in value.get("segments", []):
+            for chunk_hash in segment.get("chunks", []):
+                if remaining is not None and remaining <= 0:
+                    break
+                needed.append(f"{BENCHMARK_CHUNK_PREFIX}{chunk_hash}")
+                if remaining is not None:
+                    remaining -= BENCHMARK_CHUNK_ROWS
+    chunk_data = storage.json.get_many(needed) if needed else {}
+
+    resolved = {}
+    for key, value in values.items():
+        if not is_benchmark_manifest(value):
+            rows = value if isinstance(value, list) else []
+            resolved[key] = rows[:limit] if limit is not None else rows
+            continue
+        rows = []
+        for segment in value.get("segments", []):
+            fields = segment.get("fields") or {}
+            for chunk_hash in segment.get("chunks", []):
+                if limit is not None and len(rows) >= limit:
+                    break
+                chunk = chunk_data.get(f"{BENCHMARK_CHUNK_PREFIX}{chunk_hash}")
+                if chunk is None:
+                    print(f"Warning: Benchmark chunk {chunk_hash} referenced by {key} is missing")
+                    continue
+                rows.extend({**row, **fields} for row in chunk)
+        resolved[key] = rows[:limit] if limit is not None else rows
+    return resolved
+
+def load_benchmark_view(key: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Reads a benchmark view or import data key as a list of rows."""
+    return resolve_benchmark_views({key: storage.json.get(key, default=list)}, limit=limit)[key]
+
+
 # --- Payloads ---
 class CreateSourcePayload(BaseModel):
     name: str = Field(..., description="Name of the new benchmark source")
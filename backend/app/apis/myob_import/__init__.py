@@ -1,25 +1,130 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from datetime import date
-import requests
+"""
+MYOB AccountRight trial balance import.
+
+Each MYOB connection (one company file) is synced into the financial data store as
+a trial balance import per period, `myob_{connection_id}_{start}_{end}`, whose rows
+are written as data parts (see financial_import.save_imported_data) page by page as
+they arrive. Pages after the first are fetched concurrently, bounded by a shared pool.
+
+Syncs are incremental: the sync state of each (connection, period) keeps the
+company file's ETag and the latest LastModified seen. The next sync sends
+If-None-Match (a 304 means nothing changed) and otherwise only asks for accounts
+modified since the cursor. Parts are never rewritten in place: the parts holding
+changed accounts are copied to new parts and the import record is switched over to
+them, and the parts it no longer uses are deleted by the sync after. A delta only
+sees accounts that still exist, so a full sync (`full_sync=True`, no state yet, or
+the last one older than MYOB_FULL_SYNC_SECONDS) rewrites the import to drop
+accounts deleted in MYOB.
+
+Expired access tokens are refreshed once per 401 (MYOB rotates refresh tokens, so
+the new pair is saved on the connection straight away).
+
+Nightly syncs of many company files run as a background import job (see
+app.apis.import_jobs) via POST /myob/sync/trial-balance. tests/myob_fake_server.py
+is a local stand-in for the MYOB API to run the connector against.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
 import databutton as db
+import requests
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from requests.adapters import HTTPAdapter
 
+from app.apis.data_connections import decrypt_value, encrypt_value
+from app.apis.financial_import import (
+    FinancialDataType, _import_part_key, _import_storage_key, save_imported_data
+)
+from app.apis.import_jobs import (
+    ImportJobContext, ImportJobLeaseLost, register_import_job_handler, submit_import_job
+)
+from app.apis.permission_utils import is_organization_member
+from app.apis.storage_utils import async_storage, storage
+from app.apis.utils import log_audit_event, log_audit_event_async
 from app.auth import AuthorizedUser
-from app.apis.audit_utils import log_audit_event
 
-# TODO: Need to import or define how to get connection details (including credentials and company file ID)
-# from app.apis.connections import get_connection_details # Example import
+router = APIRouter(prefix="/myob", tags=["MYOB Integration"])
 
-# TODO: Need to import or define the standard Trial Balance schema
-# from app.models.financial_data import StandardTrialBalanceEntry # Example import
+# --- Configuration ---
+
+MYOB_API_BASE_URL = os.environ.get("MYOB_API_BASE_URL", "https://api.myob.com/accountright").rstrip("/")
+MYOB_TOKEN_URL = os.environ.get("MYOB_TOKEN_URL", "https://secure.myob.com/oauth2/v1/authorize")
+# Items per page ($top); 1000 is the most MYOB returns
+MYOB_PAGE_SIZE = int(os.environ.get("MYOB_PAGE_SIZE", "1000"))
+# Page requests in flight per company file
+MYOB_PAGE_CONCURRENCY = int(os.environ.get("MYOB_PAGE_CONCURRENCY", "4"))
+# Page requests in flight across all syncs in this process
+MYOB_PAGE_WORKERS = int(os.environ.get("MYOB_PAGE_WORKERS", "16"))
+# Company files synced at the same time by a sync job
+MYOB_SYNC_WORKERS = int(os.environ.get("MYOB_SYNC_WORKERS", "8"))
+MYOB_REQUEST_TIMEOUT = float(os.environ.get("MYOB_REQUEST_TIMEOUT", "30"))
+# Retries for 429 / 5xx / connection errors, with exponential backoff
+MYOB_MAX_RETRIES = int(os.environ.get("MYOB_MAX_RETRIES", "3"))
+MYOB_RETRY_BACKOFF_SECONDS = float(os.environ.get("MYOB_RETRY_BACKOFF_SECONDS", "1"))
+# Access tokens are refreshed this long before they expire
+MYOB_TOKEN_REFRESH_MARGIN_SECONDS = 60
+# A delta sync can't see deleted accounts, so the import is rebuilt by a full sync this often
+MYOB_FULL_SYNC_SECONDS = int(os.environ.get("MYOB_FULL_SYNC_SECONDS", str(7 * 24 * 3600)))
+
+MYOB_CONNECTION_PREFIX = "myob_connections/"
+MYOB_CONNECTIONS_BY_ORG_INDEX = "myob_connections_by_org"
+MYOB_SYNC_STATE_PREFIX = "myob_sync/"
+MYOB_SYNC_JOB_TYPE = "myob_trial_balance_sync"
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+storage.json.register_index(
+    MYOB_CONNECTIONS_BY_ORG_INDEX,
+    MYOB_CONNECTION_PREFIX,
+    lambda connection: connection.get("organization_id"),
+)
+
+_myob_page_pool = ThreadPoolExecutor(max_workers=MYOB_PAGE_WORKERS, thread_name_prefix="myob-page")
+_myob_sync_pool = ThreadPoolExecutor(max_workers=MYOB_SYNC_WORKERS, thread_name_prefix="myob-sync")
 
-router = APIRouter(prefix="/myob", tags=["MYOB Integration"])
+
+class MyobSyncError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class MyobAuthError(MyobSyncError):
+    """The refresh token was rejected: the connection has to be authorised again."""
+
+
+# --- Models ---
+
+class MyobConnectionInput(BaseModel):
+    organization_id: str
+    business_entity_id: str
+    company_file_id: str
+    access_token: str
+    refresh_token: str
+    expires_at: Optional[float] = None  # Unix timestamp
+
+
+class MyobConnectionOutput(BaseModel):
+    connection_id: str
+    organization_id: str
+    business_entity_id: str
+    company_file_id: str
+    status: str
 
 
 class MyobTrialBalanceImportRequest(BaseModel):
     connection_id: str
     start_date: date
     end_date: date
+    full_sync: bool = False
 
 
 class MyobTrialBalanceImportResponse(BaseModel):
@@ -27,202 +132,609 @@ class MyobTrialBalanceImportResponse(BaseModel):
     message: str
     # Optionally include details like number of records imported
     records_imported: int | None = None
+    import_id: Optional[str] = None
+    sync_mode: Optional[str] = None  # "full", "delta" or "unchanged"
 
 
-@router.post("/import/trial-balance", response_model=MyobTrialBalanceImportResponse)
-def import_myob_trial_balance(
-    request_body: MyobTrialBalanceImportRequest,
-    user: AuthorizedUser, # Added for audit logging
-) -> MyobTrialBalanceImportResponse:
-    """Imports Trial Balance data from MYOB AccountRight Live for a given connection and date range."""
+class MyobSyncRequest(BaseModel):
+    start_date: date
+    end_date: date
+    organization_id: str
+    connection_ids: Optional[List[str]] = None  # Defaults to every connection of the organization
+    full_sync: bool = False
 
-    print(f"Starting MYOB Trial Balance import for connection {request_body.connection_id}")
 
-    # --- 1. Fetch Connection Details & Credentials --- 
-    # TODO: Replace with actual logic to fetch connection details using request_body.connection_id
-    # This needs to provide: Access Token, Refresh Token (if needed), API Key (Client ID), Company File ID
-    # Example structure (replace with real data fetching):
+class MyobSyncSubmitted(BaseModel):
+    job_id: str
+    status: str
+    connections: int
+
+
+# --- Connections ---
+
+def _connection_key(connection_id: str) -> str:
+    return f"{MYOB_CONNECTION_PREFIX}{connection_id}"
+
+
+def get_myob_connection(connection_id: str) -> Optional[Dict[str, Any]]:
     try:
-        # connection_details = get_connection_details(request_body.connection_id) 
-        # access_token = connection_details.credentials.access_token
-        # company_file_id = connection_details.metadata.get("company_file_id") # Assuming it's stored here
-        # myob_api_key = db.secrets.get("MYOB_API_KEY") # Assuming API key/client ID is a global secret
-        
-        # Placeholder values - REMOVE once clarification is received
-        access_token = "PLACEHOLDER_ACCESS_TOKEN"
-        company_file_id = "PLACEHOLDER_COMPANY_FILE_ID"
-        myob_api_key = db.secrets.get("MYOB_API_KEY") # Check if secret exists
-        if not myob_api_key:
-             raise HTTPException(status_code=500, detail="MYOB_API_KEY secret not configured.")
-        if not access_token or not company_file_id:
-             raise ValueError("Missing access token or company file ID for the connection.")
+        return storage.json.get(_connection_key(connection_id))
+    except FileNotFoundError:
+        return None
 
-    except Exception as e:
-        print(f"Error fetching connection details: {e}")
-        # Audit log failure
-        log_audit_event(
-            user_id=user.sub,
-            action="import_myob_trial_balance_failure",
-            details={
-                "connection_id": request_body.connection_id,
-                "start_date": request_body.start_date.isoformat(),
-                "end_date": request_body.end_date.isoformat(),
-                "stage": "fetch_connection_details",
-                "error": str(e)
-            },
-            success=False
+
+def list_myob_connection_ids(organization_id: Optional[str] = None) -> List[str]:
+    if organization_id:
+        files = storage.json.list_by_index(MYOB_CONNECTIONS_BY_ORG_INDEX, organization_id)
+    else:
+        files = storage.json.list(prefix=MYOB_CONNECTION_PREFIX)
+    return sorted(f.name[len(MYOB_CONNECTION_PREFIX):] for f in files)
+
+
+def _myob_app_credentials() -> Tuple[str, str]:
+    """The MYOB developer key (client id) and secret of this app."""
+    api_key = db.secrets.get("MYOB_API_KEY")
+    if not api_key:
+        raise MyobSyncError(500, "MYOB_API_KEY secret not configured.")
+    return api_key, db.secrets.get("MYOB_API_SECRET") or ""
+
+
+# --- API Client ---
+
+class MyobClient:
+    """
+    HTTP session for one company file: MYOB headers, token refresh on 401 and
+    retries with backoff. Safe to share between the threads fetching its pages.
+    """
+
+    def __init__(self, connection: Dict[str, Any]):
+        self.connection_id: str = connection["connection_id"]
+        self.company_file_id: str = connection["company_file_id"]
+        self._api_key, self._api_secret = _myob_app_credentials()
+        self._access_token = decrypt_value(connection.get("access_token") or "")
+        self._refresh_token = decrypt_value(connection.get("refresh_token") or "")
+        self._expires_at: Optional[float] = connection.get("expires_at")
+        self._token_lock = threading.Lock()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MYOB_PAGE_CONCURRENCY + 1)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def close(self):
+        self._session.close()
+
+    def _headers(self, access_token: str) -> Dict[str, str]:
+        return {
+            'Authorization': f'Bearer {access_token}',
+            'x-myobapi-key': self._api_key,
+            'x-myobapi-version': 'v2',
+            'Accept': 'application/json',
+        }
+
+    def _refresh(self, stale_token: str):
+        with self._token_lock:
+            if self._access_token != stale_token:
+                return  # Another page request already refreshed it
+            if not self._refresh_token:
+                raise MyobAuthError(401, "Access token expired and no refresh token is stored.")
+            response = self._session.post(MYOB_TOKEN_URL, data={
+                "client_id": self._api_key,
+                "client_secret": self._api_secret,
+                "refresh_token": self._refresh_token,
+                "grant_type": "refresh_token",
+            }, timeout=MYOB_REQUEST_TIMEOUT)
+            if response.status_code != 200:
+                raise MyobAuthError(401, f"MYOB token refresh failed ({response.status_code}): {response.text[:200]}")
+            tokens = response.json()
+            self._access_token = tokens["access_token"]
+            self._refresh_token = tokens.get("refresh_token") or self._refresh_token
+            self._expires_at = time.time() + float(tokens.get("expires_in") or 1200)
+            print(f"Refreshed MYOB access token for connection {self.connection_id}")
+
+            # MYOB rotates the refresh token, so the old one is useless from here on
+            def store_tokens(connection: Dict[str, Any]):
+                connection.update(
+                    access_token=encrypt_value(self._access_token),
+                    refresh_token=encrypt_value(self._refresh_token),
+                    expires_at=self._expires_at,
+                    status="active",
+                )
+            storage.json.update(_connection_key(self.connection_id), store_tokens, default=dict)
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+            headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """GET with auth. Returns 2xx and 304 responses; raises MyobSyncError for anything else."""
+        if self._expires_at and time.time() >= self._expires_at - MYOB_TOKEN_REFRESH_MARGIN_SECONDS:
+            self._refresh(self._access_token)
+
+        refreshed = False
+        attempt = 0
+        while True:
+            token = self._access_token
+            try:
+                response = self._session.get(url, params=params, headers={**self._headers(token), **(headers or {})},
+                                             timeout=MYOB_REQUEST_TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                if attempt >= MYOB_MAX_RETRIES:
+                    raise MyobSyncError(503, f"Could not connect to MYOB API: {e}")
+                time.sleep(MYOB_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+                attempt += 1
+                continue
+
+            if response.status_code == 401 and not refreshed:
+                self._refresh(token)
+                refreshed = True
+                continue
+            if response.status_code in _RETRY_STATUSES and attempt < MYOB_MAX_RETRIES:
+                retry_after = response.headers.get("Retry-After")
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else MYOB_RETRY_BACKOFF_SECONDS * 2 ** attempt
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if response.status_code >= 400:
+                raise MyobSyncError(response.status_code, f"MYOB API Error: {response.text[:500]}")
+            return response
+
+
+def _trial_balance_url(company_file_id: str) -> str:
+    return f"{MYOB_API_BASE_URL}/{company_file_id}/GeneralLedger/TrialBalance"
+
+
+def _iter_trial_balance_pages(client: MyobClient, params: Dict[str, Any],
+                              etag: Optional[str] = None) -> Tuple[Optional[str], Optional[Iterator[List[Dict[str, Any]]]]]:
+    """
+    Fetches the first page and returns (etag, pages), where pages yields each page's
+    items in order; pages is None if the company file still matches `etag`. With the
+    total count known, up to MYOB_PAGE_CONCURRENCY later pages are requested ahead of
+    the one being consumed; otherwise NextPageLink is followed.
+    """
+    url = _trial_balance_url(client.company_file_id)
+    first = client.get(url, params={**params, "$top": MYOB_PAGE_SIZE, "$skip": 0},
+                       headers={"If-None-Match": etag} if etag else None)
+    new_etag = first.headers.get("ETag")
+    if first.status_code == 304:
+        return new_etag or etag, None
+    body = first.json()
+
+    def fetch(skip: int) -> List[Dict[str, Any]]:
+        return client.get(url, params={**params, "$top": MYOB_PAGE_SIZE, "$skip": skip}).json().get("Items") or []
+
+    def pages() -> Iterator[List[Dict[str, Any]]]:
+        yield body.get("Items") or []
+        count = body.get("Count")
+        if count is None:
+            next_link = body.get("NextPageLink")
+            while next_link:
+                page = client.get(next_link).json()
+                yield page.get("Items") or []
+                next_link = page.get("NextPageLink")
+            return
+
+        skips = iter(range(MYOB_PAGE_SIZE, count, MYOB_PAGE_SIZE))
+        in_flight = deque(_myob_page_pool.submit(fetch, skip) for skip in itertools.islice(skips, MYOB_PAGE_CONCURRENCY))
+        try:
+            while in_flight:
+                items = in_flight.popleft().result()
+                skip = next(skips, None)
+                if skip is not None:
+                    in_flight.append(_myob_page_pool.submit(fetch, skip))
+                yield items
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    return new_etag, pages()
+
+
+def _standardize_row(item: Dict[str, Any]) -> Dict[str, Any]:
+    """MYOB trial balance item -> the row format of financial_import.transform_trial_balance."""
+    account = item.get("Account") or {}
+    debit = float(item.get("DebitAmount") or 0)
+    credit = float(item.get("CreditAmount") or 0)
+    return {
+        "account_code": account.get("DisplayID"),
+        "account_name": account.get("Name"),
+        "debit": debit,
+        "credit": credit,
+        "balance": debit - credit,
+        "is_intercompany": False,
+        "account_uid": account.get("UID"),
+    }
+
+
+# --- Sync ---
+
+def _sync_state_key(connection_id: str, start_date: str, end_date: str) -> str:
+    return f"{MYOB_SYNC_STATE_PREFIX}{connection_id}/{start_date}_{end_date}"
+
+
+def _latest_modified(items: List[Dict[str, Any]], current: Optional[str]) -> Optional[str]:
+    stamps = [item["LastModified"] for item in items if item.get("LastModified")]
+    return max(stamps + ([current] if current else []), default=None)
+
+
+def _part_index(part_key: str) -> int:
+    return int(part_key.rsplit("_part", 1)[1])
+
+
+def _stored_part_keys(storage_key: str) -> List[str]:
+    """The parts the stored import reads (which may be newer than the sync state if a sync died)."""
+    try:
+        return list(storage.json.get(storage_key, fresh=True).get("data_parts") or [])
+    except FileNotFoundError:
+        return []
+
+
+def _write_full(storage_key: str, pages: Iterator[List[Dict[str, Any]]],
+                first_part: int) -> Tuple[List[str], int, Dict[str, str], Optional[str]]:
+    """
+    Writes each page as a new data part, from index `first_part`, as it arrives.
+    Returns (part keys, items, account_parts, last_modified).
+    """
+    part_keys: List[str] = []
+    item_count = 0
+    account_parts: Dict[str, str] = {}
+    last_modified = None
+    for items in pages:
+        rows = [_standardize_row(item) for item in items]
+        part_key = _import_part_key(storage_key, first_part + len(part_keys))
+        storage.json.put(part_key, rows)
+        part_keys.append(part_key)
+        for row in rows:
+            account_parts[row["account_uid"]] = part_key
+        last_modified = _latest_modified(items, last_modified)
+        item_count += len(rows)
+    return part_keys, item_count, account_parts, last_modified
+
+
+def _merge_delta(storage_key: str, pages: Iterator[List[Dict[str, Any]]], state: Dict[str, Any],
+                 first_part: int) -> Tuple[List[str], List[str], int, Dict[str, str], Optional[str]]:
+    """
+    Copies the parts holding changed accounts, with those accounts replaced, to new
+    parts from index `first_part` and appends new accounts as another new part. Only
+    the affected parts are read; the import's current parts are left untouched.
+    Returns (changed account codes, part keys, items, account_parts, last_modified).
+    """
+    changed: Dict[str, Dict[str, Any]] = {}
+    last_modified = state.get("last_modified")
+    for items in pages:
+        for item in items:
+            row = _standardize_row(item)
+            changed[row["account_uid"]] = row
+        last_modified = _latest_modified(items, last_modified)
+
+    part_keys: List[str] = list(state["part_keys"])
+    account_parts: Dict[str, str] = dict(state.get("account_parts") or {})
+    item_count = state.get("item_count", 0)
+    if not changed:
+        return [], part_keys, item_count, account_parts, last_modified
+
+    by_part: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+    new_rows = []
+    for uid, row in changed.items():
+        if uid in account_parts:
+            by_part[account_parts[uid]][uid] = row
+        else:
+            new_rows.append(row)
+
+    existing = storage.json.get_many(by_part.keys(), default=list)
+    updates: Dict[str, List[Dict[str, Any]]] = {}
+    next_part = first_part
+    for old_key, rows in by_part.items():
+        new_key = _import_part_key(storage_key, next_part)
+        next_part += 1
+        updates[new_key] = [rows.get(row.get("account_uid"), row) for row in existing[old_key]]
+        part_keys[part_keys.index(old_key)] = new_key
+    if new_rows:
+        updates[_import_part_key(storage_key, next_part)] = new_rows
+        part_keys.append(_import_part_key(storage_key, next_part))
+        item_count += len(new_rows)
+    for part_key, rows in updates.items():
+        for row in rows:
+            account_parts[row["account_uid"]] = part_key
+    storage.json.put_many(updates)
+    return sorted({str(row["account_code"]) for row in changed.values()}), part_keys, item_count, account_parts, last_modified
+
+
+def _full_sync_due(state: Dict[str, Any]) -> bool:
+    full_synced_at = state.get("full_synced_at")
+    if not full_synced_at or state.get("part_keys") is None:
+        return True
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(full_synced_at)
+    return age.total_seconds() >= MYOB_FULL_SYNC_SECONDS
+
+
+def sync_myob_trial_balance(connection_id: str, start_date: str, end_date: str,
+                            full_sync: bool = False) -> Dict[str, Any]:
+    """
+    Syncs one company file's trial balance for the period into the financial data
+    store. Returns {"import_id", "records_imported", "item_count", "sync_mode"}.
+    Raises MyobSyncError (MyobAuthError if the connection needs re-authorising).
+    """
+    connection = get_myob_connection(connection_id)
+    if not connection:
+        raise MyobSyncError(404, f"MYOB connection '{connection_id}' not found.")
+
+    state_key = _sync_state_key(connection_id, start_date, end_date)
+    state = storage.json.get(state_key, default=dict)
+    import_id = f"myob_{connection_id}_{start_date}_{end_date}"
+    storage_key = _import_storage_key(connection["organization_id"], connection["business_entity_id"],
+                                      FinancialDataType.TRIAL_BALANCE, import_id)
+    delta = bool(state.get("last_modified")) and not full_sync and not _full_sync_due(state)
+    stored_parts = _stored_part_keys(storage_key)
+    # New parts go above every index in use, so nothing a reader may be loading is overwritten
+    first_part = max([state.get("next_part", 0)]
+                     + [_part_index(key) + 1 for key in stored_parts + (state.get("part_keys") or [])])
+
+    params: Dict[str, Any] = {"StartDate": start_date, "EndDate": end_date}
+    if delta:
+        params["$filter"] = f"LastModified gt datetime'{state['last_modified']}'"
+
+    client = MyobClient(connection)
+    try:
+        etag, pages = _iter_trial_balance_pages(client, params, state.get("etag") if delta else None)
+        if pages is None:
+            sync_mode, changed, changed_codes = "unchanged", 0, []
+            part_keys, item_count = state["part_keys"], state.get("item_count", 0)
+            account_parts, last_modified = state.get("account_parts") or {}, state.get("last_modified")
+        elif delta:
+            sync_mode = "delta"
+            changed_codes, part_keys, item_count, account_parts, last_modified = _merge_delta(
+                storage_key, pages, state, first_part)
+            changed = len(changed_codes)
+        else:
+            sync_mode = "full"
+            part_keys, item_count, account_parts, last_modified = _write_full(storage_key, pages, first_part)
+            changed, changed_codes = item_count, None
+    except MyobAuthError:
+        storage.json.update(_connection_key(connection_id),
+                            lambda stored: stored.update(status="requires_reauth"), default=dict)
+        raise
+    finally:
+        client.close()
+
+    switched = bool(changed) or sync_mode == "full"
+    retired_parts = state.get("retired_parts") or []
+    if switched:
+        save_imported_data(
+            import_id=import_id,
+            organization_id=connection["organization_id"],
+            business_entity_id=connection["business_entity_id"],
+            data_type=FinancialDataType.TRIAL_BALANCE,
+            import_date=end_date,
+            data_parts=part_keys,
+            item_count=item_count,
+            changed_keys=changed_codes,
         )
-        raise HTTPException(status_code=404, detail=f"Connection not found or invalid: {e}")
-
-    # --- 2. Prepare and Call MYOB API --- 
-    # TODO: Implement actual MYOB API call, including potential token refresh logic
-    
-    # Endpoint from research
-    api_url = f"https://api.myob.com/accountright/{company_file_id}/GeneralLedger/TrialBalance"
-    
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'x-myobapi-key': myob_api_key,
-        'x-myobapi-version': 'v2',
-        'Content-Type': 'application/json'
+        # Parts replaced by the previous sync go now; this sync's wait for the next one,
+        # so reads that loaded the import record before the switch can still finish
+        in_use = set(part_keys)
+        for part_key in retired_parts:
+            if part_key not in in_use:
+                storage.json.delete(part_key)
+        retired_parts = sorted((set(stored_parts) | set(state.get("part_keys") or [])) - in_use)
+    # Saved last: if anything above fails, the next sync starts from the previous cursor
+    storage.json.put(state_key, {
+        "connection_id": connection_id,
+        "company_file_id": connection["company_file_id"],
+        "start_date": start_date,
+        "end_date": end_date,
+        "import_id": import_id,
+        "storage_key": storage_key,
+        "etag": etag,
+        "last_modified": last_modified,
+        "part_keys": part_keys,
+        "next_part": max([first_part] + [_part_index(key) + 1 for key in part_keys]),
+        "retired_parts": retired_parts,
+        "item_count": item_count,
+        "account_parts": account_parts,
+        "sync_mode": sync_mode,
+        "synced_at": datetime.now(timezone.utc).isoformat(),
+        "full_synced_at": datetime.now(timezone.utc).isoformat() if sync_mode == "full" else state.get("full_synced_at"),
+    })
+    print(f"MYOB sync {connection_id} {start_date}..{end_date}: {sync_mode}, {changed} records, {item_count} total")
+    return {"import_id": import_id, "records_imported": changed, "item_count": item_count, "sync_mode": sync_mode}
+
+
+def run_myob_sync_job(job: ImportJobContext) -> Dict[str, Any]:
+    """
+    Import job handler: syncs a list of connections, MYOB_SYNC_WORKERS at a time.
+    Each finished connection is committed, so a resumed job skips the ones done.
+    """
+    connection_ids: List[str] = job.params["connection_ids"]
+    start_date, end_date = job.params["start_date"], job.params["end_date"]
+    full_sync = job.params.get("full_sync", False)
+    done = set(job.checkpoint.get("done", []))
+    records = job.checkpoint.get("records", 0)
+    failed = list(job.checkpoint.get("failed", []))
+    job.set_total(len(connection_ids))
+
+    futures = {
+        _myob_sync_pool.submit(sync_myob_trial_balance, connection_id, start_date, end_date, full_sync): connection_id
+        for connection_id in connection_ids if connection_id not in done
     }
-    
-    # Parameters (like date range) - check MYOB docs if they are query params or part of request body/filter
-    # Assuming query params for now based on typical reporting endpoints
-    params = {
-        # 'startDate': request_body.start_date.isoformat(), 
-        # 'endDate': request_body.end_date.isoformat(),
-        # Check MYOB docs for exact parameter names and formats
+    try:
+        for future in as_completed(futures):
+            connection_id = futures[future]
+            errors = []
+            try:
+                records += future.result()["records_imported"]
+            except Exception as e:
+                print(f"MYOB sync of connection {connection_id} failed: {e}")
+                errors.append(f"{connection_id}: {e}")
+                failed.append(connection_id)
+            done.add(connection_id)
+            job.commit({"done": sorted(done), "records": records, "failed": failed}, rows=1, errors=errors)
+    except ImportJobLeaseLost:
+        for future in futures:
+            future.cancel()
+        raise
+
+    log_audit_event(
+        user_identifier=job.params.get("user_id") or "system",
+        action_type="MYOB_TRIAL_BALANCE_SYNC",
+        status="SUCCESS" if not failed else "FAILURE",
+        target_object_type="IMPORT_JOB",
+        target_object_id=job.job_id,
+        details={"connections": len(connection_ids), "failed": failed, "records_imported": records,
+                 "start_date": start_date, "end_date": end_date},
+    )
+    return {"connections": len(connection_ids), "records_imported": records, "failed": failed}
+
+
+register_import_job_handler(MYOB_SYNC_JOB_TYPE, run_myob_sync_job)
+
+
+# --- Endpoints ---
+
+async def _require_member(user_id: str, organization_id: Optional[str]):
+    if not await is_organization_member(user_id, organization_id):
+        raise HTTPException(status_code=403, detail="User does not have access to this organization.")
+
+
+async def _load_connections(connection_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """The stored connections by id; 404 if any of them is missing."""
+    connections = await async_storage.run(
+        storage.json.get_many, [_connection_key(connection_id) for connection_id in connection_ids], fresh=True)
+    missing = [connection_id for connection_id in connection_ids if _connection_key(connection_id) not in connections]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"MYOB connections not found: {', '.join(missing)}")
+    return {connection_id: connections[_connection_key(connection_id)] for connection_id in connection_ids}
+
+
+@router.put("/connections/{connection_id}", response_model=MyobConnectionOutput)
+async def save_myob_connection(connection_id: str, body: MyobConnectionInput, user: AuthorizedUser):
+    """
+    Stores the company file and OAuth tokens of a MYOB connection (tokens are encrypted).
+    The user has to belong to the organization, and to the one that owns the
+    connection already stored under this id.
+    """
+    await _require_member(user.sub, body.organization_id)
+    try:
+        existing = await async_storage.json.get(_connection_key(connection_id), fresh=True)
+    except FileNotFoundError:
+        existing = None
+    if existing and existing.get("organization_id") != body.organization_id \
+            and not await is_organization_member(user.sub, existing.get("organization_id")):
+        raise HTTPException(status_code=403, detail="User does not have access to this MYOB connection.")
+
+    record = {
+        "connection_id": connection_id,
+        "organization_id": body.organization_id,
+        "business_entity_id": body.business_entity_id,
+        "company_file_id": body.company_file_id,
+        "access_token": encrypt_value(body.access_token),
+        "refresh_token": encrypt_value(body.refresh_token),
+        "expires_at": body.expires_at,
+        "status": "active",
+        "user_id": user.sub,
     }
+    await async_storage.json.put(_connection_key(connection_id), record)
+    return MyobConnectionOutput(**record)
+
 
-    print(f"Calling MYOB API: {api_url} with params {params}")
+@router.post("/import/trial-balance", response_model=MyobTrialBalanceImportResponse)
+async def import_myob_trial_balance(
+    request_body: MyobTrialBalanceImportRequest,
+    user: AuthorizedUser, # Added for audit logging
+    request: Request,
+) -> MyobTrialBalanceImportResponse:
+    """
+    Imports Trial Balance data from MYOB AccountRight Live for a given connection and
+    date range. The user has to belong to the connection's organization.
+    """
+    connection = (await _load_connections([request_body.connection_id]))[request_body.connection_id]
+    await _require_member(user.sub, connection.get("organization_id"))
+
+    print(f"Starting MYOB Trial Balance import for connection {request_body.connection_id}")
+    details = {
+        "connection_id": request_body.connection_id,
+        "start_date": request_body.start_date.isoformat(),
+        "end_date": request_body.end_date.isoformat(),
+        "full_sync": request_body.full_sync,
+    }
     try:
-        # response = requests.get(api_url, headers=headers, params=params)
-        # response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        
-        # Placeholder response - REMOVE later
-        print("Skipping actual MYOB API call - using placeholder.")
-        myob_data = [] # Replace with response.json() from actual call
-        
-    # except requests.exceptions.HTTPError as http_err:
-    #     print(f"HTTP error occurred: {http_err} - {response.text}")
-    #     # TODO: Add logic here to handle potential 401 Unauthorized (token expired?)
-    #     # If 401, attempt token refresh and retry the API call once.
-    #     raise HTTPException(status_code=response.status_code, detail=f"MYOB API Error: {response.text}")
-    except requests.exceptions.RequestException as req_err:
-        print(f"Request error occurred: {req_err}")
-        # Audit log failure
-        log_audit_event(
-            user_id=user.sub,
-            action="import_myob_trial_balance_failure",
-            details={
-                "connection_id": request_body.connection_id,
-                "start_date": request_body.start_date.isoformat(),
-                "end_date": request_body.end_date.isoformat(),
-                "stage": "myob_api_request",
-                "error": f"Could not connect to MYOB API: {req_err}"
-            },
-            success=False
+        result = await run_in_threadpool(
+            sync_myob_trial_balance,
+            request_body.connection_id,
+            request_body.start_date.isoformat(),
+            request_body.end_date.isoformat(),
+            full_sync=request_body.full_sync,
         )
-        raise HTTPException(status_code=503, detail=f"Could not connect to MYOB API: {req_err}")
-    except Exception as e:
-        print(f"An unexpected error occurred during MYOB API call: {e}")
-        # Audit log failure
-        log_audit_event(
-            user_id=user.sub,
-            action="import_myob_trial_balance_failure",
-            details={
-                "connection_id": request_body.connection_id,
-                "start_date": request_body.start_date.isoformat(),
-                "end_date": request_body.end_date.isoformat(),
-                "stage": "myob_api_unexpected",
-                "error": str(e)
-            },
-            success=False
+    except MyobSyncError as e:
+        print(f"MYOB Trial Balance import failed: {e}")
+        await log_audit_event_async(
+            user_identifier=user.sub,
+            action_type="MYOB_TRIAL_BALANCE_IMPORT",
+            status="FAILURE",
+            request=request,
+            target_object_type="CONNECTION",
+            target_object_id=request_body.connection_id,
+            details={**details, "error": str(e)},
         )
-        raise HTTPException(status_code=500, detail=f"Internal server error during MYOB API call.")
-
-
-    # --- 3. Parse MYOB Response --- 
-    # TODO: Implement parsing logic based on the actual structure of MYOB's Trial Balance response
-    # Example structure (highly dependent on MYOB response):
-    parsed_records = []
-    # for item in myob_data.get("Items", []): # Example path
-    #     record = {
-    #         "account_code": item.get("Account", {}).get("DisplayID"),
-    #         "account_name": item.get("Account", {}).get("Name"),
-    #         "opening_balance": item.get("OpeningBalance"),
-    #         "debit_amount": item.get("DebitAmount"),
-    #         "credit_amount": item.get("CreditAmount"),
-    #         "closing_balance": item.get("ClosingBalance"),
-    #     }
-    #     parsed_records.append(record)
-    print(f"Parsed {len(parsed_records)} records from MYOB response (Placeholder)." )
-    
-
-    # --- 4. Standardize Data --- 
-    # TODO: Convert parsed MYOB records to the internal StandardTrialBalanceEntry format
-    # standard_data: list[StandardTrialBalanceEntry] = []
-    # for record in parsed_records:
-    #      standard_entry = StandardTrialBalanceEntry(
-    #          account_code=record["account_code"],
-    #          account_name=record["account_name"],
-    #          debit=record["debit_amount"], # Map correct fields
-    #          credit=record["credit_amount"], # Map correct fields
-    #          # ... map other fields based on standard schema
-    #      )
-    #      standard_data.append(standard_entry)
-    standard_data = [] # Placeholder
-    print(f"Standardized {len(standard_data)} records (Placeholder)." )
-
-
-    # --- 5. Store Standardized Data --- 
-    # TODO: Implement storage logic based on clarification (e.g., save to db.storage.dataframes)
-    try:
-        # Example: Save as Parquet DataFrame
-        # if standard_data:
-        #     import pandas as pd
-        #     df = pd.DataFrame([entry.dict() for entry in standard_data])
-        #     storage_key = f"trial_balance_{request_body.connection_id}_{request_body.start_date}_{request_body.end_date}.parquet"
-        #     db.storage.dataframes.put(storage_key, df)
-        #     print(f"Saved standardized data to {storage_key}")
-        # else:
-        #     print("No data to store.")
-        print("Skipping data storage (Placeholder).")
-        pass # Placeholder
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
-        print(f"Error storing standardized data: {e}")
-        # Decide if this should be a critical error
-        # Audit log failure
-        log_audit_event(
-            user_id=user.sub,
-            action="import_myob_trial_balance_failure",
-            details={
-                "connection_id": request_body.connection_id,
-                "start_date": request_body.start_date.isoformat(),
-                "end_date": request_body.end_date.isoformat(),
-                "stage": "store_data",
-                "error": str(e)
-            },
-            success=False
+        print(f"An unexpected error occurred during MYOB import: {e}")
+        await log_audit_event_async(
+            user_identifier=user.sub,
+            action_type="MYOB_TRIAL_BALANCE_IMPORT",
+            status="FAILURE",
+            request=request,
+            target_object_type="CONNECTION",
+            target_object_id=request_body.connection_id,
+            details={**details, "error": str(e)},
         )
-        raise HTTPException(status_code=500, detail=f"Failed to store imported data: {e}")
-
+        raise HTTPException(status_code=500, detail="Internal server error during MYOB import.")
 
-    # --- 6. Return Success Response --- 
-    # Audit log success
-    log_audit_event(
-        user_id=user.sub,
-        action="import_myob_trial_balance_success",
-        details={
-            "connection_id": request_body.connection_id,
-            "start_date": request_body.start_date.isoformat(),
-            "end_date": request_body.end_date.isoformat(),
-            "records_imported": len(standard_data) # Using placeholder length for now
-        }
+    await log_audit_event_async(
+        user_identifier=user.sub,
+        action_type="MYOB_TRIAL_BALANCE_IMPORT",
+        status="SUCCESS",
+        request=request,
+        target_object_type="IMPORT",
+        target_object_id=result["import_id"],
+        details={**details, **result},
     )
     return MyobTrialBalanceImportResponse(
         success=True,
-        message=f"Successfully imported {len(standard_data)} trial balance records from MYOB.",
-        records_imported=len(standard_data)
+        message=f"Successfully imported {result['records_imported']} trial balance records from MYOB ({result['sync_mode']} sync).",
+        records_imported=result["records_imported"],
+        import_id=result["import_id"],
+        sync_mode=result["sync_mode"],
+    )
+
+
+@router.post("/sync/trial-balance", response_model=MyobSyncSubmitted, status_code=202)
+async def sync_myob_trial_balances(body: MyobSyncRequest, user: AuthorizedUser):
+    """
+    Queues a background sync of an organization's company files (e.g. the nightly run).
+    Progress is reported by GET /import-jobs/{job_id}, one processed row per company file.
+    The user has to belong to the organization, and every listed connection to it.
+    """
+    await _require_member(user.sub, body.organization_id)
+    if body.connection_ids:
+        connection_ids = list(dict.fromkeys(body.connection_ids))
+        connections = await _load_connections(connection_ids)
+        foreign = [connection_id for connection_id, connection in connections.items()
+                   if connection.get("organization_id") != body.organization_id]
+        if foreign:
+            raise HTTPException(status_code=403,
+                                detail=f"MYOB connections not in this organization: {', '.join(foreign)}")
+    else:
+        connection_ids = await async_storage.run(list_myob_connection_ids, body.organization_id)
+    if not connection_ids:
+        raise HTTPException(status_code=404, detail="No MYOB connections to sync.")
+    job = await async_storage.run(
+        submit_import_job,
+        MYOB_SYNC_JOB_TYPE,
+        {
+            "connection_ids": connection_ids,
+            "start_date": body.start_date.isoformat(),
+            "end_date": body.end_date.isoformat(),
+            "full_sync": body.full_sync,
+            "user_id": user.sub,
+        },
+        organization_id=body.organization_id,
+        user_id=user.sub,
     )
+    return MyobSyncSubmitted(job_id=job["job_id"], status=job["status"], connections=len(connection_ids))
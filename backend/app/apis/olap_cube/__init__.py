@@ -0,0 +1,537 @@
+"""
+Pre-aggregated cube of financial values over entity × account × period × scenario.
+
+Dashboards and reports ask for the same figures at different grains (a month or a
+fiscal year, one entity or the whole group, accounts or CoA categories). Instead of
+re-aggregating imports on every request, values are materialized here as they change:
+
+- imports (scenario "actual"), via register_import_change_listener
+- budget versions (scenario "budget:{version_id}", on the organization), via
+  register_budget_change_listener
+- consolidations (scenario "consolidated", on the consolidation group), via
+  register_consolidation_listener
+
+Each (measure, scenario, node) is one blob under olap_cube/. A node is an entity, a
+consolidation group or an organization; the measure is the imported data type.
+
+    {
+        "inputs":    {"2024-03": {"4000": 1200.0}},     # values as written
+        "cells":     {"2024-03": {...}, "2024-Q1": {...}, "2024": {...}, "FY2024": {...}},
+        "ancestors": ["parent_entity", "org1"],         # as of the last write
+    }
+
+Input periods are rolled up to quarters, calendar years and fiscal years (starting in
+CUBE_FISCAL_YEAR_START_MONTH) when written: P&L and budget values are summed, balances
+take the latest value in the period. The entity hierarchy is summed at query time:
+each parent entity and organization lists the nodes below it under
+olap_cube_members/, and a query adds the cells of those whose current ancestors
+still include it. Nothing is written to the ancestors but that list, so their
+totals can't drift from their descendants' cells. CoA mappings group accounts into
+categories or line items at query time, from the precomputed cells:
+
+    query_cube("trial_balance", "actual", ["org1"], ["FY2024"], coa_mapping_id="m1")
+"""
+
+import os
+import re
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple
+
+import pandas as pd
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+
+from app.apis.actuals_timeseries import import_change_values
+from app.apis.budgets import register_budget_change_listener
+from app.apis.business_entity import get_entity
+from app.apis.consolidation import (
+    COA_MAPPING_STORAGE_PREFIX, CoAMapping, register_consolidation_listener,
+    sanitize_storage_key as sanitize_coa_key
+)
+from app.apis.financial_import import register_import_change_listener, sanitize_storage_key
+from app.apis.permission_utils import require_ops_admin
+from app.apis.storage_utils import storage
+from app.auth import AuthorizedUser
+
+router = APIRouter(prefix="/cube", tags=["Cube"])
+
+# --- Configuration ---
+
+CUBE_PREFIX = "olap_cube/"
+CUBE_MEMBERS_PREFIX = "olap_cube_members/"
+# Write counter of each node, kept apart so it can be read uncached without fetching the cube
+CUBE_REVISION_PREFIX = "olap_cube_revision/"
+# First month of the fiscal year (7 = July, the Australian financial year). FY2024 ends in 2024.
+CUBE_FISCAL_YEAR_START_MONTH = int(os.environ.get("CUBE_FISCAL_YEAR_START_MONTH", "7"))
+
+SCENARIO_ACTUAL = "actual"
+SCENARIO_CONSOLIDATED = "consolidated"
+# Budget items are by account code, so budgets sit alongside trial balance actuals
+BUDGET_MEASURE = "trial_balance"
+UNMAPPED_GROUP = "Unmapped"
+
+RollupMethod = Literal["sum", "last"]
+PeriodLevel = Literal["month", "quarter", "year", "fiscal_year"]
+
+
+def budget_scenario(version_id: str) -> str:
+    return f"budget:{version_id}"
+
+
+def _cube_key(measure: str, scenario: str, node: str, prefix: str = CUBE_PREFIX) -> str:
+    return prefix + "/".join(sanitize_storage_key(part) for part in (measure, scenario, node))
+
+
+def _members_key(measure: str, scenario: str, node: str) -> str:
+    return _cube_key(measure, scenario, node, prefix=CUBE_MEMBERS_PREFIX)
+
+
+def _revision_key(measure: str, scenario: str, node: str) -> str:
+    return _cube_key(measure, scenario, node, prefix=CUBE_REVISION_PREFIX)
+
+
+# --- Periods ---
+
+_MONTH_PATTERN = re.compile(r"^(\d{4})-(\d{1,2})$")
+_QUARTER_PATTERN = re.compile(r"^(\d{4})-Q([1-4])$", re.IGNORECASE)
+_YEAR_PATTERN = re.compile(r"^(\d{4})$")
+_FISCAL_YEAR_PATTERN = re.compile(r"^FY(\d{4})$", re.IGNORECASE)
+
+
+def normalize_period(value: Any) -> str:
+    """
+    Canonical period key: "2024-03" (month), "2024-Q1", "2024" (calendar year) or
+    "FY2024" (fiscal year ending in 2024). Dates and ISO date strings become their month.
+    """
+    if isinstance(value, str):
+        text = value.strip()
+        for pattern, build in (
+            (_MONTH_PATTERN, lambda m: f"{m.group(1)}-{int(m.group(2)):02d}"),
+            (_QUARTER_PATTERN, lambda m: f"{m.group(1)}-Q{m.group(2)}"),
+            (_YEAR_PATTERN, lambda m: m.group(1)),
+            (_FISCAL_YEAR_PATTERN, lambda m: f"FY{m.group(1)}"),
+        ):
+            match = pattern.match(text)
+            if match:
+                return build(match)
+    return pd.Timestamp(value).strftime("%Y-%m")
+
+
+def period_level(period: str) -> PeriodLevel:
+    if period.startswith("FY"):
+        return "fiscal_year"
+    if "-Q" in period:
+        return "quarter"
+    return "month" if "-" in period else "year"
+
+
+def _span(period: str) -> Tuple[int, int]:
+    """First and last month of a period, as year * 12 + month - 1."""
+    level = period_level(period)
+    if level == "month":
+        year, month = period.split("-")
+        start = int(year) * 12 + int(month) - 1
+        return start, start
+    if level == "quarter":
+        year, quarter = period.split("-Q")
+        start = int(year) * 12 + (int(quarter) - 1) * 3
+        return start, start + 2
+    if level == "year":
+        return int(period) * 12, int(period) * 12 + 11
+    end_year = int(period[2:])
+    if CUBE_FISCAL_YEAR_START_MONTH == 1:
+        return end_year * 12, end_year * 12 + 11
+    start = (end_year - 1) * 12 + CUBE_FISCAL_YEAR_START_MONTH - 1
+    return start, start + 11
+
+
+def _within(inner: Tuple[int, int], outer: Tuple[int, int]) -> bool:
+    return outer[0] <= inner[0] and inner[1] <= outer[1]
+
+
+def _month_key(index: int) -> str:
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def _fiscal_year_of(index: int) -> str:
+    year, month = index // 12, index % 12 + 1
+    if CUBE_FISCAL_YEAR_START_MONTH != 1 and month >= CUBE_FISCAL_YEAR_START_MONTH:
+        year += 1
+    return f"FY{year}"
+
+
+def rollup_periods(period: str) -> List[str]:
+    """The coarser periods (quarter, year, fiscal year) that wholly contain period."""
+    span = _span(period)
+    year, month = span[1] // 12, span[1] % 12 + 1
+    candidates = [f"{year}-Q{(month - 1) // 3 + 1}", str(year), _fiscal_year_of(span[1])]
+    return [candidate for candidate in dict.fromkeys(candidates)
+            if candidate != period and _within(span, _span(candidate))]
+
+
+def period_range(start: Any, end: Any, level: PeriodLevel = "month") -> List[str]:
+    """Period keys of one level covering start..end (inclusive), oldest first."""
+    first, last = _span(normalize_period(start))[0], _span(normalize_period(end))[1]
+    keys: List[str] = []
+    for index in range(first, last + 1):
+        if level == "month":
+            key = _month_key(index)
+        elif level == "quarter":
+            key = f"{index // 12}-Q{index % 12 // 3 + 1}"
+        elif level == "year":
+            key = str(index // 12)
+        else:
+            key = _fiscal_year_of(index)
+        if not keys or keys[-1] != key:
+            keys.append(key)
+    return keys
+
+
+def shift_period(period: str, years: int) -> str:
+    """The same period `years` later (earlier if negative), e.g. for prior-year comparisons."""
+    period = normalize_period(period)
+    if period.startswith("FY"):
+        return f"FY{int(period[2:]) + years}"
+    year, _, rest = period.partition("-")
+    return f"{int(year) + years}" + (f"-{rest}" if rest else "")
+
+
+# --- Writes ---
+
+def _empty_cube(measure: str, scenario: str, node: str, **fields: Any) -> Dict[str, Any]:
+    return dict({"measure": measure, "scenario": scenario, "node": node, "inputs": {}, "cells": {}, "ancestors": []}, **fields)
+
+
+def _rolled_value(inputs: Dict[str, Dict[str, float]], within: List[Tuple[str, Tuple[int, int]]],
+                  account: str, method: str) -> Optional[float]:
+    candidates = [(span, inputs[period][account]) for period, span in within if account in inputs[period]]
+    # Only the coarsest inputs count, so a quarter written alongside its months is not counted twice
+    coarsest = [(span, value) for span, value in candidates
+                if not any(other != span and _within(span, other) for other, _ in candidates)]
+    if not coarsest:
+        return None
+    if method == "sum":
+        return sum(value for _, value in coarsest)
+    # Latest value in the period; a month wins over a quarter ending in the same month
+    return max(coarsest, key=lambda item: (item[0][1], item[0][0]))[1]
+
+
+def write_cube_inputs(measure: str, scenario: str, node: str, updates: Dict[str, Dict[str, Optional[float]]],
+                      rollup: RollupMethod, replace: Optional[Literal["periods", "all"]] = None,
+                      ancestors: Iterable[str] = (), organization_id: Optional[str] = None) -> int:
+    """
+    Writes input values ({period: {account: value}}, None clears a value) for a node and
+    recomputes the affected cells. replace="periods" clears the other accounts of each
+    updated period; replace="all" replaces every input of the node. The node is listed
+    as a member of each ancestor (before it is written, so a failed write leaves at
+    most a member without cells). Returns the number of cells changed.
+    """
+    updates = {normalize_period(period): values for period, values in updates.items()}
+    ancestors = list(ancestors)
+    deltas: Dict[Tuple[str, str], float] = {}
+    for ancestor in ancestors:
+        _add_member(measure, scenario, ancestor, node)
+
+    def apply(doc: Dict[str, Any]):
+        deltas.clear()
+        inputs, cells = doc["inputs"], doc["cells"]
+        doc["rollup"] = rollup
+        doc["ancestors"] = ancestors
+        doc.pop("children", None)  # Descendant totals stored by earlier versions
+        if organization_id:
+            doc["organization_id"] = organization_id
+        touched: Dict[str, set] = {}
+        if replace == "all":
+            for period, values in inputs.items():
+                touched.setdefault(period, set()).update(values)
+            inputs.clear()
+        for period, values in updates.items():
+            current = inputs.setdefault(period, {})
+            if replace == "periods":
+                touched.setdefault(period, set()).update(current)
+                current.clear()
+            for account, value in values.items():
+                account = str(account)
+                touched.setdefault(period, set()).add(account)
+                if value is None or pd.isna(value):
+                    current.pop(account, None)
+                else:
+                    current[account] = float(value)
+            if not current:
+                del inputs[period]
+
+        affected: Dict[str, set] = {}
+        for period, accounts in touched.items():
+            for target in (period, *rollup_periods(period)):
+                affected.setdefault(target, set()).update(accounts)
+        spans = {period: _span(period) for period in inputs}
+        for target, accounts in affected.items():
+            target_span = _span(target)
+            within = [(period, span) for period, span in spans.items()
+                      if period != target and _within(span, target_span)]
+            row = cells.setdefault(target, {})
+            for account in accounts:
+                old = row.get(account)
+                new = inputs.get(target, {}).get(account)
+                if new is None:
+                    new = _rolled_value(inputs, within, account, rollup)
+                if new is None:
+                    row.pop(account, None)
+                else:
+                    row[account] = new
+                delta = (new or 0.0) - (old or 0.0)
+                if delta:
+                    deltas[(target, account)] = delta
+            if not row:
+                del cells[target]
+
+    storage.json.update(_cube_key(measure, scenario, node), apply,
+                        default=lambda: _empty_cube(measure, scenario, node))
+    _bump_revision(measure, scenario, node)
+    return len(deltas)
+
+
+def _bump_revision(measure: str, scenario: str, node: str):
+    storage.json.update(_revision_key(measure, scenario, node),
+                        lambda doc: {"revision": doc.get("revision", 0) + 1}, default=dict)
+
+
+def _add_member(measure: str, scenario: str, ancestor: str, node: str):
+    """Lists node under ancestor. Idempotent, and skipped when the (cached) list has it already."""
+    key = _members_key(measure, scenario, ancestor)
+    if node in storage.json.get(key, default=dict).get("members", []):
+        return
+
+    def add(doc: Dict[str, Any]):
+        members = doc.setdefault("members", [])
+        if node not in members:
+            members.append(node)
+    storage.json.update(key, add, default=dict)
+
+
+def cube_revision(measure: str, scenario: str, node: str) -> int:
+    """
+    Counter bumped after every write to the node's own values (not its descendants'),
+    e.g. to key caches of values read from it. Read from the backend, bypassing the
+    storage cache, from a key holding nothing else.
+    """
+    return storage.json.get(_revision_key(measure, scenario, node), default=dict, fresh=True).get("revision", 0)
+
+
+def entity_ancestors(entity_id: str, organization_id: Optional[str] = None) -> List[str]:
+    """Parent entities of an entity, nearest first, then its organization."""
+    chain: List[str] = []
+    seen = {entity_id}
+    entity = get_entity(entity_id)
+    while entity is not None and entity.parent_entity_id and entity.parent_entity_id not in seen:
+        chain.append(entity.parent_entity_id)
+        seen.add(entity.parent_entity_id)
+        entity = get_entity(entity.parent_entity_id)
+    if organization_id and organization_id not in seen:
+        chain.append(organization_id)
+    return chain
+
+
+def rebuild_cube_rollups(measure: str, scenario: str) -> int:
+    """
+    Re-reads every node's ancestors and relists the members of each ancestor, e.g.
+    after entities were moved in the hierarchy. Only actuals roll up the entity
+    hierarchy. Nodes are listed under their new ancestors before their documents
+    point at them, and only then dropped from the old ones, so queries keep full
+    totals throughout. Returns the number of nodes with own cells.
+    """
+    scope = "/".join(sanitize_storage_key(part) for part in (measure, scenario)) + "/"
+    keys = [entry.name for entry in storage.json.list(prefix=CUBE_PREFIX + scope)]
+    docs = storage.json.get_many(keys, default=dict)
+    # node -> the member lists it belongs on
+    lists_of: Dict[str, set] = {}
+    for key in keys:
+        doc = docs[key]
+        if not doc.get("cells"):
+            continue
+        node = doc["node"]
+        ancestors = entity_ancestors(node, doc.get("organization_id")) if scenario == SCENARIO_ACTUAL else []
+        lists_of[node] = {_members_key(measure, scenario, ancestor) for ancestor in ancestors}
+        for ancestor in ancestors:
+            _add_member(measure, scenario, ancestor, node)
+        if doc.get("ancestors") != ancestors or "children" in doc:
+            storage.json.update(key, lambda current: dict(
+                {field: value for field, value in current.items() if field != "children"},
+                ancestors=ancestors), default=dict)
+            _bump_revision(measure, scenario, node)
+
+    # Nodes first written during the rebuild aren't in lists_of and stay listed
+    def stale(member: str, list_key: str) -> bool:
+        return member in lists_of and list_key not in lists_of[member]
+
+    lists = storage.json.get_many(
+        [entry.name for entry in storage.json.list(prefix=CUBE_MEMBERS_PREFIX + scope)], default=dict)
+    for list_key, doc in lists.items():
+        if any(stale(member, list_key) for member in doc.get("members", [])):
+            storage.json.update(list_key, lambda current, list_key=list_key: current.update(
+                members=[member for member in current.get("members", []) if not stale(member, list_key)]),
+                default=dict)
+    return len(lists_of)
+
+
+def _on_import_change(change: Dict[str, Any]):
+    extracted = import_change_values(change)
+    if extracted is None:
+        return
+    values, _, replace = extracted
+    data_type = change["data_type"]
+    write_cube_inputs(
+        data_type, SCENARIO_ACTUAL, change["business_entity_id"], {change["period"]: values},
+        rollup="sum" if data_type == "profit_loss" else "last",
+        replace="periods" if replace else None,
+        ancestors=entity_ancestors(change["business_entity_id"], change["organization_id"]),
+        organization_id=change["organization_id"],
+    )
+
+
+def _on_budget_change(change: Dict[str, Any]):
+    updates: Dict[str, Dict[str, float]] = {}
+    for item in change["items"] or []:
+        row = updates.setdefault(normalize_period(item["period"]), {})
+        row[str(item["account_code"])] = row.get(str(item["account_code"]), 0.0) + float(item["amount"])
+    write_cube_inputs(BUDGET_MEASURE, budget_scenario(change["version_id"]), change["organization_id"], updates,
+                      rollup="sum", replace="all", organization_id=change["organization_id"])
+
+
+def _on_consolidation(change: Dict[str, Any]):
+    write_cube_inputs(change["data_type"], SCENARIO_CONSOLIDATED, change["consolidation_group_id"],
+                      {change["period"]: change["consolidated_trial_balance"]},
+                      rollup="last", replace="periods", organization_id=change["organization_id"])
+
+
+register_import_change_listener(_on_import_change)
+register_budget_change_listener(_on_budget_change)
+register_consolidation_listener(_on_consolidation)
+
+
+# --- Queries ---
+
+_coa_groups: Dict[str, Tuple[Any, Dict[str, str]]] = {}  # mapping_id -> (updated_at, {account: group})
+
+
+def _coa_grouper(mapping_id: str, level: str):
+    """Function mapping an account code to its CoA category (or line item)."""
+    try:
+        mapping = CoAMapping(**storage.json.get(sanitize_coa_key(f"{COA_MAPPING_STORAGE_PREFIX}{mapping_id}")))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"CoA mapping {mapping_id} not found") from None
+    cache_key = f"{mapping_id}:{level}"
+    cached = _coa_groups.get(cache_key)
+    if cached is None or cached[0] != mapping.updated_at:
+        cached = _coa_groups[cache_key] = (mapping.updated_at, {})
+    groups = cached[1]
+
+    def group(account: str) -> str:
+        if account not in groups:
+            rule = mapping.get_rule_for_account(account)
+            if rule is None:
+                groups[account] = UNMAPPED_GROUP
+            else:
+                groups[account] = rule.map_to_category.value if level == "category" else rule.map_to_line_item_key
+        return groups[account]
+
+    return group
+
+
+def query_cube(measure: str, scenario: str, nodes: List[str], periods: List[Any],
+               accounts: Optional[List[str]] = None, coa_mapping_id: Optional[str] = None,
+               coa_level: Literal["category", "line_item"] = "category",
+               include_descendants: bool = True) -> List[Dict[str, Any]]:
+    """
+    Precomputed cells as [{"scenario", "node", "period", "account", "value"}]. With a
+    CoA mapping, accounts are summed into its categories (or line items) and `accounts`
+    filters those groups. include_descendants adds the node's descendant entities.
+    """
+    periods = [normalize_period(period) for period in periods]
+    members: Dict[str, List[str]] = {node: [] for node in nodes}
+    if include_descendants:
+        listed = storage.json.get_many([_members_key(measure, scenario, node) for node in nodes], default=dict)
+        for node in nodes:
+            members[node] = [member for member in listed[_members_key(measure, scenario, node)].get("members", [])
+                             if member != node]
+    docs = storage.json.get_many(
+        {_cube_key(measure, scenario, node) for node in nodes + [m for listed in members.values() for m in listed]},
+        default=dict,
+    )
+    grouper = _coa_grouper(coa_mapping_id, coa_level) if coa_mapping_id else None
+    wanted = set(str(account) for account in accounts) if accounts is not None else None
+
+    results: List[Dict[str, Any]] = []
+    for node in nodes:
+        # A member moved elsewhere in the hierarchy stays listed until the next rebuild
+        sources_docs = [docs[_cube_key(measure, scenario, node)]] + [
+            docs[_cube_key(measure, scenario, member)] for member in members[node]
+            if node in docs[_cube_key(measure, scenario, member)].get("ancestors", [])
+        ]
+        for period in periods:
+            totals: Dict[str, float] = {}
+            sources = [doc.get("cells", {}).get(period, {}) for doc in sources_docs]
+            for row in sources:
+                for account, value in row.items():
+                    label = grouper(account) if grouper else account
+                    if grouper is None and wanted is not None and label not in wanted:
+                        continue
+                    totals[label] = totals.get(label, 0.0) + value
+            for label, value in totals.items():
+                if wanted is None or label in wanted:
+                    results.append({"scenario": scenario, "node": node, "period": period, "account": label, "value": value})
+    return results
+
+
+# --- Endpoints ---
+
+class CubeQueryRequest(BaseModel):
+    measure: str = Field(default="trial_balance", description="Imported data type: trial_balance, profit_loss or balance_sheet")
+    scenarios: List[str] = Field(default=[SCENARIO_ACTUAL], description="'actual', 'consolidated' or 'budget:{version_id}'")
+    nodes: List[str] = Field(..., description="Entity, consolidation group or organization IDs")
+    periods: List[str] = Field(..., description="Period keys: '2024-03', '2024-Q1', '2024' or 'FY2024'")
+    accounts: Optional[List[str]] = Field(None, description="Accounts (or CoA groups when a mapping is given); all if omitted")
+    coa_mapping_id: Optional[str] = Field(None, description="Group accounts by this CoA mapping")
+    coa_level: Literal["category", "line_item"] = "category"
+    include_descendants: bool = Field(default=True, description="Include the node's descendant entities")
+
+
+class CubeCell(BaseModel):
+    scenario: str
+    node: str
+    period: str
+    account: str
+    value: float
+
+
+class CubeQueryResponse(BaseModel):
+    cells: List[CubeCell]
+
+
+class CubeRebuildRequest(BaseModel):
+    measure: str = "trial_balance"
+    scenario: str = SCENARIO_ACTUAL
+
+
+@router.post("/query", response_model=CubeQueryResponse)
+def query_cube_endpoint(request: CubeQueryRequest, user: AuthorizedUser) -> CubeQueryResponse:
+    """Slice of the precomputed cube: nodes × periods × accounts (or CoA groups) × scenarios."""
+    try:
+        cells = [
+            cell
+            for scenario in request.scenarios
+            for cell in query_cube(request.measure, scenario, request.nodes, request.periods, request.accounts,
+                                   request.coa_mapping_id, request.coa_level, request.include_descendants)
+        ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid period: {e}") from e
+    return CubeQueryResponse(cells=[CubeCell(**cell) for cell in cells])
+
+
+@router.post("/rebuild", dependencies=[Depends(require_ops_admin)])
+def rebuild_cube_endpoint(request: CubeRebuildRequest, user: AuthorizedUser) -> Dict[str, int]:
+    """
+    Relists the entity hierarchy's members, e.g. after entities changed parent. Covers
+    every organization's nodes, so it needs the ops:admin permission.
+    """
+    return {"nodes": rebuild_cube_rollups(request.measure, request.scenario)}
@@ -118,4 +118,36 @@ def require_permission(required_permission: str):
     return _permission_checker
 
 
+# Held by operators: storage diagnostics, migrations and cube rebuilds read or rewrite
+# data of every organization
+OPS_ADMIN_PERMISSION = "ops:admin"
 
+require_ops_admin = require_permission(OPS_ADMIN_PERMISSION)
+
+
+
+
+# --- Organization Membership ---
+
+ROLE_ASSIGNMENTS_COLLECTION = "roleAssignments" # Same collection as app.apis.roles
+
+async def is_organization_member(user_id: str, organization_id: str) -> bool:
+    """
+    True if the user holds any role in the organization (see app.apis.roles).
+    Returns False on error, denying access.
+    """
+    if not user_id or not organization_id:
+        return False
+    try:
+        client = await get_firestore_client()
+        query = client.collection(ROLE_ASSIGNMENTS_COLLECTION) \
+                      .where("userId", "==", user_id) \
+                      .where("scopeType", "==", "Organization") \
+                      .where("scopeId", "==", organization_id) \
+                      .limit(1)
+        async for _ in query.stream():
+            return True
+        return False
+    except Exception as e:
+        print(f"ERROR checking membership of user {user_id} in organization {organization_id}: {e}")
+        return False
@@ -1,12 +1,12 @@
 
 import uuid
 from datetime import datetime, timezone
-from typing import Any, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-import databutton as db
+from app.apis.storage_utils import async_storage
 from app.apis.permission_utils import get_user_permissions # Import checker from utils
 from fastapi import Request # Added for audit logging
-from app.apis.utils import log_audit_event # CORRECT Import the audit logging function
+from app.apis.utils import log_audit_event_async # CORRECT Import the audit logging function
 from fastapi import APIRouter, HTTPException, status, Depends, Request as FastAPIRequest
 from app.auth import AuthorizedUser # Use standard auth dependency
 from pydantic import BaseModel, Field, field_validator
@@ -74,6 +74,48 @@ def get_storage_key(user_id: str, report_id: str) -> str:
     # Use hyphens instead of slashes for db.storage compatibility
     return f"report_definitions-{safe_user_id}-{safe_report_id}.json"
 
+_report_definition_listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+
+def register_report_definition_listener(listener: Callable[[Dict[str, Any]], None]):
+    """
+    Registers a callback run after a report definition is saved or deleted, with
+    {"report_id", "owner_id", "definition"}. definition is the stored definition, or
+    None if it was deleted.
+    """
+    _report_definition_listeners.append(listener)
+
+
+def _notify_report_definition_change(change: Dict[str, Any]):
+    for listener in _report_definition_listeners:
+        try:
+            listener(change)
+        except Exception as e:
+            print(f"Report definition listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+
+_report_definition_validators: List[Callable[["ReportDefinition"], Any]] = []
+
+
+def register_report_definition_validator(validator: Callable[["ReportDefinition"], Any]):
+    """
+    Registers a check run on a definition before it is created or updated. The
+    validator rejects it by raising ValueError (e.g. FormulaError, whose `cycle` is
+    returned too), which the endpoints answer with 400.
+    """
+    _report_definition_validators.append(validator)
+
+
+def _validate_report_definition(definition: "ReportDefinition"):
+    for validator in _report_definition_validators:
+        try:
+            validator(definition)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"message": str(e), "cycle": getattr(e, "cycle", [])},
+            ) from None
+
 # --- API Endpoints ---
 
 @router.post(
@@ -98,7 +140,7 @@ async def create_report_definition(
     """
     # --- Permission Check ---
     required_permission = "reports:create"
-    user_permissions = get_user_permissions(user.sub)
+    user_permissions = await get_user_permissions(user.sub)
     if required_permission not in user_permissions:
         print(f"Permission denied for user {user.sub}. Missing: '{required_permission}'. Has: {user_permissions}")
         raise HTTPException(
@@ -122,17 +164,20 @@ async def create_report_definition(
     storage_key = get_storage_key(user_id=owner_id, report_id=report_id)
 
     try:
+        _validate_report_definition(report_definition)
+
         # Convert datetime fields to ISO strings for JSON storage
         report_dict = report_definition.model_dump()
         report_dict["createdAt"] = report_definition.createdAt.isoformat()
         report_dict["updatedAt"] = report_definition.updatedAt.isoformat()
 
-        db.storage.json.put(storage_key, report_dict)
+        await async_storage.json.put(storage_key, report_dict)
         print(f"Successfully created report definition {report_id} for user {owner_id}")
+        _notify_report_definition_change({"report_id": report_id, "owner_id": owner_id, "definition": report_dict})
         
         # --- Audit Log Success ---
         try:
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=owner_id,
                 action_type="REPORT_DEFINITION_CREATE",
                 status="SUCCESS",
@@ -149,7 +194,7 @@ async def create_report_definition(
     except HTTPException as e:
         # --- Audit Log Failure (HTTPException) ---
         try:
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=user.sub if user else "unknown",
                 action_type="REPORT_DEFINITION_CREATE",
                 status="FAILURE",
@@ -167,7 +212,7 @@ async def create_report_definition(
         
         # --- Audit Log Failure (Generic Exception) ---
         try:
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=owner_id,
                 action_type="REPORT_DEFINITION_CREATE",
                 status="FAILURE",
@@ -208,7 +253,7 @@ async def list_report_definitions(
     """
     # --- Permission Check ---
     required_permission = "reports:read"
-    user_permissions = get_user_permissions(user.sub)
+    user_permissions = await get_user_permissions(user.sub)
     if required_permission not in user_permissions:
         print(f"Permission denied for user {user.sub}. Missing: '{required_permission}'. Has: {user_permissions}")
         raise HTTPException(
@@ -223,15 +268,19 @@ async def list_report_definitions(
 
     try:
         # List files starting with the user-specific prefix
-        all_files = db.storage.json.list()
-        user_files = [f for f in all_files if f.name.startswith(user_dir_prefix) and f.name.endswith(".json")]
+        all_files = await async_storage.json.list(prefix=user_dir_prefix)
+        user_files = [f for f in all_files if f.name.endswith(".json")]
         print(f"Found {len(user_files)} report definition files for user {owner_id} with prefix {user_dir_prefix}")
 
+        # Fetch the full JSON documents concurrently to extract metadata
+        report_docs = await async_storage.json.get_many(f.name for f in user_files)
+
         metadata_list = []
         for file_info in user_files:
             try:
-                # Fetch the full JSON to extract metadata
-                report_data = db.storage.json.get(file_info.name)
+                if file_info.name not in report_docs:
+                    raise FileNotFoundError(file_info.name)
+                report_data = report_docs[file_info.name]
                 # Basic check if it looks like our report structure
                 if isinstance(report_data, dict) and 'id' in report_data and 'name' in report_data and 'updatedAt' in report_data:
                     metadata_list.append(
@@ -255,7 +304,7 @@ async def list_report_definitions(
         metadata_list.sort(key=lambda x: x.updatedAt, reverse=True)
         
         # --- Audit Log Success ---
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=owner_id,
             action_type="REPORT_DEFINITION_LIST",
             status="SUCCESS",
@@ -271,7 +320,7 @@ async def list_report_definitions(
     except Exception as e:
         print(f"Error listing report definitions for user {owner_id}: {e}")
         # --- Audit Log Failure ---
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=owner_id,
             action_type="REPORT_DEFINITION_LIST",
             status="FAILURE",
@@ -314,7 +363,7 @@ async def get_report_definition(
     """
     # --- Permission Check ---
     required_permission = "reports:read"
-    user_permissions = get_user_permissions(user.sub)
+    user_permissions = await get_user_permissions(user.sub)
     if required_permission not in user_permissions:
         print(f"Permission denied for user {user.sub}. Missing: '{required_permission}'. Has: {user_permissions}")
         raise HTTPException(
@@ -327,7 +376,7 @@ async def get_report_definition(
     storage_key = get_storage_key(user_id=owner_id, report_id=report_id)
 
     try:
-        report_data = db.storage.json.get(storage_key)
+        report_data = await async_storage.json.get(storage_key)
         # Attempt to parse into the Pydantic model for validation
         report_definition = ReportDefinition(**report_data)
         
@@ -340,7 +389,7 @@ async def get_report_definition(
         print(f"Successfully retrieved report definition {report_id} for user {owner_id}")
         
         # --- Audit Log Success ---
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=owner_id,
             action_type="REPORT_DEFINITION_GET",
             status="SUCCESS",
@@ -355,7 +404,7 @@ async def get_report_definition(
     except FileNotFoundError:
         print(f"Report definition {report_id} not found for user {owner_id}")
         # --- Audit Log Failure (Not Found) ---
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=owner_id,
             action_type="REPORT_DEFINITION_GET",
             status="FAILURE",
@@ -369,7 +418,7 @@ async def get_report_definition(
     except Exception as e:
         print(f"Error retrieving report definition {report_id} for user {owner_id}: {e}")
         # --- Audit Log Failure (General Error) ---
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=owner_id,
             action_type="REPORT_DEFINITION_GET",
             status="FAILURE",
@@ -414,7 +463,7 @@ async def update_report_definition(
     """
     # --- Permission Check ---
     required_permission = "reports:update"
-    user_permissions = get_user_permissions(user.sub)
+    user_permissions = await get_user_permissions(user.sub)
     if required_permission not in user_permissions:
         print(f"Permission denied for user {user.sub}. Missing: '{required_permission}'. Has: {user_permissions}")
         raise HTTPException(
@@ -428,7 +477,7 @@ async def update_report_definition(
 
     try:
         # Fetch existing to ensure it exists and check ownership (implicitly via storage_key)
-        existing_data = db.storage.json.get(storage_key)
+        existing_data = await async_storage.json.get(storage_key)
         existing_report = ReportDefinition(**existing_data)
 
         # Double check ownerId just in case
@@ -446,17 +495,19 @@ async def update_report_definition(
             version=existing_report.version, # Keep original version for now, could be updated
             **report_update_data.model_dump() # Apply updates from request
         )
+        _validate_report_definition(updated_report)
 
         # Save the updated definition after converting datetimes
         updated_report_dict = updated_report.model_dump()
         updated_report_dict["createdAt"] = updated_report.createdAt.isoformat()
         updated_report_dict["updatedAt"] = updated_report.updatedAt.isoformat()
 
-        db.storage.json.put(storage_key, updated_report_dict)
+        await async_storage.json.put(storage_key, updated_report_dict)
         print(f"Successfully updated report definition {report_id} for user {owner_id}")
+        _notify_report_definition_change({"report_id": report_id, "owner_id": owner_id, "definition": updated_report_dict})
         
         # --- Audit Log Success ---
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=owner_id,
             action_type="REPORT_DEFINITION_UPDATE",
             status="SUCCESS",
@@ -472,7 +523,7 @@ async def update_report_definition(
     except FileNotFoundError:
         print(f"Report definition {report_id} not found for update by user {owner_id}")
         # --- Audit Log Failure (Not Found) ---
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=owner_id,
             action_type="REPORT_DEFINITION_UPDATE",
             status="FAILURE",
@@ -483,10 +534,23 @@ async def update_report_definition(
         )
         # --- End Audit Log ---
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Report definition not found") from None
+    except HTTPException as e:
+        # --- Audit Log Failure (HTTPException) ---
+        await log_audit_event_async(
+            user_identifier=owner_id,
+            action_type="REPORT_DEFINITION_UPDATE",
+            status="FAILURE",
+            request=request,
+            target_object_type="REPORT_DEFINITION",
+            target_object_id=report_id,
+            details={"error": e.detail, "status_code": e.status_code}
+        )
+        # --- End Audit Log ---
+        raise e # Re-raise HTTP exceptions (like invalid formulas) directly
     except Exception as e:
         print(f"Error updating report definition {report_id} for user {owner_id}: {e}")
         # --- Audit Log Failure (General Error) ---
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=owner_id,
             action_type="REPORT_DEFINITION_UPDATE",
             status="FAILURE",
@@ -530,7 +594,7 @@ async def delete_report_definition(
     """
     # --- Permission Check ---
     required_permission = "reports:delete"
-    user_permissions = get_user_permissions(user.sub)
+    user_permissions = await get_user_permissions(user.sub)
     if required_permission not in user_permissions:
         print(f"Permission denied for user {user.sub}. Missing: '{required_permission}'. Has: {user_permissions}")
         raise HTTPException(
@@ -545,15 +609,16 @@ async def delete_report_definition(
     try:
         # Check if the file exists first by trying to get it
         # This also implicitly checks ownership via the storage key path
-        existing_report = db.storage.json.get(storage_key)
+        existing_report = await async_storage.json.get(storage_key)
 
         # If get succeeds without FileNotFoundError, proceed to delete
-        db.storage.json.delete(storage_key)
+        await async_storage.json.delete(storage_key)
         print(f"Successfully deleted report definition {report_id} for user {owner_id}")
+        _notify_report_definition_change({"report_id": report_id, "owner_id": owner_id, "definition": None})
         
         # --- Audit Log Success ---
         try:
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=owner_id,
                 action_type="REPORT_DEFINITION_DELETE",
                 status="SUCCESS",
@@ -574,7 +639,7 @@ async def delete_report_definition(
         print(f"Report definition {report_id} not found for deletion by user {owner_id}")
         # --- Audit Log Failure (Not Found) ---
         try:
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=owner_id,
                 action_type="REPORT_DEFINITION_DELETE",
                 status="FAILURE",
@@ -593,7 +658,7 @@ async def delete_report_definition(
         # Re-raise HTTP exceptions directly
         # --- Audit Log Failure (HTTPException) ---
         try:
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=owner_id,
                 action_type="REPORT_DEFINITION_DELETE",
                 status="FAILURE",
@@ -611,7 +676,7 @@ async def delete_report_definition(
         print(f"Error deleting report definition {report_id} for user {owner_id}: {e}")
         # --- Audit Log Failure (General Error) ---
         try:
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=owner_id,
                 action_type="REPORT_DEFINITION_DELETE",
                 status="FAILURE",
@@ -5,13 +5,13 @@ from enum import Enum
 import datetime
 import json
 import re
-import databutton as db
+from app.apis.storage_utils import async_storage, storage
 import uuid # Added for UUID generation
 import tempfile # Added for download
 import os # Added for download
 from fastapi.responses import FileResponse, JSONResponse # Added for download
 from app.auth import AuthorizedUser
-from app.apis.utils import log_audit_event
+from app.apis.utils import log_audit_event_async
 
 router = APIRouter(prefix="/report-distribution")
 
@@ -149,6 +149,51 @@ def sanitize_storage_key(key: str) -> str:
     """Sanitize storage key to only allow alphanumeric and ._- symbols"""
     return re.sub(r'[^a-zA-Z0-9._-]', '', key)
 
+# Schedules and exports are stored one key per record, indexed by owner
+report_schedules = storage.collection(
+    "report_schedules",
+    id_field="scheduleId",
+    legacy_key="report_schedules",
+    indexes={"createdBy": lambda schedule: schedule.get("createdBy")},
+)
+report_exports = storage.collection("report_exports", id_field="reportId", legacy_key="report_exports")
+
+def _get_owned_schedule(schedule_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    schedule = report_schedules.get(schedule_id)
+    if schedule is None or schedule.get("createdBy") != user_id:
+        return None
+    return schedule
+
+# Shared list blobs. All writes go through storage.json.update, which re-applies
+# the change to the latest copy when two requests modify the same blob concurrently.
+REPORT_DELIVERIES_KEY = "report_deliveries"
+REPORT_FEEDBACK_KEY = "report_feedback"
+
+def _append_record(storage_key: str, record: Dict[str, Any]):
+    """Appends a record to a list blob with a versioned write."""
+    def append(records: list) -> list:
+        records.append(record)
+        return records
+    storage.json.update(sanitize_storage_key(storage_key), append, default=list)
+
+def _patch_list_record(storage_key: str, id_field: str, record_id: str, fields: Dict[str, Any]) -> bool:
+    """Sets fields on the record with the given ID in a list blob. Returns False if the record no longer exists."""
+    found = False
+    def patch(records: list) -> list:
+        nonlocal found
+        found = False
+        for record in records:
+            if record.get(id_field) == record_id:
+                record.update(fields)
+                found = True
+        return records
+    storage.json.update(sanitize_storage_key(storage_key), patch, default=list)
+    return found
+
+def _patch_record(collection, record_id: str, fields: Dict[str, Any]) -> bool:
+    """Sets fields on one record of a sharded collection. Returns False if it does not exist."""
+    return collection.update(record_id, lambda record: record.update(fields)) is not None
+
 def calculate_next_delivery_date(frequency: ScheduleFrequency, start_date: datetime.date) -> datetime.date:
     today = datetime.date.today()
     if start_date > today:
@@ -234,14 +279,9 @@ async def schedule_report(schedule_request_body: ScheduleRequest, user: Authoriz
             createdAt=datetime.datetime.now(datetime.timezone.utc),
             updatedAt=datetime.datetime.now(datetime.timezone.utc)
         )
-        try:
-            schedules_data = db.storage.json.get("report_schedules")
-        except FileNotFoundError:
-            schedules_data = []
-        schedules_data.append(schedule.dict())
-        db.storage.json.put(sanitize_storage_key("report_schedules"), schedules_data)
+        await async_storage.run(report_schedules.put, schedule.dict())
         log_details["schedule_id"] = schedule_id
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="SUCCESS",
@@ -258,7 +298,7 @@ async def schedule_report(schedule_request_body: ScheduleRequest, user: Authoriz
         )
     except Exception as e:
         error_msg = f"Failed to schedule report: {str(e)}"
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -276,17 +316,13 @@ async def list_schedules(user: AuthorizedUser, request: Request):
     """List all scheduled reports for the user"""
     action_type = "REPORT_SCHEDULE_LIST"
     try:
-        try:
-            schedules_data = db.storage.json.get("report_schedules")
-        except FileNotFoundError:
-            return [] # Not an error, just no schedules
-        schedules = [ReportSchedule(**schedule) for schedule in schedules_data 
-                    if schedule.get("createdBy") == user.sub]
+        owned_schedules = await async_storage.run(report_schedules.find, "createdBy", user.sub)
+        schedules = [ReportSchedule(**schedule) for schedule in owned_schedules]
         # No audit log for list success by default
         return schedules
     except Exception as e:
         error_msg = f"Failed to retrieve schedules: {str(e)}"
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -304,19 +340,14 @@ async def get_schedule(schedule_id: str, user: AuthorizedUser, request: Request)
     action_type = "REPORT_SCHEDULE_GET"
     target_object_type = "REPORT_SCHEDULE"
     try:
-        try:
-            schedules_data = db.storage.json.get("report_schedules")
-        except FileNotFoundError:
-            raise HTTPException(status_code=404, detail="Schedule data file not found")
-        schedule_dict = next((s for s in schedules_data 
-                         if s.get("scheduleId") == schedule_id and s.get("createdBy") == user.sub), None)
+        schedule_dict = await async_storage.run(_get_owned_schedule, schedule_id, user.sub)
         if not schedule_dict:
             raise HTTPException(status_code=404, detail="Schedule not found or access denied")
         schedule = ReportSchedule(**schedule_dict)
         # No audit log for get success by default
         return schedule
     except HTTPException as http_exc:
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -330,7 +361,7 @@ async def get_schedule(schedule_id: str, user: AuthorizedUser, request: Request)
         raise http_exc
     except Exception as e:
         error_msg = f"Failed to retrieve schedule: {str(e)}"
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -351,36 +382,37 @@ async def update_schedule(schedule_id: str, update_request_body: UpdateScheduleR
     updated_fields = list(update_request_body.dict(exclude_unset=True).keys())
     log_details = {"updated_fields": updated_fields, "user_id": user.sub}
     try:
-        try:
-            schedules_data = db.storage.json.get("report_schedules")
-        except FileNotFoundError:
-            raise HTTPException(status_code=404, detail="Schedule data file not found")
-        schedule_index = next((i for i, s in enumerate(schedules_data) 
-                            if s.get("scheduleId") == schedule_id and s.get("createdBy") == user.sub), None)
-        if schedule_index is None:
-            raise HTTPException(status_code=404, detail="Schedule not found or access denied")
-        schedule = schedules_data[schedule_index]
         update_data = update_request_body.dict(exclude_unset=True)
-        for key, value in update_data.items():
-            if value is not None:
-                # Ensure enums are stored as their values if updated
-                if isinstance(value, Enum):
-                     schedule[key] = value.value
+        schedule = None
+
+        def apply_update(stored_schedule: dict) -> dict:
+            nonlocal schedule
+            if stored_schedule.get("createdBy") != user.sub:
+                raise HTTPException(status_code=404, detail="Schedule not found or access denied")
+            schedule = stored_schedule
+            for key, value in update_data.items():
+                if value is not None:
+                    # Ensure enums are stored as their values if updated
+                    if isinstance(value, Enum):
+                         schedule[key] = value.value
+                    else:
+                         schedule[key] = value
+            if "frequency" in update_data or "startDate" in update_data:
+                freq_val = schedule.get("frequency")
+                start_val = schedule.get("startDate")
+                if isinstance(start_val, str):
+                    start_date_obj = datetime.date.fromisoformat(start_val)
+                elif isinstance(start_val, datetime.date):
+                     start_date_obj = start_val
                 else:
-                     schedule[key] = value
-        if "frequency" in update_data or "startDate" in update_data:
-            freq_val = schedule.get("frequency")
-            start_val = schedule.get("startDate")
-            if isinstance(start_val, str):
-                start_date_obj = datetime.date.fromisoformat(start_val)
-            elif isinstance(start_val, datetime.date):
-                 start_date_obj = start_val
-            else:
-                raise ValueError("Invalid startDate format") # Should not happen with pydantic
-            schedule["nextDeliveryDate"] = calculate_next_delivery_date(ScheduleFrequency(freq_val), start_date_obj).isoformat()
-        schedule["updatedAt"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        db.storage.json.put(sanitize_storage_key("report_schedules"), schedules_data)
-        log_audit_event(
+                    raise ValueError("Invalid startDate format") # Should not happen with pydantic
+                schedule["nextDeliveryDate"] = calculate_next_delivery_date(ScheduleFrequency(freq_val), start_date_obj).isoformat()
+            schedule["updatedAt"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            return schedule
+
+        if await async_storage.run(report_schedules.update, schedule_id, apply_update) is None:
+            raise HTTPException(status_code=404, detail="Schedule not found or access denied")
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="SUCCESS",
@@ -391,7 +423,7 @@ async def update_schedule(schedule_id: str, update_request_body: UpdateScheduleR
         )
         return ReportSchedule(**schedule)
     except HTTPException as http_exc:
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -406,7 +438,7 @@ async def update_schedule(schedule_id: str, update_request_body: UpdateScheduleR
     except Exception as e:
         error_msg = f"Failed to update schedule: {str(e)}"
         log_details["error"] = error_msg
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -426,18 +458,12 @@ async def delete_schedule(schedule_id: str, user: AuthorizedUser, request: Reque
     target_object_type = "REPORT_SCHEDULE"
     log_details = {"user_id": user.sub}
     try:
-        try:
-            schedules_data = db.storage.json.get("report_schedules")
-        except FileNotFoundError:
-            raise HTTPException(status_code=404, detail="Schedule data file not found")
-        schedule_index = next((i for i, s in enumerate(schedules_data) 
-                            if s.get("scheduleId") == schedule_id and s.get("createdBy") == user.sub), None)
-        if schedule_index is None:
+        schedule_info = await async_storage.run(_get_owned_schedule, schedule_id, user.sub)
+        if schedule_info is None:
             raise HTTPException(status_code=404, detail="Schedule not found or access denied")
-        schedule_info = schedules_data.pop(schedule_index)
         log_details["deleted_report_name"] = schedule_info.get("reportName")
-        db.storage.json.put(sanitize_storage_key("report_schedules"), schedules_data)
-        log_audit_event(
+        await async_storage.run(report_schedules.delete, schedule_id)
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="SUCCESS",
@@ -448,7 +474,7 @@ async def delete_schedule(schedule_id: str, user: AuthorizedUser, request: Reque
         )
         return None
     except HTTPException as http_exc:
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -463,7 +489,7 @@ async def delete_schedule(schedule_id: str, user: AuthorizedUser, request: Reque
     except Exception as e:
         error_msg = f"Failed to delete schedule: {str(e)}"
         log_details["error"] = error_msg
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -509,19 +535,14 @@ async def export_report(
             "createdAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
             "status": ReportStatus.PENDING.value
         }
-        try:
-            exports_data = db.storage.json.get("report_exports")
-        except FileNotFoundError:
-            exports_data = {}
-        exports_data[report_id] = export_data
-        db.storage.json.put(sanitize_storage_key("report_exports"), exports_data)
+        await async_storage.run(report_exports.put, export_data)
         background_tasks.add_task(generate_report, report_id, export_request_body.reportType, export_request_body.format, export_request_body.parameters)
         log_details.update({
             "export_id": report_id,
             "download_url": download_url,
             "expires_at": expires_at.isoformat()
         })
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="SUCCESS",
@@ -538,7 +559,7 @@ async def export_report(
     except Exception as e:
         error_msg = f"Failed to initiate report export: {str(e)}"
         log_details["error"] = error_msg
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -563,13 +584,9 @@ async def download_report(
     target_object_type = "REPORT_EXPORT"
     log_details = {"report_id": report_id, "format": format.value, "user_id": user.sub}
     try:
-        try:
-            exports_data = db.storage.json.get("report_exports")
-        except FileNotFoundError:
-            raise HTTPException(status_code=404, detail="Report export data not found")
-        if report_id not in exports_data:
+        export_info = await async_storage.run(report_exports.get, report_id)
+        if export_info is None:
             raise HTTPException(status_code=404, detail="Report export record not found")
-        export_info = exports_data[report_id]
         # Check ownership - Optional: Depends if downloads should be restricted to creator
         # if export_info.get("createdBy") != user.sub:
         #     raise HTTPException(status_code=403, detail="Access denied to download this report")
@@ -581,9 +598,9 @@ async def download_report(
              export_format = export_info.get("format")
              raise HTTPException(status_code=400, detail=f"Requested format '{format.value}' does not match export format '{export_format}'")
         try:
-            report_data = db.storage.binary.get(sanitize_storage_key(f"report_{report_id}"))
+            report_data = await async_storage.binary.get(sanitize_storage_key(f"report_{report_id}"))
         except FileNotFoundError:
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=user.sub,
                 action_type=action_type,
                 status="INFO",
@@ -598,7 +615,7 @@ async def download_report(
             tmp_path = tmp.name
         filename = f"{export_info.get('reportName', 'report').replace(' ', '_')}_{datetime.datetime.now().strftime('%Y%m%d')}.{format.value}"
         log_details["filename"] = filename
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="SUCCESS",
@@ -617,7 +634,7 @@ async def download_report(
             background=bg_tasks
         )
     except HTTPException as http_exc:
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -632,7 +649,7 @@ async def download_report(
     except Exception as e:
         error_msg = f"Failed to download report: {str(e)}"
         log_details["error"] = error_msg
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -659,13 +676,8 @@ async def submit_feedback(feedback_body: ReportFeedback, user: AuthorizedUser, r
         feedback_data = feedback_body.dict()
         feedback_data["submittedBy"] = user.sub
         feedback_data["submittedAt"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        try:
-            all_feedback = db.storage.json.get("report_feedback")
-        except FileNotFoundError:
-            all_feedback = []
-        all_feedback.append(feedback_data)
-        db.storage.json.put(sanitize_storage_key("report_feedback"), all_feedback)
-        log_audit_event(
+        await async_storage.run(_append_record, REPORT_FEEDBACK_KEY, feedback_data)
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="SUCCESS",
@@ -678,7 +690,7 @@ async def submit_feedback(feedback_body: ReportFeedback, user: AuthorizedUser, r
     except Exception as e:
         error_msg = f"Failed to submit feedback: {str(e)}"
         log_details["error"] = error_msg
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -697,13 +709,9 @@ async def generate_report(report_id: str, report_type: ReportType, format: Repor
     action_type = "REPORT_GENERATE_TASK"
     target_object_type = "REPORT_EXPORT"
     log_details = {"report_id": report_id, "report_type": report_type.value, "format": format.value}
-    exports_data = {}
     try:
         try:
-            exports_data = db.storage.json.get("report_exports")
-            if report_id in exports_data:
-                exports_data[report_id]["status"] = ReportStatus.IN_PROGRESS.value
-                db.storage.json.put(sanitize_storage_key("report_exports"), exports_data)
+            await async_storage.run(_patch_record, report_exports, report_id, {"status": ReportStatus.IN_PROGRESS.value})
         except Exception as status_e:
             print(f"Audit Log (generate_report): Failed to update status to IN_PROGRESS for {report_id}: {status_e}")
         # Placeholder generation logic
@@ -713,11 +721,9 @@ async def generate_report(report_id: str, report_type: ReportType, format: Repor
         elif format == ReportFormat.CSV:
             report_data = b"Header1,Header2\nValue1,Value2"
         # ... add more format placeholders ...
-        db.storage.binary.put(sanitize_storage_key(f"report_{report_id}"), report_data)
-        if report_id in exports_data:
-            exports_data[report_id]["status"] = ReportStatus.COMPLETED.value
-            db.storage.json.put(sanitize_storage_key("report_exports"), exports_data)
-        log_audit_event(
+        await async_storage.binary.put(sanitize_storage_key(f"report_{report_id}"), report_data)
+        await async_storage.run(_patch_record, report_exports, report_id, {"status": ReportStatus.COMPLETED.value})
+        await log_audit_event_async(
             user_identifier="background_task",
             action_type=action_type,
             status="SUCCESS",
@@ -730,13 +736,10 @@ async def generate_report(report_id: str, report_type: ReportType, format: Repor
         log_details["error"] = error_msg
         print(f"Audit Log (generate_report): {error_msg}")
         try:
-            if report_id in exports_data:
-                exports_data[report_id]["status"] = ReportStatus.FAILED.value
-                exports_data[report_id]["error"] = error_msg
-                db.storage.json.put(sanitize_storage_key("report_exports"), exports_data)
+            await async_storage.run(_patch_record, report_exports, report_id, {"status": ReportStatus.FAILED.value, "error": error_msg})
         except Exception as status_e:
              print(f"Audit Log (generate_report): Failed to update status to FAILED for {report_id}: {status_e}")
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier="background_task",
             action_type=action_type,
             status="FAILURE",
@@ -753,15 +756,11 @@ async def manual_deliver_report(schedule_id: str, background_tasks: BackgroundTa
     target_object_type = "REPORT_SCHEDULE"
     log_details = {"schedule_id": schedule_id, "triggered_by": user.sub}
     try:
-        try:
-            schedules_data = db.storage.json.get("report_schedules")
-        except FileNotFoundError:
-            raise HTTPException(status_code=404, detail="Schedule data file not found")
-        schedule = next((s for s in schedules_data if s.get("scheduleId") == schedule_id and s.get("createdBy") == user.sub), None)
+        schedule = await async_storage.run(_get_owned_schedule, schedule_id, user.sub)
         if not schedule:
             raise HTTPException(status_code=404, detail="Schedule not found or access denied")
         background_tasks.add_task(deliver_report, schedule_id)
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="SUCCESS",
@@ -772,7 +771,7 @@ async def manual_deliver_report(schedule_id: str, background_tasks: BackgroundTa
         )
         return {"message": "Report delivery triggered"}
     except HTTPException as http_exc:
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -787,7 +786,7 @@ async def manual_deliver_report(schedule_id: str, background_tasks: BackgroundTa
     except Exception as e:
         error_msg = f"Failed to trigger report delivery: {str(e)}"
         log_details["error"] = error_msg
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type=action_type,
             status="FAILURE",
@@ -806,20 +805,17 @@ async def deliver_report(schedule_id: str):
     target_object_type = "REPORT_DELIVERY"
     delivery_id = f"delivery-{uuid.uuid4()}"
     log_details = {"schedule_id": schedule_id, "delivery_id": delivery_id}
-    schedules_data = []
-    schedule_index = -1
+    schedule_found = False
     try:
         try:
-            schedules_data = db.storage.json.get("report_schedules")
-            schedule_index = next((i for i, s in enumerate(schedules_data) if s.get("scheduleId") == schedule_id), -1)
-            if schedule_index == -1:
+            schedule = await async_storage.run(report_schedules.get, schedule_id)
+            if schedule is None:
                 raise ValueError(f"Schedule {schedule_id} not found during delivery task")
-            schedule = schedules_data[schedule_index]
+            schedule_found = True
         except Exception as e:
             raise ValueError(f"Error retrieving schedule {schedule_id}: {e}") from e
         # Update status to IN_PROGRESS
-        schedule["status"] = ReportStatus.IN_PROGRESS.value
-        db.storage.json.put(sanitize_storage_key("report_schedules"), schedules_data)
+        await async_storage.run(_patch_record, report_schedules, schedule_id, {"status": ReportStatus.IN_PROGRESS.value})
         download_urls = {}
         generated_report_ids = []
         for format_val in schedule.get("formats", []):
@@ -840,12 +836,7 @@ async def deliver_report(schedule_id: str):
             status=ReportStatus.DELIVERED, # Assume success initially
             downloadUrls=download_urls
         ).dict()
-        try:
-            deliveries_data = db.storage.json.get("report_deliveries")
-        except FileNotFoundError:
-            deliveries_data = []
-        deliveries_data.append(delivery_data)
-        db.storage.json.put(sanitize_storage_key("report_deliveries"), deliveries_data)
+        await async_storage.run(_append_record, REPORT_DELIVERIES_KEY, delivery_data)
         # --- Actual Delivery Logic (Simulated) ---
         for method_val in schedule.get("deliveryMethods", []):
             method = DeliveryMethod(method_val)
@@ -856,18 +847,20 @@ async def deliver_report(schedule_id: str):
             elif method == DeliveryMethod.NOTIFICATION:
                  # Generate in-app notifications (requires user lookup)
                  print(f"Simulating in-app notification for delivery {delivery_id}")
-                 # db.storage.json.put("notifications", ...)
+                 # storage.json.put("notifications", ...)
         # Update schedule status and next date
-        schedule["lastDeliveryDate"] = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
-        schedule["status"] = ReportStatus.DELIVERED.value
+        schedule_updates = {
+            "lastDeliveryDate": datetime.datetime.now(datetime.timezone.utc).date().isoformat(),
+            "status": ReportStatus.DELIVERED.value,
+        }
         if ScheduleFrequency(schedule["frequency"]) != ScheduleFrequency.ONCE:
             start_date_obj = datetime.date.fromisoformat(schedule["startDate"]) if isinstance(schedule["startDate"], str) else schedule["startDate"]
             next_date = calculate_next_delivery_date(ScheduleFrequency(schedule["frequency"]), start_date_obj)
-            schedule["nextDeliveryDate"] = next_date.isoformat()
+            schedule_updates["nextDeliveryDate"] = next_date.isoformat()
         else:
-            schedule["status"] = ReportStatus.COMPLETED.value
-        db.storage.json.put(sanitize_storage_key("report_schedules"), schedules_data)
-        log_audit_event(
+            schedule_updates["status"] = ReportStatus.COMPLETED.value
+        await async_storage.run(_patch_record, report_schedules, schedule_id, schedule_updates)
+        await log_audit_event_async(
             user_identifier="background_task",
             action_type=action_type,
             status="SUCCESS",
@@ -881,21 +874,16 @@ async def deliver_report(schedule_id: str):
         print(f"Audit Log (deliver_report): {error_msg}")
         try:
             # Update schedule status to FAILED
-            if schedule_index != -1 and schedules_data:
-                schedules_data[schedule_index]["status"] = ReportStatus.FAILED.value
-                db.storage.json.put(sanitize_storage_key("report_schedules"), schedules_data)
+            if schedule_found:
+                await async_storage.run(_patch_record, report_schedules, schedule_id, {"status": ReportStatus.FAILED.value})
             # Update delivery record status to FAILED if it exists
             try:
-                deliveries_data = db.storage.json.get("report_deliveries")
-                delivery_index = next((i for i, d in enumerate(deliveries_data) if d.get("deliveryId") == delivery_id), -1)
-                if delivery_index != -1:
-                    deliveries_data[delivery_index]["status"] = ReportStatus.FAILED.value
-                    db.storage.json.put(sanitize_storage_key("report_deliveries"), deliveries_data)
+                await async_storage.run(_patch_list_record, REPORT_DELIVERIES_KEY, "deliveryId", delivery_id, {"status": ReportStatus.FAILED.value})
             except Exception as delivery_status_e:
                  print(f"Audit Log (deliver_report): Failed to update delivery record {delivery_id} status to FAILED: {delivery_status_e}")
         except Exception as final_status_e:
              print(f"Audit Log (deliver_report): Critical error updating status to FAILED for schedule {schedule_id}: {final_status_e}")
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier="background_task",
             action_type=action_type,
             status="FAILURE",
@@ -1,14 +1,29 @@
 
-import databutton as db
+from app.apis.storage_utils import async_storage, storage
+import asyncio
+import json
+import numpy as np
 import pandas as pd
 from app.auth import AuthorizedUser
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
+from collections import OrderedDict
 from datetime import date
+import os
 import re
+import threading
 
-from app.apis.report_definitions import ReportDefinition, get_report_definition
+from app.apis.report_definitions import (
+    ReportDefinition, get_storage_key, register_report_definition_listener, register_report_definition_validator
+)
+from app.apis.financial_columns import find_entity_imports, get_import_index, read_import_frame
+from app.apis.olap_cube import BUDGET_MEASURE, budget_scenario, cube_revision, normalize_period, period_level, query_cube
+from app.apis.budgets import register_budget_change_listener
+from app.apis.financial_import import register_import_change_listener, register_import_delete_listener
+from app.apis.formula_engine import FormulaError, FormulaSet, normalize_name
 
 # Placeholder - Replace with actual import or definition from report_definitions API
 # class ReportDefinition(BaseModel):
@@ -52,15 +67,12 @@ def sanitize_storage_key(key: str) -> str:
     key = re.sub(r'[^a-zA-Z0-9._-]', '_', key) # Replace disallowed chars with underscore
     return key
 
-# Placeholder for fetching report definition logic - Ideally reuse from report_definitions API
+# Reads the definition directly; the report_definitions endpoint also needs the HTTP request for audit logging
 async def get_report_definition_logic(report_id: str, user: AuthorizedUser) -> ReportDefinition:
-    """Placeholder function to fetch report definition."""
-    # This should ideally call or replicate the logic from the report_definitions API's
-    # get_report_definition endpoint to fetch the JSON from db.storage.json
-    # using the key pattern: f"report_definitions-{user.sub}-{report_id}.json"
-    storage_key = sanitize_storage_key(f"report_definitions-{user.sub}-{report_id}.json")
+    """Fetches the user's report definition from db.storage.json."""
+    storage_key = get_storage_key(user_id=user.sub, report_id=report_id)
     try:
-        report_data = db.storage.json.get(storage_key)
+        report_data = await async_storage.json.get(storage_key)
         # Basic validation
         if not isinstance(report_data, dict) or 'id' not in report_data:
              raise FileNotFoundError("Invalid report data format.")
@@ -78,29 +90,322 @@ async def get_report_definition_logic(report_id: str, user: AuthorizedUser) -> R
         raise HTTPException(status_code=500, detail=f"Could not retrieve report definition: {e}") from e
 
 
-@router.post("/generate-report", response_model=ReportDataResponse)
-async def generate_report(
-    request: GenerateReportRequest,
-    user: AuthorizedUser,
-):
+# --- Compiled Report Plans ---
+
+# Compiled plans kept in memory, by definition version
+REPORT_PLAN_CACHE_SIZE = int(os.environ.get("REPORT_PLAN_CACHE_SIZE", "256"))
+
+
+class ReportPlan:
     """
-    Generates a basic report based on a definition ID.
-    Fetches the definition, retrieves the corresponding processed financial data (JSON),
-    and structures it according to the definition's rows/columns (basic implementation).
+    A report definition compiled for execution.
+
+    Rows and columns are resolved once: every account row points at a position in
+    `account_codes` (the accounts the report reads), every column becomes an operator
+    ("value", "budget_value" or "variance") with the field it reads, and calculation
+    rows become a FormulaSet over the other rows (by id or label) and accounts.
+    Executing the plan aligns the fetched data to those positions and computes each
+    column for all account rows at once, then every calculation row for all columns at
+    once, so the same definition can be run over many periods or entities without
+    re-interpreting it.
     """
-    print(f"Generating report for definition ID: {request.report_definition_id}")
 
-    # 1. Fetch Report Definition
+    def __init__(self, definition: ReportDefinition):
+        self.report_id = definition.id
+        self.row_labels = [row_def.get("label", "Unnamed Row") for row_def in definition.rows]
+        self.row_types = [row_def.get("type") for row_def in definition.rows]
+
+        positions: Dict[str, int] = {}
+        self.row_accounts = np.full(len(definition.rows), -1, dtype=np.int64)
+        # Calculation rows, by the name formulas use for them (row id, else label)
+        self.row_formulas: Dict[int, str] = {}
+        formulas: Dict[str, str] = {}
+        # Account rows formulas can reference, by id and by label
+        self.row_names: Dict[str, int] = {}
+        # Every row's ids and labels, to find names that would be ambiguous in a formula
+        rows_by_name: Dict[str, Set[int]] = {}
+        for row_index, row_def in enumerate(definition.rows):
+            for name in (row_def.get("label"), row_def.get("id")):
+                if name:
+                    rows_by_name.setdefault(normalize_name(name), set()).add(row_index)
+
+        # Calculation rows can also be referenced by their label, where no other row has it
+        aliases: Dict[str, str] = {}
+        for row_index, row_def in enumerate(definition.rows):
+            row_type = row_def.get("type")
+            code = row_def.get("accountCode")
+            if row_type == "account" and code:
+                self.row_accounts[row_index] = positions.setdefault(str(code), len(positions))
+                for name in (row_def.get("label"), row_def.get("id")):
+                    if name:
+                        self.row_names.setdefault(normalize_name(name), row_index)
+            elif row_type == "calculation" and row_def.get("formula"):
+                name = str(row_def.get("id") or row_def.get("label") or f"row {row_index + 1}")
+                if any(normalize_name(name) == normalize_name(other) for other in formulas):
+                    raise FormulaError(f"More than one calculation row is named '{name}'")
+                formulas[name] = row_def["formula"]
+                self.row_formulas[row_index] = name
+                label = row_def.get("label")
+                if label and rows_by_name.get(normalize_name(label)) == {row_index}:
+                    aliases[str(label)] = name
+        self.formulas = FormulaSet(formulas, aliases)
+        for key in sorted(set().union(*(formula.names for formula in self.formulas.formulas.values()))):
+            if len(rows_by_name.get(key, ())) > 1:
+                raise FormulaError(f"More than one row is named '{key}', so formulas can't reference it")
+        for code in sorted(self.formulas.accounts):
+            positions.setdefault(code, len(positions))
+        self.account_codes = list(positions)
+        # Account ranges can match accounts the definition does not list
+        self.reads_all_accounts = bool(self.formulas.ranges)
+
+        # (label, operator, field)
+        self.columns: List[Tuple[str, Optional[str], Optional[str]]] = []
+        for col_def in definition.columns:
+            operator = col_def.get("type")
+            if operator not in ("value", "budget_value", "variance"):
+                operator = None
+            self.columns.append((col_def.get("label", "Unnamed Column"), operator, col_def.get("field")))
+        self.value_fields = list(dict.fromkeys(
+            field for _, operator, field in self.columns if operator in ("value", "variance") and field
+        ))
+
+    def execute(self, financial_df: pd.DataFrame, budget_lookup: Dict[str, Any]) -> List[ReportRow]:
+        """Report rows for the actuals (by account_code) and budget amounts (by account code string)."""
+        codes = self.account_codes
+        if "account_code" in financial_df.columns:
+            # The last row of an account wins, as when several rows share a code
+            frame = financial_df.set_index(financial_df["account_code"].astype(str))
+            frame = frame[~frame.index.duplicated(keep="last")]
+            if self.reads_all_accounts:
+                listed = set(codes)
+                codes = codes + [code for code in frame.index if code not in listed]
+            frame = frame.reindex(codes)
+        else:
+            frame = pd.DataFrame(index=codes)
+
+        # Numeric values per account: one column per value field, then the budget
+        budget = pd.to_numeric(pd.Series([budget_lookup.get(code) for code in codes], dtype=object),
+                               errors="coerce").to_numpy(dtype=float)
+        numeric = np.column_stack(
+            [pd.to_numeric(frame[field], errors="coerce").to_numpy(dtype=float) if field in frame.columns
+             else np.full(len(codes), np.nan) for field in self.value_fields] + [budget]
+        )
+        field_index = {field: index for index, field in enumerate(self.value_fields)}
+
+        # One vector per column over the accounts
+        column_values: List[Optional[List[Any]]] = []
+        for _, operator, field in self.columns:
+            if operator == "value":
+                values = frame[field] if field in frame.columns else None
+                column_values.append(None if values is None else values.astype(object).where(values.notna(), None).tolist())
+            elif operator == "budget_value":
+                column_values.append(_optional_floats(numeric[:, -1]))
+            elif operator == "variance" and field in field_index:
+                column_values.append(_optional_floats(numeric[:, field_index[field]] - numeric[:, -1]))
+            else:
+                column_values.append(None)
+
+        # Calculation rows over the same value fields and budget, all at once
+        calculated: Dict[str, np.ndarray] = {}
+        if self.row_formulas:
+            names = {name: numeric[self.row_accounts[row_index]] for name, row_index in self.row_names.items()}
+            accounts = {code: numeric[position] for position, code in enumerate(codes)}
+            calculated = self.formulas.evaluate(names, accounts, size=numeric.shape[1])
+
+        rows: List[ReportRow] = []
+        for row_index, (label, row_type, position) in enumerate(zip(self.row_labels, self.row_types, self.row_accounts)):
+            if row_type == "account":
+                values = {col_label: (vector[position] if vector is not None and position >= 0 else None)
+                          for (col_label, _, _), vector in zip(self.columns, column_values)}
+            elif row_type == "header":
+                values = {col_label: "" for col_label, _, _ in self.columns}
+            elif row_index in self.row_formulas:
+                result = calculated[self.row_formulas[row_index]]
+                values = {}
+                for col_label, operator, field in self.columns:
+                    value = np.nan
+                    if operator == "value" and field in field_index:
+                        value = result[field_index[field]]
+                    elif operator == "budget_value":
+                        value = result[-1]
+                    elif operator == "variance" and field in field_index:
+                        value = result[field_index[field]] - result[-1]
+                    values[col_label] = None if np.isnan(value) else float(value)
+            else:
+                values = {col_label: None for col_label, _, _ in self.columns}
+            rows.append(ReportRow(row_header=label, values=values))
+        return rows
+
+
+def _optional_floats(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+def _plan_version(definition: ReportDefinition) -> Tuple[str, str]:
+    return definition.id, definition.updatedAt.isoformat()
+
+
+_report_plan_cache: "OrderedDict[Tuple[str, str], ReportPlan]" = OrderedDict()
+_report_plan_lock = threading.Lock()
+
+
+def get_report_plan(definition: ReportDefinition) -> ReportPlan:
+    """The compiled plan of this version of the definition, compiling it on first use."""
+    cache_key = _plan_version(definition)
+    with _report_plan_lock:
+        plan = _report_plan_cache.get(cache_key)
+        if plan is not None:
+            _report_plan_cache.move_to_end(cache_key)
+            return plan
+
+    plan = ReportPlan(definition)
+    with _report_plan_lock:
+        # Older versions of the definition can no longer be requested
+        for stale_key in [key for key in _report_plan_cache if key[0] == definition.id]:
+            del _report_plan_cache[stale_key]
+        _report_plan_cache[cache_key] = plan
+        while len(_report_plan_cache) > REPORT_PLAN_CACHE_SIZE:
+            _report_plan_cache.popitem(last=False)
+    return plan
+
+
+# --- Report Result Cache ---
+
+# Generated reports kept in memory
+REPORT_RESULT_CACHE_SIZE = int(os.environ.get("REPORT_RESULT_CACHE_SIZE", "512"))
+
+# Result key: (definition id, definition updatedAt, import storage key, import timestamp,
+# budget version id, budget revision). The dependency index lets the change listeners
+# below drop exactly the results affected by a change made in this process. The budget
+# revision is read uncached, so budget changes from other processes also give new keys;
+# definitions and import indexes come through the storage cache.
+ReportResultKey = Tuple[str, str, str, Optional[str], Optional[str], int]
+
+# key -> (rows, dependencies)
+_report_result_cache: "OrderedDict[ReportResultKey, Tuple[List[ReportRow], List[Tuple[str, ...]]]]" = OrderedDict()
+_report_result_dependencies: Dict[Tuple[str, ...], set] = {}
+_report_result_lock = threading.Lock()
+
+
+def _result_dependencies(cache_key: ReportResultKey, organization_id: str) -> List[Tuple[str, ...]]:
+    dependencies = [("definition", cache_key[0]), ("import", cache_key[2])]
+    if cache_key[4]:
+        dependencies.append(("budget", organization_id, cache_key[4]))
+    return dependencies
+
+
+def budget_revision(definition: ReportDefinition, organization_id: str) -> int:
+    if not definition.budget_version_id:
+        return 0
+    return cube_revision(BUDGET_MEASURE, budget_scenario(definition.budget_version_id), organization_id)
+
+
+def report_result_key(definition: ReportDefinition, import_index: Dict[str, Any], organization_id: str,
+                      revision: Optional[int] = None) -> ReportResultKey:
+    """Cache key of a report over one import: the versions of everything it reads."""
+    if revision is None:
+        revision = budget_revision(definition, organization_id)
+    return (*_plan_version(definition), import_index["storage_key"], import_index.get("timestamp"),
+            definition.budget_version_id, revision)
+
+
+def get_cached_report(cache_key: ReportResultKey) -> Optional[List[ReportRow]]:
+    with _report_result_lock:
+        entry = _report_result_cache.get(cache_key)
+        if entry is None:
+            return None
+        _report_result_cache.move_to_end(cache_key)
+        return entry[0]
+
+
+def cache_report(cache_key: ReportResultKey, organization_id: str, rows: List[ReportRow]):
+    dependencies = _result_dependencies(cache_key, organization_id)
+    with _report_result_lock:
+        _report_result_cache[cache_key] = (rows, dependencies)
+        for dependency in dependencies:
+            _report_result_dependencies.setdefault(dependency, set()).add(cache_key)
+        while len(_report_result_cache) > REPORT_RESULT_CACHE_SIZE:
+            evicted_key, (_, evicted_dependencies) = _report_result_cache.popitem(last=False)
+            _discard_dependencies(evicted_key, evicted_dependencies)
+
+
+def _discard_dependencies(cache_key: ReportResultKey, dependencies: List[Tuple[str, ...]]):
+    for dependency in dependencies:
+        keys = _report_result_dependencies.get(dependency)
+        if keys is not None:
+            keys.discard(cache_key)
+            if not keys:
+                del _report_result_dependencies[dependency]
+
+
+def invalidate_reports(dependency: Tuple[str, ...]) -> int:
+    """Drops the cached results that read the dependency; returns how many."""
+    with _report_result_lock:
+        keys = _report_result_dependencies.pop(dependency, set())
+        for cache_key in keys:
+            entry = _report_result_cache.pop(cache_key, None)
+            if entry is not None:
+                _discard_dependencies(cache_key, entry[1])
+        return len(keys)
+
+
+def _on_report_definition_change(change: Dict[str, Any]):
+    invalidate_reports(("definition", change["report_id"]))
+    if change["definition"] is not None:
+        get_report_plan(ReportDefinition(**change["definition"]))
+    else:
+        with _report_plan_lock:
+            for stale_key in [key for key in _report_plan_cache if key[0] == change["report_id"]]:
+                del _report_plan_cache[stale_key]
+
+
+def _on_import_change(change: Dict[str, Any]):
+    invalidate_reports(("import", change["storage_key"]))
+
+
+def _on_budget_change(change: Dict[str, Any]):
+    invalidate_reports(("budget", change["organization_id"], change["version_id"]))
+
+
+register_report_definition_listener(_on_report_definition_change)
+# Definitions whose rows can't be compiled (bad formulas, duplicate names, cycles) are rejected when saved
+register_report_definition_validator(ReportPlan)
+register_import_change_listener(_on_import_change)
+register_import_delete_listener(_on_import_change)
+register_budget_change_listener(_on_budget_change)
+
+
+def _load_legacy_budget(user: AuthorizedUser, budget_version_id: str) -> Dict[str, Any]:
+    """Budget amounts by account code from the pre-cube budget blob, or {} if there is none."""
     try:
-        definition = get_report_definition(report_id=request.report_definition_id, user=user)
-        print(f"Fetched definition: {definition.name}")
-    except HTTPException as e:
-        raise e  # Re-raise HTTP exceptions from fetching
+        # Assume budget data stored similarly to how versions were listed/fetched in budgets API (MYA-101/102)
+        # Key: budgets-{owner_id}-{budget_version_id}.json
+        # Content: {"id": ..., "name": ..., "data": [{"account_code": ..., "budget_amount": ...}, ...]}
+        budget_storage_key = sanitize_storage_key(f"budgets-{user.sub}-{budget_version_id}.json")
+        budget_version_data = storage.json.get(budget_storage_key)
+
+        budget_data_list = budget_version_data.get("data")
+        if budget_data_list is None or not isinstance(budget_data_list, list):
+            print(f"Warning: Budget data for version {budget_version_id} is missing 'data' list or invalid format. Budget columns may be empty.")
+            return {}
+        # Create lookup dictionary, assuming 'account_code' and 'budget_amount' fields
+        budget_lookup = {
+            str(item.get('account_code')): item.get('budget_amount')
+            for item in budget_data_list
+            if 'account_code' in item and 'budget_amount' in item
+        }
+        print(f"Successfully processed {len(budget_lookup)} budget records.")
+        return budget_lookup
+    except FileNotFoundError:
+        print(f"Warning: Budget version data not found for ID: {budget_version_id}. Budget columns may be empty.")
     except Exception as e:
-        print(f"Unexpected error fetching definition: {e}")
-        raise HTTPException(status_code=500, detail="Error fetching report definition.") from e
+        print(f"Warning: Error fetching or processing budget data for ID {budget_version_id}: {e}. Budget columns may be empty.")
+    return {}
 
-    # 2. Determine Data Source and Fetch Financial Data JSON
+
+def _generate_report_rows(definition: ReportDefinition, user: AuthorizedUser) -> List[ReportRow]:
+    """Rows of a report over its definition's import, from the result cache when nothing changed."""
+    # 2. Determine Data Source and Fetch Financial Data
     try:
         data_source_info = definition.dataSource
         # ---- Assumptions about dataSource structure ----
@@ -115,22 +420,20 @@ async def generate_report(
         data_type = data_source_info["dataType"]
         import_id = data_source_info["importId"] # Crucial piece
 
-        # Construct the storage key for the processed data JSON
-        financial_data_key = sanitize_storage_key(f"{org_id}_{entity_id}_{data_type}_{import_id}.json")
-        print(f"Attempting to fetch financial data from key: {financial_data_key}")
-
-        # Fetch the JSON object
-        processed_data_json = db.storage.json.get(financial_data_key)
-        
-        # Extract the actual data list
-        financial_data_list = processed_data_json.get("data")
-        if financial_data_list is None or not isinstance(financial_data_list, list):
-             raise ValueError(f"Financial data JSON ('{financial_data_key}') is missing the 'data' list or it's not a list.")
-        
-        print(f"Successfully fetched {len(financial_data_list)} financial data records.")
-        
-        # OPTIONAL: Convert to DataFrame for easier manipulation, though maybe overkill for simple mapping
-        # financial_df = pd.DataFrame(financial_data_list)
+        # Only the account rows and value fields the definition uses are read from the columnar store
+        financial_data_key = sanitize_storage_key(f"{org_id}_{entity_id}_{data_type}_{import_id}")
+        plan = get_report_plan(definition)
+        account_codes = plan.account_codes
+        import_index = get_import_index(financial_data_key)
+        result_key = report_result_key(definition, import_index, org_id)
+        cached_rows = get_cached_report(result_key)
+        if cached_rows is None:
+            print(f"Attempting to fetch financial data from key: {financial_data_key}")
+            financial_df = read_import_frame(
+                financial_data_key, columns=["account_code", *plan.value_fields],
+                accounts=None if plan.reads_all_accounts else account_codes
+            )
+            print(f"Successfully fetched {len(financial_df)} financial data records.")
 
     except FileNotFoundError:
         print(f"Error: Processed financial data not found at key: {financial_data_key}")
@@ -142,115 +445,212 @@ async def generate_report(
         print(f"Unexpected error fetching/processing financial data: {e}")
         raise HTTPException(status_code=500, detail="Error retrieving or processing financial data.") from e
 
+    # Served from the result cache when none of the inputs changed
+    if cached_rows is not None:
+        print(f"Serving report {definition.id} for import {import_id} from cache")
+        return cached_rows
+
     # 3. Fetch Budget Data (if applicable)
     budget_lookup = {}
     if definition.budget_version_id:
         print(f"Budget version ID found: {definition.budget_version_id}. Fetching budget data...")
         try:
-            # Assume budget data stored similarly to how versions were listed/fetched in budgets API (MYA-101/102)
-            # Key: budgets-{owner_id}-{budget_version_id}.json
-            # Content: {"id": ..., "name": ..., "data": [{"account_code": ..., "budget_amount": ...}, ...]}
-            budget_storage_key = sanitize_storage_key(f"budgets-{user.sub}-{definition.budget_version_id}.json")
-            budget_version_data = db.storage.json.get(budget_storage_key)
-            
-            budget_data_list = budget_version_data.get("data")
-            if budget_data_list is None or not isinstance(budget_data_list, list):
-                print(f"Warning: Budget data for version {definition.budget_version_id} is missing 'data' list or invalid format. Budget columns may be empty.")
-            else:
-                 # Create lookup dictionary, assuming 'account_code' and 'budget_amount' fields
+            # Budget amounts for the import's month, precomputed in the cube when the budget was saved
+            import_period = import_index.get("period")
+            if import_period:
                 budget_lookup = {
-                    item.get('account_code'): item.get('budget_amount') 
-                    for item in budget_data_list 
-                    if 'account_code' in item and 'budget_amount' in item
+                    cell["account"]: cell["value"]
+                    for cell in query_cube(BUDGET_MEASURE, budget_scenario(definition.budget_version_id),
+                                           [org_id], [import_period],
+                                           accounts=None if plan.reads_all_accounts else account_codes)
                 }
-                print(f"Successfully processed {len(budget_lookup)} budget records.")
-                
-        except FileNotFoundError:
-             print(f"Warning: Budget version data not found for ID: {definition.budget_version_id}. Budget columns may be empty.")
-             # Continue without budget data
         except Exception as e:
-             print(f"Warning: Error fetching or processing budget data for ID {definition.budget_version_id}: {e}. Budget columns may be empty.")
-             # Continue without budget data
+            print(f"Warning: Could not read budget {definition.budget_version_id} from the cube: {e}")
 
+    if definition.budget_version_id and not budget_lookup:
+        budget_lookup = _load_legacy_budget(user, definition.budget_version_id)
 
-    # 4. Process Data & Structure Report Output
-    report_output_data: List[ReportRow] = []
+    # 4. Execute the compiled plan over the fetched data
+    report_output_data = plan.execute(financial_df, budget_lookup)
+    cache_report(result_key, org_id, report_output_data)
+    return report_output_data
 
-    # Convert actual financial data list to dict keyed by account_code for easier lookup
-    data_lookup = {item.get('account_code'): item for item in financial_data_list if 'account_code' in item}
 
-    for row_def in definition.rows:
-        # --- Assumptions about row definition ---
-        # Types: 'account', 'header', 'calculation' (calculation ignored for now)
-        # 'account' type expected keys: 'accountCode', 'label'
-        # 'header' type expected keys: 'label'
+@router.post("/generate-report", response_model=ReportDataResponse)
+async def generate_report(
+    request: GenerateReportRequest,
+    user: AuthorizedUser,
+):
+    """
+    Generates a basic report based on a definition ID.
+    Fetches the definition, reads the accounts and fields it uses from the columnar copy
+    of the imported financial data, and structures it according to the definition's rows/columns.
+    Calculation rows evaluate their `formula` (see app.apis.formula_engine) over the other rows and accounts.
+    """
+    print(f"Generating report for definition ID: {request.report_definition_id}")
 
-        row_type = row_def.get("type")
-        row_label = row_def.get("label", "Unnamed Row")
-        
-        output_row = ReportRow(row_header=row_label, values={})
+    # 1. Fetch Report Definition
+    try:
+        definition = await get_report_definition_logic(report_id=request.report_definition_id, user=user)
+        print(f"Fetched definition: {definition.name}")
+    except HTTPException as e:
+        raise e  # Re-raise HTTP exceptions from fetching
+    except Exception as e:
+        print(f"Unexpected error fetching definition: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching report definition.") from e
 
-        account_code = row_def.get("accountCode") if row_type == "account" else None
-        account_data = data_lookup.get(account_code) if account_code else None
-        budget_value = budget_lookup.get(account_code) if account_code and budget_lookup else None
-        
-        for col_def in definition.columns:
-            # --- Assumptions about column definition ---
-            # Types: 'value', 'budget_value', 'variance'
-            # 'value' expected keys: 'field' (e.g., 'balance'), 'label'
-            # 'budget_value' expected keys: 'label'
-            # 'variance' expected keys: 'field' (for actual value), 'label'
-            
-            col_type = col_def.get("type")
-            col_label = col_def.get("label", "Unnamed Column")
+    # 2-4. Read the data and execute the plan, off the event loop
+    report_output_data = await run_in_threadpool(_generate_report_rows, definition, user)
 
-            if row_type == "account":
-                if col_type == "value":
-                    field_name = col_def.get("field") # e.g., 'balance', 'debit', 'credit'
-                    output_row.values[col_label] = account_data.get(field_name) if account_data and field_name else None
-                
-                elif col_type == "budget_value":
-                    output_row.values[col_label] = budget_value # Already retrieved
-                
-                elif col_type == "variance":
-                    field_name = col_def.get("field") # Actual value field
-                    actual_value = account_data.get(field_name) if account_data and field_name else None
-                    
-                    # Calculate variance only if both actual and budget are numeric
-                    variance = None
-                    try:
-                        # Attempt conversion to float, handle None/non-numeric gracefully
-                        num_actual = float(actual_value) if actual_value is not None else None
-                        num_budget = float(budget_value) if budget_value is not None else None
-
-                        if num_actual is not None and num_budget is not None:
-                           variance = num_actual - num_budget
-                        # else: leave variance as None if either value is missing/non-numeric
-                           
-                    except (ValueError, TypeError):
-                        print(f"Could not calculate variance for account {account_code}, column '{col_label}'. Actual: {actual_value}, Budget: {budget_value}")
-                        variance = None # Ensure variance is None if conversion fails
-                        
-                    output_row.values[col_label] = variance
-                
-                else:
-                    # Unknown column type for an account row
-                    output_row.values[col_label] = None
-            
-            elif row_type == "header":
-                 # For header rows, output empty string for all columns
-                 output_row.values[col_label] = ""
-            
-            else: 
-                 # For other row types (like calculation, if added later) or unexpected types
-                 output_row.values[col_label] = None
-                 
-        report_output_data.append(output_row)
-
-    # 4. Return Structure
+    # 5. Return Structure
     return ReportDataResponse(
         report_name=definition.name,
         report_id=definition.id,
         data=report_output_data
     )
 
+
+# --- Batch Reports ---
+
+# Report cells generated concurrently by one batch request
+REPORT_BATCH_CONCURRENCY = int(os.environ.get("REPORT_BATCH_CONCURRENCY", "8"))
+# Most entity x period cells one batch request may ask for
+REPORT_BATCH_MAX_CELLS = int(os.environ.get("REPORT_BATCH_MAX_CELLS", "500"))
+
+
+class BatchReportRequest(BaseModel):
+    report_definition_id: str = Field(..., description="ID of the report definition to use.")
+    business_entity_ids: Optional[List[str]] = Field(None, description="Entities to report on; the definition's entity if omitted.")
+    periods: List[str] = Field(..., description="Months to report on ('2024-03' or any date in the month). The latest import of each month is used.")
+    stream: bool = Field(False, description="Stream the result as NDJSON: a header line, then one line per cell as it completes.")
+
+
+class BatchReportCell(BaseModel):
+    business_entity_id: str
+    period: str
+    import_id: Optional[str] = None
+    data: Optional[List[ReportRow]] = None
+    error: Optional[str] = None
+
+
+class BatchReportResponse(BaseModel):
+    report_name: str
+    report_id: str
+    business_entity_ids: List[str]
+    periods: List[str]
+    cells: List[BatchReportCell] = Field(..., description="One cell per entity and period, entity by entity.")
+
+
+def _latest_imports_by_month(org_id: str, entity_id: str, data_type: str) -> Dict[str, Dict[str, Any]]:
+    """Account index of the entity's latest import of each month."""
+    latest: Dict[str, Dict[str, Any]] = {}
+    for index in find_entity_imports(entity_id, data_type):
+        if index.get("organization_id") != org_id or not index.get("period"):
+            continue
+        month = normalize_period(index["period"])
+        if month not in latest or (index.get("timestamp") or "") > (latest[month].get("timestamp") or ""):
+            latest[month] = index
+    return latest
+
+
+def _run_report_cell(plan: ReportPlan, index: Dict[str, Any], budget_lookup: Dict[str, Any]) -> List[ReportRow]:
+    financial_df = read_import_frame(
+        index["storage_key"], columns=["account_code", *plan.value_fields],
+        accounts=None if plan.reads_all_accounts else plan.account_codes
+    )
+    return plan.execute(financial_df, budget_lookup)
+
+
+@router.post("/generate-reports", response_model=BatchReportResponse)
+async def generate_reports(
+    request: BatchReportRequest,
+    user: AuthorizedUser,
+):
+    """
+    Generates one report definition for several entities and months in one request.
+    The definition, its compiled plan, each entity's import index and the budget are
+    loaded once; the entity x period cells are then generated concurrently. A cell
+    without an import, or that fails, carries an error instead of data.
+    """
+    definition = await get_report_definition_logic(report_id=request.report_definition_id, user=user)
+    data_source_info = definition.dataSource
+    missing_keys = [key for key in ("organizationId", "dataType") if key not in data_source_info]
+    if missing_keys:
+        raise HTTPException(status_code=400, detail=f"Incomplete dataSource information in report definition. Missing required keys: {', '.join(missing_keys)}")
+    org_id = data_source_info["organizationId"]
+    data_type = data_source_info["dataType"]
+
+    entity_ids = list(dict.fromkeys(request.business_entity_ids or [])) or (
+        [data_source_info["businessEntityId"]] if data_source_info.get("businessEntityId") else []
+    )
+    try:
+        periods = list(dict.fromkeys(normalize_period(period) for period in request.periods))
+        plan = get_report_plan(definition)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    if not entity_ids or not periods:
+        raise HTTPException(status_code=400, detail="At least one business entity and one period are required.")
+    if any(period_level(period) != "month" for period in periods):
+        raise HTTPException(status_code=400, detail="Periods must be months, e.g. '2024-03'.")
+    if len(entity_ids) * len(periods) > REPORT_BATCH_MAX_CELLS:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {REPORT_BATCH_MAX_CELLS} entity-period cells.")
+    print(f"Generating report {definition.id} for {len(entity_ids)} entities x {len(periods)} periods")
+
+    # Shared inputs, loaded once for all cells
+    entity_imports = dict(zip(entity_ids, await asyncio.gather(
+        *(run_in_threadpool(_latest_imports_by_month, org_id, entity_id, data_type) for entity_id in entity_ids)
+    )))
+    budgets: Dict[str, Dict[str, Any]] = {}
+    legacy_budget: Dict[str, Any] = {}
+    if definition.budget_version_id:
+        try:
+            cube_cells = await run_in_threadpool(
+                query_cube, BUDGET_MEASURE, budget_scenario(definition.budget_version_id), [org_id], periods,
+                None if plan.reads_all_accounts else plan.account_codes
+            )
+            for cube_cell in cube_cells:
+                budgets.setdefault(cube_cell["period"], {})[cube_cell["account"]] = cube_cell["value"]
+        except Exception as e:
+            print(f"Warning: Could not read budget {definition.budget_version_id} from the cube: {e}")
+        if not budgets:
+            legacy_budget = await run_in_threadpool(_load_legacy_budget, user, definition.budget_version_id)
+
+    revision = await run_in_threadpool(budget_revision, definition, org_id)
+    semaphore = asyncio.Semaphore(REPORT_BATCH_CONCURRENCY)
+
+    async def generate_cell(entity_id: str, period: str) -> BatchReportCell:
+        index = entity_imports[entity_id].get(period)
+        if index is None:
+            return BatchReportCell(business_entity_id=entity_id, period=period, error="No import for this period.")
+        result_key = report_result_key(definition, index, org_id, revision)
+        rows = get_cached_report(result_key)
+        if rows is not None:
+            return BatchReportCell(business_entity_id=entity_id, period=period, import_id=index.get("import_id"), data=rows)
+        async with semaphore:
+            try:
+                rows = await run_in_threadpool(_run_report_cell, plan, index, budgets.get(period, legacy_budget))
+                cache_report(result_key, org_id, rows)
+            except Exception as e:
+                print(f"Error generating report {definition.id} for {entity_id} {period}: {e}")
+                return BatchReportCell(business_entity_id=entity_id, period=period,
+                                       import_id=index.get("import_id"), error="Error generating report.")
+        return BatchReportCell(business_entity_id=entity_id, period=period, import_id=index.get("import_id"), data=rows)
+
+    cell_tasks = [generate_cell(entity_id, period) for entity_id in entity_ids for period in periods]
+
+    if request.stream:
+        async def ndjson_lines():
+            yield json.dumps({"report_name": definition.name, "report_id": definition.id,
+                              "business_entity_ids": entity_ids, "periods": periods}) + "\n"
+            for next_cell in asyncio.as_completed(cell_tasks):
+                yield (await next_cell).model_dump_json() + "\n"
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    return BatchReportResponse(
+        report_name=definition.name,
+        report_id=definition.id,
+        business_entity_ids=entity_ids,
+        periods=periods,
+        cells=await asyncio.gather(*cell_tasks),
+    )
@@ -3,7 +3,7 @@ from app.auth import AuthorizedUser
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 import json
-import databutton as db
+from app.apis.storage_utils import storage
 
 # Create router
 router = APIRouter()
@@ -172,17 +172,17 @@ def initialize_benchmark_data():
     """Initialize the benchmark data store with sample data if it doesn't exist"""
     try:
         # Check if data already exists
-        existing_data = db.storage.json.get('benchmark_data_all', default=[])
+        existing_data = storage.json.get('benchmark_data_all', default=[])
         if not existing_data:
             # Store the sample data
-            db.storage.json.put('benchmark_data_all', SAMPLE_DATA)
+            storage.json.put('benchmark_data_all', SAMPLE_DATA)
             
             # Also store source-specific data
             ato_data = [item for item in SAMPLE_DATA if item['source_id'] == 'ato_small_business']
             abs_data = [item for item in SAMPLE_DATA if item['source_id'] == 'abs_industry_stats']
             
-            db.storage.json.put('benchmark_data_ato_small_business', ato_data)
-            db.storage.json.put('benchmark_data_abs_industry_stats', abs_data)
+            storage.json.put('benchmark_data_ato_small_business', ato_data)
+            storage.json.put('benchmark_data_abs_industry_stats', abs_data)
             
             print(f"Initialized benchmark data store with {len(SAMPLE_DATA)} sample records")
     except Exception as e:
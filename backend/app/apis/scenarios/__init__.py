@@ -1,5 +1,5 @@
 
-import databutton as db
+from app.apis.storage_utils import async_storage
 from fastapi import APIRouter, HTTPException, Depends, status, Request # Added Request
 from pydantic import BaseModel, Field, field_validator
 from typing import List, Dict, Any, Optional, Literal
@@ -10,7 +10,7 @@ import re
 import pandas as pd # Added pandas import
 
 from app.auth import AuthorizedUser
-from app.apis.utils import log_audit_event # Import the audit logger
+from app.apis.utils import log_audit_event_async # Import the audit logger
 
 router = APIRouter(prefix="/scenarios", tags=["Scenarios"])
 
@@ -180,11 +180,11 @@ async def create_scenario(
                     assumption['endDate'] = end_dt.isoformat() if pd.notna(end_dt) else None
 
 
-        db.storage.json.put(storage_key, scenario_dict_for_storage)
+        await async_storage.json.put(storage_key, scenario_dict_for_storage)
         print(f"Successfully created scenario {scenario_id} for user {user.sub} at {storage_key}")
 
         # Log successful audit event
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="SCENARIO_CREATE",
             status="SUCCESS",
@@ -200,7 +200,7 @@ async def create_scenario(
 
         # Log failed audit event
         log_details["error"] = str(e) # Add error to details
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="SCENARIO_CREATE",
             status="FAILURE",
@@ -227,15 +227,22 @@ async def list_scenarios(
 
     try:
         # List files matching the user-specific prefix
-        scenario_files = db.storage.json.list()
-        print(f"Found {len(scenario_files)} total json files. Filtering for prefix '{user_scenario_prefix}'")
+        scenario_files = await async_storage.json.list(prefix=user_scenario_prefix)
+        print(f"Found {len(scenario_files)} json files with prefix '{user_scenario_prefix}'")
+        # Ensure the file name starts with the correct prefix and structure
+        scenario_keys = [
+            file_info.name for file_info in scenario_files
+            if file_info.name.startswith(user_scenario_prefix) and file_info.name.endswith('.json')
+        ]
+        # Fetch all matching documents concurrently
+        scenario_docs = await async_storage.json.get_many(scenario_keys)
 
         for file_info in scenario_files:
-            # Ensure the file name starts with the correct prefix and structure
-            if file_info.name.startswith(user_scenario_prefix) and file_info.name.endswith('.json'):
+            if file_info.name in scenario_keys:
                 try:
-                    # Attempt to load the JSON data for each matching file
-                    scenario_data = db.storage.json.get(file_info.name)
+                    scenario_data = scenario_docs.get(file_info.name)
+                    if scenario_data is None:
+                        raise FileNotFoundError(file_info.name)
                     # Validate the loaded data against the full metadata model
                     metadata = ScenarioMetadata(**scenario_data)
                     # Create a summary object
@@ -280,7 +287,7 @@ async def get_scenario(
     storage_key = create_scenario_storage_key(user_id=user.sub, scenario_id=scenario_id)
 
     try:
-        scenario_data = db.storage.json.get(storage_key)
+        scenario_data = await async_storage.json.get(storage_key)
         # Validate data and ownership (redundant check, as key includes user_id, but good practice)
         metadata = ScenarioMetadata(**scenario_data)
         if metadata.ownerId != user.sub:
@@ -319,7 +326,7 @@ async def update_scenario(
 
     try:
         # 1. Retrieve existing scenario data (also verifies ownership indirectly)
-        existing_data = db.storage.json.get(storage_key)
+        existing_data = await async_storage.json.get(storage_key)
         existing_scenario = ScenarioMetadata(**existing_data)
 
         # Double check ownership explicitly
@@ -371,11 +378,11 @@ async def update_scenario(
                     end_dt = pd.to_datetime(assumption['endDate'], errors='coerce')
                     assumption['endDate'] = end_dt.isoformat() if pd.notna(end_dt) else None
 
-        db.storage.json.put(storage_key, updated_scenario_dict_for_storage)
+        await async_storage.json.put(storage_key, updated_scenario_dict_for_storage)
         print(f"Successfully updated scenario {scenario_id} for user {user.sub}")
 
         # Log successful audit event
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="SCENARIO_UPDATE",
             status="SUCCESS",
@@ -391,7 +398,7 @@ async def update_scenario(
         error_message = f"Scenario with ID '{scenario_id}' not found"
         print(f"Update Error: Scenario {scenario_id} not found for user {user.sub} at key {storage_key}")
         # Log failed audit event (Not Found)
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="SCENARIO_UPDATE",
             status="FAILURE",
@@ -407,7 +414,7 @@ async def update_scenario(
     except HTTPException as http_exc: # Handle specific permission errors
         # Log failed audit event (Permission Denied - likely from the ownership check)
         if http_exc.status_code == status.HTTP_403_FORBIDDEN:
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=user.sub,
                 action_type="SCENARIO_UPDATE",
                 status="FAILURE",
@@ -421,7 +428,7 @@ async def update_scenario(
         error_message = f"Failed to update scenario: {e}"
         print(f"Error updating scenario {scenario_id} for user {user.sub}: {e}")
         # Log failed audit event (Internal Server Error)
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="SCENARIO_UPDATE",
             status="FAILURE",
@@ -448,16 +455,16 @@ async def delete_scenario(
     try:
         # Optional check if file exists first to return 404 explicitly
         try:
-            db.storage.json.get(storage_key) # Check if it exists before delete
+            await async_storage.json.get(storage_key) # Check if it exists before delete
         except FileNotFoundError:
              print(f"Delete Error: Scenario {scenario_id} not found for user {user.sub}.")
              raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Scenario '{scenario_id}' not found") from None
 
-        db.storage.json.delete(storage_key)
+        await async_storage.json.delete(storage_key)
         print(f"Successfully deleted scenario {scenario_id} for user {user.sub}")
 
         # Log successful audit event
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="SCENARIO_DELETE",
             status="SUCCESS",
@@ -474,7 +481,7 @@ async def delete_scenario(
         # Log failed audit event (e.g., Not Found)
         if http_exc.status_code == status.HTTP_404_NOT_FOUND:
             error_message = f"Scenario '{scenario_id}' not found"
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=user.sub,
                 action_type="SCENARIO_DELETE",
                 status="FAILURE",
@@ -484,7 +491,7 @@ async def delete_scenario(
                 details={"error": error_message}
             )
         else: # Log other HTTP errors generically
-            log_audit_event(
+            await log_audit_event_async(
                     user_identifier=user.sub,
                     action_type="SCENARIO_DELETE",
                     status="FAILURE",
@@ -499,7 +506,7 @@ async def delete_scenario(
         error_message = f"Failed to delete scenario: {e}"
         print(f"Error deleting scenario {scenario_id} for user {user.sub}: {e}")
         # Log failed audit event (Internal Server Error)
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier=user.sub,
             action_type="SCENARIO_DELETE",
             status="FAILURE",
@@ -526,7 +533,7 @@ async def apply_scenario(
     # --- 1. Load Scenario Definition ---
     scenario_storage_key = create_scenario_storage_key(user_id=user.sub, scenario_id=scenario_id)
     try:
-        scenario_dict = db.storage.json.get(scenario_storage_key)
+        scenario_dict = await async_storage.json.get(scenario_storage_key)
         scenario = ScenarioMetadata(**scenario_dict)
         if scenario.ownerId != user.sub: # Double-check ownership
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied for scenario")
@@ -541,7 +548,7 @@ async def apply_scenario(
     base_forecast_storage_key = sanitize_storage_key(request.baseForecastId)
     try:
         # TODO: Confirm the actual storage key pattern if different from import_id
-        base_forecast_df = db.storage.dataframes.get(base_forecast_storage_key)
+        base_forecast_df = await async_storage.dataframes.get(base_forecast_storage_key)
         if base_forecast_df is None or base_forecast_df.empty:
             raise FileNotFoundError # Treat empty DataFrame as not found for consistency
         print(f"Successfully loaded base forecast {request.baseForecastId} with shape {base_forecast_df.shape}")
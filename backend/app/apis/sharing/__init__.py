@@ -1,9 +1,9 @@
 
-from app.apis.utils import log_audit_event # Import audit logging function
+from app.apis.utils import log_audit_event_async # Import audit logging function
 from fastapi import APIRouter, HTTPException, Depends, Request as FastAPIRequest # Import Request
 from pydantic import BaseModel, Field
 from typing import List, Literal, Dict
-import databutton as db
+from app.apis.storage_utils import storage
 from app.auth import AuthorizedUser
 
 router = APIRouter(prefix="/sharing", tags=["Sharing"])
@@ -27,38 +27,57 @@ class UserPermissionsResponse(BaseModel):
     accessible_content: List[str] = Field(..., description="List of content references (e.g., 'dashboard:id1') accessible by the user.")
 
 class PermissionsStorage(BaseModel):
+    """Format of the former single-blob permissions store, kept for migration."""
     content_permissions: Dict[str, List[str]] = Field(default_factory=dict) # Key: "content_type:content_id", Value: [user_id]
     user_permissions: Dict[str, List[str]] = Field(default_factory=dict)    # Key: "user_id", Value: ["content_type:content_id"]
 
 # --- Helper Functions (To be implemented) ---
 
-def _load_permissions() -> PermissionsStorage:
-    """Loads the permissions dictionary from db.storage.json."""
+def _legacy_grants(permissions_dict: dict) -> List[dict]:
+    """Converts the former single permissions blob into one grant record per (content, user) pair."""
     try:
-        permissions_dict = db.storage.json.get(STORAGE_KEY)
-        # Validate and parse the loaded dict into the Pydantic model
-        return PermissionsStorage(**permissions_dict)
-    except FileNotFoundError:
-        print(f"Permissions file {STORAGE_KEY} not found. Returning empty structure.")
-        return PermissionsStorage() # Return default empty structure
+        permissions = PermissionsStorage(**permissions_dict)
     except Exception as e:
-        # Catch potential Pydantic validation errors or other issues
-        print(f"Error loading or parsing permissions from {STORAGE_KEY}: {e}. Returning empty structure.")
-        # Depending on policy, could re-raise or log more severely
-        return PermissionsStorage()
-
-
-def _save_permissions(permissions: PermissionsStorage):
-    """Saves the permissions dictionary to db.storage.json."""
-    try:
-        # Convert Pydantic model to dict before saving
-        db.storage.json.put(STORAGE_KEY, permissions.dict())
-        print(f"Permissions saved successfully to {STORAGE_KEY}.")
-    except Exception as e:
-        print(f"Error saving permissions to {STORAGE_KEY}: {e}")
-        # Depending on requirements, might want to raise an exception here
-        # For now, just log the error to avoid breaking the request flow entirely
-        # Consider adding more robust error handling/retry logic if needed.
+        print(f"Error parsing legacy permissions from {STORAGE_KEY}: {e}. Nothing to migrate.")
+        return []
+    return [
+        _grant_record(content_ref, user_id)
+        for content_ref, user_ids in permissions.content_permissions.items()
+        for user_id in user_ids
+    ]
+
+
+def _grant_record(content_ref: str, user_id: str) -> dict:
+    return {"id": f"{content_ref}|{user_id}", "content_ref": content_ref, "user_id": user_id}
+
+
+# One storage key per grant, indexed both ways, so granting or revoking access
+# no longer rewrites every permission in the system
+permission_grants = storage.collection(
+    "sharing_grants",
+    id_field="id",
+    legacy_key=STORAGE_KEY,
+    legacy_records=_legacy_grants,
+    indexes={
+        "content_ref": lambda grant: grant.get("content_ref"),
+        "user_id": lambda grant: grant.get("user_id"),
+    },
+)
+
+
+def _apply_grant(content_ref: str, users_to_add: set):
+    for user_id in users_to_add:
+        permission_grants.put(_grant_record(content_ref, user_id))
+
+
+def _apply_revoke(content_ref: str, users_to_revoke: set) -> bool:
+    changes_made = False
+    for user_id in users_to_revoke:
+        if permission_grants.delete(_grant_record(content_ref, user_id)["id"]):
+            changes_made = True # Confirm change was made
+        else:
+            print(f"User {user_id} had no access to {content_ref} during revoke attempt.")
+    return changes_made
 
 
 # --- API Endpoints (To be implemented) ---
@@ -78,26 +97,8 @@ async def grant_access(
     print(f"User {granting_user_id} attempting to grant access for users {target_user_ids} to {content_ref}")
 
     try:
-        permissions = _load_permissions()
-
-        # Update content_permissions
-        if content_ref not in permissions.content_permissions:
-            permissions.content_permissions[content_ref] = []
-        
-        existing_users = set(permissions.content_permissions[content_ref])
         users_to_add = set(target_user_ids)
-        updated_users = sorted(list(existing_users.union(users_to_add)))
-        permissions.content_permissions[content_ref] = updated_users
-
-        # Update user_permissions
-        for user_id in users_to_add: # Only update for newly added users
-            if user_id not in permissions.user_permissions:
-                permissions.user_permissions[user_id] = []
-            if content_ref not in permissions.user_permissions[user_id]:
-                permissions.user_permissions[user_id].append(content_ref)
-                permissions.user_permissions[user_id] = sorted(permissions.user_permissions[user_id])
-
-        _save_permissions(permissions)
+        _apply_grant(content_ref, users_to_add)
 
         print(f"Access granted successfully for {len(users_to_add)} users to {content_ref}.")
         
@@ -105,7 +106,7 @@ async def grant_access(
         try:
             # Log one event per user granted access for better granularity
             for target_user_id in users_to_add:
-                 log_audit_event(
+                 await log_audit_event_async(
                     user_identifier=granting_user_id,
                     action_type="CONTENT_ACCESS_GRANT",
                     status="SUCCESS",
@@ -131,7 +132,7 @@ async def grant_access(
         try:
             # Attempt to log failure, potentially multiple times if multiple users were involved
             # Or log a single summary failure event
-             log_audit_event(
+             await log_audit_event_async(
                 user_identifier=granting_user_id,
                 action_type="CONTENT_ACCESS_GRANT",
                 status="FAILURE",
@@ -167,38 +168,9 @@ async def revoke_access(
     print(f"User {revoking_user_id} attempting to revoke access for users {target_user_ids} from {content_ref}")
 
     try:
-        permissions = _load_permissions()
-        changes_made = False
-
-        # Update content_permissions
-        if content_ref in permissions.content_permissions:
-            initial_users = set(permissions.content_permissions[content_ref])
-            remaining_users = sorted(list(initial_users - users_to_revoke))
-            if len(remaining_users) < len(initial_users):
-                 changes_made = True
-            if not remaining_users:
-                del permissions.content_permissions[content_ref] # Clean up if no users left
-                print(f"Removed content entry {content_ref} as no users have access.")
-            else:
-                permissions.content_permissions[content_ref] = remaining_users
-        else:
-             print(f"Content {content_ref} not found in content_permissions during revoke attempt.")
-             # If content not found, access is effectively revoked, proceed without error
-
-        # Update user_permissions
-        for user_id in users_to_revoke:
-            if user_id in permissions.user_permissions:
-                if content_ref in permissions.user_permissions[user_id]:
-                    permissions.user_permissions[user_id].remove(content_ref)
-                    changes_made = True # Confirm change was made
-                    if not permissions.user_permissions[user_id]: # Clean up if user has no permissions left
-                        del permissions.user_permissions[user_id]
-                        print(f"Removed user entry {user_id} as they have no accessible content.")
-            else:
-                print(f"User {user_id} not found in user_permissions during revoke attempt.")
+        changes_made = _apply_revoke(content_ref, users_to_revoke)
 
         if changes_made:
-            _save_permissions(permissions)
             print(f"Access revoked successfully for specified users from {content_ref}.")
         else:
              print(f"No changes needed during revoke access for users {target_user_ids} from {content_ref}.")
@@ -207,7 +179,7 @@ async def revoke_access(
         try:
             # Log one event per user revoked
             for target_user_id in users_to_revoke:
-                log_audit_event(
+                await log_audit_event_async(
                     user_identifier=revoking_user_id,
                     action_type="CONTENT_ACCESS_REVOKE",
                     status="SUCCESS",
@@ -232,7 +204,7 @@ async def revoke_access(
         print(f"Error revoking access from {content_ref} by {revoking_user_id}: {e}")
         # --- Audit Log Failure ---
         try:
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier=revoking_user_id,
                 action_type="CONTENT_ACCESS_REVOKE",
                 status="FAILURE",
@@ -259,10 +231,9 @@ def get_content_permissions(
     internal_user: AuthorizedUser # Protect this endpoint for internal use initially
 ):
     """Gets the list of user IDs who have access to a specific content item."""
-    permissions = _load_permissions()
     content_ref = f"{content_type}:{content_id}"
     
-    user_ids = permissions.content_permissions.get(content_ref, [])
+    user_ids = sorted(grant["user_id"] for grant in permission_grants.find("content_ref", content_ref))
     
     print(f"User {internal_user.sub} queried access for {content_ref}. Found users: {user_ids}")
     return ContentPermissionsResponse(user_ids=user_ids)
@@ -274,9 +245,7 @@ def get_user_permissions(
     internal_user: AuthorizedUser # Protect this endpoint for internal use initially
 ):
     """Gets the list of content items accessible by a specific external user."""
-    permissions = _load_permissions()
-    
-    accessible_content = permissions.user_permissions.get(user_id, [])
+    accessible_content = sorted(grant["content_ref"] for grant in permission_grants.find("user_id", user_id))
     
     print(f"User {internal_user.sub} queried accessible content for external user {user_id}. Found: {accessible_content}")
     return UserPermissionsResponse(accessible_content=accessible_content)
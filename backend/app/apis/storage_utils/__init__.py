@@ -0,0 +1,1930 @@
+"""Storage Utilities
+
+Shared wrapper around db.storage. API modules import `storage` from here instead
+of calling db.storage directly, so cross-cutting storage behaviour lives in one place:
+
+    from app.apis.storage_utils import storage
+
+    data = storage.json.get("some_key", default={})
+    storage.json.put("some_key", data)
+
+The json namespace keeps a per-process LRU of parsed values, bounded by their
+serialized size. Writes and deletes made through the wrapper invalidate the cached
+entry; entries expire after STORAGE_CACHE_TTL_SECONDS, so a write from another
+process is seen within that bound. Reads that must see the latest value (job
+state, "latest" pointers, counters) bypass the cache:
+
+    job = storage.json.get(job_key, fresh=True)
+
+Prefix listings go to the backend when it can list by prefix, and are otherwise served
+from an in-memory catalog instead of a full backend scan. Secondary indexes are kept
+in storage, so every process sees keys written by the others:
+
+    storage.json.list(prefix="dashboard_config-user123-")
+    storage.json.register_index("coa_mapping_by_org", "coa_mapping_", lambda v: v.get("organization_id"))
+    storage.json.list_by_index("coa_mapping_by_org", organization_id)
+
+Shared blobs that several requests read-modify-write (indexes, registries) should
+be changed with `update`, which re-applies the mutation on a fresh copy if another
+writer got in first instead of silently overwriting their change:
+
+    def add_version(index):
+        index.append(version_id)
+        return index
+
+    storage.json.update("budget_versions_index_x", add_version, default=list)
+
+On backends without compare-and-swap (the hosted db.storage), `update` holds a lease
+key, `storage_lock__<key>`, that every process honours. `storage.json.lock(name)`
+takes the same kind of lease around any other critical section.
+
+Collections of records that used to live in one blob are stored one key per record
+with `storage.collection`, so reading or writing one record does not touch the rest:
+
+    schedules = storage.collection("report_schedules", id_field="scheduleId", indexes={"createdBy": ...})
+    schedules.put(schedule_dict)
+    schedules.find("createdBy", user_id)
+
+Existing single-blob data is split into records on first use; POST /storage/collections/migrate
+runs the same migration for every registered collection up front.
+
+Endpoints that read or write many keys at once should use `get_many`/`put_many`,
+which batch the requests into one backend round trip (a single SQLite transaction
+locally) instead of one call per key:
+
+    docs = storage.json.get_many(keys)  # {key: value}, missing keys left out
+    storage.json.put_many({metadata_key: metadata, data_key: rows})
+
+Dataframes are written as Parquet (with per-row-group column statistics) and read
+through a memory-mapped local copy, so callers can ask for just the columns and
+rows they need:
+
+    storage.dataframes.get(key, columns=["account_code", "balance"],
+                           filters=[("period_date", ">=", start), ("entity_id", "in", ids)])
+
+JSON values larger than STORAGE_COMPRESSION_THRESHOLD_BYTES are stored zstd-compressed
+inside a small marker object and decompressed transparently on read. Prefixes holding
+many small, similar records can opt into a trained zstd dictionary instead
+(see `enable_dictionary_compression`).
+
+Async endpoints should not call the blocking backend on the event loop. `async_storage`
+runs the same operations on a dedicated, bounded thread pool:
+
+    from app.apis.storage_utils import async_storage
+
+    config = await async_storage.json.get(key, default=dict)
+    docs = await async_storage.json.get_many(keys)  # one batched round trip
+    await async_storage.run(report_schedules.put, schedule)  # any blocking storage helper
+
+Every backend call is counted per request (operations, bytes, latency, keys touched)
+and aggregated per endpoint; see GET /storage/metrics. JSON bytes written are the
+encoded sizes; JSON bytes read are estimated from a sample of reads. With STORAGE_METRICS_HEADERS=true
+each response also carries its own X-Storage-* totals.
+"""
+import asyncio
+import base64
+import contextvars
+import functools
+import hashlib
+import inspect
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import uuid
+import time
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+
+try:
+    import zstandard
+except ImportError:
+    # Optional: without zstandard, large values are compressed with zlib instead
+    zstandard = None
+import zlib
+
+try:
+    import databutton as db
+except ImportError:
+    # Use mock databutton for local development
+    import sys
+    sys.path.append('..')
+    import databutton_mock as db
+
+from app.apis.permission_utils import require_ops_admin
+
+router = APIRouter(prefix="/storage", tags=["Storage"])
+
+# --- Configuration ---
+
+STORAGE_CACHE_MAX_BYTES = int(os.environ.get("STORAGE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# Larger values bypass the cache so a single blob cannot flush everything else
+STORAGE_CACHE_MAX_ITEM_BYTES = int(os.environ.get("STORAGE_CACHE_MAX_ITEM_BYTES", STORAGE_CACHE_MAX_BYTES // 4))
+# Cached values are re-read from the backend after this long, to pick up writes from other processes
+STORAGE_CACHE_TTL_SECONDS = float(os.environ.get("STORAGE_CACHE_TTL_SECONDS", 30))
+# Check the backend version of a key on every cache hit (only if the backend supports it)
+STORAGE_CACHE_VERIFY_VERSIONS = os.environ.get("STORAGE_CACHE_VERIFY_VERSIONS", "false").lower() == "true"
+
+# For backends that can only list every key, the key catalog is rebuilt from a full listing
+# at most this often (and on a prefix miss), to pick up keys written by other processes.
+# Writes through the wrapper are applied immediately.
+STORAGE_CATALOG_REFRESH_SECONDS = float(os.environ.get("STORAGE_CATALOG_REFRESH_SECONDS", 30))
+
+# Secondary index postings and build markers are stored under this prefix
+STORAGE_INDEX_KEY_PREFIX = "storage_index__"
+
+# Attempts for storage.json.update before giving up with StorageConflictError
+STORAGE_CAS_MAX_RETRIES = int(os.environ.get("STORAGE_CAS_MAX_RETRIES", 8))
+STORAGE_CAS_BACKOFF_SECONDS = float(os.environ.get("STORAGE_CAS_BACKOFF_SECONDS", 0.01))
+
+# Cross-process leases (see CachedJsonStorage.lock). A holder that dies frees its lease
+# after STORAGE_LOCK_LEASE_SECONDS. Without compare-and-swap, a new lease is only
+# trusted if it is still ours after STORAGE_LOCK_SETTLE_SECONDS.
+STORAGE_LOCK_KEY_PREFIX = "storage_lock__"
+STORAGE_LOCK_LEASE_SECONDS = float(os.environ.get("STORAGE_LOCK_LEASE_SECONDS", 30))
+STORAGE_LOCK_SETTLE_SECONDS = float(os.environ.get("STORAGE_LOCK_SETTLE_SECONDS", 0.05))
+STORAGE_LOCK_TIMEOUT_SECONDS = float(os.environ.get("STORAGE_LOCK_TIMEOUT_SECONDS", 30))
+
+_MISSING = object()
+
+
+class StorageConflictError(Exception):
+    """Raised when a conditional write keeps losing against concurrent writers."""
+
+
+# Dataframes are stored as Parquet in the binary namespace under this prefix
+STORAGE_PARQUET_KEY_PREFIX = "columnar__"
+STORAGE_PARQUET_ROW_GROUP_SIZE = int(os.environ.get("STORAGE_PARQUET_ROW_GROUP_SIZE", 65536))
+# Local copies of Parquet blobs used for memory-mapped reads
+STORAGE_PARQUET_SPOOL_DIR = os.environ.get(
+    "STORAGE_PARQUET_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "lucent_columnar_cache")
+)
+# Without backend versions, a local copy is re-fetched after this many seconds
+STORAGE_PARQUET_SPOOL_SECONDS = float(os.environ.get("STORAGE_PARQUET_SPOOL_SECONDS", 300))
+
+# JSON values whose compact serialisation exceeds this are stored compressed
+STORAGE_COMPRESSION_THRESHOLD_BYTES = int(os.environ.get("STORAGE_COMPRESSION_THRESHOLD_BYTES", 16 * 1024))
+STORAGE_COMPRESSION_LEVEL = int(os.environ.get("STORAGE_COMPRESSION_LEVEL", 6))
+# Dictionary compression: records above this size under an enabled prefix are compressed
+# once a dictionary has been trained from STORAGE_DICTIONARY_TRAINING_SAMPLES writes
+STORAGE_DICTIONARY_MIN_BYTES = int(os.environ.get("STORAGE_DICTIONARY_MIN_BYTES", 256))
+STORAGE_DICTIONARY_TRAINING_SAMPLES = int(os.environ.get("STORAGE_DICTIONARY_TRAINING_SAMPLES", 200))
+STORAGE_DICTIONARY_SIZE_BYTES = int(os.environ.get("STORAGE_DICTIONARY_SIZE_BYTES", 16 * 1024))
+STORAGE_DICTIONARY_KEY_PREFIX = "zstd_dictionary__"
+
+# Threads used for blocking storage calls made from async code
+STORAGE_EXECUTOR_MAX_WORKERS = int(os.environ.get("STORAGE_EXECUTOR_MAX_WORKERS", 16))
+
+# Parallel requests used by get_many/put_many on backends without batch operations
+STORAGE_BATCH_CONCURRENCY = int(os.environ.get("STORAGE_BATCH_CONCURRENCY", 8))
+
+# Per-request storage instrumentation (see StorageMetrics)
+STORAGE_METRICS_ENABLED = os.environ.get("STORAGE_METRICS_ENABLED", "true").lower() == "true"
+# Attach X-Storage-* headers to every response; meant for debugging
+STORAGE_METRICS_HEADERS = os.environ.get("STORAGE_METRICS_HEADERS", "false").lower() == "true"
+# Keys tracked for the "top keys" report before the least used ones are dropped
+STORAGE_METRICS_MAX_TRACKED_KEYS = int(os.environ.get("STORAGE_METRICS_MAX_TRACKED_KEYS", 2000))
+# Fraction of JSON reads whose size is measured (by re-serialising); the bytes read
+# reported for JSON are the sampled sizes scaled up by 1 / rate
+STORAGE_METRICS_READ_SIZE_SAMPLE_RATE = float(os.environ.get("STORAGE_METRICS_READ_SIZE_SAMPLE_RATE", 0.1))
+
+# --- Helper Functions ---
+
+def _clone(value: Any) -> Any:
+    """Copies a JSON-shaped value. Cheaper than copy.deepcopy for dict/list trees."""
+    if isinstance(value, dict):
+        return {k: _clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clone(v) for v in value]
+    return value
+
+
+def _json_size(value: Any) -> int:
+    """Approximate in-memory cost of a cached value, measured as its compact JSON size."""
+    try:
+        return len(json.dumps(value, default=str, separators=(",", ":")))
+    except (TypeError, ValueError):
+        return STORAGE_CACHE_MAX_ITEM_BYTES + 1 # Unmeasurable values are not cached
+
+
+def _resolve_default(default: Any) -> Any:
+    return default() if callable(default) else default
+
+
+# --- Compression ---
+
+_ENCODING_MARKER = "__lucent_encoding__"
+
+
+class JsonBlobCodec:
+    """
+    Encodes JSON values for storage. Large values become a marker object
+    {"__lucent_encoding__": "zstd" | "zlib" | "zstd-dict", "data": <base64>, ...}
+    so they stay valid JSON for the hosted json namespace, and decode() restores
+    the original value. Anything without the marker is returned unchanged, so
+    uncompressed values written earlier keep working.
+    """
+
+    def __init__(self, threshold: int = STORAGE_COMPRESSION_THRESHOLD_BYTES, level: int = STORAGE_COMPRESSION_LEVEL):
+        self.threshold = threshold
+        self.level = level
+        # prefix -> name, for prefixes using dictionary compression
+        self._dictionary_prefixes: Dict[str, str] = {}
+        self._dictionaries: Dict[str, Any] = {} # dictionary id -> zstandard.ZstdCompressionDict
+        self._active_dictionary: Dict[str, str] = {} # prefix -> dictionary id used for new writes
+        self._samples: Dict[str, "deque[bytes]"] = {}
+        self._lock = threading.Lock()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.compressed_writes = 0
+
+    def encode(self, key: str, value: Any) -> Any:
+        return self.encode_sized(key, value)[0]
+
+    def encode_sized(self, key: str, value: Any) -> Tuple[Any, Optional[int]]:
+        """encode(), plus the stored size in bytes (None if value is not JSON serialisable)."""
+        try:
+            raw = json.dumps(value, default=str, separators=(",", ":")).encode("utf-8")
+        except (TypeError, ValueError):
+            return value, None
+        encoded = self._encode_raw(key, raw, value)
+        if encoded is value:
+            return value, len(raw)
+        return encoded, len(encoded["data"])
+
+    def _encode_raw(self, key: str, raw: bytes, value: Any) -> Any:
+        prefix = self._dictionary_prefix(key)
+        if prefix is not None and len(raw) < self.threshold:
+            return self._encode_with_dictionary(prefix, raw, value)
+        if len(raw) < self.threshold:
+            return value
+
+        if zstandard is not None:
+            encoding = "zstd"
+            compressed = zstandard.ZstdCompressor(level=self.level).compress(raw)
+        else:
+            encoding = "zlib"
+            compressed = zlib.compress(raw, self.level)
+        return self._marker(encoding, raw, compressed, value)
+
+    def decode(self, value: Any, loader: Optional[Callable[[str], Any]] = None) -> Any:
+        if not isinstance(value, dict) or _ENCODING_MARKER not in value:
+            return value
+        encoding = value[_ENCODING_MARKER]
+        data = base64.b64decode(value["data"])
+        if encoding == "zlib":
+            raw = zlib.decompress(data)
+        elif encoding == "zstd":
+            raw = self._require_zstd().ZstdDecompressor().decompress(data, max_output_size=value.get("size", 0))
+        elif encoding == "zstd-dict":
+            dictionary = self._load_dictionary(value["dict"], loader)
+            raw = self._require_zstd().ZstdDecompressor(dict_data=dictionary).decompress(
+                data, max_output_size=value.get("size", 0)
+            )
+        else:
+            raise ValueError(f"Unknown storage encoding '{encoding}'")
+        return json.loads(raw)
+
+    def _marker(self, encoding: str, raw: bytes, compressed: bytes, original: Any, **extra) -> Any:
+        marker = {_ENCODING_MARKER: encoding, "size": len(raw), "data": base64.b64encode(compressed).decode("ascii"), **extra}
+        # Base64 and the marker fields cost ~35%; keep the plain value if compression does not pay for it
+        if len(marker["data"]) + 64 >= len(raw):
+            return original
+        with self._lock:
+            self.bytes_in += len(raw)
+            self.bytes_out += len(marker["data"])
+            self.compressed_writes += 1
+        return marker
+
+    @staticmethod
+    def _require_zstd():
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this value")
+        return zstandard
+
+    # --- Dictionary compression ---
+
+    def enable_dictionary(self, prefix: str, name: str):
+        if zstandard is None:
+            return
+        with self._lock:
+            self._dictionary_prefixes[prefix] = name
+            self._samples.setdefault(prefix, deque(maxlen=STORAGE_DICTIONARY_TRAINING_SAMPLES))
+
+    def _dictionary_prefix(self, key: str) -> Optional[str]:
+        for prefix in self._dictionary_prefixes:
+            if key.startswith(prefix):
+                return prefix
+        return None
+
+    def _encode_with_dictionary(self, prefix: str, raw: bytes, value: Any) -> Any:
+        if len(raw) < STORAGE_DICTIONARY_MIN_BYTES:
+            return value
+        dictionary_id = self._active_dictionary.get(prefix)
+        if dictionary_id is None:
+            self._samples[prefix].append(raw)
+            return value
+        compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._dictionaries[dictionary_id])
+        return self._marker("zstd-dict", raw, compressor.compress(raw), value, dict=dictionary_id)
+
+    def pending_training(self) -> List[str]:
+        """Prefixes without a dictionary that have collected enough samples to train one."""
+        with self._lock:
+            return [
+                prefix for prefix, samples in self._samples.items()
+                if prefix not in self._active_dictionary and len(samples) >= STORAGE_DICTIONARY_TRAINING_SAMPLES
+            ]
+
+    def train(self, prefix: str) -> Optional[Tuple[str, bytes]]:
+        """Trains a dictionary from the collected samples. Returns (dictionary id, dictionary bytes)."""
+        with self._lock:
+            samples = list(self._samples.get(prefix, ()))
+        try:
+            trained = zstandard.train_dictionary(STORAGE_DICTIONARY_SIZE_BYTES, samples)
+        except Exception as e:
+            print(f"[WARN] Could not train compression dictionary for '{prefix}': {e}")
+            with self._lock:
+                self._samples[prefix].clear()
+            return None
+        data = trained.as_bytes()
+        dictionary_id = f"{self._dictionary_prefixes[prefix]}-{hashlib.sha1(data).hexdigest()[:12]}"
+        self.activate(prefix, dictionary_id, data)
+        return dictionary_id, data
+
+    def activate(self, prefix: str, dictionary_id: str, data: bytes):
+        with self._lock:
+            self._dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(data)
+            self._active_dictionary[prefix] = dictionary_id
+            self._samples.pop(prefix, None)
+
+    def _load_dictionary(self, dictionary_id: str, loader: Optional[Callable[[str], Any]]) -> Any:
+        dictionary = self._dictionaries.get(dictionary_id)
+        if dictionary is None:
+            if loader is None:
+                raise ValueError(f"Compression dictionary '{dictionary_id}' is not loaded")
+            dictionary = zstandard.ZstdCompressionDict(loader(dictionary_id))
+            with self._lock:
+                self._dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "zstd" if zstandard is not None else "zlib",
+                "threshold_bytes": self.threshold,
+                "compressed_writes": self.compressed_writes,
+                "bytes_before": self.bytes_in,
+                "bytes_after": self.bytes_out,
+                "ratio": round(self.bytes_in / self.bytes_out, 2) if self.bytes_out else None,
+                "dictionaries": dict(self._active_dictionary),
+            }
+
+
+# --- Cache ---
+
+class JsonCache:
+    """
+    Thread-safe LRU of parsed JSON values, bounded by total serialized bytes.
+    Entries older than ttl_seconds are treated as misses.
+    """
+
+    def __init__(self, max_bytes: int = STORAGE_CACHE_MAX_BYTES, max_item_bytes: int = STORAGE_CACHE_MAX_ITEM_BYTES,
+                 ttl_seconds: float = STORAGE_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.ttl_seconds = ttl_seconds
+        # key -> (value, size, version, stored_at)
+        self._entries: "OrderedDict[str, Tuple[Any, int, Any, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Bumped on every invalidation; fills that raced with a write are dropped
+        self.write_epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def lookup(self, key: str) -> Tuple[Any, Any]:
+        """Returns (value, version) for a cached key, or (_MISSING, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[3] > self.ttl_seconds:
+                self._discard(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return _MISSING, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[2]
+
+    def store(self, key: str, value: Any, version: Any = None, epoch: Optional[int] = None):
+        size = _json_size(value)
+        if size > self.max_item_bytes:
+            return
+        with self._lock:
+            if epoch is not None and epoch != self.write_epoch:
+                return
+            self._discard(key)
+            self._entries[key] = (value, size, version, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self.write_epoch += 1
+            if self._discard(key):
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _discard(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[1]
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+# --- Key Catalog ---
+
+class StorageKeyEntry(NamedTuple):
+    """Mirrors the entries returned by db.storage.<ns>.list()."""
+    name: str
+    size: Optional[int] = None
+
+
+def _safe_key_part(value: str) -> str:
+    """value with characters outside [a-zA-Z0-9._-] replaced, plus a hash suffix to keep it unique."""
+    digest = hashlib.sha1(value.encode("utf-8")).hexdigest()[:12]
+    return f"{re.sub(r'[^a-zA-Z0-9._-]', '_', value)}-{digest}"
+
+
+class SecondaryIndex:
+    """
+    Maps an attribute extracted from stored values (e.g. organization_id) to keys.
+
+    The index lives in storage so that every process sees the same entries: one
+    posting key per indexed value (`storage_index__<name>__<value>`) listing the keys
+    written with that value, plus a marker key once existing values have been indexed.
+    Writes add their key to its posting. Keys that were deleted or whose value changed
+    are filtered out, and dropped from the posting, when it is read.
+    """
+
+    def __init__(self, name: str, prefix: str, extract: Callable[[Any], Optional[str]]):
+        self.name = name
+        self.prefix = prefix
+        self.extract = extract
+        self.marker_key = STORAGE_INDEX_KEY_PREFIX + _safe_key_part(name)
+        self.built = False
+        self.build_lock = threading.Lock()
+
+    def indexed_value(self, value: Any) -> Optional[str]:
+        try:
+            indexed = self.extract(value) if isinstance(value, dict) else None
+        except Exception:
+            indexed = None
+        return None if indexed is None else str(indexed)
+
+    def posting_key(self, indexed: str) -> str:
+        return f"{self.marker_key}__{_safe_key_part(indexed)}"
+
+
+def _add_posting_keys(posting: Dict[str, Any], indexed: str, keys: Iterable[str]) -> Dict[str, Any]:
+    posting["value"] = indexed
+    posting["keys"] = sorted(set(posting.get("keys", [])) | set(keys))
+    return posting
+
+
+def _remove_posting_keys(posting: Dict[str, Any], keys: Set[str]) -> Dict[str, Any]:
+    posting["keys"] = [key for key in posting.get("keys", []) if key not in keys]
+    return posting
+
+
+class KeyCatalog:
+    """
+    Prefix listings for one storage namespace.
+
+    Backends whose list() takes a prefix (the local SQLite store) are asked directly,
+    so listings always include keys written by other processes. For backends that can
+    only list everything, a sorted in-memory copy of the full listing answers prefix
+    queries in O(log n + results). It is reloaded every refresh_seconds, and whenever
+    a prefix has no keys in it, and is kept current with writes made through the wrapper.
+    """
+
+    def __init__(self, backend: Any, refresh_seconds: float = STORAGE_CATALOG_REFRESH_SECONDS):
+        self._backend = backend
+        self.refresh_seconds = refresh_seconds
+        self._keys: List[str] = []
+        self._sizes: Dict[str, Optional[int]] = {}
+        self._loaded_at: Optional[float] = None
+        self._prefix_listing: Optional[bool] = None
+        self._lock = threading.RLock()
+
+    def _lists_by_prefix(self) -> bool:
+        if self._prefix_listing is None:
+            try:
+                self._prefix_listing = "prefix" in inspect.signature(self._backend.list).parameters
+            except (AttributeError, TypeError, ValueError):
+                self._prefix_listing = False
+        return self._prefix_listing
+
+    def _load(self):
+        try:
+            entries = self._backend.list()
+        except AttributeError:
+            # Backends without list() only know about keys written through the wrapper
+            entries = [StorageKeyEntry(name) for name in self._keys]
+        except Exception as e:
+            print(f"[WARN] Storage key listing failed, serving catalog as-is: {e}")
+            self._loaded_at = time.monotonic()
+            return
+        self._sizes = {entry.name: getattr(entry, "size", None) for entry in entries}
+        self._keys = sorted(self._sizes)
+        self._loaded_at = time.monotonic()
+
+    def add(self, key: str, size: Optional[int] = None):
+        with self._lock:
+            if key not in self._sizes:
+                insort(self._keys, key)
+            self._sizes[key] = size
+
+    def remove(self, key: str):
+        with self._lock:
+            if self._sizes.pop(key, _MISSING) is not _MISSING:
+                index = bisect_left(self._keys, key)
+                if index < len(self._keys) and self._keys[index] == key:
+                    del self._keys[index]
+
+    def list(self, prefix: str = "") -> List[StorageKeyEntry]:
+        if self._lists_by_prefix():
+            return [StorageKeyEntry(entry.name, getattr(entry, "size", None))
+                    for entry in self._backend.list(prefix=prefix)]
+        with self._lock:
+            stale = self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_seconds
+            if stale:
+                self._load()
+            results = self._scan(prefix)
+            if not results and not stale:
+                # Nothing cached under the prefix: another process may have written the first keys
+                self._load()
+                results = self._scan(prefix)
+            return results
+
+    def _scan(self, prefix: str) -> List[StorageKeyEntry]:
+        start = bisect_left(self._keys, prefix)
+        results = []
+        for key in self._keys[start:]:
+            if not key.startswith(prefix):
+                break
+            results.append(StorageKeyEntry(key, self._sizes.get(key)))
+        return results
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+# --- Instrumentation ---
+
+# Upper bounds (ms) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket containing the given fraction of observations."""
+        if not self.count:
+            return 0.0
+        threshold = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= threshold:
+                return float(bound)
+        return round(self.max_ms, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + ["le_inf"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class KeyTraffic:
+    """Operation and byte counts per key, bounded by dropping the least used keys."""
+
+    def __init__(self, max_keys: int = STORAGE_METRICS_MAX_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self.ops: Counter = Counter()
+        self.bytes: Counter = Counter()
+
+    def add(self, key: str, ops: int = 1, nbytes: int = 0):
+        self.ops[key] += ops
+        self.bytes[key] += nbytes
+        if len(self.ops) > self.max_keys:
+            for stale, _ in self.ops.most_common()[self.max_keys // 2:]:
+                del self.ops[stale]
+                self.bytes.pop(stale, None)
+
+    def merge(self, other: "KeyTraffic"):
+        for key, ops in other.ops.items():
+            self.add(key, ops, other.bytes[key])
+
+    def top(self, limit: int) -> List[Dict[str, Any]]:
+        return [{"key": key, "ops": ops, "bytes": self.bytes[key]} for key, ops in self.ops.most_common(limit)]
+
+
+# Stored sizes of the JSON values being written, {key: bytes}, taken from the codec
+_write_sizes: contextvars.ContextVar = contextvars.ContextVar("storage_write_sizes", default=None)
+
+
+def _read_size(value: Any) -> int:
+    """
+    Bytes read for a stored value. Compressed JSON is measured exactly from its payload;
+    plain JSON values are only measured on a sample of reads, scaled to an unbiased estimate.
+    """
+    if isinstance(value, dict) and _ENCODING_MARKER in value:
+        return len(value.get("data", ""))
+    if isinstance(value, (dict, list)):
+        if random.random() >= STORAGE_METRICS_READ_SIZE_SAMPLE_RATE:
+            return 0
+        return int(_json_size(value) / STORAGE_METRICS_READ_SIZE_SAMPLE_RATE)
+    return _payload_size(value)
+
+
+def _written_size(sizes: Dict[str, int], key: str, value: Any) -> int:
+    """Size noted by the codec when the value was encoded, falling back to measuring it."""
+    size = sizes.pop(key, None)
+    return size if size is not None else _payload_size(value)
+
+
+def _payload_size(value: Any) -> int:
+    """Bytes moved for a stored value (serialised size for JSON values)."""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if hasattr(value, "memory_usage"):
+        try:
+            return int(value.memory_usage(index=True).sum())
+        except Exception:
+            return 0
+    return _json_size(value)
+
+
+class RequestStorageMetrics:
+    """Storage traffic of a single request. Shared by all threads working for it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ops: Counter = Counter()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.seconds = 0.0
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.keys = KeyTraffic(max_keys=200)
+
+    def record(self, op: str, keys: List[str], bytes_read: int, bytes_written: int, seconds: float):
+        with self._lock:
+            self.ops[op] += 1
+            self.bytes_read += bytes_read
+            self.bytes_written += bytes_written
+            self.seconds += seconds
+            self.latency.setdefault(op, LatencyHistogram()).observe(seconds * 1000)
+            per_key = (bytes_read + bytes_written) // max(len(keys), 1)
+            for key in keys:
+                self.keys.add(key, 1, per_key)
+
+    def headers(self) -> Dict[str, str]:
+        with self._lock:
+            return {
+                "X-Storage-Ops": ",".join(f"{op}={count}" for op, count in sorted(self.ops.items())) or "none",
+                "X-Storage-Bytes-Read": str(self.bytes_read),
+                "X-Storage-Bytes-Written": str(self.bytes_written),
+                "X-Storage-Time-Ms": f"{self.seconds * 1000:.1f}",
+            }
+
+
+class EndpointStorageStats:
+    """Storage traffic aggregated over all requests to one endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        self.ops: Counter = Counter()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.max_ops_per_request = 0
+        self.storage_time = LatencyHistogram()  # storage time per request
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.keys = KeyTraffic(max_keys=500)
+
+    def add(self, metrics: RequestStorageMetrics):
+        self.requests += 1
+        self.ops.update(metrics.ops)
+        self.bytes_read += metrics.bytes_read
+        self.bytes_written += metrics.bytes_written
+        self.max_ops_per_request = max(self.max_ops_per_request, sum(metrics.ops.values()))
+        self.storage_time.observe(metrics.seconds * 1000)
+        for op, histogram in metrics.latency.items():
+            target = self.latency.setdefault(op, LatencyHistogram())
+            for i, count in enumerate(histogram.counts):
+                target.counts[i] += count
+            target.count += histogram.count
+            target.total_ms += histogram.total_ms
+            target.max_ms = max(target.max_ms, histogram.max_ms)
+        self.keys.merge(metrics.keys)
+
+    def to_dict(self, top: int) -> Dict[str, Any]:
+        total_ops = sum(self.ops.values())
+        return {
+            "requests": self.requests,
+            "ops": dict(self.ops),
+            "avg_ops_per_request": round(total_ops / self.requests, 2) if self.requests else 0.0,
+            "max_ops_per_request": self.max_ops_per_request,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "storage_time_per_request": self.storage_time.to_dict(),
+            "latency": {op: histogram.to_dict() for op, histogram in self.latency.items()},
+            "top_keys": self.keys.top(top),
+        }
+
+
+_current_request_metrics: contextvars.ContextVar = contextvars.ContextVar("storage_request_metrics", default=None)
+
+
+class StorageMetrics:
+    """
+    Process-wide storage instrumentation. Backend calls are recorded against the
+    request active in the current context (set by the HTTP middleware in main.py)
+    and, when the request ends, folded into per-endpoint totals. Calls made outside
+    any request (startup, background threads) are reported under "background".
+    """
+
+    BACKGROUND = "background"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.started_at = time.time()
+        self.endpoints: Dict[str, EndpointStorageStats] = {}
+        self.operations: Dict[str, LatencyHistogram] = {}
+        self.bytes: Counter = Counter()
+        self.keys = KeyTraffic()
+        self._background = RequestStorageMetrics()
+
+    def begin_request(self) -> Tuple[contextvars.Token, RequestStorageMetrics]:
+        metrics = RequestStorageMetrics()
+        return _current_request_metrics.set(metrics), metrics
+
+    def end_request(self, token: contextvars.Token, metrics: RequestStorageMetrics, endpoint: str):
+        _current_request_metrics.reset(token)
+        with self._lock, metrics._lock:
+            self.endpoints.setdefault(endpoint, EndpointStorageStats()).add(metrics)
+
+    def record(self, namespace: str, op: str, keys: List[str], bytes_read: int, bytes_written: int, seconds: float):
+        name = f"{namespace}.{op}"
+        qualified_keys = [f"{namespace}:{key}" for key in keys]
+        with self._lock:
+            self.operations.setdefault(name, LatencyHistogram()).observe(seconds * 1000)
+            self.bytes[f"{namespace}.read"] += bytes_read
+            self.bytes[f"{namespace}.written"] += bytes_written
+            per_key = (bytes_read + bytes_written) // max(len(keys), 1)
+            for key in qualified_keys:
+                self.keys.add(key, 1, per_key)
+        request_metrics = _current_request_metrics.get() or self._background
+        request_metrics.record(name, qualified_keys, bytes_read, bytes_written, seconds)
+
+    def snapshot(self, top: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            with self._background._lock:
+                background = EndpointStorageStats()
+                background.add(self._background)
+                background.requests = 0
+            return {
+                "since": self.started_at,
+                "endpoints": {name: stats.to_dict(top) for name, stats in sorted(self.endpoints.items())},
+                "background": background.to_dict(top),
+                "operations": {name: histogram.to_dict() for name, histogram in sorted(self.operations.items())},
+                "bytes": dict(self.bytes),
+                "top_keys": self.keys.top(top),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+
+storage_metrics = StorageMetrics()
+
+
+class InstrumentedNamespace:
+    """Wraps a backend namespace and records every call in `storage_metrics`."""
+
+    # method -> (operation, reads a value, writes a value)
+    _OPERATIONS = {
+        "get": ("get", True, False),
+        "get_with_version": ("get", True, False),
+        "get_many_with_versions": ("get_many", True, False),
+        "version": ("version", False, False),
+        "put": ("put", False, True),
+        "put_many": ("put_many", False, True),
+        "compare_and_swap": ("put", False, True),
+        "delete": ("delete", False, False),
+        "list": ("list", False, False),
+    }
+
+    def __init__(self, backend: Any, namespace: str, metrics: StorageMetrics):
+        self._backend = backend
+        self._namespace = namespace
+        self._metrics = metrics
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._backend, name)
+        if name not in self._OPERATIONS:
+            return attribute
+        op, reads, writes = self._OPERATIONS[name]
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = attribute(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started
+            keys, bytes_read, bytes_written = self._measure(name, args, kwargs, result, reads, writes)
+            self._metrics.record(self._namespace, op, keys, bytes_read, bytes_written, seconds)
+            return result
+        return call
+
+    @staticmethod
+    def _measure(name: str, args: tuple, kwargs: dict, result: Any, reads: bool, writes: bool):
+        first = args[0] if args else kwargs.get("key", kwargs.get("prefix", ""))
+        sizes = _write_sizes.get() or {}
+        if name == "get_many_with_versions":
+            return list(first), sum(_read_size(value) for value, _ in (result or {}).values()), 0
+        if name == "put_many":
+            return list(first), 0, sum(_written_size(sizes, key, value) for key, value in first.items())
+        if name == "list":
+            return [f"{first}*"], 0, 0
+        bytes_read = bytes_written = 0
+        if reads:
+            bytes_read = _read_size(result[0] if name == "get_with_version" else result)
+        if writes:
+            bytes_written = _written_size(sizes, first, args[1] if len(args) > 1 else kwargs.get("value"))
+        return [first], bytes_read, bytes_written
+
+
+def _instrument(backend: Any, namespace: str) -> Any:
+    if backend is None or not STORAGE_METRICS_ENABLED:
+        return backend
+    return InstrumentedNamespace(backend, namespace, storage_metrics)
+
+
+# --- Storage Wrappers ---
+
+# Fan-out pool for batch operations. Separate from the async executor so that a batch
+# issued from an executor thread can never wait on its own pool.
+_batch_pool = ThreadPoolExecutor(max_workers=STORAGE_BATCH_CONCURRENCY, thread_name_prefix="storage-batch")
+
+class CachedJsonStorage:
+    """Read-through cache in front of a db.storage.json compatible backend."""
+
+    def __init__(self, backend: Any, cache: JsonCache, verify_versions: bool = STORAGE_CACHE_VERIFY_VERSIONS):
+        self._backend = backend
+        self.cache = cache
+        self.verify_versions = verify_versions
+        self.catalog = KeyCatalog(backend)
+        self._indexes: Dict[str, SecondaryIndex] = {}
+        self._index_lock = threading.RLock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self.codec = JsonBlobCodec()
+
+    def _backend_version(self, key: str) -> Any:
+        version_fn: Optional[Callable[[str], Any]] = getattr(self._backend, "version", None)
+        if version_fn is None:
+            return None
+        try:
+            return version_fn(key)
+        except FileNotFoundError:
+            return None
+
+    def get(self, key: str, *, default: Any = None, fresh: bool = False) -> Any:
+        """
+        Same contract as db.storage.json.get: raises FileNotFoundError if missing and no default.
+        fresh=True skips the cache and reads the backend (refreshing the cached copy).
+        """
+        if not fresh:
+            value, cached_version = self.cache.lookup(key)
+            if value is not _MISSING:
+                if not self.verify_versions or self._backend_version(key) == cached_version:
+                    return _clone(value)
+                self.cache.invalidate(key)
+
+        epoch = self.cache.write_epoch
+        try:
+            value, version = self._read(key)
+        except FileNotFoundError:
+            if default is not None:
+                return _resolve_default(default)
+            raise
+        if value is None:
+            # Local mock backends return None instead of raising
+            return _resolve_default(default)
+
+        self.cache.store(key, value, version, epoch)
+        return _clone(value)
+
+    def _read(self, key: str) -> Tuple[Any, Any]:
+        """Decoded value and version of key, in one backend call where the backend allows it."""
+        get_with_version = getattr(self._backend, "get_with_version", None)
+        if get_with_version is not None:
+            value, version = get_with_version(key)
+        else:
+            # Versions are only needed to verify later hits; otherwise skip the extra round trip
+            version = self._backend_version(key) if self.verify_versions else None
+            value = self._backend.get(key)
+        return self._decode(value), version
+
+    def _encode(self, items: Mapping[str, Any]) -> Dict[str, Any]:
+        """Encodes values for the backend and notes their stored sizes for the storage metrics."""
+        encoded, sizes = {}, {}
+        for key, value in items.items():
+            encoded[key], size = self.codec.encode_sized(key, value)
+            if size is not None:
+                sizes[key] = size
+        _write_sizes.set(sizes)
+        return encoded
+
+    def put(self, key: str, value: Any):
+        try:
+            result = self._backend.put(key, self._encode({key: value})[key])
+        finally:
+            self.cache.invalidate(key)
+        self.catalog.add(key)
+        self._update_indexes({key: value})
+        self._train_pending_dictionaries()
+        return result
+
+    def get_many(self, keys: Iterable[str], *, default: Any = _MISSING, fresh: bool = False) -> Dict[str, Any]:
+        """
+        Fetches several keys in one round trip where the backend supports it (and in
+        parallel otherwise). Missing keys map to `default` if one is given and are left
+        out of the result otherwise. fresh=True skips the cache, as in get().
+        """
+        keys = list(dict.fromkeys(keys))
+        results: Dict[str, Any] = {}
+        misses = []
+        for key in keys:
+            value, cached_version = (_MISSING, None) if fresh else self.cache.lookup(key)
+            if value is not _MISSING and not self.verify_versions:
+                results[key] = _clone(value)
+            else:
+                misses.append(key)
+
+        if misses:
+            epoch = self.cache.write_epoch
+            for key, (value, version) in self._fetch_many(misses).items():
+                value = self._decode(value)
+                self.cache.store(key, value, version, epoch)
+                results[key] = _clone(value)
+
+        if default is not _MISSING:
+            for key in keys:
+                if key not in results:
+                    results[key] = _resolve_default(default)
+        return {key: results[key] for key in keys if key in results}
+
+    def _fetch_many(self, keys: List[str]) -> Dict[str, Tuple[Any, Any]]:
+        """Raw (value, version) pairs for the keys that exist in the backend."""
+        batch_get = getattr(self._backend, "get_many_with_versions", None)
+        if batch_get is not None:
+            return batch_get(keys)
+
+        def fetch(key: str) -> Any:
+            version = self._backend_version(key) if self.verify_versions else None
+            try:
+                value = self._backend.get(key)
+            except FileNotFoundError:
+                return _MISSING
+            return _MISSING if value is None else (value, version)
+
+        contexts = [contextvars.copy_context() for _ in keys]
+        fetched = _batch_pool.map(lambda context, key: context.run(fetch, key), contexts, keys)
+        return {key: pair for key, pair in zip(keys, fetched) if pair is not _MISSING}
+
+    def put_many(self, items: Mapping[str, Any]):
+        """
+        Stores several keys at once: a single transaction on backends with put_many,
+        parallel puts otherwise. Use update() instead for shared read-modify-write blobs.
+        """
+        encoded = self._encode(items)
+        try:
+            batch_put = getattr(self._backend, "put_many", None)
+            if batch_put is not None:
+                batch_put(encoded)
+            else:
+                contexts = [contextvars.copy_context() for _ in encoded]
+                list(_batch_pool.map(lambda context, item: context.run(self._backend.put, *item), contexts, encoded.items()))
+        finally:
+            for key in encoded:
+                self.cache.invalidate(key)
+        for key in items:
+            self.catalog.add(key)
+        self._update_indexes(items)
+        self._train_pending_dictionaries()
+
+    def delete(self, key: str):
+        try:
+            result = self._backend.delete(key)
+        finally:
+            self.cache.invalidate(key)
+        # Index postings drop the key the next time they are read
+        self.catalog.remove(key)
+        return result
+
+    def list(self, prefix: str = "") -> List[StorageKeyEntry]:
+        """Lists keys, optionally restricted to a prefix (see KeyCatalog)."""
+        return self.catalog.list(prefix)
+
+    # --- Versioned writes ---
+
+    @property
+    def supports_versions(self) -> bool:
+        return all(hasattr(self._backend, name) for name in ("get_with_version", "compare_and_swap"))
+
+    def get_with_version(self, key: str, *, default: Any = None) -> Tuple[Any, int]:
+        """
+        Reads key straight from the backend and returns (value, version), where the
+        version is 0 if the key does not exist. Pass the version to put_if_version.
+        """
+        if not self.supports_versions:
+            raise NotImplementedError("Storage backend does not support versioned reads")
+        try:
+            value, version = self._backend.get_with_version(key)
+        except FileNotFoundError:
+            if default is not None:
+                return _resolve_default(default), 0
+            raise
+        return self._decode(value), version
+
+    def put_if_version(self, key: str, value: Any, expected_version: int) -> Optional[int]:
+        """
+        Writes value only if key is still at expected_version (0 = must not exist yet).
+        Returns the new version, or None if another writer changed the key first.
+        """
+        if not self.supports_versions:
+            raise NotImplementedError("Storage backend does not support conditional writes")
+        try:
+            new_version = self._backend.compare_and_swap(key, self._encode({key: value})[key], expected_version)
+        finally:
+            self.cache.invalidate(key)
+        if new_version is None:
+            return None
+        self.catalog.add(key)
+        self._update_indexes({key: value})
+        return new_version
+
+    def update(self, key: str, mutate: Callable[[Any], Any], *, default: Any = None,
+               max_retries: int = STORAGE_CAS_MAX_RETRIES) -> Any:
+        """
+        Read-modify-write of a shared blob. `mutate` receives a private copy of the
+        current value (or `default` if the key is missing) and returns the new value;
+        returning None keeps the in-place modified copy. On a version conflict the
+        blob is re-read and `mutate` runs again, so it must not have side effects
+        outside the value. Returns the value that was written.
+
+        Backends without versions (the hosted db.storage) serialise writers with a
+        per-key lock in this process and a lease key shared with other processes.
+        """
+        if not self.supports_versions:
+            with self._key_lock(key), self.lock(key):
+                current = self.get(key, default=default, fresh=True)
+                new_value = mutate(current)
+                new_value = current if new_value is None else new_value
+                self.put(key, new_value)
+                return new_value
+
+        for attempt in range(max_retries):
+            current, version = self.get_with_version(key, default=default)
+            new_value = mutate(current)
+            new_value = current if new_value is None else new_value
+            if self.put_if_version(key, new_value, version) is not None:
+                return new_value
+            # Jittered exponential backoff so competing writers do not retry in lockstep
+            time.sleep(STORAGE_CAS_BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5))
+        raise StorageConflictError(f"Gave up updating '{key}' after {max_retries} conflicting writes")
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._index_lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def lock(self, name: str, *, lease_seconds: float = STORAGE_LOCK_LEASE_SECONDS,
+             timeout: float = STORAGE_LOCK_TIMEOUT_SECONDS) -> Iterator[None]:
+        """
+        Holds a lease on `name` that all processes sharing the backend respect. Raises
+        StorageConflictError if it cannot be taken within `timeout` seconds. The lease
+        lapses after `lease_seconds`, so the enclosed work must finish well within it.
+        """
+        lock_key = STORAGE_LOCK_KEY_PREFIX + _safe_key_part(name)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while not self._try_acquire(lock_key, token, lease_seconds):
+            if time.monotonic() >= deadline:
+                raise StorageConflictError(f"Timed out waiting for the lock on '{name}'")
+            time.sleep(min(STORAGE_CAS_BACKOFF_SECONDS * (2 ** attempt), 0.5) * random.uniform(0.5, 1.5))
+            attempt += 1
+        try:
+            yield
+        finally:
+            self._release(lock_key, token)
+
+    def _read_lease(self, lock_key: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        try:
+            if self.supports_versions:
+                return self._backend.get_with_version(lock_key)
+            return self._backend.get(lock_key), 0
+        except FileNotFoundError:
+            return None, 0
+
+    def _try_acquire(self, lock_key: str, token: str, lease_seconds: float) -> bool:
+        lease, version = self._read_lease(lock_key)
+        if isinstance(lease, dict) and lease.get("owner") != token and lease.get("expires_at", 0) > time.time():
+            return False
+        lease = {"owner": token, "expires_at": time.time() + lease_seconds}
+        if self.supports_versions:
+            return self._backend.compare_and_swap(lock_key, lease, version) is not None
+        self._backend.put(lock_key, lease)
+        # Last writer wins: a competitor that wrote after us has the lease
+        time.sleep(STORAGE_LOCK_SETTLE_SECONDS)
+        current, _ = self._read_lease(lock_key)
+        return isinstance(current, dict) and current.get("owner") == token
+
+    def _release(self, lock_key: str, token: str):
+        lease, _ = self._read_lease(lock_key)
+        if isinstance(lease, dict) and lease.get("owner") == token:
+            try:
+                self._backend.delete(lock_key)
+            except FileNotFoundError:
+                pass
+
+    # --- Compression ---
+
+    def _decode(self, value: Any) -> Any:
+        return self.codec.decode(value, loader=self._load_dictionary)
+
+    def enable_dictionary_compression(self, prefix: str, name: str):
+        """
+        Compresses small records under `prefix` with a zstd dictionary trained from
+        the first writes. Dictionaries are stored under `zstd_dictionary__<name>-<hash>`
+        and are never deleted, since older records keep referring to them.
+        """
+        self.codec.enable_dictionary(prefix, name)
+
+    def _load_dictionary(self, dictionary_id: str) -> bytes:
+        stored = self._backend.get(STORAGE_DICTIONARY_KEY_PREFIX + dictionary_id)
+        return base64.b64decode(stored["data"])
+
+    def _train_pending_dictionaries(self):
+        for prefix in self.codec.pending_training():
+            name = self.codec._dictionary_prefixes[prefix]
+            existing = self.catalog.list(f"{STORAGE_DICTIONARY_KEY_PREFIX}{name}-")
+            if existing:
+                # Another process trained one already; share it
+                dictionary_id = existing[0].name[len(STORAGE_DICTIONARY_KEY_PREFIX):]
+                self.codec.activate(prefix, dictionary_id, self._load_dictionary(dictionary_id))
+                continue
+            trained = self.codec.train(prefix)
+            if trained is None:
+                continue
+            dictionary_id, data = trained
+            key = STORAGE_DICTIONARY_KEY_PREFIX + dictionary_id
+            self._backend.put(key, {"data": base64.b64encode(data).decode("ascii")})
+            self.catalog.add(key)
+            print(f"Trained storage compression dictionary {dictionary_id} ({len(data)} bytes)")
+
+    # --- Secondary indexes ---
+
+    def register_index(self, name: str, prefix: str, extract: Callable[[Any], Optional[str]]):
+        """
+        Registers an index over values stored under `prefix`. `extract` receives a stored
+        value and returns the attribute to index by (or None to leave it unindexed).
+        Existing values are indexed on first query; later writes keep the index current,
+        so it must be registered in every module that writes under `prefix`.
+        """
+        with self._index_lock:
+            if name not in self._indexes:
+                self._indexes[name] = SecondaryIndex(name, prefix, extract)
+
+    def list_by_index(self, name: str, value: str) -> List[StorageKeyEntry]:
+        index = self._indexes[name]
+        self._ensure_index_built(index)
+        value = str(value)
+        posting_key = index.posting_key(value)
+        keys = self.get(posting_key, default=dict, fresh=True).get("keys", [])
+        # Read fresh, which also refreshes the cached copies callers go on to read
+        current = self.get_many(keys, fresh=True)
+        stale = {key for key in keys if index.indexed_value(current.get(key)) != value}
+        if stale:
+            self.update(posting_key, lambda posting: _remove_posting_keys(posting, stale), default=dict)
+        return [StorageKeyEntry(key) for key in keys if key not in stale]
+
+    def _ensure_index_built(self, index: SecondaryIndex):
+        if index.built:
+            return
+        with index.build_lock:
+            if index.built:
+                return
+            try:
+                self.get(index.marker_key, fresh=True)
+            except FileNotFoundError:
+                self._build_index(index)
+            index.built = True
+
+    def _build_index(self, index: SecondaryIndex):
+        """Indexes the values already stored under the index prefix (once, for all processes)."""
+        keys = [entry.name for entry in self.list(index.prefix)]
+        values = {}
+        for start in range(0, len(keys), 500):
+            values.update(self.get_many(keys[start:start + 500]))
+        self._update_indexes(values, only=index)
+        self.put(index.marker_key, {"index": index.name, "prefix": index.prefix, "built_at": time.time()})
+        print(f"Built storage index '{index.name}' over {len(values)} keys")
+
+    def _update_indexes(self, items: Mapping[str, Any], only: Optional[SecondaryIndex] = None):
+        """Adds written keys to the postings of their indexed values."""
+        with self._index_lock:
+            indexes = [only] if only is not None else list(self._indexes.values())
+        for index in indexes:
+            added: Dict[str, List[str]] = {}
+            for key, value in items.items():
+                if not key.startswith(index.prefix):
+                    continue
+                indexed = index.indexed_value(value)
+                if indexed is not None:
+                    added.setdefault(indexed, []).append(key)
+            for indexed, keys in added.items():
+                posting_key = index.posting_key(indexed)
+                if set(keys) <= set(self.get(posting_key, default=dict, fresh=True).get("keys", [])):
+                    continue
+                self.update(posting_key, lambda posting: _add_posting_keys(posting, indexed, keys), default=dict)
+
+
+# --- Sharded Collections ---
+
+_SAFE_RECORD_ID = re.compile(r'^[a-zA-Z0-9._-]+$')
+
+
+def _default_legacy_records(value: Any) -> Iterable[Dict[str, Any]]:
+    """Legacy blobs are either a list of records or a dict of id -> record."""
+    if isinstance(value, dict):
+        return value.values()
+    if isinstance(value, list):
+        return value
+    return []
+
+
+class ShardedCollection:
+    """
+    A collection stored as one JSON key per record under a common prefix.
+
+    Record keys are `<name>__<record id>`; listing comes from the key catalog and
+    `indexes` (field name -> extractor) are secondary indexes maintained on write,
+    so a single get/put/delete costs the same however large the collection is.
+    """
+
+    def __init__(
+        self,
+        json_storage: CachedJsonStorage,
+        name: str,
+        id_field: str = "id",
+        legacy_key: Optional[str] = None,
+        legacy_records: Callable[[Any], Iterable[Dict[str, Any]]] = _default_legacy_records,
+        indexes: Optional[Dict[str, Callable[[Dict[str, Any]], Optional[str]]]] = None,
+        compression_dictionary: bool = False,
+    ):
+        self._json = json_storage
+        self.name = name
+        self.id_field = id_field
+        self.prefix = f"{name}__"
+        self.legacy_key = legacy_key
+        self._legacy_records = legacy_records
+        self._index_names: Dict[str, str] = {}
+        for field, extract in (indexes or {}).items():
+            index_name = f"{name}:{field}"
+            self._json.register_index(index_name, self.prefix, extract)
+            self._index_names[field] = index_name
+        if compression_dictionary:
+            # Records are small and share most of their structure
+            self._json.enable_dictionary_compression(self.prefix, name)
+        self._migrated = legacy_key is None
+        self._migration_lock = threading.Lock()
+
+    def record_key(self, record_id: str) -> str:
+        record_id = str(record_id)
+        if _SAFE_RECORD_ID.match(record_id):
+            return self.prefix + record_id
+        # IDs with other characters are sanitised, with a hash suffix to keep them unique
+        digest = hashlib.sha1(record_id.encode("utf-8")).hexdigest()[:12]
+        return f"{self.prefix}{re.sub(r'[^a-zA-Z0-9._-]', '_', record_id)}-{digest}"
+
+    def get(self, record_id: str, default: Any = None) -> Optional[Dict[str, Any]]:
+        self._ensure_migrated()
+        try:
+            return self._json.get(self.record_key(record_id))
+        except FileNotFoundError:
+            return default
+
+    def put(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Creates or replaces a record. A missing id field is filled with a new UUID."""
+        self._ensure_migrated()
+        if not record.get(self.id_field):
+            record[self.id_field] = str(uuid.uuid4())
+        self._json.put(self.record_key(record[self.id_field]), record)
+        return record
+
+    def update(self, record_id: str, mutate: Callable[[Dict[str, Any]], Any]) -> Optional[Dict[str, Any]]:
+        """Versioned read-modify-write of one record. Returns None if the record does not exist."""
+        self._ensure_migrated()
+        try:
+            return self._json.update(self.record_key(record_id), mutate)
+        except FileNotFoundError:
+            return None
+
+    def delete(self, record_id: str) -> bool:
+        self._ensure_migrated()
+        key = self.record_key(record_id)
+        if self._json.get(key, default=_MISSING) is _MISSING:
+            return False
+        self._json.delete(key)
+        return True
+
+    def keys(self) -> List[str]:
+        self._ensure_migrated()
+        return [entry.name for entry in self._json.list(prefix=self.prefix)]
+
+    def all(self) -> List[Dict[str, Any]]:
+        """All records, in key order."""
+        return self._load(self.keys())
+
+    def find(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        """Records whose indexed `field` equals value."""
+        self._ensure_migrated()
+        entries = self._json.list_by_index(self._index_names[field], value)
+        return self._load(entry.name for entry in entries)
+
+    def count(self) -> int:
+        return len(self.keys())
+
+    def _load(self, keys: Iterable[str]) -> List[Dict[str, Any]]:
+        """The records under keys, in order, fetched in one batch; missing keys are skipped."""
+        keys = list(keys)
+        found = self._json.get_many(keys)
+        return [found[key] for key in keys if key in found]
+
+    # --- Migration from a single blob ---
+
+    def _ensure_migrated(self):
+        if self._migrated:
+            return
+        with self._migration_lock:
+            if not self._migrated:
+                self.migrate()
+
+    def migrate(self) -> int:
+        """
+        Splits the legacy single-blob value (if any) into per-record keys.
+        Records are written before the legacy blob is moved aside to
+        `<legacy_key>.premigration`, so an interrupted migration is simply repeated.
+        Returns the number of records written.
+        """
+        migrated = 0
+        if self.legacy_key and any(entry.name == self.legacy_key for entry in self._json.list(prefix=self.legacy_key)):
+            legacy_value = self._json.get(self.legacy_key, default=_MISSING)
+            if legacy_value is not _MISSING:
+                for record in self._legacy_records(legacy_value):
+                    if not isinstance(record, dict):
+                        continue
+                    if not record.get(self.id_field):
+                        record[self.id_field] = str(uuid.uuid4())
+                    self._json.put(self.record_key(record[self.id_field]), record)
+                    migrated += 1
+                self._json.put(f"{self.legacy_key}.premigration", legacy_value)
+                self._json.delete(self.legacy_key)
+                print(f"Migrated {migrated} records from '{self.legacy_key}' into collection '{self.name}'")
+        self._migrated = True
+        return migrated
+
+
+# --- Columnar Dataframes ---
+
+DataFrameFilters = List[Tuple[str, str, Any]]
+
+_FILTER_OPERATORS: Dict[str, Callable[[Any, Any], Any]] = {
+    "=": lambda column, value: column == value,
+    "==": lambda column, value: column == value,
+    "!=": lambda column, value: column != value,
+    "<": lambda column, value: column < value,
+    "<=": lambda column, value: column <= value,
+    ">": lambda column, value: column > value,
+    ">=": lambda column, value: column >= value,
+    "in": lambda column, value: column.isin(list(value)),
+    "not in": lambda column, value: ~column.isin(list(value)),
+}
+
+
+def _apply_dataframe_filters(df: Any, filters: Optional[DataFrameFilters]) -> Any:
+    """Applies (column, op, value) filters in pandas, for frames that were not read from Parquet."""
+    if not filters or df.empty:
+        return df
+    mask = None
+    for column, op, value in filters:
+        if column not in df.columns:
+            continue
+        condition = _FILTER_OPERATORS[op](df[column], value)
+        mask = condition if mask is None else mask & condition
+    return df if mask is None else df[mask].reset_index(drop=True)
+
+
+class ColumnarDataFrameStorage:
+    """
+    db.storage.dataframes compatible store that writes Parquet into the binary
+    namespace and reads it back through a memory-mapped local spool file.
+
+    `get` accepts `columns` (projection) and `filters` (a list of (column, op, value)
+    tuples, ANDed) which are pushed down to Parquet: row groups whose column
+    statistics cannot match are skipped without being decoded. Frames stored
+    before this layer existed are read from the legacy dataframes namespace.
+    """
+
+    def __init__(self, binary_backend: Any, legacy_backend: Any = None,
+                 spool_dir: str = STORAGE_PARQUET_SPOOL_DIR,
+                 row_group_size: int = STORAGE_PARQUET_ROW_GROUP_SIZE):
+        self._binary = binary_backend
+        self._legacy = legacy_backend
+        self.catalog = KeyCatalog(binary_backend)
+        self.spool_dir = spool_dir
+        self.row_group_size = row_group_size
+        self._spooled: Dict[str, Tuple[str, Any, float]] = {} # key -> (path, version, fetched_at)
+        self._lock = threading.Lock()
+
+    def _blob_key(self, key: str) -> str:
+        return STORAGE_PARQUET_KEY_PREFIX + key
+
+    def _spool_path(self, key: str) -> str:
+        return os.path.join(self.spool_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".parquet")
+
+    def _backend_version(self, blob_key: str) -> Any:
+        version_fn = getattr(self._binary, "version", None)
+        if version_fn is None:
+            return None
+        try:
+            return version_fn(blob_key)
+        except FileNotFoundError:
+            return None
+
+    def _write_spool(self, key: str, data: bytes, version: Any) -> str:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = self._spool_path(key)
+        # Write-then-rename so readers holding a memory map of the old file are unaffected
+        fd, tmp_path = tempfile.mkstemp(dir=self.spool_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._spooled[key] = (path, version, time.monotonic())
+        return path
+
+    def _local_copy(self, key: str) -> Optional[str]:
+        """Path of an up-to-date local Parquet file for key, or None if no Parquet blob exists."""
+        blob_key = self._blob_key(key)
+        with self._lock:
+            spooled = self._spooled.get(key)
+        if spooled is not None and os.path.exists(spooled[0]):
+            path, version, fetched_at = spooled
+            current = self._backend_version(blob_key)
+            if current is not None and current == version:
+                return path
+            if current is None and version is None and time.monotonic() - fetched_at < STORAGE_PARQUET_SPOOL_SECONDS:
+                return path
+
+        version = self._backend_version(blob_key)
+        try:
+            data = self._binary.get(blob_key)
+        except FileNotFoundError:
+            return None
+        if data is None:
+            return None
+        return self._write_spool(key, data, version)
+
+    def put(self, key: str, df: Any, *, sort_by: Optional[List[str]] = None):
+        """
+        Stores df as Parquet. Sorting by the columns usually filtered on (dates, entity ids)
+        keeps row-group statistics tight so filters can skip most of the file.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if sort_by:
+            df = df.sort_values(by=sort_by)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=None)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, ValueError) as e:
+            # Columns Arrow cannot type (e.g. mixed objects) fall back to the legacy format
+            if self._legacy is None:
+                raise
+            print(f"[WARN] Storing dataframe '{key}' in legacy format, not Parquet-compatible: {e}")
+            return self._legacy.put(key, df)
+
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer, row_group_size=self.row_group_size, write_statistics=True, compression="zstd")
+        data = buffer.getvalue()
+        blob_key = self._blob_key(key)
+        self._binary.put(blob_key, data)
+        self.catalog.add(blob_key, len(data))
+        self._write_spool(key, data, self._backend_version(blob_key))
+
+    def get(self, key: str, *, columns: Optional[List[str]] = None,
+            filters: Optional[DataFrameFilters] = None, default: Any = None) -> Any:
+        """
+        Returns the stored frame (an empty DataFrame if missing, like db.storage.dataframes),
+        limited to `columns` and to rows matching `filters`.
+        """
+        import pandas as pd
+
+        path = self._local_copy(key)
+        if path is not None:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # Not closed explicitly: the decoded table may still reference the mapped pages
+            source = pa.memory_map(path, "r")
+            schema_names = set(pq.read_schema(source).names)
+            if columns is not None:
+                columns = [column for column in columns if column in schema_names]
+            pushdown = [f for f in filters or [] if f[0] in schema_names] or None
+            source.seek(0)
+            table = pq.read_table(source, columns=columns, filters=pushdown, use_pandas_metadata=True)
+            return table.to_pandas()
+
+        if self._legacy is not None:
+            try:
+                df = self._legacy.get(key)
+            except FileNotFoundError:
+                df = None
+            if df is not None and not df.empty:
+                df = _apply_dataframe_filters(df, filters)
+                if columns is not None:
+                    df = df[[column for column in columns if column in df.columns]]
+                return df
+
+        resolved = _resolve_default(default)
+        return resolved if resolved is not None else pd.DataFrame()
+
+    def describe(self, key: str) -> Optional[Dict[str, Any]]:
+        """Row count, columns and per-column min/max from the Parquet footer, without reading data."""
+        path = self._local_copy(key)
+        if path is None:
+            return None
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with pa.memory_map(path, "r") as source:
+            metadata = pq.ParquetFile(source).metadata
+            stats: Dict[str, Dict[str, Any]] = {}
+            for rg in range(metadata.num_row_groups):
+                row_group = metadata.row_group(rg)
+                for c in range(row_group.num_columns):
+                    column = row_group.column(c)
+                    column_stats = column.statistics
+                    if column_stats is None or not column_stats.has_min_max:
+                        continue
+                    entry = stats.setdefault(column.path_in_schema, {"min": column_stats.min, "max": column_stats.max})
+                    entry["min"] = min(entry["min"], column_stats.min)
+                    entry["max"] = max(entry["max"], column_stats.max)
+            return {
+                "rows": metadata.num_rows,
+                "row_groups": metadata.num_row_groups,
+                "columns": metadata.schema.names,
+                "column_stats": stats,
+            }
+
+    def delete(self, key: str):
+        blob_key = self._blob_key(key)
+        with self._lock:
+            spooled = self._spooled.pop(key, None)
+        if spooled is not None:
+            try:
+                os.remove(spooled[0])
+            except OSError:
+                pass
+        try:
+            self._binary.delete(blob_key)
+        except FileNotFoundError:
+            pass
+        self.catalog.remove(blob_key)
+        if self._legacy is not None:
+            try:
+                self._legacy.delete(key)
+            except Exception:
+                pass
+
+    def list(self, prefix: str = "") -> List[StorageKeyEntry]:
+        stripped = len(STORAGE_PARQUET_KEY_PREFIX)
+        return [StorageKeyEntry(entry.name[stripped:], entry.size)
+                for entry in self.catalog.list(self._blob_key(prefix))]
+
+
+class Storage:
+    """Drop-in replacement for db.storage with the same json/dataframes/binary/text namespaces."""
+
+    def __init__(self, backend: Any = None):
+        backend = backend if backend is not None else db.storage
+        self.json = CachedJsonStorage(_instrument(backend.json, "json"), JsonCache())
+        self.binary = _instrument(getattr(backend, "binary", None), "binary")
+        self.dataframes = ColumnarDataFrameStorage(
+            self.binary, _instrument(getattr(backend, "dataframes", None), "dataframes")
+        )
+        # Not cached: passed through unchanged
+        self.text = _instrument(getattr(backend, "text", None), "text")
+        self._collections: Dict[str, ShardedCollection] = {}
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {"json": self.json.cache.stats(), "compression": self.json.codec.stats()}
+
+    def collection(self, name: str, **kwargs) -> ShardedCollection:
+        """Returns the sharded collection `name`, registering it on first use."""
+        if name not in self._collections:
+            self._collections[name] = ShardedCollection(self.json, name, **kwargs)
+        return self._collections[name]
+
+    def migrate_collections(self) -> Dict[str, int]:
+        """Migrates every registered collection from its legacy blob. Returns records moved per collection."""
+        results = {}
+        for name, collection in self._collections.items():
+            with collection._migration_lock:
+                results[name] = collection.migrate()
+        return results
+
+
+storage = Storage()
+
+
+# --- Async Access ---
+
+class StorageExecutor:
+    """Bounded thread pool for blocking storage calls, with queueing and latency metrics."""
+
+    def __init__(self, max_workers: int = STORAGE_EXECUTOR_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage-io")
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.max_running = 0
+        self.max_queued = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self.slowest_seconds = 0.0
+
+    def _instrumented(self, fn: Callable[..., Any], args: tuple, kwargs: dict) -> Callable[[], Any]:
+        submitted_at = time.monotonic()
+        with self._lock:
+            self.submitted += 1
+            self.max_queued = max(self.max_queued, self.submitted - self.completed - self.failed - self.running)
+
+        def call():
+            started_at = time.monotonic()
+            with self._lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+                self.total_wait_seconds += started_at - submitted_at
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                elapsed = time.monotonic() - started_at
+                with self._lock:
+                    self.running -= 1
+                    self.total_run_seconds += elapsed
+                    self.slowest_seconds = max(self.slowest_seconds, elapsed)
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+        return call
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs fn(*args, **kwargs) on the storage pool and awaits the result."""
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context over so storage metrics are attributed to its request
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, self._instrumented(fn, args, kwargs))
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Schedules fn in the background from synchronous code."""
+        context = contextvars.copy_context()
+        return self._executor.submit(context.run, self._instrumented(fn, args, kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "running": self.running,
+                "queued": self.submitted - finished - self.running,
+                "max_running": self.max_running,
+                "max_queued": self.max_queued,
+                "avg_wait_ms": round(1000 * self.total_wait_seconds / finished, 3) if finished else 0.0,
+                "avg_run_ms": round(1000 * self.total_run_seconds / finished, 3) if finished else 0.0,
+                "slowest_ms": round(1000 * self.slowest_seconds, 3),
+            }
+
+
+class AsyncNamespace:
+    """Awaitable versions of a storage namespace's methods, executed on the storage pool."""
+
+    def __init__(self, executor: StorageExecutor, namespace: Any):
+        self._executor = executor
+        self._namespace = namespace
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        method = getattr(self._namespace, name)
+        if not callable(method):
+            return method
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await self._executor.run(method, *args, **kwargs)
+        return call
+
+    async def get_many(self, keys: Iterable[str], *, default: Any = _MISSING) -> Dict[str, Any]:
+        """
+        Fetches keys concurrently. Missing keys map to `default` if one is given and are
+        left out of the result otherwise.
+        """
+        batch_get = getattr(self._namespace, "get_many", None)
+        if batch_get is not None:
+            return await self._executor.run(batch_get, keys, default=default)
+
+        keys = list(dict.fromkeys(keys))
+
+        def fetch(key: str) -> Any:
+            try:
+                return self._namespace.get(key)
+            except FileNotFoundError:
+                return _MISSING
+
+        values = await asyncio.gather(*(self._executor.run(fetch, key) for key in keys))
+        results = {}
+        for key, value in zip(keys, values):
+            if value is _MISSING:
+                if default is _MISSING:
+                    continue
+                value = _resolve_default(default)
+            results[key] = value
+        return results
+
+
+class AsyncStorage:
+    """Async facade over `storage`: `await async_storage.json.get(...)`."""
+
+    def __init__(self, sync_storage: Storage, executor: Optional[StorageExecutor] = None):
+        self.executor = executor or StorageExecutor()
+        self.json = AsyncNamespace(self.executor, sync_storage.json)
+        self.dataframes = AsyncNamespace(self.executor, sync_storage.dataframes)
+        self.binary = AsyncNamespace(self.executor, sync_storage.binary)
+        self.text = AsyncNamespace(self.executor, sync_storage.text)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs any blocking storage helper (collections, module helpers) on the storage pool."""
+        return await self.executor.run(fn, *args, **kwargs)
+
+
+async_storage = AsyncStorage(storage)
+
+
+# --- API Endpoints ---
+
+class StorageCacheStatsResponse(BaseModel):
+    json_cache: Dict[str, Any]
+    compression: Dict[str, Any]
+    executor: Dict[str, Any]
+
+
+@router.get("/cache-stats", response_model=StorageCacheStatsResponse)
+def get_storage_cache_stats():
+    """Returns hit/miss counts and size of the in-process storage cache."""
+    stats = storage.cache_stats()
+    return StorageCacheStatsResponse(
+        json_cache=stats["json"], compression=stats["compression"], executor=async_storage.executor.stats()
+    )
+
+
+class StorageMetricsResponse(BaseModel):
+    since: float
+    endpoints: Dict[str, Any]
+    background: Dict[str, Any]
+    operations: Dict[str, Any]
+    bytes: Dict[str, int]
+    top_keys: List[Dict[str, Any]]
+
+
+@router.get("/metrics", response_model=StorageMetricsResponse, dependencies=[Depends(require_ops_admin)])
+def get_storage_metrics(top: int = 20):
+    """
+    Storage traffic per endpoint (operation counts, bytes, latency histograms and the
+    busiest keys) plus process-wide latency per operation, since start or the last reset.
+    Key names include organization and user ids, so this needs the ops:admin permission.
+    """
+    return StorageMetricsResponse(**storage_metrics.snapshot(top=top))
+
+
+@router.post("/metrics/reset", dependencies=[Depends(require_ops_admin)])
+def reset_storage_metrics():
+    """Clears the collected storage metrics (needs the ops:admin permission)."""
+    storage_metrics.reset()
+    return {"status": "reset"}
+
+
+class CollectionMigrationResponse(BaseModel):
+    migrated_records: Dict[str, int]
+    record_counts: Dict[str, int]
+
+
+@router.post("/collections/migrate", response_model=CollectionMigrationResponse,
+             dependencies=[Depends(require_ops_admin)])
+def migrate_storage_collections():
+    """
+    Splits legacy single-blob collections into per-record keys. Safe to run repeatedly.
+    Rewrites every organization's records, so it needs the ops:admin permission.
+    """
+    migrated = storage.migrate_collections()
+    counts = {name: collection.count() for name, collection in storage._collections.items()}
+    return CollectionMigrationResponse(migrated_records=migrated, record_counts=counts)
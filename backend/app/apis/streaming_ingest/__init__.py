@@ -0,0 +1,291 @@
+"""
+Bounded-memory helpers for ingesting large uploads.
+
+Starlette spools multipart uploads larger than 1 MB to a temporary file on disk,
+so UploadFile.file is already a seekable file that never has to be read whole.
+The helpers here work on that file object block by block or chunk by chunk:
+
+- store_upload / iter_stored_upload / open_stored_upload: the raw file kept in
+  binary storage as fixed-size parts, written and read back one part at a time
+- hash_upload: the file's sha256, to recognise a re-upload before storing it
+- detect_csv_encoding / iter_csv_chunks / profile_csv: CSV parsed in row chunks
+- iter_excel_sheets: worksheets read with openpyxl in read-only mode, as row chunks
+
+Memory use depends on the block, part and chunk sizes below, not on the file size.
+"""
+
+import codecs
+import hashlib
+import io
+import os
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+from fastapi import APIRouter
+
+from app.apis.storage_utils import storage
+
+# Create an empty router to indicate this is not an API
+router = APIRouter()
+
+# --- Configuration ---
+
+# Bytes read from the upload per call
+INGEST_READ_BLOCK_BYTES = int(os.environ.get("INGEST_READ_BLOCK_BYTES", str(1024 * 1024)))
+# Raw uploads are stored as binary parts of at most this size
+INGEST_PART_BYTES = int(os.environ.get("INGEST_PART_BYTES", str(8 * 1024 * 1024)))
+# Rows per chunk for CSV and Excel parsing
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", "50000"))
+
+
+def _rewind(fileobj: BinaryIO):
+    # Stored uploads opened with open_stored_upload are forward-only
+    if fileobj.seekable():
+        fileobj.seek(0)
+
+
+def _iter_blocks(fileobj: BinaryIO, block_size: int = INGEST_READ_BLOCK_BYTES) -> Iterator[bytes]:
+    _rewind(fileobj)
+    while True:
+        block = fileobj.read(block_size)
+        if not block:
+            break
+        yield block
+
+
+# --- Raw File Storage ---
+
+def hash_upload(fileobj: BinaryIO) -> str:
+    """sha256 of the upload, read block by block (the digest store_upload records)."""
+    digest = hashlib.sha256()
+    for block in _iter_blocks(fileobj):
+        digest.update(block)
+    _rewind(fileobj)
+    return digest.hexdigest()
+
+
+def _part_key(key: str, index: int) -> str:
+    return f"{key}.part{index:05d}"
+
+
+def store_upload(key: str, fileobj: BinaryIO, part_size: int = INGEST_PART_BYTES) -> Dict[str, Any]:
+    """
+    Copies the upload into binary storage without reading it whole. A file that fits in
+    one part is stored at `key` itself; larger files are split into `key.partNNNNN`.
+    Returns the descriptor needed by iter_stored_upload (keys, size and sha256).
+    """
+    digest = hashlib.sha256()
+    part_keys: List[str] = []
+    size = 0
+    buffer = bytearray()
+    pending: Optional[bytes] = None
+
+    for block in _iter_blocks(fileobj):
+        digest.update(block)
+        size += len(block)
+        buffer.extend(block)
+        while len(buffer) >= part_size:
+            # Hold one finished part back: it is stored under `key` if nothing follows it
+            if pending is not None:
+                part_keys.append(_part_key(key, len(part_keys)))
+                storage.binary.put(part_keys[-1], pending)
+            pending = bytes(buffer[:part_size])
+            del buffer[:part_size]
+
+    tail = [pending] if pending is not None else []
+    if buffer or pending is None:
+        tail.append(bytes(buffer))
+    if not part_keys and len(tail) == 1:
+        part_keys.append(key)
+        storage.binary.put(key, tail[0])
+    else:
+        for data in tail:
+            part_keys.append(_part_key(key, len(part_keys)))
+            storage.binary.put(part_keys[-1], data)
+    _rewind(fileobj)
+    return {"key": key, "parts": part_keys, "size": size, "sha256": digest.hexdigest()}
+
+
+def iter_stored_upload(descriptor: Dict[str, Any]) -> Iterator[bytes]:
+    """Yields a file stored by store_upload, one part at a time."""
+    for part_key in descriptor.get("parts") or [descriptor["key"]]:
+        yield storage.binary.get(part_key)
+
+
+class StoredUploadReader(io.RawIOBase):
+    """Read-only file object over a stored upload that fetches one part at a time."""
+
+    def __init__(self, descriptor: Dict[str, Any]):
+        self._parts = iter_stored_upload(descriptor)
+        self._current = b""
+        self._offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        while self._offset >= len(self._current):
+            next_part = next(self._parts, None)
+            if next_part is None:
+                return 0
+            self._current, self._offset = next_part, 0
+        size = min(len(buffer), len(self._current) - self._offset)
+        buffer[:size] = self._current[self._offset:self._offset + size]
+        self._offset += size
+        return size
+
+
+def open_stored_upload(descriptor: Dict[str, Any]) -> BinaryIO:
+    """Buffered, forward-only file object for a file stored by store_upload."""
+    return io.BufferedReader(StoredUploadReader(descriptor), buffer_size=INGEST_READ_BLOCK_BYTES)
+
+
+def delete_stored_upload(descriptor: Dict[str, Any]):
+    for part_key in descriptor.get("parts") or [descriptor["key"]]:
+        try:
+            storage.binary.delete(part_key)
+        except FileNotFoundError:
+            pass
+
+
+# --- CSV ---
+
+def detect_csv_encoding(fileobj: BinaryIO) -> str:
+    """
+    'utf-8' if the whole file decodes as UTF-8, otherwise 'latin1' (which accepts any
+    byte sequence). The check is incremental, so only one block is held at a time.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for block in _iter_blocks(fileobj):
+            decoder.decode(block)
+        decoder.decode(b"", final=True)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin1"
+    finally:
+        _rewind(fileobj)
+
+
+def iter_csv_chunks(fileobj: BinaryIO, chunk_rows: int = INGEST_CHUNK_ROWS,
+                    encoding: Optional[str] = None, **read_csv_kwargs: Any) -> Iterator[pd.DataFrame]:
+    """
+    Parses the CSV in frames of at most chunk_rows rows, each indexed by its row
+    position in the file. Raises pandas.errors.EmptyDataError for an empty file.
+    Forward-only files must be given their encoding, since detecting it reads the file.
+    """
+    if encoding is None:
+        encoding = detect_csv_encoding(fileobj)
+    _rewind(fileobj)
+    with pd.read_csv(fileobj, chunksize=chunk_rows, encoding=encoding, **read_csv_kwargs) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def profile_csv(fileobj: BinaryIO, preview_rows: int = 5,
+                chunk_rows: int = INGEST_CHUNK_ROWS) -> Tuple[List[str], List[Dict[str, Any]], int, str]:
+    """
+    Columns, the first preview_rows rows (NaN as ''), the row count and the detected
+    encoding, in one chunked pass.
+    """
+    columns: List[str] = []
+    preview: List[Dict[str, Any]] = []
+    row_count = 0
+    encoding = detect_csv_encoding(fileobj)
+    for chunk in iter_csv_chunks(fileobj, chunk_rows, encoding):
+        if row_count == 0:
+            columns = chunk.columns.tolist()
+            preview = chunk.head(preview_rows).fillna('').to_dict('records')
+        row_count += len(chunk)
+    return columns, preview, row_count, encoding
+
+
+# --- Excel ---
+
+def _excel_cell(cell: Any) -> Any:
+    """Cell value as pandas.read_excel sees it: '' for empty, NaN for errors, ints for whole numbers."""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return float("nan")
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+def _excel_row(cells: Tuple[Any, ...]) -> List[Any]:
+    row = [_excel_cell(cell) for cell in cells]
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+def _excel_frame(header: List[Any], rows: List[List[Any]], start: int) -> pd.DataFrame:
+    """Parses header + rows exactly like pandas.read_excel (column naming, NA values, dtypes)."""
+    from pandas.io.parsers import TextParser
+
+    if not header and not rows:
+        return pd.DataFrame()
+    frame = TextParser([header] + rows, header=0, skip_blank_lines=False).read()
+    frame.index = range(start, start + len(frame))
+    return frame
+
+
+def _iter_sheet_chunks(worksheet: Any, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    worksheet.reset_dimensions()
+    rows = iter(worksheet.rows)
+    header = _excel_row(next(rows, ()))
+    width = len(header)
+
+    buffer: List[List[Any]] = []
+    blank_rows = 0
+    start = 0
+    yielded = False
+    for cells in rows:
+        row = _excel_row(cells)
+        if not row:
+            # Blank rows are kept only if data follows them (trailing ones are dropped)
+            blank_rows += 1
+            continue
+        buffer.extend([""] * width for _ in range(blank_rows))
+        blank_rows = 0
+        # Cells beyond the header row are ignored, so every chunk has the same columns
+        buffer.append(row[:width] + [""] * (width - len(row)))
+        if len(buffer) >= chunk_rows:
+            yield _excel_frame(header, buffer, start)
+            start += len(buffer)
+            buffer = []
+            yielded = True
+    if buffer or not yielded:
+        yield _excel_frame(header, buffer, start)
+
+
+def iter_excel_sheets(fileobj: BinaryIO, chunk_rows: int = INGEST_CHUNK_ROWS) -> Iterator[Tuple[str, Iterator[pd.DataFrame]]]:
+    """
+    Yields (sheet_name, chunks) per worksheet. Each sheet yields at least one frame,
+    so the first frame always carries the sheet's columns. .xlsx files are streamed
+    with openpyxl read-only mode; legacy .xls files have no streaming reader and are
+    read one sheet at a time with pandas.
+    """
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    fileobj.seek(0)
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile):
+        fileobj.seek(0)
+        excel_file = pd.ExcelFile(fileobj)
+        for sheet in excel_file.sheet_names:
+            yield sheet, iter([pd.read_excel(excel_file, sheet_name=sheet)])
+        return
+
+    try:
+        for sheet in workbook.sheetnames:
+            yield sheet, _iter_sheet_chunks(workbook[sheet], chunk_rows)
+    finally:
+        workbook.close()
@@ -5,13 +5,14 @@ from typing import Optional, List, Dict, Any
 import stripe
 import json
 import databutton as db
+from app.apis.storage_utils import storage
 import uuid
 from enum import Enum
 from app.auth import AuthorizedUser
 
 router = APIRouter(prefix="/subscriptions")
 
-from app.apis.utils import log_audit_event # Import audit logging function
+from app.apis.utils import log_audit_event_async # Import audit logging function
 try:
     stripe.api_key = db.secrets.get("STRIPE_SECRET_KEY")
     STRIPE_PUBLISHABLE_KEY = db.secrets.get("STRIPE_PUBLISHABLE_KEY")
@@ -189,7 +190,7 @@ async def create_checkout_session(request: CreateCheckoutSessionRequest, user: A
             
             # Save subscription details
             storage_key = get_subscription_storage_key(request.organization_id)
-            db.storage.json.put(storage_key, subscription.dict())
+            storage.json.put(storage_key, subscription.dict())
             
             return {"redirect_url": request.success_url or f"{APP_DOMAIN}/dashboard"}
             
@@ -240,7 +241,7 @@ async def get_organization_subscription(organization_id: str, user: AuthorizedUs
         storage_key = get_subscription_storage_key(organization_id)
         
         try:
-            subscription_data = db.storage.json.get(storage_key)
+            subscription_data = storage.json.get(storage_key)
             if subscription_data:
                 return SubscriptionDetails(**subscription_data)
             return None
@@ -260,7 +261,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
     
     # Log receiving the request *before* body parsing/verification
     try:
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier="stripe_webhook", # Generic identifier for webhook source
             action_type="STRIPE_WEBHOOK_RECEIVED",
             status="INFO",
@@ -287,7 +288,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
     except ValueError as e:
         # Invalid payload
         print(f"Stripe webhook error: Invalid payload. {e}")
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier="stripe_webhook",
             action_type="STRIPE_WEBHOOK_VERIFY",
             status="FAILURE",
@@ -301,7 +302,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
     except stripe.error.SignatureVerificationError as e:
         # Invalid signature
         print(f"Stripe webhook error: Invalid signature. {e}")
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier="stripe_webhook",
             action_type="STRIPE_WEBHOOK_VERIFY",
             status="FAILURE",
@@ -315,7 +316,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
     except Exception as e:
         # Catch other potential errors during construction/verification
         print(f"Stripe webhook error: Unexpected error during event construction. {e}")
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier="stripe_webhook",
             action_type="STRIPE_WEBHOOK_VERIFY",
             status="FAILURE",
@@ -328,7 +329,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
         raise HTTPException(status_code=500, detail=f"Error processing webhook event: {e}")
         
     # Signature verified, log the event type
-    log_audit_event(
+    await log_audit_event_async(
         user_identifier="stripe_webhook",
         action_type="STRIPE_WEBHOOK_PROCESS",
         status="INFO",
@@ -344,7 +345,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
         if event_type.startswith('customer.subscription.'):
             await handle_subscription_event(event)
             
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier="stripe_webhook", 
                 action_type="STRIPE_SUBSCRIPTION_EVENT",
                 status="SUCCESS",
@@ -359,7 +360,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
         elif event_type == 'checkout.session.completed':
             await handle_checkout_completed(event)
             
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier="stripe_webhook", 
                 action_type="STRIPE_CHECKOUT_COMPLETE",
                 status="SUCCESS",
@@ -374,7 +375,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
         else:
             print(f"Unhandled Stripe event type: {event_type}")
             # Optionally log unhandled events
-            log_audit_event(
+            await log_audit_event_async(
                 user_identifier="stripe_webhook",
                 action_type="STRIPE_WEBHOOK_UNHANDLED",
                 status="WARNING",
@@ -390,7 +391,7 @@ async def stripe_webhook(request: Request, stripe_signature: str = Header(None))
         # Catch errors during event handling logic
         error_message = f"Error handling Stripe event {event_type} ({event_id}): {e}"
         print(f"Error handling webhook: {e}")
-        log_audit_event(
+        await log_audit_event_async(
             user_identifier="stripe_webhook",
             action_type="STRIPE_WEBHOOK_PROCESS",
             status="FAILURE",
@@ -443,7 +444,7 @@ async def handle_subscription_event(event):
     
     # Save subscription record
     storage_key = get_subscription_storage_key(organization_id)
-    db.storage.json.put(storage_key, subscription_record.dict())
+    storage.json.put(storage_key, subscription_record.dict())
     print(f"Updated subscription for organization {organization_id}")
 
 
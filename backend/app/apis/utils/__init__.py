@@ -1,7 +1,8 @@
 # src/app/apis/utils/__init__.py
 
-import databutton as db
+from app.apis.storage_utils import async_storage, storage
 import datetime
+import uuid
 import pytz
 from typing import Optional, Dict, Any
 from fastapi import APIRouter, Request # Import Request to potentially get IP
@@ -13,6 +14,39 @@ router = APIRouter()
 AUDIT_LOG_KEY = "audit_log.json"
 DEFAULT_TIMEZONE = pytz.utc # Use UTC for consistency
 
+# One storage key per audit event. Event ids start with the UTC timestamp, so keys
+# sort chronologically. The former single audit_log.json list is split into records on first use.
+audit_events = storage.collection(
+    "audit_events",
+    id_field="event_id",
+    legacy_key=AUDIT_LOG_KEY,
+    compression_dictionary=True,
+)
+
+def _audit_entry(
+    user_identifier: str,
+    action_type: str,
+    status: str,
+    request: Optional[Request],
+    target_object_type: Optional[str],
+    target_object_id: Optional[str],
+    details: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    now = datetime.datetime.now(DEFAULT_TIMEZONE)
+    ip_address = request.client.host if request and request.client else None
+    return {
+        "event_id": f"{now.strftime('%Y%m%dT%H%M%S%fZ')}-{uuid.uuid4().hex[:8]}",
+        "timestamp": now.isoformat(),
+        "user_identifier": user_identifier,
+        "action_type": action_type,
+        "status": status,
+        "ip_address": ip_address,
+        "target_object_type": target_object_type,
+        "target_object_id": target_object_id,
+        "details": details or {},
+    }
+
+
 def log_audit_event(
     user_identifier: str, # Can be user ID or email
     action_type: str,
@@ -24,6 +58,11 @@ def log_audit_event(
 ):
     """Logs an audit event to db.storage.json.
 
+    Each event is written synchronously to its own key in the audit_events collection,
+    so it is stored once this returns and logging never rewrites earlier events. This
+    blocks on storage: call it from sync handlers, threadpool and job code, and use
+    log_audit_event_async from async handlers.
+
     Args:
         user_identifier: The ID or email of the user performing the action.
         action_type: A string code representing the action (e.g., 'USER_LOGIN', 'REPORT_DELETE').
@@ -34,36 +73,28 @@ def log_audit_event(
         details: A dictionary containing additional context or parameters related to the event.
     """
     try:
-        timestamp = datetime.datetime.now(DEFAULT_TIMEZONE).isoformat()
-        ip_address = request.client.host if request and request.client else None
-
-        log_entry = {
-            "timestamp": timestamp,
-            "user_identifier": user_identifier,
-            "action_type": action_type,
-            "status": status,
-            "ip_address": ip_address,
-            "target_object_type": target_object_type,
-            "target_object_id": target_object_id,
-            "details": details or {},
-        }
-
-        # Fetch existing logs safely
-        try:
-            audit_logs = db.storage.json.get(AUDIT_LOG_KEY, default=[])
-            if not isinstance(audit_logs, list):
-                print(f"[WARN] Audit log at '{AUDIT_LOG_KEY}' was not a list. Reinitializing.")
-                audit_logs = []
-        except Exception as e:
-             print(f"[ERROR] Failed to get audit log '{AUDIT_LOG_KEY}': {e}. Reinitializing.")
-             audit_logs = [] # Avoid appending to corrupt data
+        audit_events.put(_audit_entry(user_identifier, action_type, status, request,
+                                      target_object_type, target_object_id, details))
+        print(f"[AUDIT] Logged action: {action_type} by {user_identifier} - Status: {status}")
 
-        # Append new log
-        audit_logs.append(log_entry)
+    except Exception as e:
+        # Avoid crashing the main operation due to logging failure
+        print(f"[ERROR] Failed to log audit event: {e}")
 
-        # Save updated logs
-        db.storage.json.put(AUDIT_LOG_KEY, audit_logs)
 
+async def log_audit_event_async(
+    user_identifier: str,
+    action_type: str,
+    status: str,
+    request: Optional[Request] = None,
+    target_object_type: Optional[str] = None,
+    target_object_id: Optional[str] = None,
+    details: Optional[Dict[str, Any]] = None,
+):
+    """Like log_audit_event, with the write run on the storage pool instead of the event loop."""
+    try:
+        await async_storage.run(audit_events.put, _audit_entry(
+            user_identifier, action_type, status, request, target_object_type, target_object_id, details))
         print(f"[AUDIT] Logged action: {action_type} by {user_identifier} - Status: {status}")
 
     except Exception as e:
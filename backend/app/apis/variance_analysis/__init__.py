@@ -6,6 +6,8 @@ from datetime import date
 import os # Added for OpenAI key check potentially
 from openai import OpenAI # Added for LLM
 import databutton as db # Added for secrets
+from app.apis.storage_utils import storage
+from app.apis.financial_columns import find_entity_imports, read_import_frame
 
 # Potentially import models or functions related to financial data access
 # from app.apis.data_import import ... # Example
@@ -89,67 +91,63 @@ else:
 
 # --- Helper Functions for /calculate ---
 
+# Imported data type read for each report type
+REPORT_DATA_TYPES = {'pnl': 'profit_loss', 'balance_sheet': 'balance_sheet'}
+# Only these columns of an import are read: a name and an amount for each line
+VARIANCE_COLUMNS = ['account_name', 'item_name', 'balance', 'amount']
+
+
 def _fetch_financial_data(entity_id: str, report_type: str, period_end_date: date) -> pd.DataFrame:
-    """Placeholder: Fetches processed financial data for a specific entity, report, and period."""
-    print(f"[Placeholder] Fetching {report_type} data for {entity_id} ending {period_end_date}")
-    # TODO: Implement actual data retrieval from db.storage or other source
-    #       based on how data imports (e.g., MYA-96, MYA-98) store results.
-    # Example: key = f"{entity_id}_{report_type}_{period_end_date}.parquet"
-    #          try:
-    #              df = db.storage.dataframes.get(key)
-    #          except FileNotFoundError:
-    #              raise HTTPException(status_code=404, detail=f"Data not found for {key}")
-    
-    # Returning placeholder data for now
-    if report_type == 'pnl':
-         return pd.DataFrame({
-            'account_name': ['Revenue', 'COGS', 'Gross Profit', 'Operating Expenses', 'Net Income'],
-            'value': [100000.0, -40000.0, 60000.0, -30000.0, 30000.0]
-        })
-    elif report_type == 'balance_sheet':
-         # Add placeholder BS data if needed for testing later
-         return pd.DataFrame({'account_name': ['Cash', 'Receivables', 'Assets'], 'value': [50000.0, 20000.0, 70000.0]})
-    else:
-        return pd.DataFrame()
+    """
+    Fetches the latest import of an entity, report and period as (account_name, value)
+    rows, reading only the name and amount columns. Empty if nothing was imported.
+    """
+    data_type = REPORT_DATA_TYPES.get(report_type)
+    period = period_end_date.isoformat()
+    print(f"Fetching {report_type} data for {entity_id} ending {period}")
+    if data_type is None:
+        return pd.DataFrame(columns=['account_name', 'value'])
+
+    imports = find_entity_imports(entity_id, data_type, period)
+    if not imports:
+        return pd.DataFrame(columns=['account_name', 'value'])
+    # The most recent import wins when a period was imported more than once
+    storage_key = max(imports, key=lambda index: index.get('timestamp') or '')['storage_key']
+    try:
+        df = read_import_frame(storage_key, columns=VARIANCE_COLUMNS)
+    except FileNotFoundError:
+        return pd.DataFrame(columns=['account_name', 'value'])
+
+    names = df['account_name'] if 'account_name' in df.columns else df.get('item_name')
+    values = df['balance'] if 'balance' in df.columns else df.get('amount')
+    if names is None or values is None:
+        return pd.DataFrame(columns=['account_name', 'value'])
+    result = pd.DataFrame({'account_name': names.astype(str), 'value': values.astype(float)})
+    # Lines repeated within an import (e.g. the same item under two categories) are summed
+    return result.groupby('account_name', as_index=False, sort=False)['value'].sum()
 
 def _fetch_comparison_data(entity_id: str, report_type: str, period_end_date: date, comparison_type: str) -> pd.DataFrame:
-    """Placeholder: Fetches comparison data (budget, prior period, prior year)."""
-    print(f"[Placeholder] Fetching comparison data ({comparison_type}) for {entity_id}, {report_type} based on {period_end_date}")
-    
+    """Fetches comparison data: the prior period's or prior year's import (budgets not yet supported)."""
+    print(f"Fetching comparison data ({comparison_type}) for {entity_id}, {report_type} based on {period_end_date}")
+
     comparison_date = None
     if comparison_type == 'budget':
-        # Budget data might be stored differently, maybe by period without exact date matching needed?
-        print(f"[Placeholder] Needs logic to fetch budget data for period ending {period_end_date}")
-        # Fetch budget data corresponding to period_end_date
-        # Example key: f"{entity_id}_{report_type}_{period_end_date}_budget.parquet"
+        # Budget versions are not linked to an entity and period yet, so there is nothing to compare with
+        # TODO: Fetch budget data corresponding to period_end_date once budgets carry entity/period
+        print(f"Budget comparison for period ending {period_end_date} is not available yet")
+        return pd.DataFrame(columns=['account_name', 'value'])
     elif comparison_type == 'prior_period':
-        # This needs logic to determine the 'prior' period (e.g., previous month/quarter)
-        # Requires knowing the reporting frequency (monthly, quarterly)
-        # Example: Assuming monthly - subtract 1 month (approx)
-        comparison_date = period_end_date - pd.DateOffset(months=1)
-        print(f"[Placeholder] Calculated prior period date: {comparison_date.date()}")
-        # Fetch data for comparison_date
+        # Assumes monthly reporting: the same day (or month end) one month earlier
+        comparison_date = pd.Timestamp(period_end_date) - pd.DateOffset(months=1)
     elif comparison_type == 'prior_year':
-        comparison_date = period_end_date - pd.DateOffset(years=1)
-        print(f"[Placeholder] Calculated prior year date: {comparison_date.date()}")
-        # Fetch data for comparison_date
-    
-    # TODO: Implement actual fetching using the determined comparison date/period
-    #       Similar logic to _fetch_financial_data but using comparison_date/period info
-    
-    # Returning placeholder data for now - specific to PnL example
-    if report_type == 'pnl':
-        # Simulate slightly different data based on comparison type for demo
-        base_values = [95000.0, -38000.0, 57000.0, -32000.0, 25000.0]
-        if comparison_type == 'prior_year':
-            base_values = [v * 0.9 for v in base_values] # Simulate lower values last year
-        return pd.DataFrame({
-            'account_name': ['Revenue', 'COGS', 'Gross Profit', 'Operating Expenses', 'Net Income'],
-            'value': base_values 
-        })
+        comparison_date = pd.Timestamp(period_end_date) - pd.DateOffset(years=1)
     else:
-        # Add placeholder BS comparison data if needed
-        return pd.DataFrame({'account_name': ['Cash', 'Receivables', 'Assets'], 'value': [45000.0, 18000.0, 63000.0]})
+        return pd.DataFrame(columns=['account_name', 'value'])
+
+    if pd.Timestamp(period_end_date).is_month_end:
+        comparison_date = comparison_date + pd.offsets.MonthEnd(0)
+    print(f"Calculated comparison period date: {comparison_date.date()}")
+    return _fetch_financial_data(entity_id, report_type, comparison_date.date())
 
 
 def _calculate_and_merge_variances(
@@ -8,6 +8,9 @@ from app.apis.models import WidgetConfig, WidgetConfiguration
 
 # Import the new function and models from cash_flow api
 from app.apis.cash_flow import generate_enhanced_waterfall_data, ChartDataItemModel
+from app.apis.olap_cube import (
+    BUDGET_MEASURE, SCENARIO_ACTUAL, budget_scenario, period_range, query_cube, shift_period
+)
 
 # Assuming WidgetConfiguration is defined somewhere accessible, possibly generated from OpenAPI/types
 # If not, define a basic Pydantic model for it here for type hinting
@@ -29,6 +32,53 @@ router = APIRouter(prefix="/widget-data", tags=["Widget Data"])
 
 # Response model removed for debugging
 
+# Widget date aggregation -> cube period level
+CUBE_PERIOD_LEVELS = {"Monthly": "month", "Quarterly": "quarter", "Yearly": "fiscal_year"}
+
+
+def fetch_cube_widget_data(config: WidgetConfig) -> List[Dict[str, Any]]:
+    """
+    Chart rows ({"period": ..., metric: value, ...}) for metrics read from the
+    precomputed cube. Metrics are account codes, or CoA groups when the config has a
+    coaMappingId. Optional extra config: measure (imported data type, default
+    trial_balance), organizationId and budgetVersionId (for the Budget comparison).
+    """
+    extra = config.model_extra or {}
+    metrics = config.metrics or [config.kpiMetric or config.metricName]
+    measure = extra.get("measure", BUDGET_MEASURE)
+    today = datetime.now(timezone.utc).date()
+    start = config.startDate or today.replace(year=today.year - 1, day=1).isoformat()
+    end = config.endDate or today.isoformat()
+    periods = period_range(start, end, CUBE_PERIOD_LEVELS.get(config.dateAggregation or "Monthly", "month"))
+
+    def values(scenario: str, node: str, keys: List[str]) -> Dict[tuple, float]:
+        cells = query_cube(measure, scenario, [node], keys, accounts=metrics,
+                           coa_mapping_id=extra.get("coaMappingId"))
+        return {(cell["period"], cell["account"]): cell["value"] for cell in cells}
+
+    actuals = values(SCENARIO_ACTUAL, config.entityId, periods)
+    comparison: Dict[tuple, float] = {}
+    comparison_label = None
+    if config.comparison == "PriorYear":
+        prior = values(SCENARIO_ACTUAL, config.entityId, [shift_period(period, -1) for period in periods])
+        comparison = {(period, metric): prior[(shift_period(period, -1), metric)]
+                      for period in periods for metric in metrics if (shift_period(period, -1), metric) in prior}
+        comparison_label = "Prior Year"
+    elif config.comparison == "Budget" and extra.get("budgetVersionId") and extra.get("organizationId"):
+        comparison = values(budget_scenario(extra["budgetVersionId"]), extra["organizationId"], periods)
+        comparison_label = "Budget"
+
+    rows = []
+    for period in periods:
+        row: Dict[str, Any] = {"period": period}
+        for metric in metrics:
+            row[metric] = actuals.get((period, metric))
+            if comparison_label:
+                row[f"{metric} ({comparison_label})"] = comparison.get((period, metric))
+        rows.append(row)
+    return rows
+
+
 # --- Endpoint ---
 
 @router.post("/fetch", response_model=FetchWidgetDataResponse)
@@ -54,6 +104,15 @@ async def fetch_widget_data(
         # Pass the actual WidgetConfig object (uses imported WidgetConfig)
         data_to_return = generate_enhanced_waterfall_data(config=widget_config.config)
 
+    elif widget_config.config is not None and widget_config.config.entityId and (
+        widget_config.config.metrics or widget_config.config.kpiMetric or widget_config.config.metricName
+    ):
+        # KPI cards and charts over accounts are served from the precomputed cube
+        try:
+            data_to_return = fetch_cube_widget_data(widget_config.config)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid widget date range: {e}") from e
+
     # elif widget_config.type == 'kpiCard':
         # TODO: Add logic for KPI cards based on widget_config.config
         # data_to_return = fetch_kpi_data(widget_config.config)
@@ -1,81 +1,361 @@
 """
 Mock implementation of Databutton module for local development.
 This allows the backend to run without the actual Databutton platform.
+
+Storage is backed by a single SQLite database in WAL mode, implementing the
+`json`, `dataframes`, `binary` and `text` namespaces of db.storage with
+get/put/delete/list. On top of the hosted interface it offers prefix listing,
+per-key version numbers, compare-and-swap writes, multi-key transactions and
+batched get_many/put_many, which makes it usable for load tests and single-node deployments.
+
+The database location can be set with DATABUTTON_MOCK_STORAGE_PATH.
 """
+import io
 import json
 import os
+import sqlite3
 import tempfile
-from typing import Any, Dict, Optional
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
 from pathlib import Path
 
 
-class MockStorage:
-    """Mock implementation of Databutton storage."""
-    
-    def __init__(self):
-        self._storage_dir = Path(tempfile.gettempdir()) / "databutton_mock_storage"
-        self._storage_dir.mkdir(exist_ok=True)
-    
-    class Json:
-        def __init__(self, storage_dir: Path):
-            self.storage_dir = storage_dir
-            
-        def get(self, key: str, default: Any = None) -> Any:
-            """Get JSON data from mock storage."""
-            file_path = self.storage_dir / f"{key}.json"
-            if file_path.exists():
-                try:
-                    with open(file_path, 'r') as f:
-                        return json.load(f)
-                except (json.JSONDecodeError, IOError):
-                    return default
-            return default
-        
-        def put(self, key: str, value: Any) -> None:
-            """Store JSON data in mock storage."""
-            file_path = self.storage_dir / f"{key}.json"
+DEFAULT_STORAGE_DIR = Path(tempfile.gettempdir()) / "databutton_mock_storage"
+DEFAULT_STORAGE_PATH = DEFAULT_STORAGE_DIR / "storage.sqlite3"
+
+# Stay well below SQLite's limit on bound parameters per statement
+_MAX_KEYS_PER_QUERY = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    namespace  TEXT    NOT NULL,
+    key        TEXT    NOT NULL,
+    value      BLOB    NOT NULL,
+    version    INTEGER NOT NULL,
+    size       INTEGER NOT NULL,
+    updated_at REAL    NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID
+"""
+
+
+class FileListEntry(NamedTuple):
+    """Same shape as the entries returned by the hosted db.storage.<ns>.list()."""
+    name: str
+    size: int
+
+
+def _prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with prefix (None if unbounded)."""
+    while prefix:
+        last = prefix[-1]
+        if ord(last) < 0x10FFFF:
+            return prefix[:-1] + chr(ord(last) + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+class SQLiteDatabase:
+    """Connection management and low-level blob operations shared by all namespaces."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        # SQLite allows one writer at a time; serialise writers in-process instead of spinning on SQLITE_BUSY
+        self._write_lock = threading.RLock()
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Runs the enclosed reads and writes atomically. Nested calls join the
+        outermost transaction; the write lock is held until it commits.
+        """
+        conn = self.conn
+        if self._local.depth:
+            self._local.depth += 1
             try:
-                with open(file_path, 'w') as f:
-                    json.dump(value, f, indent=2, default=str)
-            except (TypeError, IOError) as e:
-                print(f"Warning: Failed to store {key}: {e}")
-        
-        def delete(self, key: str) -> bool:
-            """Delete JSON data from mock storage."""
-            file_path = self.storage_dir / f"{key}.json"
-            if file_path.exists():
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            self._local.depth = 1
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._local.depth = 0
+
+    def read(self, namespace: str, key: str) -> Optional[Tuple[bytes, int]]:
+        row = self.conn.execute(
+            "SELECT value, version FROM blobs WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def read_many(self, namespace: str, keys: List[str]) -> Dict[str, Tuple[bytes, int]]:
+        """Reads several keys with one query per chunk of keys. Missing keys are left out."""
+        results = {}
+        for start in range(0, len(keys), _MAX_KEYS_PER_QUERY):
+            chunk = keys[start:start + _MAX_KEYS_PER_QUERY]
+            rows = self.conn.execute(
+                f"SELECT key, value, version FROM blobs WHERE namespace = ? AND key IN ({','.join('?' * len(chunk))})",
+                (namespace, *chunk),
+            )
+            for key, value, version in rows:
+                results[key] = (value, version)
+        return results
+
+    def version(self, namespace: str, key: str) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT version FROM blobs WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def write(self, namespace: str, key: str, data: bytes, expected_version: Optional[int] = None) -> Optional[int]:
+        """
+        Writes data and returns the new version. With expected_version set the write
+        only happens if the current version matches (0 means "must not exist"),
+        otherwise None is returned.
+        """
+        with self.transaction() as conn:
+            current = self.version(namespace, key)
+            if expected_version is not None and (current or 0) != expected_version:
+                return None
+            new_version = (current or 0) + 1
+            conn.execute(
+                "INSERT INTO blobs (namespace, key, value, version, size, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, version = excluded.version, "
+                "size = excluded.size, updated_at = excluded.updated_at",
+                (namespace, key, sqlite3.Binary(data), new_version, len(data), time.time()),
+            )
+            return new_version
+
+    def remove(self, namespace: str, key: str) -> bool:
+        with self.transaction() as conn:
+            cursor = conn.execute("DELETE FROM blobs WHERE namespace = ? AND key = ?", (namespace, key))
+            return cursor.rowcount > 0
+
+    def list(self, namespace: str, prefix: str = "") -> List[FileListEntry]:
+        upper = _prefix_upper_bound(prefix)
+        if upper is None:
+            rows = self.conn.execute(
+                "SELECT key, size FROM blobs WHERE namespace = ? AND key >= ? ORDER BY key", (namespace, prefix)
+            )
+        else:
+            rows = self.conn.execute(
+                "SELECT key, size FROM blobs WHERE namespace = ? AND key >= ? AND key < ? ORDER BY key",
+                (namespace, prefix, upper),
+            )
+        return [FileListEntry(name, size) for name, size in rows]
+
+
+class _Namespace:
+    """Base class for a storage namespace. Subclasses define how values are encoded."""
+
+    namespace = ""
+
+    def __init__(self, database: SQLiteDatabase):
+        self._db = database
+
+    def encode(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+    def _missing(self, key: str, default: Any) -> Any:
+        if default is not None:
+            return default() if callable(default) else default
+        raise FileNotFoundError(f"{key} not found")
+
+    def get(self, key: str, *, default: Any = None) -> Any:
+        """Get the value at key. Raises FileNotFoundError if missing and no default is given."""
+        row = self._db.read(self.namespace, key)
+        if row is None:
+            return self._missing(key, default)
+        return self.decode(row[0])
+
+    def get_with_version(self, key: str) -> Tuple[Any, int]:
+        """Returns (value, version). Raises FileNotFoundError if missing."""
+        row = self._db.read(self.namespace, key)
+        if row is None:
+            raise FileNotFoundError(f"{key} not found")
+        return self.decode(row[0]), row[1]
+
+    def get_many_with_versions(self, keys: Iterable[str]) -> Dict[str, Tuple[Any, int]]:
+        """Returns {key: (value, version)} for the keys that exist, in one query."""
+        rows = self._db.read_many(self.namespace, list(dict.fromkeys(keys)))
+        return {key: (self.decode(data), version) for key, (data, version) in rows.items()}
+
+    def version(self, key: str) -> Optional[int]:
+        """Current version number of key, or None if it does not exist."""
+        return self._db.version(self.namespace, key)
+
+    def put(self, key: str, value: Any) -> int:
+        """Store value at key, returning the new version number."""
+        return self._db.write(self.namespace, key, self.encode(value))
+
+    def put_many(self, items: Mapping[str, Any]) -> Dict[str, int]:
+        """Stores several values in a single transaction, returning their new versions."""
+        encoded = {key: self.encode(value) for key, value in items.items()}
+        with self._db.transaction():
+            return {key: self._db.write(self.namespace, key, data) for key, data in encoded.items()}
+
+    def compare_and_swap(self, key: str, value: Any, expected_version: int) -> Optional[int]:
+        """
+        Store value only if key is still at expected_version (0 = key must not exist).
+        Returns the new version, or None if another writer got there first.
+        """
+        return self._db.write(self.namespace, key, self.encode(value), expected_version=expected_version)
+
+    def delete(self, key: str) -> bool:
+        return self._db.remove(self.namespace, key)
+
+    def list(self, prefix: str = "") -> List[FileListEntry]:
+        """List stored keys, optionally restricted to a prefix."""
+        return self._db.list(self.namespace, prefix)
+
+
+class JsonNamespace(_Namespace):
+    namespace = "json"
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, default=str, separators=(",", ":")).encode("utf-8")
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class TextNamespace(_Namespace):
+    namespace = "text"
+
+    def encode(self, value: str) -> bytes:
+        return value.encode("utf-8")
+
+    def decode(self, data: bytes) -> str:
+        return data.decode("utf-8")
+
+
+class BinaryNamespace(_Namespace):
+    namespace = "binary"
+
+    def encode(self, value: bytes) -> bytes:
+        return bytes(value)
+
+    def decode(self, data: bytes) -> bytes:
+        return bytes(data)
+
+
+class DataFramesNamespace(_Namespace):
+    """Stores pandas DataFrames as Arrow (feather) files, like the hosted platform."""
+
+    namespace = "dataframes"
+
+    def encode(self, value: Any) -> bytes:
+        buffer = io.BytesIO()
+        value.reset_index(drop=True).to_feather(buffer)
+        return buffer.getvalue()
+
+    def decode(self, data: bytes) -> Any:
+        import pandas as pd
+        return pd.read_feather(io.BytesIO(data))
+
+    def get(self, key: str, *, ignore_not_found: bool = True, default: Any = None) -> Any:
+        """Get dataframe with given key. Returns an empty DataFrame if missing, like the hosted API."""
+        if default is None and ignore_not_found:
+            import pandas as pd
+            default = pd.DataFrame
+        return super().get(key, default=default)
+
+
+class SQLiteStorage:
+    """db.storage compatible storage backed by SQLite."""
+
+    def __init__(self, path: Optional[Path] = None):
+        path = Path(path or os.environ.get("DATABUTTON_MOCK_STORAGE_PATH") or DEFAULT_STORAGE_PATH)
+        self._db = SQLiteDatabase(path)
+        self.json = JsonNamespace(self._db)
+        self.text = TextNamespace(self._db)
+        self.binary = BinaryNamespace(self._db)
+        self.dataframes = DataFramesNamespace(self._db)
+        self._import_legacy_json_files(path.parent)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Group writes across namespaces into one atomic SQLite transaction."""
+        with self._db.transaction():
+            yield
+
+    def _import_legacy_json_files(self, directory: Path):
+        """One-time import of the <key>.json files written by the previous file-based mock."""
+        if self.json.list():
+            return
+        legacy_files = sorted(directory.glob("*.json"))
+        if not legacy_files:
+            return
+        with self.transaction():
+            for file_path in legacy_files:
                 try:
-                    file_path.unlink()
-                    return True
-                except IOError:
-                    return False
-            return False
-    
-    @property
-    def json(self) -> Json:
-        return self.Json(self._storage_dir)
+                    with open(file_path, 'r') as f:
+                        self.json.put(file_path.stem, json.load(f))
+                except (json.JSONDecodeError, IOError) as e:
+                    print(f"Warning: Failed to import legacy mock file {file_path.name}: {e}")
+        print(f"Imported {len(legacy_files)} legacy mock storage files into {self._db.path}")
+
+
+# Kept for backwards compatibility with code that instantiates the old mock directly
+MockStorage = SQLiteStorage
 
 
 class MockDatabutton:
     """Mock implementation of the main Databutton module."""
-    
-    def __init__(self):
-        self.storage = MockStorage()
-    
+
+    def __init__(self, storage_backend: Optional[SQLiteStorage] = None):
+        self.storage = storage_backend or SQLiteStorage()
+
     def run_sql(self, query: str, params: Optional[Dict] = None) -> list:
         """Mock SQL execution - returns empty list."""
         print(f"Mock SQL query: {query}")
         if params:
             print(f"Mock SQL params: {params}")
         return []
-    
+
     def get_secret(self, key: str) -> Optional[str]:
         """Get secret from environment variables."""
         return os.getenv(key)
 
 
 # Create the mock instance
-storage = MockStorage()
+storage = SQLiteStorage()
 json_storage = storage.json
 
 # Backwards compatibility
@@ -84,7 +364,7 @@ put = json_storage.put
 delete = json_storage.delete
 
 # Create main module mock
-mock_db = MockDatabutton()
+mock_db = MockDatabutton(storage)
 
 # Export the interface that matches the real databutton module
-__all__ = ['storage', 'json_storage', 'get', 'put', 'delete', 'mock_db']
\ No newline at end of file
+__all__ = ['storage', 'json_storage', 'get', 'put', 'delete', 'mock_db', 'SQLiteStorage']
@@ -2,7 +2,7 @@ import os
 import pathlib
 import json
 import dotenv
-from fastapi import FastAPI, APIRouter, Depends
+from fastapi import FastAPI, APIRouter, Depends, Request
 
 dotenv.load_dotenv()
 
@@ -81,10 +81,37 @@ def get_firebase_config() -> dict | None:
     return None
 
 
+def add_storage_metrics_middleware(app: FastAPI):
+    """Records the storage traffic of every request, per endpoint (see GET /routes/storage/metrics)."""
+    from app.apis.storage_utils import STORAGE_METRICS_HEADERS, storage_metrics
+
+    @app.middleware("http")
+    async def storage_metrics_middleware(request: Request, call_next):
+        token, metrics = storage_metrics.begin_request()
+        try:
+            response = await call_next(request)
+        finally:
+            route = request.scope.get("route")
+            endpoint = f"{request.method} {route.path}" if route is not None else "unmatched"
+            storage_metrics.end_request(token, metrics, endpoint)
+        if STORAGE_METRICS_HEADERS:
+            response.headers.update(metrics.headers())
+        return response
+
+
+def add_import_job_recovery(app: FastAPI):
+    """Resumes background import jobs interrupted by a restart (see app.apis.import_jobs)."""
+    from app.apis.import_jobs import resume_import_jobs
+
+    app.router.on_startup.append(resume_import_jobs)
+
+
 def create_app() -> FastAPI:
     """Create the app. This is called by uvicorn with the factory option to construct the app object."""
     app = FastAPI()
     app.include_router(import_api_routers())
+    add_storage_metrics_middleware(app)
+    add_import_job_recovery(app)
 
     for route in app.routes:
         if hasattr(route, "methods"):
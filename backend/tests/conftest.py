@@ -0,0 +1,44 @@
+"""
+Test setup: all storage goes to a throwaway SQLite database (databutton_mock's
+SQLiteStorage), never to the hosted db.storage, even where databutton is installed.
+
+The shared `storage` object is pointed at that database before any API module is
+imported, so indexes and collections registered at import time land on it. Where
+databutton is not installed, a stand-in module serves `db.storage` from the same
+database and `db.secrets` from the environment.
+"""
+import importlib.util
+import os
+import sys
+import tempfile
+import types
+
+_storage_dir = tempfile.mkdtemp(prefix="lucent_tests_")
+os.environ["DATABUTTON_MOCK_STORAGE_PATH"] = os.path.join(_storage_dir, "storage.sqlite3")
+os.environ.setdefault("STORAGE_PARQUET_SPOOL_DIR", os.path.join(_storage_dir, "spool"))
+
+import pytest
+
+import databutton_mock
+from databutton_mock import SQLiteStorage
+
+if importlib.util.find_spec("databutton") is None:
+    class _EnvironmentSecrets:
+        def get(self, name, default=None):
+            return os.environ.get(name, default)
+
+    _databutton = types.ModuleType("databutton")
+    _databutton.storage = databutton_mock.storage
+    _databutton.secrets = _EnvironmentSecrets()
+    sys.modules["databutton"] = _databutton
+
+from app.apis import storage_utils
+
+storage_utils.storage.__init__(SQLiteStorage())
+storage_utils.async_storage.__init__(storage_utils.storage)
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    """A fresh SQLite backend of its own, for tests of the storage layer itself."""
+    return SQLiteStorage(tmp_path / "storage.sqlite3")
@@ -0,0 +1,263 @@
+"""
+Local stand-in for the MYOB AccountRight API, for exercising the MYOB connector
+(app.apis.myob_import) without a MYOB account.
+
+It serves the two endpoints the connector uses:
+
+- POST /oauth2/v1/authorize                          refresh_token grant
+- GET  /accountright/{company_file_id}/GeneralLedger/TrialBalance
+       OData paging ($top / $skip, Count, NextPageLink), the
+       "LastModified gt datetime'...'" filter, and ETag / If-None-Match
+
+Company files hold generated accounts. `touch` changes some of them (moving their
+LastModified forward), `expire_tokens` invalidates every issued access token so
+the next request gets a 401, and `latency` adds a delay to each request to mimic
+the round trip to api.myob.com.
+
+    server = FakeMyobServer(company_files=300, accounts_per_file=800, latency=0.05)
+    server.start()
+    os.environ["MYOB_API_BASE_URL"] = server.api_base_url   # before importing myob_import
+    os.environ["MYOB_TOKEN_URL"] = server.token_url
+    ...
+    server.stop()
+
+Or run it standalone (from backend/): python tests/myob_fake_server.py --port 8765
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+FAKE_MYOB_MAX_PAGE_SIZE = 1000
+_FILTER_PATTERN = re.compile(r"LastModified\s+gt\s+datetime'([^']+)'")
+_TRIAL_BALANCE_PATH = re.compile(r"^/accountright/([^/]+)/GeneralLedger/TrialBalance$")
+
+
+class FakeMyobServer:
+    """Threaded HTTP server holding the fake company files, tokens and request counters."""
+
+    def __init__(self, company_files: int = 3, accounts_per_file: int = 250, latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 7):
+        self.latency = latency
+        self.requests_served = 0
+        self.token_refreshes = 0
+        self.unauthorized = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._clock = datetime(2026, 1, 1)
+        self._tokens: Dict[str, str] = {}          # access token -> refresh token
+        self._refresh_tokens: Dict[str, bool] = {}  # refresh token -> still valid
+        self.company_files: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for index in range(company_files):
+            self.add_company_file(f"cf-{index:04d}", accounts_per_file)
+
+        handler = type("FakeMyobHandler", (_FakeMyobHandler,), {"fake": self})
+        self._httpd = ThreadingHTTPServer((host, port), handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Test controls ---
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_base_url(self) -> str:
+        return f"{self.base_url}/accountright"
+
+    @property
+    def token_url(self) -> str:
+        return f"{self.base_url}/oauth2/v1/authorize"
+
+    def start(self) -> "FakeMyobServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-myob", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _tick(self) -> str:
+        self._clock += timedelta(seconds=1)
+        return self._clock.isoformat()
+
+    def add_company_file(self, company_file_id: str, accounts: int):
+        with self._lock:
+            rows = {}
+            for index in range(accounts):
+                uid = str(uuid.UUID(int=self._random.getrandbits(128)))
+                debit = round(self._random.uniform(0, 50000), 2) if index % 2 == 0 else 0.0
+                credit = 0.0 if index % 2 == 0 else round(self._random.uniform(0, 50000), 2)
+                rows[uid] = {
+                    "Account": {"UID": uid, "DisplayID": f"{1 + index % 6}-{index:04d}", "Name": f"Account {index}"},
+                    "OpeningBalance": 0.0,
+                    "DebitAmount": debit,
+                    "CreditAmount": credit,
+                    "ClosingBalance": round(debit - credit, 2),
+                    "LastModified": self._tick(),
+                }
+            self.company_files[company_file_id] = rows
+
+    def issue_tokens(self) -> Dict[str, str]:
+        """A valid access/refresh token pair, as a completed OAuth flow would give."""
+        with self._lock:
+            access_token, refresh_token = uuid.uuid4().hex, uuid.uuid4().hex
+            self._tokens[access_token] = refresh_token
+            self._refresh_tokens[refresh_token] = True
+            return {"access_token": access_token, "refresh_token": refresh_token}
+
+    def expire_tokens(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def touch(self, company_file_id: str, count: int = 1, new_accounts: int = 0) -> List[str]:
+        """Changes `count` existing accounts and adds `new_accounts`. Returns the changed UIDs."""
+        with self._lock:
+            rows = self.company_files[company_file_id]
+            changed = self._random.sample(sorted(rows), min(count, len(rows)))
+            for uid in changed:
+                row = rows[uid]
+                row["DebitAmount"] = round(row["DebitAmount"] + 100.0, 2)
+                row["ClosingBalance"] = round(row["DebitAmount"] - row["CreditAmount"], 2)
+                row["LastModified"] = self._tick()
+        for _ in range(new_accounts):
+            uid = str(uuid.UUID(int=self._random.getrandbits(128)))
+            with self._lock:
+                rows[uid] = {
+                    "Account": {"UID": uid, "DisplayID": f"9-{len(rows):04d}", "Name": f"New account {len(rows)}"},
+                    "OpeningBalance": 0.0, "DebitAmount": 10.0, "CreditAmount": 0.0, "ClosingBalance": 10.0,
+                    "LastModified": self._tick(),
+                }
+            changed.append(uid)
+        return changed
+
+    def remove(self, company_file_id: str, count: int = 1) -> List[str]:
+        """Deletes `count` accounts (which a LastModified filter can't report). Returns their UIDs."""
+        with self._lock:
+            rows = self.company_files[company_file_id]
+            removed = self._random.sample(sorted(rows), min(count, len(rows)))
+            for uid in removed:
+                del rows[uid]
+            self._tick()
+        return removed
+
+    # --- Request handling ---
+
+    def _authorized(self, header: Optional[str]) -> bool:
+        token = (header or "").removeprefix("Bearer ").strip()
+        with self._lock:
+            return token in self._tokens
+
+    def _refresh(self, form: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            refresh_token = form.get("refresh_token", "")
+            if form.get("grant_type") != "refresh_token" or not self._refresh_tokens.get(refresh_token):
+                return None
+            # MYOB rotates the refresh token on every use
+            self._refresh_tokens[refresh_token] = False
+            access_token, new_refresh = uuid.uuid4().hex, uuid.uuid4().hex
+            self._tokens[access_token] = new_refresh
+            self._refresh_tokens[new_refresh] = True
+            self.token_refreshes += 1
+        return {"access_token": access_token, "refresh_token": new_refresh,
+                "expires_in": "1200", "token_type": "bearer", "scope": "CompanyFile"}
+
+    def _trial_balance_page(self, company_file_id: str, query: Dict[str, str], path: str):
+        with self._lock:
+            rows = self.company_files.get(company_file_id)
+            if rows is None:
+                return 404, None, {"Errors": [{"Message": "Company file not found"}]}
+            ordered = sorted(rows.values(), key=lambda row: (row["LastModified"], row["Account"]["UID"]))
+            ordered = [dict(row, Account=dict(row["Account"])) for row in ordered]
+
+        # The ETag versions the whole company file, so it is the same for every page and filter
+        etag = '"' + hashlib.sha256(json.dumps(ordered, sort_keys=True).encode()).hexdigest()[:32] + '"'
+        match = _FILTER_PATTERN.search(query.get("$filter", ""))
+        if match:
+            ordered = [row for row in ordered if row["LastModified"] > match.group(1)]
+
+        top = min(int(query.get("$top", FAKE_MYOB_MAX_PAGE_SIZE)), FAKE_MYOB_MAX_PAGE_SIZE)
+        skip = int(query.get("$skip", 0))
+        next_link = None
+        if skip + top < len(ordered):
+            next_query = dict(query, **{"$skip": str(skip + top), "$top": str(top)})
+            next_link = f"{self.base_url}{path}?" + "&".join(f"{k}={v}" for k, v in next_query.items())
+        body = {"Items": ordered[skip:skip + top], "NextPageLink": next_link, "Count": len(ordered)}
+        return 200, etag, body
+
+
+class _FakeMyobHandler(BaseHTTPRequestHandler):
+    fake: FakeMyobServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def _send(self, status: int, body: Optional[Dict[str, Any]] = None, etag: Optional[str] = None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _begin(self):
+        with self.fake._lock:
+            self.fake.requests_served += 1
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+    def do_POST(self):
+        self._begin()
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        if urlparse(self.path).path != "/oauth2/v1/authorize":
+            return self._send(404, {"error": "not_found"})
+        tokens = self.fake._refresh(form)
+        if tokens is None:
+            return self._send(400, {"error": "invalid_grant"})
+        self._send(200, tokens)
+
+    def do_GET(self):
+        self._begin()
+        url = urlparse(self.path)
+        match = _TRIAL_BALANCE_PATH.match(url.path)
+        if not match:
+            return self._send(404, {"Errors": [{"Message": "Not found"}]})
+        if not self.fake._authorized(self.headers.get("Authorization")):
+            with self.fake._lock:
+                self.fake.unauthorized += 1
+            return self._send(401, {"Errors": [{"Name": "OAuthTokenIsInvalid", "Message": "The access token is invalid"}]})
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        status, etag, body = self.fake._trial_balance_page(match.group(1), query, url.path)
+        if status == 200 and etag and self.headers.get("If-None-Match") == etag:
+            return self._send(304, etag=etag)
+        self._send(status, body, etag)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the fake MYOB AccountRight API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--company-files", type=int, default=3)
+    parser.add_argument("--accounts", type=int, default=250)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+    fake = FakeMyobServer(args.company_files, args.accounts, args.latency, port=args.port)
+    for company_file_id in fake.company_files:
+        print(f"{company_file_id}: {fake.issue_tokens()}")
+    print(f"Fake MYOB API on {fake.api_base_url} (token URL {fake.token_url})")
+    fake._httpd.serve_forever()
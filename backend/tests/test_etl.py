@@ -0,0 +1,26 @@
+import threading
+
+from app.apis.etl import save_benchmark_import
+from app.apis.models import benchmark_view_segments
+from app.apis.storage_utils import storage
+
+
+def _points(source_id, count=3):
+    return [{"industry_code": f"{source_id}-{index}", "metric_name": "margin", "value": float(index)}
+            for index in range(count)]
+
+
+def test_concurrent_imports_of_different_sources_keep_each_other():
+    sources = [f"etl_source_{index}" for index in range(6)]
+    threads = [threading.Thread(target=save_benchmark_import, args=(
+        _points(source_id), {"source_id": source_id, "version": "1.0", "year": "2024", "filename": "f.csv"}))
+        for source_id in sources]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    all_segments = benchmark_view_segments(storage.json.get("benchmark_data_all", fresh=True))
+    assert sorted(segment["source_id"] for segment in all_segments) == sources
+    imports = storage.json.get("benchmark_imports", fresh=True)
+    assert sorted(summary["source_id"] for summary in imports) == sources
@@ -0,0 +1,216 @@
+import io
+
+import pytest
+from fastapi import HTTPException
+
+from app.apis.financial_import import (
+    UPLOAD_METADATA_PREFIX, ImportMappingRequest, _import_manifest_key, _import_storage_key, _load_manifests,
+    delete_import, get_import, get_latest_import, load_import_data, run_financial_import_job, save_imported_data,
+)
+from app.apis.financial_columns import find_entity_imports, read_import_frame
+from app.apis.import_jobs import ImportJobLeaseLost
+from app.apis.storage_utils import storage
+from app.apis.streaming_ingest import store_upload
+
+ORG, ENTITY, PERIOD = "org_import", "entity_import", "2026-03-31"
+
+
+def _trial_balance(changed_code=None, accounts=20):
+    return [
+        {"account_code": str(1000 + index), "account_name": f"Account {index}",
+         "debit": 500.0 if str(1000 + index) == changed_code else 100.0, "credit": 0.0}
+        for index in range(accounts)
+    ]
+
+
+def _save(import_id, rows, entity=ENTITY):
+    return save_imported_data(import_id=import_id, organization_id=ORG, business_entity_id=entity,
+                              data_type="trial_balance", import_date=PERIOD, data=rows)
+
+
+def _record(import_id, entity=ENTITY):
+    return storage.json.get(_import_storage_key(ORG, entity, "trial_balance", import_id), fresh=True)
+
+
+def test_delta_import_round_trips():
+    _save("imp_full", _trial_balance())
+    saved = _save("imp_delta", _trial_balance(changed_code="1003"))
+    assert saved["stored_rows"] == 1
+    assert saved["changed_keys"] == ["1003"]
+
+    record = _record("imp_delta")
+    assert record["base_key"] == _import_storage_key(ORG, ENTITY, "trial_balance", "imp_full")
+    assert load_import_data(record) == _trial_balance(changed_code="1003")
+    assert _record("imp_full")["dependents"] == [get_latest_import(ORG, ENTITY, "trial_balance", PERIOD)["storage_key"]]
+
+
+def test_deleting_a_base_import_keeps_its_deltas_readable():
+    entity = "entity_delete"
+    _save("imp_base", _trial_balance(), entity=entity)
+    _save("imp_change", _trial_balance(changed_code="1005"), entity=entity)
+    base_key = _import_storage_key(ORG, entity, "trial_balance", "imp_base")
+
+    delete_import(base_key)
+
+    with pytest.raises(FileNotFoundError):
+        storage.json.get(base_key, fresh=True)
+    record = _record("imp_change", entity=entity)
+    assert "base_key" not in record
+    assert load_import_data(record) == _trial_balance(changed_code="1005")
+
+
+def test_loading_a_delta_whose_base_is_gone_names_the_base():
+    entity = "entity_orphan"
+    _save("imp_base", _trial_balance(), entity=entity)
+    _save("imp_change", _trial_balance(changed_code="1001"), entity=entity)
+    storage.json.delete(_import_storage_key(ORG, entity, "trial_balance", "imp_base"))
+
+    with pytest.raises(FileNotFoundError, match="imp_base"):
+        load_import_data(_record("imp_change", entity=entity))
+
+
+def test_get_import_looks_the_import_up_by_id():
+    entity = "entity_lookup"
+    _save("imp_1", _trial_balance(accounts=3), entity=entity)
+    _save("imp_10", _trial_balance(changed_code="1001", accounts=3), entity=entity)
+
+    assert get_import("imp_1")["data"] == _trial_balance(accounts=3)
+    assert get_import("imp_10")["import_id"] == "imp_10"
+    with pytest.raises(HTTPException) as error:
+        get_import("imp_")
+    assert error.value.status_code == 404
+
+    delete_import(_import_storage_key(ORG, entity, "trial_balance", "imp_10"))
+    with pytest.raises(HTTPException):
+        get_import("imp_10")
+
+
+def test_deleting_an_import_drops_its_columnar_copy():
+    entity = "entity_columns"
+    _save("imp_cols", _trial_balance(accounts=3), entity=entity)
+    storage_key = _import_storage_key(ORG, entity, "trial_balance", "imp_cols")
+    assert [index["storage_key"] for index in find_entity_imports(entity)] == [storage_key]
+    assert len(read_import_frame(storage_key)) == 3
+
+    delete_import(storage_key)
+    assert find_entity_imports(entity) == []
+    with pytest.raises(FileNotFoundError):
+        read_import_frame(storage_key)
+
+
+# --- Background import jobs ---
+
+class _JobContext:
+    """Stands in for ImportJobContext; loses its lease after `fail_after` commits."""
+
+    def __init__(self, params, checkpoint=None, fail_after=None):
+        self.job_id = f"job_{params['import_id']}"
+        self.params = params
+        self.checkpoint = dict(checkpoint or {})
+        self.chunk_rows = 3
+        self.commits = 0
+        self.fail_after = fail_after
+
+    def set_total(self, rows_total):
+        pass
+
+    def commit(self, checkpoint, rows, errors=None, error_count=None):
+        self.checkpoint = checkpoint
+        self.commits += 1
+        if self.fail_after is not None and self.commits >= self.fail_after:
+            raise ImportJobLeaseLost(self.job_id)
+
+
+def _upload(upload_id, rows):
+    lines = ["code,name,debit,credit"] + [f"{r['account_code']},{r['account_name']},{r['debit']},{r['credit']}"
+                                           for r in rows]
+    descriptor = store_upload(f"{UPLOAD_METADATA_PREFIX}{upload_id}/tb.csv", io.BytesIO("\n".join(lines).encode()))
+    storage.json.put(f"{UPLOAD_METADATA_PREFIX}{upload_id}/metadata.json", {
+        "upload_id": upload_id, "organization_id": ORG, "temp_file_key": descriptor["key"],
+        "temp_file": descriptor, "encoding": "utf-8", "row_count": len(rows),
+    })
+
+
+def _job_params(import_id, upload_id, entity):
+    request = ImportMappingRequest(
+        upload_id=upload_id, data_type="trial_balance", date=PERIOD, organization_id=ORG,
+        business_entity_id=entity, mappings=[
+            {"source_column": "code", "target_field": "account_code"},
+            {"source_column": "name", "target_field": "account_name"},
+            {"source_column": "debit", "target_field": "debit"},
+            {"source_column": "credit", "target_field": "credit"},
+        ])
+    return {"request": request.model_dump(), "import_id": import_id}
+
+
+def _manifest_keys(import_id, entity, parts):
+    storage_key = _import_storage_key(ORG, entity, "trial_balance", import_id)
+    return [key for manifest in _load_manifests([_import_manifest_key(storage_key, i) for i in range(parts)])
+            for key in manifest["keys"]]
+
+
+def test_resumed_job_numbers_repeated_keys_like_an_uninterrupted_run():
+    # Every account appears twice, so the second half of the file repeats keys from the first
+    rows = _trial_balance(accounts=6) * 2
+    _upload("upload_repeats", rows)
+
+    clean = run_financial_import_job(_JobContext(_job_params("imp_clean", "upload_repeats", "entity_clean")))
+
+    interrupted = _JobContext(_job_params("imp_resumed", "upload_repeats", "entity_resumed"), fail_after=2)
+    with pytest.raises(ImportJobLeaseLost):
+        run_financial_import_job(interrupted)
+    resumed = run_financial_import_job(_JobContext(interrupted.params, checkpoint=interrupted.checkpoint))
+
+    assert resumed["parts"] == clean["parts"]
+    assert _manifest_keys("imp_resumed", "entity_resumed", resumed["parts"]) == \
+        _manifest_keys("imp_clean", "entity_clean", clean["parts"])
+    assert len(set(_manifest_keys("imp_resumed", "entity_resumed", resumed["parts"]))) == len(rows)
+
+
+def test_resumed_delta_job_starts_over_when_its_base_is_gone():
+    entity = "entity_base_gone"
+    _save("imp_base", _trial_balance(accounts=6), entity=entity)
+    changed = _trial_balance(changed_code="1002", accounts=6)
+    _upload("upload_change", changed)
+
+    interrupted = _JobContext(_job_params("imp_next", "upload_change", entity), fail_after=1)
+    with pytest.raises(ImportJobLeaseLost):
+        run_financial_import_job(interrupted)
+    assert interrupted.checkpoint["base_key"]
+    storage.json.delete(_import_storage_key(ORG, entity, "trial_balance", "imp_base"))
+
+    run_financial_import_job(_JobContext(interrupted.params, checkpoint=interrupted.checkpoint))
+    record = _record("imp_next", entity=entity)
+    assert "base_key" not in record
+    assert [row["debit"] for row in load_import_data(record)] == [row["debit"] for row in changed]
+
+
+def test_job_import_in_which_most_rows_changed_is_stored_in_full():
+    entity = "entity_job_rewrite"
+    _upload("upload_rewrite_base", _trial_balance(accounts=6))
+    run_financial_import_job(_JobContext(_job_params("imp_old", "upload_rewrite_base", entity)))
+    rewritten = [dict(row, debit=row["debit"] + 1) for row in _trial_balance(accounts=6)]
+    rewritten[0]["debit"] = 100.0
+    _upload("upload_rewrite", rewritten)
+
+    result = run_financial_import_job(_JobContext(_job_params("imp_new", "upload_rewrite", entity)))
+
+    record = _record("imp_new", entity=entity)
+    assert result["changed_keys"] == 5
+    assert "base_key" not in record
+    assert _record("imp_old", entity=entity).get("dependents", []) == []
+    assert [row["debit"] for row in load_import_data(record)] == [row["debit"] for row in rewritten]
+
+
+def test_job_import_in_which_few_rows_changed_is_stored_as_changes():
+    entity = "entity_job_delta"
+    _upload("upload_one_change_base", _trial_balance(accounts=6))
+    run_financial_import_job(_JobContext(_job_params("imp_old", "upload_one_change_base", entity)))
+    changed = _trial_balance(changed_code="1004", accounts=6)
+    _upload("upload_one_change", changed)
+
+    run_financial_import_job(_JobContext(_job_params("imp_new", "upload_one_change", entity)))
+
+    record = _record("imp_new", entity=entity)
+    assert record["base_key"] == _import_storage_key(ORG, entity, "trial_balance", "imp_old")
+    assert [row["debit"] for row in load_import_data(record)] == [row["debit"] for row in changed]
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from app.apis.formula_engine import FormulaError, FormulaSet, compile_formula
+
+
+def test_formulas_parse_names_accounts_and_ranges():
+    formula = compile_formula("([Gross Profit] - revenue) / {4000} + SUM({6000:6999}) ^ 2")
+    assert formula.names == {"gross profit", "revenue"}
+    assert formula.accounts == {"4000"}
+    assert formula.ranges == {("6000", "6999")}
+
+    values = formula.evaluate({"gross profit": np.array([50.0]), "revenue": np.array([10.0])},
+                              {"4000": np.array([8.0]), "6100": np.array([2.0]), "7000": np.array([9.0])})
+    assert values.tolist() == [9.0]
+
+
+def test_division_by_zero_gives_nan():
+    assert np.isnan(compile_formula("{1} / {2}").evaluate(accounts={"1": np.array([1.0])})[0])
+
+
+@pytest.mark.parametrize("source", ["", "[Revenue] +", "__import__('os')", "UNKNOWN(1)", "IF(1, 2)", "x.y"])
+def test_invalid_formulas_raise_formula_error(source):
+    with pytest.raises(FormulaError):
+        compile_formula(source)
+
+
+@pytest.mark.parametrize("source", ["-" * 1500 + "1", "ABS(" * 400 + "1" + ")" * 400, "2 ^ " * 400 + "1",
+                                    "(" * 600 + "1" + ")" * 600])
+def test_deeply_nested_formulas_raise_formula_error(source):
+    with pytest.raises(FormulaError):
+        compile_formula(source)
+
+
+def test_long_flat_formulas_still_compile():
+    assert compile_formula("+".join(["{1}"] * 150)).evaluate(accounts={"1": np.array([1.0])}).tolist() == [150.0]
+
+
+def test_formula_sets_evaluate_in_dependency_order():
+    formulas = FormulaSet({"GP %": "[Gross Profit] / [Revenue] * 100", "Gross Profit": "[Revenue] - [Cost of Sales]"})
+    assert formulas.inputs == {"revenue", "cost of sales"}
+    results = formulas.evaluate({"Revenue": np.array([100.0, 200.0]), "Cost of Sales": np.array([60.0, 50.0])}, size=2)
+    assert results["Gross Profit"].tolist() == [40.0, 150.0]
+    assert results["GP %"].tolist() == [40.0, 75.0]
+
+
+def test_cycles_are_reported_with_their_members():
+    with pytest.raises(FormulaError) as error:
+        FormulaSet({"A": "[B] + 1", "B": "[C] * 2", "C": "[A]", "D": "{1000}"})
+    assert sorted(set(error.value.cycle)) == ["A", "B", "C"]
+
+
+def test_aliases_reference_a_formula_by_another_name():
+    formulas = FormulaSet({"gp": "[Revenue] - {5000}", "margin": "[Gross Profit] / [Revenue] * 100"},
+                          aliases={"Gross Profit": "gp"})
+    assert formulas.inputs == {"revenue"}
+    results = formulas.evaluate({"revenue": np.array([200.0])}, {"5000": np.array([50.0])})
+    assert results["margin"].tolist() == [75.0]
+
+    with pytest.raises(FormulaError):
+        FormulaSet({"gp": "1", "Gross Profit": "2"}, aliases={"Gross Profit": "gp"})
+    with pytest.raises(FormulaError) as error:
+        FormulaSet({"gp": "[Gross Profit] + 1"}, aliases={"Gross Profit": "gp"})
+    assert error.value.cycle
@@ -0,0 +1,42 @@
+import threading
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from app.apis import fx_rates
+from app.apis.fx_rates import get_cross_rate, load_fx_rates_df, merge_fx_rates
+
+
+def _rates(from_currency, day, rate, year=2023, to_currency="AUD"):
+    return pd.DataFrame([{"rate_date": date(year, 1, day), "from_currency": from_currency,
+                          "to_currency": to_currency, "rate": rate}])
+
+
+def test_concurrent_uploads_to_one_year_keep_every_row():
+    currencies = ["USD", "EUR", "GBP", "JPY", "NZD", "CAD"]
+    threads = [threading.Thread(target=merge_fx_rates, args=(_rates(currency, index + 1, 1.0 + index),))
+               for index, currency in enumerate(currencies)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stored = load_fx_rates_df(start_date=date(2023, 1, 1), end_date=date(2023, 12, 31))
+    assert sorted(stored["from_currency"]) == sorted(currencies)
+
+
+def test_cached_graphs_follow_merges_they_did_not_see():
+    as_of = date(2021, 6, 30)
+    merge_fx_rates(pd.concat([_rates("USD", 1, 1.5, year=2021), _rates("EUR", 1, 1.6, year=2021)]))
+    assert get_cross_rate("USD", "AUD", as_of) == 1.5
+    graph = fx_rates.get_fx_rate_graph(as_of)
+
+    # A later year is outside the window: the cached graph is kept
+    merge_fx_rates(_rates("USD", 1, 9.9, year=2022))
+    assert fx_rates.get_fx_rate_graph(as_of) is graph
+
+    # Nothing drops graphs in the writing process, so this is what any other process sees
+    merge_fx_rates(_rates("USD", 2, 1.4, year=2021))
+    assert get_cross_rate("USD", "AUD", as_of) == 1.4
+    assert get_cross_rate("USD", "EUR", as_of) == pytest.approx(1.4 / 1.6)
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from app.apis import import_jobs
+from app.apis.import_jobs import (
+    STATUS_QUEUED, STATUS_RUNNING, STATUS_SUCCEEDED, _is_stale, _job_key, get_import_job,
+    register_import_job_handler, resume_import_jobs, submit_import_job,
+)
+from app.apis.storage_utils import storage
+
+
+def _wait_for(job_id, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get_import_job(job_id)
+        if job and job["status"] not in (STATUS_QUEUED, STATUS_RUNNING):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Import job {job_id} did not finish")
+
+
+def _counting_handler(context):
+    """Processes params["chunks"] chunks, resuming after the checkpointed one."""
+    start = context.checkpoint.get("next_chunk", 0)
+    for chunk in range(start, context.params["chunks"]):
+        context.commit({"next_chunk": chunk + 1}, rows=10)
+    return {"started_at_chunk": start}
+
+
+register_import_job_handler("test_counting", _counting_handler)
+
+
+def test_job_runs_to_completion():
+    job = submit_import_job("test_counting", {"chunks": 3}, organization_id="org_jobs")
+    finished = _wait_for(job["job_id"])
+    assert finished["status"] == STATUS_SUCCEEDED
+    assert finished["rows_processed"] == 30
+    assert finished["result"] == {"started_at_chunk": 0}
+
+
+def test_interrupted_job_resumes_from_its_checkpoint():
+    job_id = "job_test_interrupted"
+    storage.json.put(_job_key(job_id), {
+        "job_id": job_id, "job_type": "test_counting", "status": STATUS_RUNNING, "lease": "dead-worker",
+        "params": {"chunks": 5}, "checkpoint": {"next_chunk": 3}, "rows_processed": 30, "chunks_processed": 3,
+        "created_at": time.time() - 3600, "heartbeat_at": time.time() - 3600, "errors": [], "error_count": 0,
+        "attempts": 1,
+    })
+    assert resume_import_jobs() >= 1
+    finished = _wait_for(job_id)
+    assert finished["status"] == STATUS_SUCCEEDED
+    assert finished["result"] == {"started_at_chunk": 3}
+    assert finished["rows_processed"] == 50
+    assert finished["attempts"] == 2
+
+
+def test_heartbeat_keeps_a_long_chunk_leased(monkeypatch):
+    monkeypatch.setattr(import_jobs, "IMPORT_JOB_LEASE_SECONDS", 0.3)
+    monkeypatch.setattr(import_jobs, "IMPORT_JOB_HEARTBEAT_SECONDS", 0.05)
+    release = threading.Event()
+    observed = []
+
+    def slow_handler(context):
+        # One chunk that takes several lease periods without committing
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            observed.append(_is_stale(get_import_job(context.job_id)))
+            time.sleep(0.05)
+        release.wait(5)
+        context.commit({"done": True}, rows=1)
+        return {}
+
+    register_import_job_handler("test_slow", slow_handler)
+    job = submit_import_job("test_slow", {})
+    time.sleep(0.5)
+    release.set()
+    assert _wait_for(job["job_id"])["status"] == STATUS_SUCCEEDED
+    assert observed and not any(observed)
+
+
+def test_queued_job_is_left_to_its_process_during_the_grace_period(monkeypatch):
+    monkeypatch.setattr(import_jobs, "IMPORT_JOB_QUEUED_GRACE_SECONDS", 60)
+    # Submitted moments ago by another process
+    queued = {"job_id": "job_elsewhere", "job_type": "test_counting", "status": STATUS_QUEUED,
+              "created_at": time.time() - 5}
+    assert not _is_stale(queued)
+    queued["created_at"] = time.time() - 120
+    assert _is_stale(queued)
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from fastapi import HTTPException
+
+from app.apis import myob_import
+from app.apis.financial_import import load_import_data
+from app.apis.myob_import import (
+    MyobConnectionInput, MyobSyncRequest, MyobTrialBalanceImportRequest, _connection_key, _sync_state_key,
+    import_myob_trial_balance, save_myob_connection, sync_myob_trial_balance, sync_myob_trial_balances
+)
+from app.apis.storage_utils import storage
+from app.auth import User
+from myob_fake_server import FakeMyobServer
+
+PERIOD = ("2026-01-01", "2026-01-31")
+
+
+@pytest.fixture
+def fake_myob(monkeypatch):
+    server = FakeMyobServer(company_files=1, accounts_per_file=25).start()
+    monkeypatch.setattr(myob_import, "MYOB_API_BASE_URL", server.api_base_url)
+    monkeypatch.setattr(myob_import, "MYOB_TOKEN_URL", server.token_url)
+    monkeypatch.setattr(myob_import, "MYOB_PAGE_SIZE", 10)
+    monkeypatch.setattr(myob_import, "_myob_app_credentials", lambda: ("key", "secret"))
+    yield server
+    server.stop()
+
+
+def _connect(server, connection_id):
+    tokens = server.issue_tokens()
+    storage.json.put(_connection_key(connection_id), {
+        "connection_id": connection_id, "organization_id": "org_myob", "business_entity_id": "entity_myob",
+        "company_file_id": "cf-0000", "access_token": myob_import.encrypt_value(tokens["access_token"]),
+        "refresh_token": myob_import.encrypt_value(tokens["refresh_token"]), "status": "active",
+    })
+
+
+def _stored_rows(connection_id):
+    state = storage.json.get(_sync_state_key(connection_id, *PERIOD), fresh=True)
+    return load_import_data(storage.json.get(state["storage_key"], fresh=True))
+
+
+def _account_uids(server):
+    return sorted(server.company_files["cf-0000"])
+
+
+def test_delta_sync_writes_new_parts_and_keeps_the_old_ones_intact(fake_myob):
+    _connect(fake_myob, "conn_delta")
+    assert sync_myob_trial_balance("conn_delta", *PERIOD)["sync_mode"] == "full"
+    state = storage.json.get(_sync_state_key("conn_delta", *PERIOD), fresh=True)
+    before = storage.json.get_many(state["part_keys"], fresh=True)
+
+    changed = fake_myob.touch("cf-0000", count=2, new_accounts=1)
+    result = sync_myob_trial_balance("conn_delta", *PERIOD)
+    assert result["sync_mode"] == "delta"
+    assert result["records_imported"] == 3
+
+    # The parts the previous record read are unchanged, and kept until the next sync
+    assert storage.json.get_many(before, fresh=True) == before
+    after = storage.json.get(_sync_state_key("conn_delta", *PERIOD), fresh=True)
+    assert after["retired_parts"] and set(after["retired_parts"]) <= set(before)
+    assert not set(after["retired_parts"]) & set(after["part_keys"])
+    rows = _stored_rows("conn_delta")
+    assert sorted(row["account_uid"] for row in rows) == _account_uids(fake_myob)
+    assert all(row["debit"] >= 10.0 for row in rows if row["account_uid"] in changed)
+
+    fake_myob.touch("cf-0000", count=1)
+    sync_myob_trial_balance("conn_delta", *PERIOD)
+    assert storage.json.get_many(after["retired_parts"], fresh=True) == {}
+
+
+def test_periodic_full_sync_drops_deleted_accounts(fake_myob, monkeypatch):
+    _connect(fake_myob, "conn_full")
+    sync_myob_trial_balance("conn_full", *PERIOD)
+    removed = fake_myob.remove("cf-0000", count=2)
+
+    # A delta can't see deleted accounts
+    assert sync_myob_trial_balance("conn_full", *PERIOD)["sync_mode"] != "full"
+    assert set(removed) <= {row["account_uid"] for row in _stored_rows("conn_full")}
+
+    monkeypatch.setattr(myob_import, "MYOB_FULL_SYNC_SECONDS", 0)
+    assert sync_myob_trial_balance("conn_full", *PERIOD)["sync_mode"] == "full"
+    assert sorted(row["account_uid"] for row in _stored_rows("conn_full")) == _account_uids(fake_myob)
+
+
+def test_saving_a_connection_requires_organization_membership(monkeypatch):
+    members = {("alice", "org_a"), ("bob", "org_b")}
+
+    async def is_member(user_id, organization_id):
+        return (user_id, organization_id) in members
+    monkeypatch.setattr(myob_import, "is_organization_member", is_member)
+
+    def save(user_id, organization_id):
+        body = MyobConnectionInput(organization_id=organization_id, business_entity_id="entity",
+                                   company_file_id="cf", access_token="a", refresh_token="r")
+        return asyncio.run(save_myob_connection("conn_owned", body, User(sub=user_id)))
+
+    assert save("alice", "org_a").organization_id == "org_a"
+    with pytest.raises(HTTPException) as error:
+        save("bob", "org_a")
+    assert error.value.status_code == 403
+    # Bob can't take over Alice's connection by moving it to his own organization
+    with pytest.raises(HTTPException) as error:
+        save("bob", "org_b")
+    assert error.value.status_code == 403
+    assert storage.json.get(_connection_key("conn_owned"), fresh=True)["user_id"] == "alice"
+
+
+def test_imports_and_syncs_require_the_connection_organization(monkeypatch):
+    async def is_member(user_id, organization_id):
+        return (user_id, organization_id) == ("alice", "org_myob")
+    monkeypatch.setattr(myob_import, "is_organization_member", is_member)
+    storage.json.put(_connection_key("conn_alice"), {"connection_id": "conn_alice", "organization_id": "org_myob"})
+    storage.json.put(_connection_key("conn_other"), {"connection_id": "conn_other", "organization_id": "org_other"})
+
+    def status_of(call):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(call)
+        return error.value.status_code
+
+    request = MyobTrialBalanceImportRequest(connection_id="conn_alice", start_date=PERIOD[0], end_date=PERIOD[1])
+    assert status_of(import_myob_trial_balance(request, User(sub="bob"), None)) == 403
+    assert status_of(import_myob_trial_balance(request.model_copy(update={"connection_id": "conn_missing"}),
+                                               User(sub="alice"), None)) == 404
+
+    def sync(user_id, organization_id, connection_ids=None):
+        return sync_myob_trial_balances(MyobSyncRequest(
+            start_date=PERIOD[0], end_date=PERIOD[1], organization_id=organization_id,
+            connection_ids=connection_ids), User(sub=user_id))
+    assert status_of(sync("bob", "org_myob")) == 403
+    # A member of one organization can't name another organization's connection
+    assert status_of(sync("alice", "org_myob", ["conn_alice", "conn_other"])) == 403
+    with pytest.raises(ValueError):
+        MyobSyncRequest(start_date=PERIOD[0], end_date=PERIOD[1])
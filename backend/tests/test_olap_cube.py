@@ -0,0 +1,114 @@
+import threading
+
+from app.apis import olap_cube
+from app.apis.business_entity import sanitize_storage_key as entity_key
+from app.apis.financial_import import save_imported_data
+from app.apis.olap_cube import SCENARIO_ACTUAL, query_cube, rebuild_cube_rollups
+from app.apis.storage_utils import storage
+
+
+def _entity(entity_id, parent=None):
+    storage.json.put(entity_key(f"entity_{entity_id}"), {
+        "id": entity_id, "name": entity_id, "abn": "1", "business_structure": "company", "tfn": "1",
+        "registered_for_gst": False, "local_currency": "AUD", "created_at": "2024-01-01T00:00:00",
+        "updated_at": "2024-01-01T00:00:00", "parent_entity_id": parent,
+    })
+
+
+def _import_sales(organization_id, entity_id, month, amount):
+    save_imported_data(f"pl_{entity_id}_{month}_{amount}", organization_id, entity_id, "profit_loss",
+                       f"2024-{month:02d}-28", data=[{"category": "rev", "item_name": "Sales", "amount": amount}])
+
+
+def _totals(nodes, periods, **kwargs):
+    return {(cell["node"], cell["period"]): cell["value"]
+            for cell in query_cube("profit_loss", SCENARIO_ACTUAL, nodes, periods, **kwargs)}
+
+
+def test_ancestors_sum_their_descendants_at_query_time():
+    _entity("cube_hold")
+    _entity("cube_e1", "cube_hold")
+    _entity("cube_e2", "cube_hold")
+    for month in (1, 2, 3):
+        _import_sales("cube_org", "cube_e1", month, 100.0 * month)
+        _import_sales("cube_org", "cube_e2", month, 1000.0 * month)
+
+    totals = _totals(["cube_e1", "cube_hold", "cube_org"], ["2024-02", "2024-Q1"])
+    assert totals[("cube_e1", "2024-Q1")] == 600.0
+    assert totals[("cube_hold", "2024-02")] == 2200.0
+    assert totals[("cube_org", "2024-Q1")] == 6600.0
+    assert _totals(["cube_hold"], ["2024-Q1"], include_descendants=False) == {}
+
+    # A re-import replaces the entity's value; nothing stored on the ancestors has to follow
+    _import_sales("cube_org", "cube_e1", 2, 50.0)
+    assert _totals(["cube_org"], ["2024-Q1"])[("cube_org", "2024-Q1")] == 6450.0
+
+
+def test_concurrent_writes_to_siblings_keep_the_parent_total():
+    _entity("conc_hold")
+    entities = [f"conc_e{index}" for index in range(6)]
+    for entity_id in entities:
+        _entity(entity_id, "conc_hold")
+
+    def write(entity_id):
+        for month in range(1, 4):
+            _import_sales("conc_org", entity_id, month, 10.0)
+
+    threads = [threading.Thread(target=write, args=(entity_id,)) for entity_id in entities]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert _totals(["conc_hold", "conc_org"], ["2024-Q1"]) == {
+        ("conc_hold", "2024-Q1"): 180.0, ("conc_org", "2024-Q1"): 180.0}
+
+
+def test_moved_entities_leave_their_old_parent():
+    _entity("move_a")
+    _entity("move_b")
+    _entity("move_e1", "move_a")
+    _entity("move_e2", "move_a")
+    _import_sales("move_org", "move_e1", 1, 10.0)
+    _import_sales("move_org", "move_e2", 1, 20.0)
+
+    # Rewritten after the move: its new ancestors are recorded with the write
+    _entity("move_e1", "move_b")
+    _import_sales("move_org", "move_e1", 1, 11.0)
+    assert _totals(["move_a", "move_b"], ["2024-01"]) == {("move_a", "2024-01"): 20.0, ("move_b", "2024-01"): 11.0}
+
+    # Moved without a new import: picked up by a rebuild
+    _entity("move_e2", "move_b")
+    assert rebuild_cube_rollups("profit_loss", SCENARIO_ACTUAL) >= 2
+    assert _totals(["move_a", "move_b", "move_org"], ["2024-01"]) == {
+        ("move_b", "2024-01"): 31.0, ("move_org", "2024-01"): 31.0}
+    assert storage.json.get(olap_cube._members_key("profit_loss", SCENARIO_ACTUAL, "move_a")) == {"members": []}
+
+    # Nodes whose ancestors didn't change are left alone
+    revision = olap_cube.cube_revision("profit_loss", SCENARIO_ACTUAL, "move_e1")
+    rebuild_cube_rollups("profit_loss", SCENARIO_ACTUAL)
+    assert olap_cube.cube_revision("profit_loss", SCENARIO_ACTUAL, "move_e1") == revision
+
+
+def test_rebuild_lists_new_ancestors_before_dropping_old_ones(monkeypatch):
+    _entity("order_a")
+    _entity("order_b")
+    _entity("order_e", "order_a")
+    _import_sales("order_org", "order_e", 1, 7.0)
+    _entity("order_e", "order_b")
+
+    # Every member list write during the rebuild must leave the organization total whole
+    totals = []
+    update = storage.json.update
+
+    def checked_update(key, *args, **kwargs):
+        result = update(key, *args, **kwargs)
+        if key.startswith(olap_cube.CUBE_MEMBERS_PREFIX):
+            totals.append(_totals(["order_org"], ["2024-01"]))
+        return result
+    monkeypatch.setattr(storage.json, "update", checked_update)
+    rebuild_cube_rollups("profit_loss", SCENARIO_ACTUAL)
+    monkeypatch.undo()
+
+    assert totals and all(total == {("order_org", "2024-01"): 7.0} for total in totals)
+    assert _totals(["order_a", "order_b"], ["2024-01"]) == {("order_b", "2024-01"): 7.0}
@@ -0,0 +1,37 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.apis import olap_cube, permission_utils, storage_utils
+from app.auth import User
+from databutton_app.mw.auth_mw import get_authorized_user
+
+
+@pytest.fixture
+def client_as(monkeypatch):
+    """A client for the ops routers, signed in as a user holding the given permissions."""
+    app = FastAPI()
+    app.include_router(storage_utils.router)
+    app.include_router(olap_cube.router)
+
+    def sign_in(*permissions):
+        async def user_permissions(user_id):
+            return list(permissions)
+        monkeypatch.setattr(permission_utils, "get_user_permissions", user_permissions)
+        app.dependency_overrides[get_authorized_user] = lambda: User(sub="someone")
+        return TestClient(app)
+    return sign_in
+
+
+@pytest.mark.parametrize("method, path", [
+    ("get", "/storage/metrics"), ("post", "/storage/metrics/reset"), ("post", "/storage/collections/migrate"),
+])
+def test_storage_ops_endpoints_need_the_ops_permission(client_as, method, path):
+    assert getattr(client_as(), method)(path).status_code == 403
+    assert getattr(client_as(permission_utils.OPS_ADMIN_PERMISSION), method)(path).status_code == 200
+
+
+def test_cube_rebuild_needs_the_ops_permission(client_as):
+    body = {"measure": "profit_loss", "scenario": "actual"}
+    assert client_as().post("/cube/rebuild", json=body).status_code == 403
+    assert client_as(permission_utils.OPS_ADMIN_PERMISSION).post("/cube/rebuild", json=body).status_code == 200
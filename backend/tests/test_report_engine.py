@@ -0,0 +1,149 @@
+import asyncio
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from app.apis.financial_import import save_imported_data
+from app.apis.formula_engine import FormulaError
+from app.apis.olap_cube import BUDGET_MEASURE, budget_scenario, write_cube_inputs
+from fastapi import HTTPException
+
+from app.apis import report_definitions
+from app.apis.report_definitions import (
+    ReportDefinition, ReportDefinitionCreate, create_report_definition, get_storage_key, update_report_definition
+)
+from app.apis.report_engine import (
+    GenerateReportRequest, ReportPlan, _on_budget_change, _on_import_change, cache_report, generate_report,
+    get_cached_report, report_result_key
+)
+from app.apis.storage_utils import storage
+from app.auth import User
+
+
+def _definition(rows, definition_id="plan"):
+    return ReportDefinition(
+        id=definition_id, name="Test report", dataSource={}, filters={}, rows=rows,
+        columns=[{"label": "Actual", "type": "value", "field": "balance"}],
+        createdAt=datetime(2024, 1, 1), updatedAt=datetime(2024, 1, 1), ownerId="owner",
+    )
+
+
+def _execute(rows):
+    financials = pd.DataFrame({"account_code": ["4000", "5000"], "balance": [200.0, 50.0]})
+    return {row.row_header: row.values["Actual"] for row in ReportPlan(_definition(rows)).execute(financials, {})}
+
+
+def test_calculation_rows_are_referenced_by_id_or_label():
+    values = _execute([
+        {"type": "account", "id": "rev", "label": "Revenue", "accountCode": "4000"},
+        {"type": "account", "label": "Cost of Sales", "accountCode": "5000"},
+        {"type": "calculation", "id": "gp", "label": "Gross Profit", "formula": "[Revenue] - [Cost of Sales]"},
+        {"type": "calculation", "id": "gp_pct", "label": "GP %", "formula": "[Gross Profit] / [Revenue] * 100"},
+        {"type": "calculation", "label": "GP check", "formula": "[gp] - [gp_pct] + {5000}"},
+    ])
+    assert values["Gross Profit"] == 150.0
+    assert values["GP %"] == 75.0
+    assert values["GP check"] == 125.0
+
+
+def test_duplicate_calculation_names_are_rejected():
+    with pytest.raises(FormulaError):
+        ReportPlan(_definition([
+            {"type": "calculation", "id": "total", "formula": "{4000}"},
+            {"type": "calculation", "id": "Total", "formula": "{5000}"},
+        ]))
+
+
+def test_ambiguous_references_are_rejected():
+    rows = [
+        {"type": "account", "label": "Other", "accountCode": "4000"},
+        {"type": "account", "label": "Other", "accountCode": "5000"},
+    ]
+    # Unreferenced duplicate labels are fine
+    ReportPlan(_definition(rows))
+    with pytest.raises(FormulaError):
+        ReportPlan(_definition(rows + [{"type": "calculation", "id": "x", "label": "X", "formula": "[Other] * 2"}]))
+
+
+def test_circular_calculation_rows_are_rejected():
+    with pytest.raises(FormulaError) as error:
+        ReportPlan(_definition([
+            {"type": "calculation", "id": "a", "label": "A", "formula": "[B] + 1"},
+            {"type": "calculation", "id": "b", "label": "B", "formula": "[a] + 1"},
+        ]))
+    assert sorted(set(error.value.cycle)) == ["a", "b"]
+
+
+def test_cached_reports_follow_budget_and_import_changes():
+    definition = _definition([{"type": "account", "label": "Revenue", "accountCode": "4000"}], "cached")
+    definition.budget_version_id = "budget_v1"
+    index = {"storage_key": "imports/cached", "timestamp": "2024-01-31T00:00:00"}
+
+    key = report_result_key(definition, index, "org_cached")
+    cache_report(key, "org_cached", ["rows"])
+    assert get_cached_report(key) == ["rows"]
+
+    # A budget write gives the report a new key, even before any listener has run
+    write_cube_inputs(BUDGET_MEASURE, budget_scenario("budget_v1"), "org_cached",
+                      {"2024-01": {"4000": 10.0}}, "sum")
+    assert report_result_key(definition, index, "org_cached") != key
+
+    # The listeners drop exactly the results that read the changed data
+    other = report_result_key(definition, dict(index, storage_key="imports/other"), "org_cached")
+    cache_report(other, "org_cached", ["other rows"])
+    _on_import_change({"storage_key": "imports/cached"})
+    assert get_cached_report(key) is None
+    assert get_cached_report(other) == ["other rows"]
+    _on_budget_change({"organization_id": "org_cached", "version_id": "budget_v1", "items": None})
+    assert get_cached_report(other) is None
+
+
+def test_generate_report_reads_the_definition_import():
+    save_imported_data("imp_generate", "org_generate", "entity_generate", "trial_balance", "2024-01-31", data=[
+        {"account_code": "4000", "account_name": "Sales", "debit": 0.0, "credit": 200.0, "balance": 200.0},
+        {"account_code": "5000", "account_name": "Costs", "debit": 50.0, "credit": 0.0, "balance": 50.0},
+    ])
+    definition = _definition([
+        {"type": "account", "label": "Revenue", "accountCode": "4000"},
+        {"type": "account", "label": "Costs", "accountCode": "5000"},
+        {"type": "calculation", "label": "Profit", "formula": "[Revenue] - [Costs]"},
+    ], "generate")
+    definition.dataSource = {"importId": "imp_generate", "organizationId": "org_generate",
+                             "businessEntityId": "entity_generate", "dataType": "trial_balance"}
+    storage.json.put(get_storage_key("owner", "generate"), definition.model_dump(mode="json"))
+
+    response = asyncio.run(generate_report(GenerateReportRequest(report_definition_id="generate"), User(sub="owner")))
+    assert {row.row_header: row.values["Actual"] for row in response.data} == {
+        "Revenue": 200.0, "Costs": 50.0, "Profit": 150.0}
+
+
+def test_definitions_with_invalid_formulas_are_not_saved(monkeypatch):
+    async def permissions(user_id):
+        return ["reports:create", "reports:update"]
+    monkeypatch.setattr(report_definitions, "get_user_permissions", permissions)
+    user = User(sub="author")
+
+    def body(rows):
+        return ReportDefinitionCreate(name="Checked", dataSource={}, filters={}, rows=rows,
+                                      columns=[{"label": "Actual", "type": "value", "field": "balance"}])
+
+    def rejected(call):
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(call)
+        assert error.value.status_code == 400
+        return error.value.detail
+
+    cyclic = [
+        {"type": "calculation", "id": "a", "label": "A", "formula": "[B] + 1"},
+        {"type": "calculation", "id": "b", "label": "B", "formula": "[a] + 1"},
+    ]
+    assert sorted(set(rejected(create_report_definition(body(cyclic), None, user))["cycle"])) == ["a", "b"]
+    assert storage.json.list(prefix="report_definitions-author-") == []
+
+    created = asyncio.run(create_report_definition(body([{"type": "calculation", "id": "a", "formula": "{4000}"}]),
+                                                   None, user))
+    detail = rejected(update_report_definition(created.id, body([{"type": "calculation", "id": "a", "formula": "(("}]),
+                                               None, user))
+    assert "Invalid formula" in detail["message"]
+    assert storage.json.get(get_storage_key("author", created.id), fresh=True)["rows"][0]["formula"] == "{4000}"
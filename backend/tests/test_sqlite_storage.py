@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from databutton_mock import SQLiteStorage
+
+
+def test_versions_increase_on_every_write(sqlite_storage):
+    assert sqlite_storage.json.version("k") is None
+    assert sqlite_storage.json.put("k", {"a": 1}) == 1
+    assert sqlite_storage.json.put("k", {"a": 2}) == 2
+    assert sqlite_storage.json.get_with_version("k") == ({"a": 2}, 2)
+
+
+def test_compare_and_swap_rejects_stale_versions(sqlite_storage):
+    json_ns = sqlite_storage.json
+    assert json_ns.compare_and_swap("k", {"n": 1}, 0) == 1
+    # 0 means "must not exist yet"
+    assert json_ns.compare_and_swap("k", {"n": 99}, 0) is None
+    assert json_ns.compare_and_swap("k", {"n": 2}, 1) == 2
+    assert json_ns.compare_and_swap("k", {"n": 99}, 1) is None
+    assert json_ns.get("k") == {"n": 2}
+
+
+def test_concurrent_compare_and_swap_loses_no_increment(sqlite_storage):
+    json_ns = sqlite_storage.json
+    json_ns.put("counter", {"n": 0})
+
+    def increment():
+        for _ in range(25):
+            while True:
+                value, version = json_ns.get_with_version("counter")
+                if json_ns.compare_and_swap("counter", {"n": value["n"] + 1}, version) is not None:
+                    break
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert json_ns.get("counter") == {"n": 100}
+
+
+def test_transaction_commits_across_namespaces(sqlite_storage):
+    with sqlite_storage.transaction():
+        sqlite_storage.json.put("meta", {"rows": 1})
+        sqlite_storage.text.put("note", "hello")
+    assert sqlite_storage.json.get("meta") == {"rows": 1}
+    assert sqlite_storage.text.get("note") == "hello"
+
+
+def test_transaction_rolls_back_every_write_on_error(sqlite_storage):
+    sqlite_storage.json.put("meta", {"rows": 1})
+    with pytest.raises(RuntimeError):
+        with sqlite_storage.transaction():
+            sqlite_storage.json.put("meta", {"rows": 2})
+            sqlite_storage.json.put("data", [1, 2])
+            with sqlite_storage.transaction():  # nested calls join the outer transaction
+                sqlite_storage.json.delete("meta")
+            raise RuntimeError("abort")
+    assert sqlite_storage.json.get_with_version("meta") == ({"rows": 1}, 1)
+    assert sqlite_storage.json.get("data", default=list) == []
+
+
+def test_put_many_and_get_many(sqlite_storage):
+    versions = sqlite_storage.json.put_many({"a": 1, "b": [2], "c": {"x": 3}})
+    assert versions == {"a": 1, "b": 1, "c": 1}
+    assert sqlite_storage.json.get_many_with_versions(["c", "missing", "a"]) == {"c": ({"x": 3}, 1), "a": (1, 1)}
+
+
+def test_list_by_prefix(sqlite_storage):
+    for key in ("org_1/a", "org_1/b", "org_10/a", "org_2/a"):
+        sqlite_storage.json.put(key, {})
+    assert [entry.name for entry in sqlite_storage.json.list(prefix="org_1/")] == ["org_1/a", "org_1/b"]
+    assert len(sqlite_storage.json.list()) == 4
+
+
+def test_database_is_shared_between_instances(tmp_path):
+    path = tmp_path / "shared.sqlite3"
+    first, second = SQLiteStorage(path), SQLiteStorage(path)
+    first.json.put("k", {"from": "first"})
+    assert second.json.get("k") == {"from": "first"}
+    journal_mode = second._db.conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert journal_mode == "wal"
@@ -0,0 +1,113 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.apis.storage_utils import Storage, StorageConflictError
+
+
+class HostedJsonNamespace:
+    """Only the operations of the hosted db.storage.json: no versions, no compare-and-swap."""
+
+    def __init__(self, namespace):
+        self._namespace = namespace
+
+    def get(self, key, default=None):
+        return self._namespace.get(key, default=default)
+
+    def put(self, key, value):
+        self._namespace.put(key, value)
+
+    def delete(self, key):
+        self._namespace.delete(key)
+
+    def list(self):
+        return self._namespace.list()
+
+
+def _hosted_like(sqlite_storage):
+    return SimpleNamespace(json=HostedJsonNamespace(sqlite_storage.json), binary=sqlite_storage.binary,
+                           dataframes=None, text=sqlite_storage.text)
+
+
+def _increment_concurrently(storages, increments):
+    def increment(storage):
+        for _ in range(increments):
+            storage.json.update("counter", lambda value: {"n": value["n"] + 1}, default=lambda: {"n": 0})
+
+    # Two threads per storage; each Storage stands in for a separate process
+    threads = [threading.Thread(target=increment, args=(storage,)) for storage in storages for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_update_with_compare_and_swap_loses_no_writes(sqlite_storage):
+    storages = [Storage(sqlite_storage), Storage(sqlite_storage)]
+    assert storages[0].json.supports_versions
+    _increment_concurrently(storages, 20)
+    assert storages[1].json.get("counter", fresh=True) == {"n": 80}
+
+
+def test_update_without_versions_is_serialised_across_processes(sqlite_storage):
+    storages = [Storage(_hosted_like(sqlite_storage)), Storage(_hosted_like(sqlite_storage))]
+    assert not storages[0].json.supports_versions
+    _increment_concurrently(storages, 5)
+    assert storages[1].json.get("counter", fresh=True) == {"n": 20}
+    # Leases are released afterwards
+    assert not [entry for entry in sqlite_storage.json.list() if entry.name.startswith("storage_lock__")]
+
+
+@pytest.mark.parametrize("hosted", [False, True])
+def test_lock_is_exclusive_between_processes(sqlite_storage, hosted):
+    backend = _hosted_like(sqlite_storage) if hosted else sqlite_storage
+    first, second = Storage(backend), Storage(backend)
+    with first.json.lock("job-1"):
+        with pytest.raises(StorageConflictError):
+            with second.json.lock("job-1", timeout=0.2):
+                pass
+        with second.json.lock("job-2", timeout=0.2):
+            pass
+    with second.json.lock("job-1", timeout=0.2):
+        pass
+
+
+def test_expired_lease_is_taken_over(sqlite_storage):
+    first, second = Storage(sqlite_storage), Storage(sqlite_storage)
+    holder = first.json.lock("job-1", lease_seconds=0.01)
+    holder.__enter__()  # never released, like a process that died
+    threading.Event().wait(0.05)
+    with second.json.lock("job-1", timeout=0.5):
+        pass
+
+
+def test_collection_reads_records_in_one_batch(sqlite_storage, monkeypatch):
+    indexes = {"kind": lambda record: record.get("kind")}
+    writer = Storage(sqlite_storage).collection("grants_batch", indexes=indexes)
+    for index in range(5):
+        writer.put({"id": f"g{index}", "kind": "even" if index % 2 == 0 else "odd"})
+    # A second process, with its index built but no records cached
+    grants = Storage(sqlite_storage).collection("grants_batch", indexes=indexes)
+    grants.find("kind", "even")
+    grants._json.cache.clear()
+
+    # Batched reads count once, single reads once per record key
+    reads = []
+    for method in ("get", "get_with_version", "get_many", "get_many_with_versions"):
+        if hasattr(sqlite_storage.json, method):
+            original = getattr(sqlite_storage.json, method)
+
+            def counted(keys, *args, _original=original, **kwargs):
+                reads.append(keys if isinstance(keys, str) else "batch")
+                return _original(keys, *args, **kwargs)
+            monkeypatch.setattr(sqlite_storage.json, method, counted)
+
+    def record_reads():
+        return [read for read in reads if read == "batch" or read.startswith(grants.prefix)]
+
+    assert [record["id"] for record in grants.all()] == ["g0", "g1", "g2", "g3", "g4"]
+    assert record_reads() == ["batch"]
+    grants._json.cache.clear()
+    assert [record["id"] for record in grants.find("kind", "even")] == ["g0", "g2", "g4"]
+    assert record_reads() == ["batch", "batch"]